@@ -0,0 +1,44 @@
+"""Add journal xid
+
+Revision ID: 0082e5a964ff
+Revises: e38df06269cc
+Create Date: 2026-10-18 16:05:12.418203
+
+"""
+
+from collections.abc import Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "0082e5a964ff"
+down_revision: str | None = "e38df06269cc"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # the existing entries are ordered before any new entry, and the existing watermark is
+    # kept with last_xid = 0, so that the entries aggregated already aren't aggregated again
+    op.add_column(
+        "journal",
+        sa.Column("xid", sa.BigInteger(), server_default=sa.text("0"), nullable=False),
+    )
+    op.alter_column(
+        "journal",
+        "xid",
+        server_default=sa.text("pg_current_xact_id()::text::bigint"),
+    )
+    op.create_index("ix_journal_xid", "journal", ["xid", "id"], unique=False)
+    op.add_column(
+        "rollup_watermark",
+        sa.Column("last_xid", sa.BigInteger(), server_default=sa.text("0"), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("rollup_watermark", "last_xid")
+    op.drop_index("ix_journal_xid", table_name="journal")
+    op.drop_column("journal", "xid")
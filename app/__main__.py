@@ -1,70 +1,132 @@
-"""Main entry point."""
+"""Main entry point.
 
+The roles executed by the process can be selected with the --role option, or with PROCESS_ROLES,
+for example:
+
+    python -m app --role api
+    python -m app --role consumer:longrun,consumer:oneshot --role charger
+
+With UVICORN_WORKERS > 1, the api is served by the uvicorn workers, sharing their metrics, while
+the other roles are executed once in a dedicated process, serving its metrics on METRICS_PORT
+if specified.
+"""
+
+import argparse
 import asyncio
 import contextlib
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+from pathlib import Path
 
 import uvicorn
 import uvloop
 
 from app.config import settings
 from app.db.session import database_session_manager
-from app.logger import configure_logging
-from app.task.job_charger.longrun import PeriodicLongrunCharger
-from app.task.job_charger.oneshot import PeriodicOneshotCharger
-from app.task.job_charger.storage import PeriodicStorageCharger
-from app.task.queue_consumer.longrun import LongrunQueueConsumer
-from app.task.queue_consumer.oneshot import OneshotQueueConsumer
-from app.task.queue_consumer.storage import StorageQueueConsumer
+from app.logger import L, configure_logging
+from app.roles import API_ROLE, create_tasks, initialize_database, parse_roles
+from app.task.job_charger.shard import ShardCoordinator
+
+# seconds to wait for the process of the other roles to stop, before terminating it
+STOP_TIMEOUT = 30
+
+
+def _uvicorn_config(**kwargs) -> dict:
+    return {
+        "app": "app.application:app",
+        "host": "0.0.0.0",
+        "port": settings.UVICORN_PORT,
+        "proxy_headers": True,
+        "log_config": None,
+        **kwargs,
+    }
 
 
-async def main() -> None:
-    """Init and run all the async tasks."""
+async def main(roles: frozenset[str]) -> None:
+    """Init and run all the async tasks of the given roles."""
     configure_logging()
-    database_session_manager.initialize(
-        url=settings.DB_URI,
-        pool_size=settings.DB_POOL_SIZE,
-        pool_pre_ping=settings.DB_POOL_PRE_PING,
-        max_overflow=settings.DB_MAX_OVERFLOW,
-    )
-    server = uvicorn.Server(
-        uvicorn.Config(
-            "app.application:app",
-            host="0.0.0.0",
-            port=settings.UVICORN_PORT,
-            proxy_headers=True,
-            log_config=None,
-        )
-    )
-    longrun_consumer = LongrunQueueConsumer(
-        name="longrun-consumer",
-        queue_name=settings.SQS_LONGRUN_QUEUE_NAME,
-        initial_delay=1,
-    )
-    oneshot_consumer = OneshotQueueConsumer(
-        name="oneshot-consumer",
-        queue_name=settings.SQS_ONESHOT_QUEUE_NAME,
-        initial_delay=2,
-    )
-    storage_consumer = StorageQueueConsumer(
-        name="storage-consumer",
-        queue_name=settings.SQS_STORAGE_QUEUE_NAME,
-        initial_delay=3,
-    )
-    longrun_charger = PeriodicLongrunCharger(name="longrun-charger", initial_delay=4)
-    oneshot_charger = PeriodicOneshotCharger(name="oneshot-charger", initial_delay=5)
-    storage_charger = PeriodicStorageCharger(name="storage-charger", initial_delay=6)
+    initialize_database(roles)
+    tasks = create_tasks(roles)
     try:
         async with asyncio.TaskGroup() as tg:
-            tg.create_task(longrun_consumer.run_forever(), name=longrun_consumer.name)
-            tg.create_task(oneshot_consumer.run_forever(), name=oneshot_consumer.name)
-            tg.create_task(storage_consumer.run_forever(), name=storage_consumer.name)
-            tg.create_task(longrun_charger.run_forever(), name=longrun_charger.name)
-            tg.create_task(oneshot_charger.run_forever(), name=oneshot_charger.name)
-            tg.create_task(storage_charger.run_forever(), name=storage_charger.name)
-            tg.create_task(server.serve(), name="uvicorn")
+            for task in tasks:
+                tg.create_task(task.run_forever(), name=task.name)
+            if API_ROLE in roles:
+                server = uvicorn.Server(uvicorn.Config(**_uvicorn_config()))
+                tg.create_task(server.serve(), name="uvicorn")
+            elif settings.METRICS_PORT:
+                config = _uvicorn_config(
+                    app="app.application:metrics_app",
+                    port=settings.METRICS_PORT,
+                    lifespan="off",
+                    access_log=False,
+                )
+                server = uvicorn.Server(uvicorn.Config(**config))
+                tg.create_task(server.serve(), name="metrics")
     finally:
+        for task in tasks:
+            if isinstance(task, ShardCoordinator):
+                with contextlib.suppress(Exception):
+                    await task.release()
         await database_session_manager.close()
 
 
-with contextlib.suppress(KeyboardInterrupt):
-    uvloop.run(main())
+def _run_roles(roles: frozenset[str]) -> None:
+    """Run the given roles until interrupted."""
+    with contextlib.suppress(KeyboardInterrupt):
+        uvloop.run(main(roles))
+
+
+def _run_workers(roles: frozenset[str]) -> None:
+    """Run the api in the uvicorn workers, and the other roles once in a dedicated process."""
+    process = None
+    if other_roles := roles - {API_ROLE}:
+        process = multiprocessing.get_context("fork").Process(
+            target=_run_roles, args=(other_roles,), name="roles"
+        )
+        # started before configuring the logging and any event loop, so that it's safe to fork
+        process.start()
+    # the workers share their metrics through the directory, passed in the environment
+    metrics_dir = settings.METRICS_MULTIPROCESS_DIR or tempfile.mkdtemp(prefix="metrics-")
+    for path in Path(metrics_dir).glob("*.json"):
+        path.unlink()
+    os.environ["METRICS_MULTIPROCESS_DIR"] = metrics_dir
+    # each worker initializes its own database pool in the lifespan of the application
+    configure_logging()
+    try:
+        uvicorn.run(**_uvicorn_config(workers=settings.UVICORN_WORKERS))
+    finally:
+        if not settings.METRICS_MULTIPROCESS_DIR:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+        if process and process.pid and process.is_alive():
+            L.info("Stopping the process of the roles {}", sorted(other_roles))
+            os.kill(process.pid, signal.SIGINT)
+            process.join(STOP_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+
+def run() -> None:
+    """Parse the arguments and run the selected roles."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--role",
+        action="append",
+        help="comma-separated roles, or aliases (all, consumer, charger). Can be repeated.",
+    )
+    args = parser.parse_args()
+    try:
+        roles = parse_roles(args.role or [settings.PROCESS_ROLES])
+    except ValueError as err:
+        parser.error(str(err))
+    if settings.UVICORN_WORKERS > 1 and API_ROLE in roles:
+        _run_workers(roles)
+    else:
+        _run_roles(roles)
+
+
+run()
@@ -4,7 +4,7 @@ from uuid import UUID
 
 from fastapi import APIRouter
 
-from app.dependencies import RepoGroupDep
+from app.dependencies import ReadRepoGroupDep
 from app.schema.api import ApiResponse, ProjBalanceOut, SysBalanceOut, VlabBalanceOut
 from app.service import balance as balance_service
 
@@ -12,7 +12,7 @@ router = APIRouter()
 
 
 @router.get("/system")
-async def get_balance_for_system(repos: RepoGroupDep) -> ApiResponse[SysBalanceOut]:
+async def get_balance_for_system(repos: ReadRepoGroupDep) -> ApiResponse[SysBalanceOut]:
     """Return the balance for thr system."""
     result = await balance_service.get_balance_for_system(repos)
     return ApiResponse[SysBalanceOut](
@@ -23,7 +23,7 @@ async def get_balance_for_system(repos: RepoGroupDep) -> ApiResponse[SysBalanceO
 
 @router.get("/virtual-lab/{vlab_id}", response_model_exclude_defaults=True)
 async def get_balance_for_virtual_lab(
-    repos: RepoGroupDep, *, vlab_id: UUID, include_projects: bool = False
+    repos: ReadRepoGroupDep, *, vlab_id: UUID, include_projects: bool = False
 ) -> ApiResponse[VlabBalanceOut]:
     """Return the balance for a given virtual-lab."""
     result = await balance_service.get_balance_for_vlab(
@@ -37,7 +37,7 @@ async def get_balance_for_virtual_lab(
 
 @router.get("/project/{proj_id}")
 async def get_balance_for_project(
-    repos: RepoGroupDep, proj_id: UUID
+    repos: ReadRepoGroupDep, proj_id: UUID
 ) -> ApiResponse[ProjBalanceOut]:
     """Return the balance for a given project."""
     result = await balance_service.get_balance_for_project(repos, proj_id=proj_id)
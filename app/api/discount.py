@@ -5,7 +5,7 @@ from uuid import UUID
 
 from fastapi import APIRouter, status
 
-from app.dependencies import RepoGroupDep
+from app.dependencies import ReadRepoGroupDep, RepoGroupDep
 from app.errors import ApiError, ApiErrorCode
 from app.schema.api import AddDiscountIn, ApiResponse, Discount
 from app.service import discount
@@ -32,7 +32,7 @@ async def create_discount(
 
 @router.get("/virtual-lab/{vlab_id}", status_code=status.HTTP_200_OK)
 async def get_all_vlab_discounts(
-    repos: RepoGroupDep,
+    repos: ReadRepoGroupDep,
     vlab_id: UUID,
 ) -> ApiResponse[list[Discount]]:
     """Get all discounts for a vlab."""
@@ -47,7 +47,7 @@ async def get_all_vlab_discounts(
 
 @router.get("/virtual-lab/{vlab_id}/current", status_code=status.HTTP_200_OK)
 async def get_current_vlab_discount(
-    repos: RepoGroupDep,
+    repos: ReadRepoGroupDep,
     vlab_id: UUID,
 ) -> ApiResponse[Discount]:
     """Get current discount for a vlab."""
@@ -6,7 +6,7 @@ from fastapi import APIRouter, Query
 from starlette.requests import Request
 
 from app.constants import ServiceSubtype
-from app.dependencies import RepoGroupDep
+from app.dependencies import ReadRepoGroupDep
 from app.schema.api import ApiResponse, LongrunOpenJobOut, PaginatedOut, PaginatedParams
 from app.service import job as job_service
 
@@ -16,7 +16,7 @@ router = APIRouter()
 @router.get("/longrun/open")
 async def get_open_longrun_jobs(
     request: Request,
-    repos: RepoGroupDep,
+    repos: ReadRepoGroupDep,
     subtype: Annotated[ServiceSubtype | None, Query()] = None,
     page: Annotated[int, Query(ge=1)] = 1,
     page_size: Annotated[int, Query(ge=1)] = 1000,
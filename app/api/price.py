@@ -2,8 +2,10 @@
 
 from fastapi import APIRouter, status
 
+from app.cache import price_cache
+from app.config import settings
 from app.dependencies import RepoGroupDep
-from app.schema.api import AddPriceIn, AddPriceOut, ApiResponse
+from app.schema.api import AddPriceIn, AddPriceOut, ApiResponse, PriceCacheStatsOut
 from app.service import price
 
 router = APIRouter()
@@ -20,3 +22,12 @@ async def add_price(
         message="Price added",
         data=AddPriceOut.model_validate(result, from_attributes=True),
     )
+
+
+@router.get("/cache")
+async def get_price_cache_stats() -> ApiResponse[PriceCacheStatsOut]:
+    """Return the statistics of the price cache of the current process."""
+    return ApiResponse[PriceCacheStatsOut](
+        message="Price cache statistics",
+        data=PriceCacheStatsOut(enabled=settings.PRICE_CACHE_ENABLED, **price_cache.get_stats()),
+    )
@@ -4,27 +4,55 @@ from typing import Annotated
 from uuid import UUID
 
 from fastapi import APIRouter, Query
+from pydantic import AwareDatetime
 from starlette.requests import Request
+from starlette.responses import StreamingResponse
 
-from app.dependencies import RepoGroupDep
-from app.schema.api import ApiResponse, JobReportUnionOut, PaginatedOut, PaginatedParams
+from app.constants import ExportFormat, RollupGranularity
+from app.db.session import database_session_manager
+from app.dependencies import ReadRepoGroupDep
+from app.schema.api import (
+    ApiResponse,
+    JobReportUnionOut,
+    PaginatedOut,
+    PaginatedParams,
+    UsageTimeseriesOut,
+)
 from app.service import report as report_service
 
 router = APIRouter()
 
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+CURSOR_DESCRIPTION = (
+    "Opaque cursor returned in the links of the previous page, or empty for the first page. "
+    "If specified, the page is selected after the cursor, and the page number is informative."
+)
+
 
 @router.get("/system", response_model_exclude_defaults=True)
 async def get_jobs_for_system(
     request: Request,
-    repos: RepoGroupDep,
+    repos: ReadRepoGroupDep,
     page: Annotated[int, Query(ge=1)] = 1,
     page_size: Annotated[int, Query(ge=1)] = 1000,
+    *,
+    cursor: Annotated[str | None, Query(description=CURSOR_DESCRIPTION)] = None,
+    include_total: bool = True,
 ) -> ApiResponse[PaginatedOut[JobReportUnionOut]]:
     """Return the job report for a given virtual-lab."""
-    pagination = PaginatedParams(page=page, page_size=page_size)
+    pagination = PaginatedParams(
+        page=page, page_size=page_size, cursor=cursor, include_total=include_total
+    )
     jobs, total_items = await report_service.get_report_for_system(repos, pagination=pagination)
     result = PaginatedOut[JobReportUnionOut].new(
-        items=jobs, total_items=total_items, pagination=pagination, url=request.url
+        items=jobs,
+        total_items=total_items,
+        pagination=pagination,
+        url=request.url,
+        next_cursor=report_service.get_next_cursor(jobs, pagination=pagination),
     )
     return ApiResponse[PaginatedOut[JobReportUnionOut]](
         message="Job report for system",
@@ -35,18 +63,27 @@ async def get_jobs_for_system(
 @router.get("/virtual-lab/{vlab_id}", response_model_exclude_defaults=True)
 async def get_jobs_for_vlab(
     request: Request,
-    repos: RepoGroupDep,
+    repos: ReadRepoGroupDep,
     vlab_id: UUID,
     page: Annotated[int, Query(ge=1)] = 1,
     page_size: Annotated[int, Query(ge=1)] = 1000,
+    *,
+    cursor: Annotated[str | None, Query(description=CURSOR_DESCRIPTION)] = None,
+    include_total: bool = True,
 ) -> ApiResponse[PaginatedOut[JobReportUnionOut]]:
     """Return the job report for a given virtual-lab."""
-    pagination = PaginatedParams(page=page, page_size=page_size)
+    pagination = PaginatedParams(
+        page=page, page_size=page_size, cursor=cursor, include_total=include_total
+    )
     jobs, total_items = await report_service.get_report_for_vlab(
         repos, vlab_id=vlab_id, pagination=pagination
     )
     result = PaginatedOut[JobReportUnionOut].new(
-        items=jobs, total_items=total_items, pagination=pagination, url=request.url
+        items=jobs,
+        total_items=total_items,
+        pagination=pagination,
+        url=request.url,
+        next_cursor=report_service.get_next_cursor(jobs, pagination=pagination),
     )
     return ApiResponse[PaginatedOut[JobReportUnionOut]](
         message=f"Job report for virtual-lab {vlab_id}",
@@ -57,20 +94,106 @@ async def get_jobs_for_vlab(
 @router.get("/project/{proj_id}", response_model_exclude_defaults=True)
 async def get_jobs_for_proj(
     request: Request,
-    repos: RepoGroupDep,
+    repos: ReadRepoGroupDep,
     proj_id: UUID,
     page: Annotated[int, Query(ge=1)] = 1,
     page_size: Annotated[int, Query(ge=1)] = 1000,
+    *,
+    cursor: Annotated[str | None, Query(description=CURSOR_DESCRIPTION)] = None,
+    include_total: bool = True,
 ) -> ApiResponse[PaginatedOut[JobReportUnionOut]]:
     """Return the job report for a given project."""
-    pagination = PaginatedParams(page=page, page_size=page_size)
+    pagination = PaginatedParams(
+        page=page, page_size=page_size, cursor=cursor, include_total=include_total
+    )
     jobs, total_items = await report_service.get_report_for_project(
         repos, proj_id=proj_id, pagination=pagination
     )
     result = PaginatedOut[JobReportUnionOut].new(
-        items=jobs, total_items=total_items, pagination=pagination, url=request.url
+        items=jobs,
+        total_items=total_items,
+        pagination=pagination,
+        url=request.url,
+        next_cursor=report_service.get_next_cursor(jobs, pagination=pagination),
     )
     return ApiResponse[PaginatedOut[JobReportUnionOut]](
         message=f"Job report for project {proj_id}",
         data=result,
     )
+
+
+@router.get("/usage-timeseries")
+async def get_usage_timeseries(
+    repos: ReadRepoGroupDep,
+    granularity: RollupGranularity = RollupGranularity.DAY,
+    vlab_id: UUID | None = None,
+    proj_id: UUID | None = None,
+    after: AwareDatetime | None = None,
+    before: AwareDatetime | None = None,
+) -> ApiResponse[UsageTimeseriesOut]:
+    """Return the amounts and number of the job transactions, aggregated in time buckets.
+
+    The buckets are filtered by virtual-lab and project if specified, and by start datetime.
+    The rollups are refreshed periodically, so the most recent transactions may be missing.
+    The usage quantities aren't included, only the charged amounts and transactions.
+    """
+    items, refreshed_at = await report_service.get_usage_timeseries(
+        repos,
+        granularity=granularity,
+        vlab_id=vlab_id,
+        proj_id=proj_id,
+        after=after,
+        before=before,
+    )
+    return ApiResponse[UsageTimeseriesOut](
+        message="Usage timeseries",
+        data=UsageTimeseriesOut.model_validate(
+            {"granularity": granularity, "refreshed_at": refreshed_at, "items": items}
+        ),
+    )
+
+
+async def _export(
+    export_format: ExportFormat,
+    filename: str,
+    vlab_id: UUID | None = None,
+    proj_id: UUID | None = None,
+) -> StreamingResponse:
+    """Return the response streaming the job report in the given format."""
+    chunks = await report_service.export_report(
+        database_session_manager.read_session,
+        export_format=export_format,
+        vlab_id=vlab_id,
+        proj_id=proj_id,
+    )
+    return StreamingResponse(
+        chunks,
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{export_format}"'},
+    )
+
+
+@router.get("/system/export", response_class=StreamingResponse)
+async def export_jobs_for_system(
+    export_format: Annotated[ExportFormat, Query(alias="format")] = ExportFormat.NDJSON,
+) -> StreamingResponse:
+    """Stream the full job report for the system."""
+    return await _export(export_format, filename="job-report-system")
+
+
+@router.get("/virtual-lab/{vlab_id}/export", response_class=StreamingResponse)
+async def export_jobs_for_vlab(
+    vlab_id: UUID,
+    export_format: Annotated[ExportFormat, Query(alias="format")] = ExportFormat.NDJSON,
+) -> StreamingResponse:
+    """Stream the full job report for a given virtual-lab."""
+    return await _export(export_format, filename=f"job-report-{vlab_id}", vlab_id=vlab_id)
+
+
+@router.get("/project/{proj_id}/export", response_class=StreamingResponse)
+async def export_jobs_for_proj(
+    proj_id: UUID,
+    export_format: Annotated[ExportFormat, Query(alias="format")] = ExportFormat.NDJSON,
+) -> StreamingResponse:
+    """Stream the full job report for a given project."""
+    return await _export(export_format, filename=f"job-report-{proj_id}", proj_id=proj_id)
@@ -1,11 +1,13 @@
 """Base api."""
 
 from fastapi import APIRouter
+from starlette.requests import Request
 from starlette.responses import RedirectResponse, Response
 from starlette.status import HTTP_302_FOUND
 
 from app.config import settings
 from app.errors import ApiError, ApiErrorCode
+from app.metrics import metrics_endpoint
 
 router = APIRouter()
 
@@ -34,6 +36,12 @@ async def version() -> dict:
     }
 
 
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request) -> Response:
+    """Metrics endpoint, in the Prometheus text format."""
+    return await metrics_endpoint(request)
+
+
 @router.get("/error", include_in_schema=False)
 async def error() -> None:
     """Error endpoint to test generic error responses."""
@@ -11,14 +11,20 @@ from fastapi import FastAPI
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.applications import Starlette
 from starlette.requests import Request
 from starlette.responses import Response
+from starlette.routing import Route
 
 from app.api import router
 from app.config import settings
+from app.db.session import database_session_manager
 from app.errors import ApiError, ApiErrorCode
 from app.logger import L
+from app.metrics import metrics, metrics_endpoint
+from app.middleware import MetricsMiddleware, QueryStatsMiddleware
 from app.queue.session import SQSManager
+from app.roles import API_ROLE, create_worker_tasks, initialize_database, run_tasks
 from app.schema.api import ErrorResponse
 
 
@@ -31,6 +37,13 @@ async def lifespan(_: FastAPI) -> AsyncIterator[dict[str, Any]]:
         os.cpu_count(),
         settings.ENVIRONMENT,
     )
+    # the database and the tasks of the workers are initialized here only in the uvicorn workers
+    # started for the api role, while they are initialized in main when running in one process
+    db_owner = not database_session_manager.initialized
+    if db_owner:
+        initialize_database(frozenset({API_ROLE}))
+        metrics.configure_directory(settings.METRICS_MULTIPROCESS_DIR)
+    worker_tasks = create_worker_tasks() if db_owner else []
     sqs_manager = SQSManager()
     sqs_manager.configure(
         queue_names=[
@@ -41,12 +54,15 @@ async def lifespan(_: FastAPI) -> AsyncIterator[dict[str, Any]]:
         client_config=settings.SQS_CLIENT_CONFIG.model_dump(),
     )
     try:
-        async with sqs_manager:
+        async with sqs_manager, run_tasks(worker_tasks):
             yield {"sqs_manager": sqs_manager}
     except asyncio.CancelledError as err:
         # this can happen if the task is cancelled without sending SIGINT
         L.info("Ignored {} in lifespan", err)
     finally:
+        if db_owner:
+            metrics.write(final=True)
+            await database_session_manager.close()
         L.info("Stopping application")
 
 
@@ -102,9 +118,15 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.DB_QUERY_STATS_ENABLED or settings.SERVER_TIMING_ENABLED:
+    app.add_middleware(QueryStatsMiddleware, server_timing=settings.SERVER_TIMING_ENABLED)
+app.add_middleware(MetricsMiddleware)
 app.include_router(
     router,
     responses={
         422: {"description": "Validation Error", "model": ErrorResponse},
     },
 )
+
+# application serving only the metrics, in the processes not executing the api role
+metrics_app = Starlette(routes=[Route("/metrics", metrics_endpoint)])
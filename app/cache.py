@@ -0,0 +1,191 @@
+"""In-process caches."""
+
+import bisect
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Protocol
+from uuid import UUID
+
+from app.config import settings
+from app.constants import ServiceSubtype, ServiceType
+from app.metrics import metrics
+from app.schema.domain import AccountIds, PriceInfo
+
+# channel used to notify the other processes when the prices are modified
+PRICE_CACHE_CHANNEL = "price_cache"
+
+type PriceKey = tuple[UUID | None, ServiceType, ServiceSubtype]
+
+
+class CacheProtocol(Protocol):
+    """Protocol of the caches exposing their statistics as metrics."""
+
+    def get_stats(self) -> dict[str, int]:
+        """Return the cache statistics, including hits, misses and size."""
+
+
+@dataclass(frozen=True, slots=True)
+class PriceHistory:
+    """All the prices for the same vlab, service type and subtype, sorted by valid_from and id."""
+
+    prices: tuple[PriceInfo, ...]
+    valid_from: tuple[datetime, ...]
+    loaded_at: float
+
+    def find(self, usage_datetime: datetime) -> PriceInfo | None:
+        """Return the price valid at usage_datetime, or None if there isn't any.
+
+        If multiple prices are valid, the price with the latest valid_from and id is returned,
+        consistently with PriceRepository.
+        """
+        index = bisect.bisect_right(self.valid_from, usage_datetime)
+        for i in range(index - 1, -1, -1):
+            price = self.prices[i]
+            if price.valid_to is None or price.valid_to > usage_datetime:
+                return price
+        return None
+
+
+class PriceCache:
+    """Cache of the prices, invalidated when any price is added.
+
+    The entries are reloaded also after settings.PRICE_CACHE_TTL seconds, to limit the effects
+    of any invalidation notification lost by the process.
+    """
+
+    def __init__(self) -> None:
+        """Init the cache."""
+        self._entries: dict[PriceKey, PriceHistory] = {}
+        # incremented at each invalidation, to discard the entries loaded concurrently
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        """Current generation of the cache."""
+        return self._generation
+
+    def get(self, key: PriceKey) -> PriceHistory | None:
+        """Return the cached prices for the given key, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry.loaded_at > settings.PRICE_CACHE_TTL:
+            self._misses += 1
+            return None
+        self._hits += 1
+        return entry
+
+    def set(self, key: PriceKey, prices: Iterable[PriceInfo], generation: int) -> PriceHistory:
+        """Cache and return the prices for the given key.
+
+        Args:
+            key: tuple (vlab_id, service_type, service_subtype).
+            prices: all the prices for the given key, sorted by valid_from and id.
+            generation: generation of the cache before loading the prices. If the cache has been
+                invalidated in the meantime, the prices are returned but not cached.
+        """
+        prices = tuple(prices)
+        entry = PriceHistory(
+            prices=prices,
+            valid_from=tuple(price.valid_from for price in prices),
+            loaded_at=time.monotonic(),
+        )
+        if generation == self._generation:
+            self._entries[key] = entry
+        return entry
+
+    def clear(self) -> None:
+        """Invalidate all the cached prices."""
+        self._entries.clear()
+        self._generation += 1
+        self._invalidations += 1
+
+    def reset_stats(self) -> None:
+        """Reset the cache statistics."""
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def get_stats(self) -> dict[str, int]:
+        """Return the cache statistics."""
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "invalidations": self._invalidations,
+            "size": len(self._entries),
+        }
+
+
+price_cache = PriceCache()
+
+
+class AccountIdsCache:
+    """Cache of the ids of the accounts related to each project.
+
+    The hierarchy of the accounts never changes once created, so the entries are never
+    invalidated, but they are reloaded after settings.ACCOUNT_IDS_CACHE_TTL seconds, to take
+    into account the accounts that may have been disabled. Until then, the ids of the disabled
+    accounts are still returned, and the transactions are rejected by the ledger, which updates
+    only the balance of the enabled accounts after locking them.
+    """
+
+    def __init__(self) -> None:
+        """Init the cache."""
+        self._entries: dict[UUID, tuple[AccountIds, float]] = {}
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, proj_id: UUID) -> AccountIds | None:
+        """Return the cached ids for the given project, or None if missing or expired."""
+        entry = self._entries.get(proj_id)
+        if entry is None or time.monotonic() - entry[1] > settings.ACCOUNT_IDS_CACHE_TTL:
+            self._misses += 1
+            return None
+        self._hits += 1
+        return entry[0]
+
+    def set(self, proj_id: UUID, account_ids: AccountIds) -> None:
+        """Cache the ids for the given project."""
+        self._entries[proj_id] = (account_ids, time.monotonic())
+
+    def clear(self) -> None:
+        """Remove all the cached ids."""
+        self._entries.clear()
+
+    def reset_stats(self) -> None:
+        """Reset the cache statistics."""
+        self._hits = 0
+        self._misses = 0
+
+    def get_stats(self) -> dict[str, int]:
+        """Return the cache statistics."""
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "size": len(self._entries),
+        }
+
+
+account_ids_cache = AccountIdsCache()
+
+_caches: dict[str, CacheProtocol] = {"price": price_cache, "account_ids": account_ids_cache}
+metrics.callback(
+    "cache_lookups_total",
+    "Number of lookups in the in-process caches, by result.",
+    ("cache", "result"),
+    lambda: (
+        ((name, result), cache.get_stats()[key])
+        for name, cache in _caches.items()
+        for result, key in (("hit", "hits"), ("miss", "misses"))
+    ),
+    kind="counter",
+)
+metrics.callback(
+    "cache_entries",
+    "Number of entries in the in-process caches.",
+    ("cache",),
+    lambda: (((name,), cache.get_stats()["size"]) for name, cache in _caches.items()),
+)
@@ -6,6 +6,8 @@ from pydantic import BaseModel, PostgresDsn, field_validator
 from pydantic_core.core_schema import ValidationInfo
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from app.constants import EventBodyStorage
+
 
 class SQSClientConfig(BaseModel):
     """SQSClientConfig.
@@ -34,6 +36,22 @@ class Settings(BaseSettings):
     COMMIT_SHA: str | None = None
 
     UVICORN_PORT: int = 8000
+    # number of uvicorn worker processes serving the api. If greater than 1, the other roles are
+    # executed once in a dedicated process, and the metrics of the workers are shared through
+    # METRICS_MULTIPROCESS_DIR, so that /metrics returns the sum of all the workers
+    UVICORN_WORKERS: int = 1
+    # directory where the workers write their metrics, emptied at startup. If not specified with
+    # multiple workers, a temporary directory is created
+    METRICS_MULTIPROCESS_DIR: str = ""
+    # seconds between the writes of the metrics of each worker to METRICS_MULTIPROCESS_DIR
+    METRICS_WRITE_INTERVAL: float = 5
+    # port serving the metrics in the processes not executing the api role, if specified.
+    # The api role serves the metrics at /metrics
+    METRICS_PORT: int | None = None
+    # comma-separated roles executed by the process when not specified in the command line:
+    # api, consumer:<longrun|oneshot|storage>, charger:<longrun|oneshot|storage|finished|
+    # system-balance>, or the aliases all, consumer, charger
+    PROCESS_ROLES: str = "all"
 
     ROOT_PATH: str = ""
 
@@ -59,6 +77,8 @@ class Settings(BaseSettings):
     CHARGE_STORAGE_ERROR_SLEEP: float = 60
     CHARGE_STORAGE_MIN_CHARGING_INTERVAL: float = 3600
     CHARGE_STORAGE_MIN_CHARGING_AMOUNT: Decimal = Decimal("0.000001")
+    # maximum number of jobs charged concurrently, partitioned by project (see DB_POOL_SIZE)
+    CHARGE_STORAGE_CONCURRENCY: int = 1
 
     CHARGE_LONGRUN_LOOP_SLEEP: float = 600
     CHARGE_LONGRUN_ERROR_SLEEP: float = 60
@@ -66,16 +86,92 @@ class Settings(BaseSettings):
     CHARGE_LONGRUN_MIN_CHARGING_AMOUNT: Decimal = Decimal("0.000001")
     # time since last_alive_at, after which the job is considered expired
     CHARGE_LONGRUN_EXPIRATION_INTERVAL: float = 3600
+    # if True, prefetch accounts, prices, discounts and reservations for each chunk of jobs
+    CHARGE_LONGRUN_BULK_MODE: bool = False
+    # number of jobs prefetched at once in bulk mode, or selected at once in due-only mode
+    CHARGE_LONGRUN_BULK_CHUNK_SIZE: int = 1000
+    # if True, select only the jobs with job.next_charge_due_at in the past
+    CHARGE_LONGRUN_DUE_ONLY: bool = False
+    # maximum number of jobs charged concurrently, partitioned by project (see DB_POOL_SIZE)
+    CHARGE_LONGRUN_CONCURRENCY: int = 1
+
+    # if True, the periodic chargers of each replica charge only the jobs of the projects in the
+    # hash slots leased by the replica, and the slots are rebalanced when replicas come and go
+    CHARGER_SHARDING_ENABLED: bool = False
+    # total number of hash slots, it should be greater than the number of replicas
+    CHARGER_SHARDING_SLOTS: int = 64
+    # seconds after which the leases of a replica expire if not renewed
+    CHARGER_SHARDING_LEASE_TTL: float = 60
+    CHARGER_SHARDING_RENEW_INTERVAL: float = 10
+    CHARGER_SHARDING_ERROR_SLEEP: float = 5
 
     CHARGE_ONESHOT_LOOP_SLEEP: float = 600
     CHARGE_ONESHOT_ERROR_SLEEP: float = 60
+    # maximum number of jobs charged concurrently, partitioned by project (see DB_POOL_SIZE)
+    CHARGE_ONESHOT_CONCURRENCY: int = 1
+
+    # maximum number of seconds before reloading the cached ids of the accounts of a project
+    ACCOUNT_IDS_CACHE_TTL: float = 3600
+
+    # if True, cache the prices in memory, and invalidate them when any price is added
+    PRICE_CACHE_ENABLED: bool = False
+    # maximum number of seconds before reloading the cached prices. Each process, including each
+    # uvicorn worker, listens for the invalidations, and uses the prices cached before a price is
+    # added until the notification is received, or up to PRICE_CACHE_TTL if it's lost while the
+    # listener is disconnected
+    PRICE_CACHE_TTL: float = 300
+    # seconds to wait before listening again for the invalidation notifications
+    PRICE_CACHE_LISTENER_LOOP_SLEEP: float = 1
+    PRICE_CACHE_LISTENER_ERROR_SLEEP: float = 10
+
+    # if True, the consumers notify the finished oneshot and longrun jobs, and they are charged
+    # immediately, while the periodic chargers still charge any job not notified
+    CHARGE_FINISHED_ON_EVENT: bool = False
+    # seconds to wait after the first notification, to charge more finished jobs together
+    CHARGE_FINISHED_DELAY: float = 0.1
+    CHARGE_FINISHED_LOOP_SLEEP: float = 1
+    CHARGE_FINISHED_ERROR_SLEEP: float = 10
 
     SQS_STORAGE_QUEUE_NAME: str = "storage.fifo"
     SQS_ONESHOT_QUEUE_NAME: str = "oneshot.fifo"
     SQS_LONGRUN_QUEUE_NAME: str = "longrun.fifo"
     SQS_CLIENT_ERROR_SLEEP: float = 10
+    # maximum number of messages received at once by the consumers (1 to 10)
+    SQS_MAX_NUMBER_OF_MESSAGES: int = 10
+    # maximum number of message groups processed concurrently by each consumer
+    SQS_MAX_CONCURRENCY: int = 4
+    # number of processed messages triggering a batch deletion (1 to 10)
+    SQS_DELETE_BATCH_SIZE: int = 10
+    # maximum number of seconds before deleting the processed messages
+    SQS_DELETE_FLUSH_INTERVAL: float = 1
+    SQS_DELETE_MAX_RETRIES: int = 3
     SQS_CLIENT_CONFIG: SQSClientConfig = SQSClientConfig()
 
+    # how the body of the completed events is stored (failed events are always stored in full)
+    EVENT_BODY_STORAGE: EventBodyStorage = EventBodyStorage.FULL
+    # maximum number of characters stored when the body is truncated
+    EVENT_BODY_MAX_LENGTH: int = 1000
+
+    # if True, insert the ledger transactions and update the balance with a single statement
+    LEDGER_SINGLE_STATEMENT_POSTING: bool = False
+    # if True, the balance of the system account isn't locked and updated by each transaction,
+    # but the changes are stored in system_balance_delta and folded periodically
+    LEDGER_DEFERRED_SYSTEM_BALANCE: bool = False
+    SYSTEM_BALANCE_FOLD_LOOP_SLEEP: float = 10
+    SYSTEM_BALANCE_FOLD_ERROR_SLEEP: float = 60
+    # if True, the job reports read the amounts from job_cost_summary instead of the ledger.
+    # To be enabled after populating the summaries with scripts/backfill_cost_summaries.py
+    REPORT_FROM_COST_SUMMARY: bool = False
+    # number of rows fetched from the database and serialized together in the exported reports
+    REPORT_EXPORT_BATCH_SIZE: int = 1000
+    # if True, the chargers maintain hourly and daily rollups of the job transactions,
+    # used by the usage timeseries
+    USAGE_ROLLUP_ENABLED: bool = False
+    # maximum number of journal ids aggregated by each refresh of the rollups
+    USAGE_ROLLUP_BATCH_SIZE: int = 10000
+    USAGE_ROLLUP_LOOP_SLEEP: float = 60
+    USAGE_ROLLUP_ERROR_SLEEP: float = 60
+
     DB_ENGINE: str = "postgresql+asyncpg"
     DB_USER: str = "accounting_service"
     DB_PASS: str = "accounting_service"  # noqa: S105
@@ -84,9 +180,40 @@ class Settings(BaseSettings):
     DB_NAME: str = "accounting_service"
     DB_URI: str = ""
 
+    # size of the pool when the process runs all the roles
     DB_POOL_SIZE: int = 30
+    # size of the pool for each role, summed when the process doesn't run all the roles
+    DB_POOL_SIZE_API: int = 20
+    DB_POOL_SIZE_CONSUMER: int = 5
+    DB_POOL_SIZE_CHARGER: int = 5
+    # use separate pools for the api, the consumers, and the chargers, sized with DB_POOL_SIZE_*,
+    # so that a burst of one workload cannot starve the others
+    DB_POOLS_ENABLED: bool = False
+    # size of the default pool when the separate pools are enabled, used by the other tasks
+    DB_POOL_SIZE_DEFAULT: int = 2
+    # seconds to wait for a connection from each pool before raising an error
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_TIMEOUT_API: float = 10
+    DB_POOL_TIMEOUT_CONSUMER: float = 30
+    DB_POOL_TIMEOUT_CHARGER: float = 30
+    # url of an optional read-only replica, used by the read-only endpoints of the api
+    DB_REPLICA_URI: str = ""
+    DB_POOL_SIZE_REPLICA: int = 10
+    # seconds of replication lag above which the read-only endpoints use the primary
+    DB_REPLICA_MAX_LAG: float = 5
+    # seconds between the checks of the replication lag
+    DB_REPLICA_LAG_CHECK_INTERVAL: float = 5
+    # maximum seconds to wait for the replication lag, before using the primary until next check
+    DB_REPLICA_LAG_CHECK_TIMEOUT: float = 1
     DB_POOL_PRE_PING: bool = True
     DB_MAX_OVERFLOW: int = 0
+    # if True, log the number of statements and the database time of each api request,
+    # consumed message, charged job, and loop of the periodic tasks
+    DB_QUERY_STATS_ENABLED: bool = False
+    # minimum seconds for a statement to be logged as slow, with the parameters redacted
+    DB_SLOW_QUERY_THRESHOLD: float | None = None
+    # if True, add the Server-Timing header with the database time to the api responses
+    SERVER_TIMING_ENABLED: bool = False
 
     @field_validator("DB_URI", mode="before")
     @classmethod
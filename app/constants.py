@@ -17,6 +17,38 @@ class EventStatus(HyphenStrEnum):
     FAILED = auto()
 
 
+class EventBodyStorage(HyphenStrEnum):
+    """Storage of the body of the completed events."""
+
+    FULL = auto()
+    TRUNCATED = auto()
+    COMPRESSED = auto()
+
+
+class DatabasePool(HyphenStrEnum):
+    """Database connection pool, separated by workload."""
+
+    DEFAULT = auto()
+    API = auto()
+    CONSUMER = auto()
+    CHARGER = auto()
+    REPLICA = auto()
+
+
+class ExportFormat(HyphenStrEnum):
+    """Format of the exported reports."""
+
+    NDJSON = auto()
+    CSV = auto()
+
+
+class RollupGranularity(HyphenStrEnum):
+    """Size of the time buckets of the usage rollups."""
+
+    HOUR = auto()
+    DAY = auto()
+
+
 class ServiceType(HyphenStrEnum):
     """Service Type."""
 
@@ -0,0 +1,127 @@
+"""Instrumentation of the database statements."""
+
+import re
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, ExceptionContext
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+from app.logger import L
+
+# key of the connection info, where the start times of the running statements are stored
+_START_TIMES_KEY = "statement_start_times"
+# string literals in the statements, redacted in the log of the slow statements
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+# maximum number of characters of the slow statements included in the log
+SLOW_STATEMENT_MAX_LENGTH = 2000
+
+
+@dataclass(kw_only=True)
+class QueryStats:
+    """Number of statements executed, and seconds spent executing them."""
+
+    statements: int = 0
+    duration: float = 0.0
+
+    def as_extra(self) -> dict[str, Any]:
+        """Return the statistics to be bound to the log records."""
+        return {"db_statements": self.statements, "db_time_ms": round(self.duration * 1000, 3)}
+
+
+_current_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def get_query_stats() -> QueryStats | None:
+    """Return the statistics of the current context, or None if not tracked."""
+    return _current_stats.get()
+
+
+@contextmanager
+def track_queries(name: str, **extra: Any) -> Iterator[QueryStats]:
+    """Count the statements executed in the context, including the tasks created in it.
+
+    The statistics are added to the statistics of the enclosing context, if any, and they are
+    logged at the end if DB_QUERY_STATS_ENABLED is set.
+
+    Args:
+        name: description of the work done in the context, included in the log.
+        extra: additional parameters bound to the log record.
+    """
+    parent = _current_stats.get()
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+        if parent is not None:
+            parent.statements += stats.statements
+            parent.duration += stats.duration
+        if settings.DB_QUERY_STATS_ENABLED:
+            L.bind(**extra, **stats.as_extra()).info(
+                "Executed {} statements in {:.1f}ms for {}",
+                stats.statements,
+                stats.duration * 1000,
+                name,
+            )
+
+
+def redact_statement(statement: str) -> str:
+    """Return the statement with the string literals redacted, truncated if too long."""
+    redacted = _STRING_LITERAL.sub("'?'", statement)
+    if len(redacted) > SLOW_STATEMENT_MAX_LENGTH:
+        return redacted[:SLOW_STATEMENT_MAX_LENGTH] + "..."
+    return redacted
+
+
+def _before_cursor_execute(conn: Connection, *args: Any) -> None:  # noqa: ARG001
+    conn.info.setdefault(_START_TIMES_KEY, []).append(time.perf_counter())
+
+
+def _handle_error(context: ExceptionContext) -> None:
+    if context.connection is not None and (
+        start_times := context.connection.info.get(_START_TIMES_KEY)
+    ):
+        start_times.pop()
+
+
+def instrument_engine(engine: AsyncEngine, slow_query_threshold: float | None = None) -> None:
+    """Count the statements executed by the engine, and log the slow ones.
+
+    Args:
+        engine: engine to be instrumented.
+        slow_query_threshold: minimum seconds for a statement to be logged as slow, or None to
+            disable the log. The parameters and the string literals aren't logged.
+    """
+
+    def _after_cursor_execute(
+        conn: Connection,
+        _cursor: Any,
+        statement: str,
+        parameters: Any,
+        _context: Any,
+        executemany: bool,  # noqa: FBT001
+    ) -> None:
+        elapsed = time.perf_counter() - conn.info[_START_TIMES_KEY].pop()
+        if (stats := _current_stats.get()) is not None:
+            stats.statements += 1
+            stats.duration += elapsed
+        if slow_query_threshold is not None and elapsed >= slow_query_threshold:
+            L.warning(
+                "Slow statement in {:.1f}ms [{} parameters redacted{}]: {}",
+                elapsed * 1000,
+                len(parameters) if parameters else 0,
+                ", executemany" if executemany else "",
+                redact_statement(statement),
+            )
+
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", _handle_error)
@@ -18,7 +18,14 @@ from sqlalchemy import (
 )
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
-from app.constants import AccountType, EventStatus, ServiceSubtype, ServiceType, TransactionType
+from app.constants import (
+    AccountType,
+    EventStatus,
+    RollupGranularity,
+    ServiceSubtype,
+    ServiceType,
+    TransactionType,
+)
 from app.db.types import BIGINT, CREATED_AT, JSON_DICT, UPDATED_AT
 
 
@@ -81,6 +88,10 @@ class Job(Base):
     cancelled_at: Mapped[datetime | None]
     reservation_params: Mapped[JSON_DICT] = mapped_column(server_default="{}")
     usage_params: Mapped[JSON_DICT] = mapped_column(server_default="{}")
+    # maintained by the ledger postings, it must be equal to the sum of the RSV ledger rows
+    remaining_reservation: Mapped[Decimal] = mapped_column(server_default=text("0"))
+    # maintained by the job repository for the started longrun jobs, null if nothing is due
+    next_charge_due_at: Mapped[datetime | None]
 
 
 class Account(Base):
@@ -110,6 +121,8 @@ class Journal(Base):
     price_id: Mapped[BIGINT | None] = mapped_column(ForeignKey("price.id"), index=True)
     discount_id: Mapped[BIGINT | None] = mapped_column(ForeignKey("discount.id"), index=True)
     properties: Mapped[JSON_DICT | None]
+    # id of the transaction inserting the entry, used to aggregate only the committed entries
+    xid: Mapped[BIGINT] = mapped_column(server_default=text("pg_current_xact_id()::text::bigint"))
     created_at: Mapped[CREATED_AT]
 
 
@@ -125,6 +138,92 @@ class Ledger(Base):
     created_at: Mapped[CREATED_AT]
 
 
+class SystemBalanceDelta(Base):
+    """Pending changes to the balance of the system account.
+
+    Used only when the balance of the system account is updated in deferred mode.
+    """
+
+    __tablename__ = "system_balance_delta"
+
+    id: Mapped[BIGINT] = mapped_column(Identity(always=True), primary_key=True)
+    account_id: Mapped[UUID] = mapped_column(ForeignKey("account.id"), index=True)
+    amount: Mapped[Decimal]
+    created_at: Mapped[CREATED_AT]
+
+
+class JobCostSummary(Base):
+    """Amounts posted to the ledger for each job, maintained by the ledger postings.
+
+    The amounts are the sum of the transactions of each type, while amount is the net amount
+    debited from the project account, as shown in the job reports.
+    """
+
+    __tablename__ = "job_cost_summary"
+
+    job_id: Mapped[UUID] = mapped_column(ForeignKey("job.id"), primary_key=True)
+    amount: Mapped[Decimal] = mapped_column(server_default=text("0"))
+    charged: Mapped[Decimal] = mapped_column(server_default=text("0"))
+    reserved: Mapped[Decimal] = mapped_column(server_default=text("0"))
+    released: Mapped[Decimal] = mapped_column(server_default=text("0"))
+    refunded: Mapped[Decimal] = mapped_column(server_default=text("0"))
+    last_posting_at: Mapped[datetime | None]
+
+
+class UsageRollup(Base):
+    """Amounts and number of the job transactions, aggregated in time buckets.
+
+    The rows are maintained incrementally from the journal, up to the journal id stored in
+    rollup_watermark, and the buckets are calculated from the transaction datetime in UTC.
+
+    The usage quantities (count, duration, size) aren't aggregated, because the journal
+    doesn't record the usage charged by each transaction, and a charge can be split into
+    transactions debiting the reservation and the project.
+    """
+
+    __tablename__ = "usage_rollup"
+
+    vlab_id: Mapped[UUID] = mapped_column(primary_key=True)
+    granularity: Mapped[RollupGranularity] = mapped_column(primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(primary_key=True)
+    proj_id: Mapped[UUID] = mapped_column(primary_key=True)
+    service_type: Mapped[ServiceType] = mapped_column(primary_key=True)
+    service_subtype: Mapped[ServiceSubtype] = mapped_column(primary_key=True)
+    transaction_type: Mapped[TransactionType] = mapped_column(primary_key=True)
+    amount: Mapped[Decimal] = mapped_column(server_default=text("0"))
+    transactions: Mapped[int] = mapped_column(server_default=text("0"))
+
+
+class RollupWatermark(Base):
+    """Last journal entry aggregated into each rollup, in order of transaction id and id."""
+
+    __tablename__ = "rollup_watermark"
+
+    name: Mapped[str] = mapped_column(primary_key=True)
+    last_xid: Mapped[BIGINT] = mapped_column(server_default=text("0"))
+    last_journal_id: Mapped[BIGINT] = mapped_column(server_default=text("0"))
+    updated_at: Mapped[UPDATED_AT]
+
+
+class ChargerMember(Base):
+    """Charger replicas participating in the assignment of the charger leases."""
+
+    __tablename__ = "charger_member"
+
+    id: Mapped[str] = mapped_column(primary_key=True)
+    expires_at: Mapped[datetime]
+
+
+class ChargerLease(Base):
+    """Hash slots of the projects, leased to the charger replicas."""
+
+    __tablename__ = "charger_lease"
+
+    slot: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
+    owner: Mapped[str | None]
+    expires_at: Mapped[datetime | None]
+
+
 class Price(Base):
     """Price table."""
 
@@ -175,3 +274,43 @@ Index(
     unique=True,
     postgresql_where=Account.account_type == AccountType.SYS,
 )
+Index(
+    "ix_job_next_charge_due_at",
+    Job.next_charge_due_at,
+    Job.id,
+    postgresql_where=Job.next_charge_due_at.is_not(None),
+)
+# used by the keyset pagination of the job reports, for the system, virtual-labs and projects
+Index(
+    "ix_job_report",
+    Job.started_at.desc(),
+    Job.id,
+    postgresql_where=Job.finished_at == Job.last_charged_at,
+)
+Index(
+    "ix_job_report_vlab_id",
+    Job.vlab_id,
+    Job.started_at.desc(),
+    Job.id,
+    postgresql_where=Job.finished_at == Job.last_charged_at,
+)
+Index(
+    "ix_job_report_proj_id",
+    Job.proj_id,
+    Job.started_at.desc(),
+    Job.id,
+    postgresql_where=Job.finished_at == Job.last_charged_at,
+)
+# used by the refresh of the usage rollups
+Index(
+    "ix_journal_xid",
+    Journal.xid,
+    Journal.id,
+)
+# used by the usage timeseries of the projects, while the virtual-labs use the primary key
+Index(
+    "ix_usage_rollup_proj_id",
+    UsageRollup.proj_id,
+    UsageRollup.granularity,
+    UsageRollup.bucket_start,
+)
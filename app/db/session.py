@@ -1,14 +1,91 @@
 """Database session utils."""
 
-from collections.abc import AsyncIterator, Callable
+import asyncio
+import math
+import time
+from collections.abc import AsyncIterator, Callable, Mapping
 from contextlib import AbstractAsyncContextManager, asynccontextmanager
+from dataclasses import asdict, dataclass
+from functools import partial
+from typing import Any, cast
 
-from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+import sqlalchemy as sa
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, PoolProxiedConnection
 
+from app.constants import DatabasePool
+from app.db.instrumentation import instrument_engine
 from app.logger import L
+from app.metrics import metrics
 
 SessionFactory = Callable[[], AbstractAsyncContextManager[AsyncSession]]
 
+# replication lag in seconds, or 0 when the replica has replayed everything it received
+REPLICA_LAG_QUERY = sa.text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() IS DISTINCT FROM pg_last_wal_replay_lsn()
+        THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        ELSE 0
+    END
+""")
+
+
+POOL_CHECKOUT_DURATION = metrics.histogram(
+    "db_pool_checkout_duration_seconds",
+    "Time spent waiting to check out a connection from the pool.",
+    ("pool",),
+)
+POOL_CHECKOUT_TIMEOUTS = metrics.counter(
+    "db_pool_checkout_timeouts_total",
+    "Number of timeouts while waiting to check out a connection from the pool.",
+    ("pool",),
+)
+
+
+@dataclass(kw_only=True)
+class PoolStats:
+    """Statistics of the connections checked out from a pool."""
+
+    checkouts: int = 0
+    timeouts: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool collecting the time spent waiting to check out the connections."""
+
+    def __init__(self, *args, **kwargs) -> None:
+        """Init the pool."""
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        # labels of the metrics, set to the name of the pool by the manager
+        self.metric_labels: tuple[str] = (DatabasePool.DEFAULT,)
+
+    def recreate(self) -> "TimedQueuePool":
+        """Return a new pool with the same parameters, keeping the statistics."""
+        pool = cast("TimedQueuePool", super().recreate())
+        pool.stats = self.stats
+        pool.metric_labels = self.metric_labels
+        return pool
+
+    def connect(self) -> PoolProxiedConnection:
+        """Check out a connection, measuring the time spent waiting for it."""
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            POOL_CHECKOUT_TIMEOUTS.inc(self.metric_labels)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.checkouts += 1
+            self.stats.wait_total += elapsed
+            self.stats.wait_max = max(self.stats.wait_max, elapsed)
+            POOL_CHECKOUT_DURATION.observe(elapsed, self.metric_labels)
+
 
 class DatabaseSessionManager:
     """DatabaseSessionManager."""
@@ -16,32 +93,161 @@ class DatabaseSessionManager:
     def __init__(self) -> None:
         """Init the manager."""
         self._engine: AsyncEngine | None = None
+        self._engines: dict[str, AsyncEngine] = {}
+        self._replica_max_lag = 0.0
+        self._replica_check_interval = 0.0
+        self._replica_check_timeout = 0.0
+        self._replica_checked_at = -math.inf
+        self._replica_lag: float | None = None
+        self._read_sessions = {"replica": 0, "fallback": 0}
+
+    @property
+    def initialized(self) -> bool:
+        """Whether the database engine has been initialized."""
+        return self._engine is not None
 
-    def initialize(self, url: str, **kwargs) -> None:
-        """Initialize the database engine."""
+    def initialize(
+        self,
+        url: str,
+        pools: Mapping[str, Mapping[str, Any]] | None = None,
+        replica_max_lag: float = 5,
+        replica_check_interval: float = 5,
+        replica_check_timeout: float = 1,
+        *,
+        instrument_queries: bool = False,
+        slow_query_threshold: float | None = None,
+        **kwargs,
+    ) -> None:
+        """Initialize the database engines.
+
+        Args:
+            url: database url.
+            pools: parameters of the named pools, each one with a separate engine, overriding
+                the parameters of the default pool, and optionally the url. The pools not
+                specified use the default pool.
+            replica_max_lag: replication lag in seconds, above which the replica isn't used.
+            replica_check_interval: seconds between the checks of the replication lag.
+            replica_check_timeout: maximum seconds to wait for the replication lag, including
+                the checkout of the connection, before using the primary.
+            instrument_queries: if True, count the statements executed in each tracked context.
+            slow_query_threshold: minimum seconds for a statement to be logged as slow, or None.
+                It's used only if instrument_queries is True.
+            kwargs: parameters of the default pool.
+        """
         if self._engine:
             err = "DB engine already initialized"
             raise RuntimeError(err)
+        kwargs = {"poolclass": TimedQueuePool, **kwargs}
         self._engine = create_async_engine(url, **kwargs)
-        L.info("DB engine has been initialized")
+        self._engines = {DatabasePool.DEFAULT: self._engine}
+        for name, params in (pools or {}).items():
+            pool_url = params.get("url", url)
+            pool_kwargs = {key: value for key, value in params.items() if key != "url"}
+            self._engines[name] = create_async_engine(pool_url, **{**kwargs, **pool_kwargs})
+        for name, engine in self._engines.items():
+            if isinstance(engine.pool, TimedQueuePool):
+                engine.pool.metric_labels = (name,)
+            if instrument_queries:
+                instrument_engine(engine, slow_query_threshold=slow_query_threshold)
+        self._replica_max_lag = replica_max_lag
+        self._replica_check_interval = replica_check_interval
+        self._replica_check_timeout = replica_check_timeout
+        self._replica_checked_at = -math.inf
+        L.info("DB engine has been initialized with pools: {}", list(self._engines))
 
     async def close(self) -> None:
-        """Shut down the database engine."""
+        """Shut down the database engines."""
         if not self._engine:
             err = "DB engine not initialized"
             raise RuntimeError(err)
-        await self._engine.dispose()
+        for engine in self._engines.values():
+            await engine.dispose()
         self._engine = None
+        self._engines = {}
         L.info("DB engine has been closed")
 
-    @asynccontextmanager
-    async def session(self) -> AsyncIterator[AsyncSession]:
-        """Yield a new database session."""
+    def _get_engine(self, pool: str) -> AsyncEngine:
+        """Return the engine of the given pool, or the default engine if not configured."""
         if not self._engine:
             err = "DB engine not initialized"
             raise RuntimeError(err)
+        return self._engines.get(pool, self._engine)
+
+    def get_pool_stats(self) -> dict[str, dict[str, Any]]:
+        """Return the statistics of each pool."""
+        result = {}
+        for name, engine in self._engines.items():
+            pool = engine.pool
+            if isinstance(pool, TimedQueuePool):
+                result[name] = {
+                    "size": pool.size(),
+                    "checked_out": pool.checkedout(),
+                    "overflow": pool.overflow(),
+                    **asdict(pool.stats),
+                }
+        return result
+
+    def reset_pool_stats(self) -> None:
+        """Reset the statistics of each pool."""
+        for engine in self._engines.values():
+            if isinstance(engine.pool, TimedQueuePool):
+                engine.pool.stats = PoolStats()
+
+    async def _is_replica_available(self) -> bool:
+        """Return True if the replica is configured and its lag doesn't exceed the threshold.
+
+        The lag is checked at most once per interval, and the replica is considered unavailable
+        until the next check if the lag cannot be retrieved within the timeout. The requests
+        received while the lag is being checked use the result of the previous check.
+        """
+        engine = self._engines.get(DatabasePool.REPLICA)
+        if engine is None:
+            return False
+        now = time.monotonic()
+        if now - self._replica_checked_at >= self._replica_check_interval:
+            self._replica_checked_at = now
+            try:
+                async with asyncio.timeout(self._replica_check_timeout), engine.connect() as conn:
+                    self._replica_lag = float((await conn.execute(REPLICA_LAG_QUERY)).scalar_one())
+            # TimeoutError is a subclass of OSError
+            except (exc.SQLAlchemyError, OSError) as err:
+                L.warning("Unable to check the replication lag: {!r}", err)
+                self._replica_lag = None
+            if self._replica_lag is not None and self._replica_lag > self._replica_max_lag:
+                L.warning("Replication lag is {:.1f}s, using the primary", self._replica_lag)
+        return self._replica_lag is not None and self._replica_lag <= self._replica_max_lag
+
+    def get_replica_stats(self) -> dict[str, Any]:
+        """Return the last replication lag, and the number of read sessions by database."""
+        return {"lag": self._replica_lag, **self._read_sessions}
+
+    @asynccontextmanager
+    async def read_session(
+        self, fallback_pool: str = DatabasePool.API
+    ) -> AsyncIterator[AsyncSession]:
+        """Yield a new database session for read-only queries.
+
+        The session uses the replica if it's available, or the fallback pool otherwise.
+        """
+        if await self._is_replica_available():
+            pool, kind = DatabasePool.REPLICA, "replica"
+        else:
+            pool, kind = fallback_pool, "fallback"
+        self._read_sessions[kind] += 1
+        async with self.session(pool) as session:
+            yield session
+
+    @asynccontextmanager
+    async def connection(self, pool: str = DatabasePool.DEFAULT) -> AsyncIterator[AsyncConnection]:
+        """Yield a new database connection from the given pool, not bound to any session."""
+        async with self._get_engine(pool).connect() as connection:
+            yield connection
+
+    @asynccontextmanager
+    async def session(self, pool: str = DatabasePool.DEFAULT) -> AsyncIterator[AsyncSession]:
+        """Yield a new database session using the given pool."""
         async with AsyncSession(
-            self._engine,
+            self._get_engine(pool),
             expire_on_commit=False,
             autocommit=False,
             autoflush=False,
@@ -54,5 +260,36 @@ class DatabaseSessionManager:
             else:
                 await session.commit()
 
+    def session_factory(self, pool: str) -> SessionFactory:
+        """Return a factory of database sessions using the given pool."""
+        return partial(self.session, pool)
+
 
 database_session_manager = DatabaseSessionManager()
+
+metrics.callback(
+    "db_pool_connections",
+    "Number of connections of the pool, by state.",
+    ("pool", "state"),
+    lambda: (
+        ((pool, state), stats[state])
+        for pool, stats in database_session_manager.get_pool_stats().items()
+        for state in ("size", "checked_out", "overflow")
+    ),
+)
+metrics.callback(
+    "db_replica_lag_seconds",
+    "Last replication lag of the replica, if available.",
+    (),
+    lambda: [((), database_session_manager.get_replica_stats()["lag"])],
+)
+metrics.callback(
+    "db_read_sessions_total",
+    "Number of read-only sessions, by database used.",
+    ("database",),
+    lambda: (
+        ((kind,), database_session_manager.get_replica_stats()[kind])
+        for kind in ("replica", "fallback")
+    ),
+    kind="counter",
+)
@@ -7,6 +7,7 @@ from fastapi import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.requests import Request
 
+from app.constants import DatabasePool
 from app.db.session import database_session_manager
 from app.queue.session import SQSManager
 from app.repository.group import RepositoryGroup
@@ -14,7 +15,13 @@ from app.repository.group import RepositoryGroup
 
 async def _database_session_factory() -> AsyncIterator[AsyncSession]:
     """Yield a database session, to be used as a dependency."""
-    async with database_session_manager.session() as session:
+    async with database_session_manager.session(DatabasePool.API) as session:
+        yield session
+
+
+async def _read_database_session_factory() -> AsyncIterator[AsyncSession]:
+    """Yield a database session for read-only queries, to be used as a dependency."""
+    async with database_session_manager.read_session() as session:
         yield session
 
 
@@ -23,6 +30,11 @@ def _repo_group(db: "SessionDep") -> RepositoryGroup:
     return RepositoryGroup(db=db)
 
 
+def _read_repo_group(db: "ReadSessionDep") -> RepositoryGroup:
+    """Return the repository group for read-only queries, to be used as a dependency."""
+    return RepositoryGroup(db=db)
+
+
 def _sqs_manager(request: Request) -> SQSManager:
     """Return the SQS manager."""
     return request.state.sqs_manager
@@ -30,4 +42,6 @@ def _sqs_manager(request: Request) -> SQSManager:
 
 SessionDep = Annotated[AsyncSession, Depends(_database_session_factory)]
 RepoGroupDep = Annotated[RepositoryGroup, Depends(_repo_group)]
+ReadSessionDep = Annotated[AsyncSession, Depends(_read_database_session_factory)]
+ReadRepoGroupDep = Annotated[RepositoryGroup, Depends(_read_repo_group)]
 SQSManagerDep = Annotated[SQSManager, Depends(_sqs_manager)]
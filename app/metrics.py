@@ -0,0 +1,346 @@
+"""Metrics recorded in memory by each process, and exposed in the Prometheus text format.
+
+The metrics are recorded on the hot paths, so recording a value costs only a dict lookup,
+while the values of the callback metrics are retrieved only when the metrics are rendered.
+
+When the api is served by multiple processes, the values of each process are written
+periodically to a shared directory, and the rendered metrics are the sum of all the processes.
+
+See https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+
+import bisect
+import json
+import math
+import os
+import uuid
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from pathlib import Path
+from typing import Any
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# upper bounds in seconds of the buckets of the duration histograms
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# upper bounds in seconds of the buckets of the age histograms
+AGE_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+type Labels = tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    """Return the value formatted as expected by Prometheus."""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Return the labels formatted as expected by Prometheus, or an empty string if none."""
+    if not names:
+        return ""
+    pairs = (
+        '{}="{}"'.format(
+            name, str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+        )
+        for name, value in zip(names, values, strict=True)
+    )
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    """Base class of the metrics."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        """Init the metric.
+
+        Args:
+            name: name of the metric.
+            documentation: help text of the metric.
+            labelnames: names of the labels, whose values are passed in the same order.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def get_values(self) -> dict[Labels, Any]:
+        """Return the current values, by labels."""
+        raise NotImplementedError
+
+    @staticmethod
+    def merge_values(value: Any, other: Any) -> Any:
+        """Return the sum of two values recorded by different processes."""
+        return value + other
+
+    def render_values(self, values: dict[Labels, Any]) -> Iterator[str]:
+        """Yield the lines of the samples of the given values."""
+        for labels, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+    def collect(self) -> Iterator[str]:
+        """Yield the lines of the samples."""
+        return self.render_values(self.get_values())
+
+    def reset(self) -> None:
+        """Reset the recorded values."""
+
+
+class Counter(Metric):
+    """Value that can only increase, for each combination of labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        """Init the counter."""
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        """Increment the value of the given labels."""
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels: Labels = ()) -> float:
+        """Return the value of the given labels."""
+        return self._values.get(labels, 0)
+
+    def get_values(self) -> dict[Labels, float]:
+        """Return the current values, by labels."""
+        return dict(self._values)
+
+    def reset(self) -> None:
+        """Reset the recorded values."""
+        self._values = {}
+
+
+class Histogram(Metric):
+    """Distribution of the observed values in cumulative buckets, for each combination of labels."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> None:
+        """Init the histogram.
+
+        Args:
+            name: name of the metric.
+            documentation: help text of the metric.
+            labelnames: names of the labels, whose values are passed in the same order.
+            buckets: upper bounds of the buckets, in ascending order, excluding +Inf.
+        """
+        super().__init__(name, documentation, labelnames)
+        self._buckets = tuple(sorted(buckets))
+        # for each combination of labels: the count of each bucket, the count of +Inf, the sum
+        self._values: dict[Labels, list[float]] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        """Record a value for the given labels."""
+        counts = self._values.get(labels)
+        if counts is None:
+            counts = self._values[labels] = [0] * (len(self._buckets) + 2)
+        counts[bisect.bisect_left(self._buckets, value)] += 1
+        counts[-1] += value
+
+    def get_count(self, labels: Labels = ()) -> int:
+        """Return the number of values observed for the given labels."""
+        counts = self._values.get(labels)
+        return int(sum(counts[:-1])) if counts else 0
+
+    def get_values(self) -> dict[Labels, list[float]]:
+        """Return the counts of the buckets and the sum, by labels."""
+        return {labels: list(counts) for labels, counts in self._values.items()}
+
+    @staticmethod
+    def merge_values(value: list[float], other: list[float]) -> list[float]:
+        """Return the sum of the counts and of the sums recorded by different processes."""
+        return [a + b for a, b in zip(value, other, strict=True)]
+
+    def render_values(self, values: dict[Labels, list[float]]) -> Iterator[str]:
+        """Yield the lines of the samples of the given values."""
+        for labels, counts in values.items():
+            cumulative = 0.0
+            for upper_bound, count in zip([*self._buckets, math.inf], counts, strict=False):
+                cumulative += count
+                bucket_labels = _format_labels(
+                    [*self.labelnames, "le"], [*labels, _format_value(upper_bound)]
+                )
+                yield f"{self.name}_bucket{bucket_labels} {_format_value(cumulative)}"
+            formatted_labels = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{formatted_labels} {_format_value(counts[-1])}"
+            yield f"{self.name}_count{formatted_labels} {_format_value(cumulative)}"
+
+    def reset(self) -> None:
+        """Reset the recorded values."""
+        self._values = {}
+
+
+class CallbackMetric(Metric):
+    """Counter or gauge whose values are retrieved from a callback when rendered.
+
+    It's used to expose the statistics already maintained by other objects.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Iterable[tuple[Labels, float | None]]],
+        kind: str = "gauge",
+    ) -> None:
+        """Init the metric.
+
+        Args:
+            name: name of the metric.
+            documentation: help text of the metric.
+            labelnames: names of the labels, whose values are passed in the same order.
+            callback: function returning the values for each combination of labels.
+                The values that are None are skipped.
+            kind: type of the metric, gauge or counter.
+        """
+        super().__init__(name, documentation, labelnames)
+        self._callback = callback
+        self.kind = kind
+
+    def get_values(self) -> dict[Labels, float]:
+        """Return the values retrieved from the callback, skipping the values that are None."""
+        return {labels: value for labels, value in self._callback() if value is not None}
+
+
+class MetricsRegistry:
+    """Registry of the metrics of the process."""
+
+    def __init__(self) -> None:
+        """Init the registry."""
+        self._metrics: dict[str, Metric] = {}
+        # file where the values of the process are written, if shared with other processes
+        self._path: Path | None = None
+
+    def configure_directory(self, directory: str | None) -> None:
+        """Share the values with the other processes writing to the same directory, if given.
+
+        The directory must be emptied before starting the processes, because the values
+        written by the processes that have exited are still included in the sum.
+        """
+        self._path = (
+            Path(directory, f"{os.getpid()}-{uuid.uuid4().hex}.json") if directory else None
+        )
+
+    def register[M: Metric](self, metric: M) -> M:
+        """Register and return the metric, or raise ValueError if the name is already used."""
+        if metric.name in self._metrics:
+            err = f"Metric already registered: {metric.name}"
+            raise ValueError(err)
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Register and return a new counter."""
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ) -> Histogram:
+        """Register and return a new histogram."""
+        return self.register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Iterable[tuple[Labels, float | None]]],
+        kind: str = "gauge",
+    ) -> CallbackMetric:
+        """Register and return a new metric retrieving the values from a callback."""
+        return self.register(CallbackMetric(name, documentation, labelnames, callback, kind=kind))
+
+    def reset(self) -> None:
+        """Reset the values recorded by all the metrics."""
+        for metric in self._metrics.values():
+            metric.reset()
+
+    def write(self, *, final: bool = False) -> None:
+        """Write the values of the process to the shared directory, if configured.
+
+        Args:
+            final: if True, the process is exiting, so the gauges are excluded, while the
+                counters and the histograms are kept to avoid decreasing the sums.
+        """
+        if not self._path:
+            return
+        data = {
+            name: [[list(labels), value] for labels, value in metric.get_values().items()]
+            for name, metric in self._metrics.items()
+            if not final or metric.kind != "gauge"
+        }
+        tmp_path = self._path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        # atomic replacement, so the other processes never read a partial file
+        tmp_path.replace(self._path)
+
+    def _read_values(self, directory: Path) -> dict[str, dict[Labels, Any]]:
+        """Return the sum of the values written by all the processes, by metric and labels."""
+        result: dict[str, dict[Labels, Any]] = {}
+        for path in sorted(directory.glob("*.json")):
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+            for name, samples in data.items():
+                if (metric := self._metrics.get(name)) is None:
+                    continue
+                values = result.setdefault(name, {})
+                for labels, value in samples:
+                    key = tuple(labels)
+                    values[key] = (
+                        metric.merge_values(values[key], value) if key in values else value
+                    )
+        return result
+
+    def render(self) -> str:
+        """Return all the metrics in the Prometheus text format.
+
+        If the values are shared with other processes, the sum of all the processes is rendered.
+        """
+        values = None
+        if self._path:
+            self.write()
+            values = self._read_values(self._path.parent)
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            lines.extend(
+                (
+                    f"# HELP {metric.name} {metric.documentation}",
+                    f"# TYPE {metric.name} {metric.kind}",
+                )
+            )
+            if values is None:
+                lines.extend(metric.collect())
+            else:
+                lines.extend(metric.render_values(values.get(metric.name, {})))
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+async def metrics_endpoint(_request: Request) -> Response:
+    """Return the metrics of the process in the Prometheus text format."""
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
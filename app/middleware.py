@@ -0,0 +1,130 @@
+"""ASGI middlewares."""
+
+import time
+from collections.abc import Iterable
+
+from starlette.datastructures import MutableHeaders
+from starlette.routing import BaseRoute, Match, Mount
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.db.instrumentation import track_queries
+from app.metrics import metrics
+
+HTTP_REQUESTS = metrics.counter(
+    "http_requests_total", "Number of HTTP requests.", ("method", "route", "status")
+)
+HTTP_REQUEST_DURATION = metrics.histogram(
+    "http_request_duration_seconds",
+    "Duration of the HTTP requests, including the streaming of the response.",
+    ("method", "route"),
+)
+# route of the requests not matching any route, to keep the number of labels bounded
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _find_route_path(routes: Iterable[BaseRoute], scope: Scope) -> str | None:
+    """Return the template of the route matching the request, or None if not matched.
+
+    The routes are matched as done by the Starlette router, including the mounted routes,
+    and a partial match (wrong method) is returned only if there isn't any full match.
+    """
+    partial: tuple[BaseRoute, Scope] | None = None
+    for route in routes:
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            break
+        if match == Match.PARTIAL and partial is None:
+            partial = route, child_scope
+    else:
+        if partial is None:
+            return None
+        route, child_scope = partial
+    path = getattr(route, "path", None)
+    if path is None or not isinstance(route, Mount) or not route.routes:
+        return path
+    child_path = _find_route_path(route.routes, {**scope, **child_scope})
+    return None if child_path is None else path + child_path
+
+
+def get_route_path(scope: Scope, initial_scope: Scope) -> str:
+    """Return the template of the route matching the request, or UNMATCHED_ROUTE.
+
+    The route is set in the scope by the FastAPI routes, and it's matched again with the
+    routes of the application for the other routes, including the Starlette and mounted routes.
+
+    Args:
+        scope: scope of the request, after it has been updated by the routers.
+        initial_scope: copy of the scope received by the application.
+    """
+    if (route := scope.get("route")) is not None and (path := getattr(route, "path", None)):
+        return path
+    if app := initial_scope.get("app"):
+        return _find_route_path(getattr(app, "routes", ()), initial_scope) or UNMATCHED_ROUTE
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Record the number and the duration of the HTTP requests, by route template."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """Init the middleware."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Call the application and record the metrics of the request."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = "500"
+        # the routers update the scope in place while dispatching the request
+        initial_scope = dict(scope)
+
+        async def _send(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            path = get_route_path(scope, initial_scope)
+            HTTP_REQUESTS.inc((scope["method"], path, status))
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, (scope["method"], path))
+
+
+class QueryStatsMiddleware:
+    """Count the database statements executed by each request.
+
+    The statistics are logged if DB_QUERY_STATS_ENABLED is set, and they can be added to the
+    Server-Timing header, including only the statements executed before the response starts.
+    """
+
+    def __init__(self, app: ASGIApp, *, server_timing: bool = False) -> None:
+        """Init the middleware.
+
+        Args:
+            app: the wrapped application.
+            server_timing: if True, add the Server-Timing header to the responses.
+        """
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Call the application tracking the database statements."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with track_queries(f"{scope['method']} {scope['path']}") as stats:
+
+            async def _send(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    headers = MutableHeaders(scope=message)
+                    headers.append(
+                        "Server-Timing",
+                        f'db;dur={stats.duration * 1000:.1f};desc="{stats.statements} statements"',
+                    )
+                await send(message)
+
+            await self.app(scope, receive, _send if self.server_timing else send)
@@ -0,0 +1,154 @@
+"""Batched acknowledgement of SQS messages."""
+
+import asyncio
+import contextlib
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Self
+
+import botocore.exceptions
+from aiobotocore.client import AioBaseClient
+
+from app.logger import L
+
+# maximum number of entries that can be deleted by a single call to delete_message_batch
+MAX_DELETE_BATCH_SIZE = 10
+
+
+@dataclass(slots=True)
+class _PendingAck:
+    """Receipt handle waiting to be deleted."""
+
+    receipt_handle: str
+    attempts: int = 0
+
+
+class MessageAcknowledger:
+    """Collect the receipt handles of the processed messages, and delete them in batches.
+
+    The messages are deleted in a background task when the batch is full, or when the flush
+    interval has elapsed, so that the deletion doesn't delay the processing of the messages.
+    The flush interval should be considerably shorter than the visibility timeout of the messages,
+    or the messages may be received again before being deleted.
+    """
+
+    def __init__(
+        self,
+        sqs_client: AioBaseClient,
+        queue_url: str,
+        *,
+        batch_size: int = MAX_DELETE_BATCH_SIZE,
+        flush_interval: float = 1,
+        max_retries: int = 3,
+    ) -> None:
+        """Init the MessageAcknowledger.
+
+        Args:
+            sqs_client: SQS client.
+            queue_url: url of the queue.
+            batch_size: number of receipt handles triggering the deletion (1 to 10).
+            flush_interval: maximum number of seconds before deleting the pending messages.
+            max_retries: maximum number of retries for each message that failed to be deleted.
+        """
+        if not 1 <= batch_size <= MAX_DELETE_BATCH_SIZE:
+            err = f"batch_size must be between 1 and {MAX_DELETE_BATCH_SIZE}"
+            raise ValueError(err)
+        self._sqs_client = sqs_client
+        self._queue_url = queue_url
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._max_retries = max_retries
+        self._pending: list[_PendingAck] = []
+        self._batch_ready = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._acked = 0
+        self._failed = 0
+        self._retried = 0
+        self.logger = L.bind(queue_url=queue_url)
+
+    async def __aenter__(self) -> Self:
+        """Start the background task deleting the messages."""
+        self._task = asyncio.create_task(self._run_forever(), name="message-acknowledger")
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_val: BaseException | None,
+        exc_tb: TracebackType | None,
+    ) -> None:
+        """Stop the background task, and delete the pending messages."""
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        # failed deletions are retried until they succeed or max_retries is reached
+        while self._pending:
+            await self.flush()
+
+    def get_stats(self) -> dict[str, int]:
+        """Return the acknowledgement statistics."""
+        return {
+            "acked": self._acked,
+            "failed": self._failed,
+            "retried": self._retried,
+            "pending": len(self._pending),
+        }
+
+    def ack(self, receipt_handle: str) -> None:
+        """Schedule the deletion of a message."""
+        self._pending.append(_PendingAck(receipt_handle=receipt_handle))
+        if len(self._pending) >= self._batch_size:
+            self._batch_ready.set()
+
+    async def flush(self) -> None:
+        """Delete the pending messages.
+
+        The messages that failed to be deleted are scheduled again, and retried at the next flush.
+        """
+        async with self._lock:
+            self._batch_ready.clear()
+            pending, self._pending = self._pending, []
+            for start in range(0, len(pending), MAX_DELETE_BATCH_SIZE):
+                await self._delete_batch(pending[start : start + MAX_DELETE_BATCH_SIZE])
+
+    async def _delete_batch(self, batch: list[_PendingAck]) -> None:
+        """Delete a batch of messages, and schedule a retry for the failed ones."""
+        try:
+            response = await self._sqs_client.delete_message_batch(
+                QueueUrl=self._queue_url,
+                Entries=[
+                    {"Id": str(n), "ReceiptHandle": item.receipt_handle}
+                    for n, item in enumerate(batch)
+                ],
+            )
+        except (botocore.exceptions.BotoCoreError, botocore.exceptions.ClientError):
+            self.logger.exception("Error deleting {} messages", len(batch))
+            failed = [(item, False) for item in batch]
+        else:
+            self._acked += len(response.get("Successful", []))
+            failed = [
+                (batch[int(entry["Id"])], entry.get("SenderFault", False))
+                for entry in response.get("Failed", [])
+            ]
+            if failed:
+                self.logger.warning("Failed to delete messages: {}", response["Failed"])
+        for item, sender_fault in failed:
+            if sender_fault or item.attempts >= self._max_retries:
+                self._failed += 1
+            else:
+                item.attempts += 1
+                self._retried += 1
+                self._pending.append(item)
+
+    async def _run_forever(self) -> None:
+        """Delete the pending messages when the batch is full, or at regular intervals."""
+        while True:
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._batch_ready.wait(), timeout=self._flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                self.logger.exception("Error flushing the pending messages")
@@ -0,0 +1,87 @@
+"""Recording of the consumed SQS messages."""
+
+import base64
+import zlib
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.constants import EventBodyStorage, EventStatus
+from app.repository.event import EventRepository
+
+# prefix of the bodies stored compressed
+COMPRESSED_BODY_PREFIX = "zlib:"
+# suffix of the bodies stored truncated
+TRUNCATED_BODY_SUFFIX = "...[truncated]"
+
+
+def encode_event_body(body: str, storage: EventBodyStorage, max_length: int) -> str:
+    """Return the body of a completed event as it should be stored."""
+    if storage == EventBodyStorage.FULL:
+        return body
+    if storage == EventBodyStorage.TRUNCATED:
+        if len(body) <= max_length:
+            return body
+        return body[:max_length] + TRUNCATED_BODY_SUFFIX
+    if storage == EventBodyStorage.COMPRESSED:
+        compressed = base64.b64encode(zlib.compress(body.encode())).decode()
+        return COMPRESSED_BODY_PREFIX + compressed
+    err = f"Event body storage not handled: {storage}"
+    raise ValueError(err)
+
+
+def decode_event_body(body: str | None) -> str | None:
+    """Return the original body of a stored event, decompressing it if needed.
+
+    Truncated bodies cannot be restored, and they are returned unchanged.
+    """
+    if body is None or not body.startswith(COMPRESSED_BODY_PREFIX):
+        return body
+    compressed = base64.b64decode(body.removeprefix(COMPRESSED_BODY_PREFIX))
+    return zlib.decompress(compressed).decode()
+
+
+class EventRecorder:
+    """Store the completed events in the same transaction used to consume the messages.
+
+    The events are committed atomically with the changes made by the consumer, so the messages
+    redelivered after being committed, for example because they couldn't be deleted, can be
+    detected as duplicates. The messages consumed together are stored with a single statement.
+    """
+
+    def __init__(
+        self,
+        queue_name: str,
+        *,
+        body_storage: EventBodyStorage = EventBodyStorage.FULL,
+        body_max_length: int = 1000,
+    ) -> None:
+        """Init the EventRecorder.
+
+        Args:
+            queue_name: name of the queue.
+            body_storage: how the body of the events is stored.
+            body_max_length: maximum number of characters stored when the body is truncated.
+        """
+        self._queue_name = queue_name
+        self._body_storage = body_storage
+        self._body_max_length = body_max_length
+
+    async def record(
+        self, db: AsyncSession, msgs: list[dict[str, Any]], job_ids: list[UUID | None]
+    ) -> None:
+        """Store the completed events in the current transaction of the given session."""
+        bodies: list[str | None] = [
+            encode_event_body(
+                msg["Body"], storage=self._body_storage, max_length=self._body_max_length
+            )
+            for msg in msgs
+        ]
+        await EventRepository(db=db).upsert_many(
+            msgs=msgs,
+            queue_name=self._queue_name,
+            status=EventStatus.COMPLETED,
+            job_ids=job_ids,
+            bodies=bodies,
+        )
@@ -1,16 +1,64 @@
 """Account repository module."""
 
+from typing import Any
 from uuid import UUID
 
 import sqlalchemy as sa
 from sqlalchemy import and_, true
+from sqlalchemy.orm import aliased
 
+from app.cache import account_ids_cache
 from app.constants import AccountType
 from app.db.model import Account
 from app.repository.base import BaseRepository
-from app.schema.domain import Accounts, ProjAccount, RsvAccount, SysAccount, VlabAccount
+from app.schema.domain import (
+    AccountIds,
+    Accounts,
+    ProjAccount,
+    RsvAccount,
+    SysAccount,
+    VlabAccount,
+)
 from app.utils import create_uuid
 
+_SYS = aliased(Account, name="sys")
+_VLAB = aliased(Account, name="vlab")
+_PROJ = aliased(Account, name="proj")
+_RSV = aliased(Account, name="rsv")
+
+
+def _select_related_accounts(*entities: Any) -> sa.Select:
+    """Return a query selecting the given entities from the accounts related to each project.
+
+    The aliases _SYS, _VLAB, _PROJ, and _RSV can be used to select the entities and filter
+    the results, and only the projects with enabled PROJ, RSV and VLAB accounts are selected.
+    """
+    return (
+        sa.select(*entities)
+        .select_from(_PROJ)
+        .join(
+            _RSV,
+            and_(
+                _RSV.parent_id == _PROJ.id,
+                _RSV.account_type == AccountType.RSV,
+                _RSV.enabled == true(),
+            ),
+        )
+        .join(
+            _VLAB,
+            and_(
+                _VLAB.id == _PROJ.parent_id,
+                _VLAB.account_type == AccountType.VLAB,
+                _VLAB.enabled == true(),
+            ),
+        )
+        .join(_SYS, _SYS.account_type == AccountType.SYS)
+        .where(
+            _PROJ.account_type == AccountType.PROJ,
+            _PROJ.enabled == true(),
+        )
+    )
+
 
 class AccountRepository(BaseRepository):
     """AccountRepository."""
@@ -85,19 +133,84 @@ class AccountRepository(BaseRepository):
     async def get_accounts_by_proj_id(
         self, proj_id: UUID, *, for_update: set[AccountType] | None = None
     ) -> Accounts:
-        """Return the related VLAB, PROJ, and RSV accounts for the given proj_id."""
-        for_update = for_update or set()
-        proj = await self.get_proj_account(
-            proj_id=proj_id, for_update=AccountType.PROJ in for_update
+        """Return the related SYS, VLAB, PROJ, and RSV accounts for the given proj_id.
+
+        Only the rows of the account types specified in for_update are locked, in order of id
+        as in the ledger, so that concurrent transactions cannot deadlock. The accounts are
+        selected with a single query after being locked, so the balances are up to date.
+        """
+        if for_update:
+            account_ids = await self.get_account_ids_by_proj_id(proj_id)
+            ids_by_type = {
+                AccountType.SYS: account_ids.sys_id,
+                AccountType.VLAB: account_ids.vlab_id,
+                AccountType.PROJ: account_ids.proj_id,
+                AccountType.RSV: account_ids.rsv_id,
+            }
+            await self.db.execute(
+                sa.select(Account.id)
+                .where(Account.id.in_([ids_by_type[account_type] for account_type in for_update]))
+                .order_by(Account.id)
+                .with_for_update()
+            )
+        query = _select_related_accounts(_SYS, _VLAB, _PROJ, _RSV).where(_PROJ.id == proj_id)
+        sys, vlab, proj, rsv = (await self.db.execute(query)).one()
+        return Accounts(
+            sys=SysAccount.model_validate(sys),
+            vlab=VlabAccount.model_validate(vlab),
+            proj=ProjAccount.model_validate(proj),
+            rsv=RsvAccount.model_validate(rsv),
         )
-        rsv = await self.get_reservation_account(
-            proj_id=proj_id, for_update=AccountType.RSV in for_update
+
+    async def get_account_ids_by_proj_id(self, proj_id: UUID) -> AccountIds:
+        """Return the ids of the related SYS, VLAB, PROJ, and RSV accounts for the given proj_id.
+
+        The hierarchy of the accounts never changes once created, so the ids are cached in memory,
+        and the database is queried only at the first call for each project.
+        Use get_accounts_by_proj_id when the balances are needed, or the accounts must be locked.
+        """
+        if result := account_ids_cache.get(proj_id):
+            return result
+        query = _select_related_accounts(_SYS.id, _VLAB.id, _PROJ.id, _RSV.id).where(
+            _PROJ.id == proj_id
         )
-        vlab = await self.get_vlab_account(
-            vlab_id=proj.vlab_id, for_update=AccountType.VLAB in for_update
+        sys_id, vlab_id, proj_id, rsv_id = (await self.db.execute(query)).one()
+        result = AccountIds(sys_id=sys_id, vlab_id=vlab_id, proj_id=proj_id, rsv_id=rsv_id)
+        account_ids_cache.set(proj_id, result)
+        return result
+
+    async def get_account_ids_by_proj_ids(self, proj_ids: list[UUID]) -> dict[UUID, AccountIds]:
+        """Return the ids of the related SYS, VLAB, PROJ, and RSV accounts for each project.
+
+        The ids not found in the cache are selected with a single query, and the projects
+        that don't have exactly one enabled reservation account, or an enabled virtual-lab
+        account, are not included.
+        """
+        result: dict[UUID, AccountIds] = {}
+        missing: list[UUID] = []
+        for proj_id in proj_ids:
+            if account_ids := account_ids_cache.get(proj_id):
+                result[proj_id] = account_ids
+            else:
+                missing.append(proj_id)
+        if not missing:
+            return result
+        query = _select_related_accounts(_SYS.id, _VLAB.id, _PROJ.id, _RSV.id).where(
+            _PROJ.id.in_(missing)
         )
-        sys = await self.get_system_account()
-        return Accounts(sys=sys, vlab=vlab, proj=proj, rsv=rsv)
+        loaded: dict[UUID, AccountIds] = {}
+        duplicated: set[UUID] = set()
+        for sys_id, vlab_id, proj_id, rsv_id in (await self.db.execute(query)).all():
+            if proj_id in loaded:
+                duplicated.add(proj_id)
+            loaded[proj_id] = AccountIds(
+                sys_id=sys_id, vlab_id=vlab_id, proj_id=proj_id, rsv_id=rsv_id
+            )
+        for proj_id, account_ids in loaded.items():
+            if proj_id not in duplicated:
+                account_ids_cache.set(proj_id, account_ids)
+                result[proj_id] = account_ids
+        return result
 
     async def get_proj_accounts_for_vlab(self, vlab_id: UUID) -> list[ProjAccount]:
         """Return all the projects for the specified virtual-lab."""
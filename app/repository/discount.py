@@ -43,6 +43,36 @@ class DiscountRepository(BaseRepository):
         )
         return (await self.db.execute(query)).scalar_one_or_none()
 
+    async def get_current_vlab_discounts(self, vlab_ids: list[UUID]) -> dict[UUID, Discount]:
+        """Retrieve the currently active discount for each of the given virtual labs.
+
+        The virtual labs without an active discount are not included in the result.
+
+        Args:
+            vlab_ids: list of UUIDs of the virtual labs to query discounts for
+
+        Returns:
+            Dictionary of {vlab_id: Discount}
+        """
+        if not vlab_ids:
+            return {}
+        now = utils.utcnow()
+        query = (
+            sa.select(Discount)
+            .where(
+                Discount.vlab_id.in_(vlab_ids),
+                Discount.valid_from <= now,
+                or_(
+                    Discount.valid_to == null(),
+                    Discount.valid_to > now,
+                ),
+            )
+            .order_by(Discount.vlab_id, Discount.valid_from.desc(), Discount.id.desc())
+            .distinct(Discount.vlab_id)
+        )
+        rows = (await self.db.execute(query)).scalars()
+        return {row.vlab_id: row for row in rows if row.vlab_id}
+
     async def get_all_vlab_discounts(self, vlab_id: UUID) -> Sequence[Discount]:
         """Retrieve all discounts (active and inactive) for a specific virtual lab.
 
@@ -1,5 +1,6 @@
 """Queue message repository module."""
 
+from collections import Counter
 from typing import Any
 from uuid import UUID
 
@@ -47,3 +48,65 @@ class EventRepository(BaseRepository):
             },
         ).returning(Event.counter)
         return (await self.db.execute(query)).scalar_one()
+
+    async def upsert_many(
+        self,
+        msgs: list[dict[str, Any]],
+        queue_name: str,
+        status: EventStatus,
+        job_ids: list[UUID | None],
+        bodies: list[str | None] | None = None,
+    ) -> None:
+        """Insert or update multiple records with a single statement.
+
+        The counter of each record is incremented by the number of occurrences of the message.
+
+        Args:
+            msgs: list of messages.
+            queue_name: name of the queue.
+            status: status of the events.
+            job_ids: list of job ids, in the same order of the messages.
+            bodies: list of bodies to be stored, or None to store the original bodies.
+        """
+        if not msgs:
+            return
+        if bodies is None:
+            bodies = [msg["Body"] for msg in msgs]
+        counters = Counter(msg["MessageId"] for msg in msgs)
+        # the same row cannot be updated twice by the same statement, so the last message wins
+        values = {
+            msg["MessageId"]: {
+                "message_id": msg["MessageId"],
+                "queue_name": queue_name,
+                "status": status,
+                "attributes": msg["Attributes"],
+                "body": body,
+                "error": None,
+                "job_id": job_id,
+                "counter": counters[msg["MessageId"]],
+            }
+            for msg, job_id, body in zip(msgs, job_ids, bodies, strict=True)
+        }
+        query = pg.insert(Event).values(list(values.values()))
+        query = query.on_conflict_do_update(
+            index_elements=["message_id"],
+            set_={
+                "queue_name": query.excluded.queue_name,
+                "status": query.excluded.status,
+                "attributes": query.excluded.attributes,
+                "body": query.excluded.body,
+                "error": query.excluded.error,
+                "job_id": query.excluded.job_id,
+                "counter": Event.counter + query.excluded.counter,
+                "updated_at": sa.func.now(),
+            },
+        )
+        await self.db.execute(query)
+
+    async def get_completed_job_ids(self, message_ids: list[UUID]) -> dict[UUID, UUID | None]:
+        """Return the job ids of the completed events, by message id."""
+        query = sa.select(Event.message_id, Event.job_id).where(
+            Event.message_id.in_(message_ids),
+            Event.status == EventStatus.COMPLETED,
+        )
+        return dict((await self.db.execute(query)).tuples().all())
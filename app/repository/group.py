@@ -8,6 +8,7 @@ from app.repository.account import AccountRepository
 from app.repository.discount import DiscountRepository
 from app.repository.event import EventRepository
 from app.repository.job import JobRepository
+from app.repository.lease import LeaseRepository
 from app.repository.ledger import LedgerRepository
 from app.repository.price import PriceRepository
 from app.repository.report import ReportRepository
@@ -23,6 +24,7 @@ class RepositoryGroup:
         discount_repo_class: type[DiscountRepository] = DiscountRepository,
         event_repo_class: type[EventRepository] = EventRepository,
         job_repo_class: type[JobRepository] = JobRepository,
+        lease_repo_class: type[LeaseRepository] = LeaseRepository,
         ledger_repo_class: type[LedgerRepository] = LedgerRepository,
         price_repo_class: type[PriceRepository] = PriceRepository,
         report_repo_class: type[ReportRepository] = ReportRepository,
@@ -33,6 +35,7 @@ class RepositoryGroup:
         self._discount_repo_class = discount_repo_class
         self._event_repo_class = event_repo_class
         self._job_repo_class = job_repo_class
+        self._lease_repo_class = lease_repo_class
         self._ledger_repo_class = ledger_repo_class
         self._price_repo_class = price_repo_class
         self._report_repo_class = report_repo_class
@@ -62,6 +65,11 @@ class RepositoryGroup:
         """Return the job repository."""
         return self._job_repo_class(self.db)
 
+    @cached_property
+    def lease(self) -> LeaseRepository:
+        """Return the lease repository."""
+        return self._lease_repo_class(self.db)
+
     @cached_property
     def ledger(self) -> LedgerRepository:
         """Return the ledger repository."""
@@ -2,16 +2,19 @@
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any
 
 import sqlalchemy as sa
 from sqlalchemy import func, null, or_, true
 from sqlalchemy.dialects import postgresql as pg
+from sqlalchemy.exc import NoResultFound
 
+from app.config import settings
 from app.constants import ServiceSubtype, ServiceType
 from app.db.model import Job
 from app.repository.base import BaseRepository
-from app.schema.domain import StartedJob
+from app.schema.domain import Shard, StartedJob
 
 if TYPE_CHECKING:
     from collections.abc import Sequence
@@ -20,6 +23,70 @@ if TYPE_CHECKING:
 
     from app.schema.api import PaginatedParams
 
+# channel used to notify the finished jobs to be charged immediately
+JOB_FINISHED_CHANNEL = "job_finished"
+
+# columns used to calculate next_charge_due_at
+_DUE_AT_COLUMNS = ("service_type", "started_at", "last_alive_at", "last_charged_at", "finished_at")
+
+
+def _next_charge_due_at(
+    values: dict[str, Any] | None = None, *, use_columns: bool = True
+) -> sa.ColumnElement:
+    """Return the expression calculating next_charge_due_at of a job.
+
+    The result is null if the job isn't a started longrun job, or if it has been fully charged.
+    If the job is finished, it's due immediately. Otherwise, it's due when the minimum charging
+    interval has elapsed since the last charge, or when the job expires.
+
+    If only last_alive_at is updated, the result is never earlier than the existing value,
+    so that the heartbeats don't override the postponed charges.
+
+    Args:
+        values: new values of the job, that override the existing columns. They can be
+            constants or SQL expressions.
+        use_columns: if False, the values not specified are considered null, as when inserting.
+    """
+    values = values or {}
+
+    def _get_value(name: str) -> sa.ColumnElement:
+        if name not in values and use_columns:
+            return getattr(Job, name)
+        if isinstance(value := values.get(name), sa.ColumnElement):
+            return value
+        return sa.literal(value, type_=getattr(Job, name).type)
+
+    service_type, started_at, last_alive_at, last_charged_at, finished_at = (
+        _get_value(name) for name in _DUE_AT_COLUMNS
+    )
+    due_at = sa.case(
+        (or_(service_type != ServiceType.LONGRUN, started_at.is_(None)), null()),
+        (
+            finished_at.is_not(None),
+            sa.case((last_charged_at.is_distinct_from(finished_at), finished_at), else_=null()),
+        ),
+        else_=func.least(
+            func.coalesce(last_charged_at, started_at)
+            + timedelta(seconds=settings.CHARGE_LONGRUN_MIN_CHARGING_INTERVAL),
+            last_alive_at + timedelta(seconds=settings.CHARGE_LONGRUN_EXPIRATION_INTERVAL),
+        ),
+    )
+    if use_columns and values.keys() & set(_DUE_AT_COLUMNS) == {"last_alive_at"}:
+        # a heartbeat doesn't anticipate the charge postponed by postpone_longrun_charge
+        due_at = sa.case(
+            (due_at.is_(None), null()),
+            else_=func.greatest(Job.next_charge_due_at, due_at),
+        )
+    return due_at
+
+
+def _in_shard(shard: Shard | None) -> sa.ColumnElement[bool]:
+    """Return the condition selecting the jobs of the projects in the hash slots of the shard."""
+    if shard is None:
+        return true()
+    slot = func.hashtext(sa.cast(Job.proj_id, sa.Text), type_=sa.Integer).op("&")(0x7FFFFFFF)
+    return (slot % shard.total).in_(sorted(shard.slots))
+
 
 class JobRepository(BaseRepository):
     """JobRepository."""
@@ -33,15 +100,28 @@ class JobRepository(BaseRepository):
 
     async def insert_job(self, job_id: UUID, **kwargs) -> Job:
         """Insert a new job."""
-        query = sa.insert(Job).values(id=job_id, **kwargs).returning(Job)
+        query = (
+            sa.insert(Job)
+            .values(
+                id=job_id,
+                next_charge_due_at=_next_charge_due_at(kwargs, use_columns=False),
+                **kwargs,
+            )
+            .returning(Job)
+        )
         return (await self.db.execute(query)).scalar_one()
 
     async def upsert_job(self, job_id: UUID, *, query_update_fields: list[str], **kwargs) -> Job:
         """Insert or update a job."""
         update_values = {key: kwargs[key] for key in query_update_fields}
+        update_values["next_charge_due_at"] = _next_charge_due_at(update_values)
         query = (
             pg.insert(Job)
-            .values(id=job_id, **kwargs)
+            .values(
+                id=job_id,
+                next_charge_due_at=_next_charge_due_at(kwargs, use_columns=False),
+                **kwargs,
+            )
             .on_conflict_do_update(index_elements=["id"], set_=update_values)
             .returning(Job)
         )
@@ -51,7 +131,7 @@ class JobRepository(BaseRepository):
         """Update an existing record."""
         query = (
             sa.update(Job)
-            .values(**kwargs)
+            .values(next_charge_due_at=_next_charge_due_at(kwargs), **kwargs)
             .where(
                 Job.id == job_id,
                 Job.vlab_id == vlab_id,
@@ -61,6 +141,41 @@ class JobRepository(BaseRepository):
         )
         return (await self.db.execute(query)).scalar_one()
 
+    async def update_last_alive_at(
+        self, values: Sequence[tuple[UUID, UUID, UUID, datetime]]
+    ) -> None:
+        """Update last_alive_at of multiple jobs with a single statement.
+
+        Raise NoResultFound if any job doesn't exist in the given virtual lab and project.
+
+        Args:
+            values: job id, vlab id, project id, and last_alive_at of each job.
+        """
+        alive = sa.values(
+            sa.column("id", Job.id.type),
+            sa.column("vlab_id", Job.vlab_id.type),
+            sa.column("proj_id", Job.proj_id.type),
+            sa.column("last_alive_at", Job.last_alive_at.type),
+            name="alive",
+        ).data(list(values))
+        query = (
+            sa.update(Job)
+            .values(
+                last_alive_at=alive.c.last_alive_at,
+                next_charge_due_at=_next_charge_due_at({"last_alive_at": alive.c.last_alive_at}),
+            )
+            .where(
+                Job.id == alive.c.id,
+                Job.vlab_id == alive.c.vlab_id,
+                Job.proj_id == alive.c.proj_id,
+            )
+            .returning(Job.id)
+        )
+        updated = (await self.db.execute(query)).scalars().all()
+        if len(updated) != len(values):
+            err = f"Updated {len(updated)} jobs instead of {len(values)}"
+            raise NoResultFound(err)
+
     async def update_finished_at(
         self, vlab_id: UUID, proj_id: UUID, service_type: ServiceType, finished_at: datetime
     ) -> Sequence[Job]:
@@ -90,7 +205,9 @@ class JobRepository(BaseRepository):
         res = await self.db.scalars(query)
         return res.all()
 
-    async def get_storage_running(self, *, proj_ids: list[UUID] | None = None) -> list[StartedJob]:
+    async def get_storage_running(
+        self, *, proj_ids: list[UUID] | None = None, shard: Shard | None = None
+    ) -> list[StartedJob]:
         """Get the jobs of type storage not finished yet, partially charged or not.
 
         There should be only one record per project, but this isn't enforced.
@@ -100,12 +217,13 @@ class JobRepository(BaseRepository):
             Job.service_type == ServiceType.STORAGE,
             Job.finished_at == null(),
             Job.proj_id.in_(proj_ids) if proj_ids is not None else true(),
+            _in_shard(shard),
         )
         rows = (await self.db.execute(query)).scalars().all()
         return [StartedJob.model_validate(row) for row in rows]
 
     async def get_storage_finished_to_be_charged(
-        self, *, proj_ids: list[UUID] | None = None
+        self, *, proj_ids: list[UUID] | None = None, shard: Shard | None = None
     ) -> list[StartedJob]:
         """Get the jobs of type storage finished, not charged or only partially charged."""
         query = sa.select(Job).where(
@@ -116,12 +234,17 @@ class JobRepository(BaseRepository):
             ),
             Job.finished_at != null(),
             Job.proj_id.in_(proj_ids) if proj_ids is not None else true(),
+            _in_shard(shard),
         )
         rows = (await self.db.execute(query)).scalars().all()
         return [StartedJob.model_validate(row) for row in rows]
 
     async def get_longrun_to_be_charged(
-        self, *, proj_ids: list[UUID] | None = None
+        self,
+        *,
+        proj_ids: list[UUID] | None = None,
+        job_ids: list[UUID] | None = None,
+        shard: Shard | None = None,
     ) -> list[StartedJob]:
         """Get the longrun jobs to be charged.
 
@@ -140,10 +263,89 @@ class JobRepository(BaseRepository):
                 Job.finished_at == null(),
             ),
             Job.proj_id.in_(proj_ids) if proj_ids is not None else true(),
+            _in_shard(shard),
+            Job.id.in_(job_ids) if job_ids is not None else true(),
+        )
+        rows = (await self.db.execute(query)).scalars().all()
+        return [StartedJob.model_validate(row) for row in rows]
+
+    async def lock_unchanged_job(self, job: StartedJob) -> bool:
+        """Lock the job FOR UPDATE, and return True if it's unchanged since it was selected.
+
+        The job is considered changed if it has been charged or finished in the meantime,
+        for example by a different charger, so that the same usage isn't charged twice.
+        """
+        query = (
+            sa.select(Job.last_charged_at, Job.finished_at)
+            .where(Job.id == job.id)
+            .with_for_update()
+        )
+        row = (await self.db.execute(query)).one_or_none()
+        return row is not None and (row.last_charged_at, row.finished_at) == (
+            job.last_charged_at,
+            job.finished_at,
+        )
+
+    async def notify_finished(self, job_id: UUID, service_type: ServiceType) -> None:
+        """Notify that the job is finished and can be charged, when the transaction is committed."""
+        payload = f"{service_type}:{job_id}"
+        await self.db.execute(sa.select(func.pg_notify(JOB_FINISHED_CHANNEL, payload)))
+
+    async def get_longrun_due(
+        self,
+        *,
+        due_at: datetime,
+        limit: int,
+        after: tuple[datetime, UUID] | None = None,
+        shard: Shard | None = None,
+    ) -> list[StartedJob]:
+        """Get a batch of longrun jobs to be charged, having next_charge_due_at <= due_at.
+
+        The jobs are ordered by (next_charge_due_at, id), and the batch starts after the given
+        key, so that only the jobs actually due are scanned using the partial index.
+
+        The records are NOT locked for update, as in get_longrun_to_be_charged.
+        """
+        query = (
+            sa.select(Job)
+            .where(
+                Job.next_charge_due_at <= due_at,
+                sa.tuple_(Job.next_charge_due_at, Job.id) > after if after else true(),
+                _in_shard(shard),
+            )
+            .order_by(Job.next_charge_due_at, Job.id)
+            .limit(limit)
         )
         rows = (await self.db.execute(query)).scalars().all()
         return [StartedJob.model_validate(row) for row in rows]
 
+    async def postpone_longrun_charge(self, job_id: UUID, due_at: datetime) -> None:
+        """Postpone the next charge of a longrun job, without exceeding its expiration."""
+        query = (
+            sa.update(Job)
+            .values(
+                next_charge_due_at=func.least(
+                    due_at,
+                    Job.last_alive_at
+                    + timedelta(seconds=settings.CHARGE_LONGRUN_EXPIRATION_INTERVAL),
+                )
+            )
+            .where(Job.id == job_id, Job.next_charge_due_at.is_not(None))
+        )
+        await self.db.execute(query)
+
+    async def refresh_next_charge_due_at(self) -> None:
+        """Calculate again next_charge_due_at of all the longrun jobs.
+
+        It should be called only after changing the charging or expiration intervals.
+        """
+        query = (
+            sa.update(Job)
+            .values(next_charge_due_at=_next_charge_due_at())
+            .where(Job.service_type == ServiceType.LONGRUN)
+        )
+        await self.db.execute(query)
+
     async def get_open_longrun_jobs(
         self,
         pagination: PaginatedParams,
@@ -170,7 +372,11 @@ class JobRepository(BaseRepository):
         return list(rows), count
 
     async def get_oneshot_to_be_charged(
-        self, *, proj_ids: list[UUID] | None = None
+        self,
+        *,
+        proj_ids: list[UUID] | None = None,
+        job_ids: list[UUID] | None = None,
+        shard: Shard | None = None,
     ) -> list[StartedJob]:
         """Get the oneshot jobs to be charged."""
         query = sa.select(Job).where(
@@ -179,6 +385,8 @@ class JobRepository(BaseRepository):
             Job.finished_at != null(),
             Job.last_charged_at == null(),
             Job.proj_id.in_(proj_ids) if proj_ids is not None else true(),
+            _in_shard(shard),
+            Job.id.in_(job_ids) if job_ids is not None else true(),
         )
         rows = (await self.db.execute(query)).scalars().all()
         return [StartedJob.model_validate(row) for row in rows]
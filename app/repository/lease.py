@@ -0,0 +1,95 @@
+"""Charger lease repository module."""
+
+from collections.abc import Sequence
+from datetime import timedelta
+
+import sqlalchemy as sa
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql as pg
+
+from app.db.model import ChargerLease, ChargerMember
+from app.repository.base import BaseRepository
+
+# key of the advisory lock serializing the assignment of the leases
+LEASE_LOCK_KEY = 8_310_771_214
+
+
+class LeaseRepository(BaseRepository):
+    """LeaseRepository."""
+
+    async def rebalance(self, member_id: str, total: int, ttl: float) -> Sequence[int]:
+        """Renew the membership and the leases, rebalance them, and return the leased slots.
+
+        Each live member should lease the same number of slots, so the slots exceeding the fair
+        share are released, and the free or expired slots are acquired up to the fair share.
+        The slots released by the other members are acquired when this method is called again.
+
+        Args:
+            member_id: unique id of the replica.
+            total: total number of slots.
+            ttl: number of seconds after which the membership and the leases expire.
+        """
+        now = func.now()
+        expires_at = now + timedelta(seconds=ttl)
+        await self.db.execute(sa.select(func.pg_advisory_xact_lock(LEASE_LOCK_KEY)))
+        await self.db.execute(sa.delete(ChargerMember).where(ChargerMember.expires_at < now))
+        await self.db.execute(
+            pg.insert(ChargerMember)
+            .values(id=member_id, expires_at=expires_at)
+            .on_conflict_do_update(index_elements=["id"], set_={"expires_at": expires_at})
+        )
+        await self.db.execute(
+            pg.insert(ChargerLease)
+            .from_select(["slot"], sa.select(func.generate_series(0, total - 1)))
+            .on_conflict_do_nothing()
+        )
+        members = (
+            (await self.db.execute(sa.select(ChargerMember.id).order_by(ChargerMember.id)))
+            .scalars()
+            .all()
+        )
+        quotient, remainder = divmod(total, len(members))
+        fair_share = quotient + (1 if members.index(member_id) < remainder else 0)
+
+        renewed = await self.db.execute(
+            sa.update(ChargerLease)
+            .values(expires_at=expires_at)
+            .where(ChargerLease.owner == member_id, ChargerLease.slot < total)
+            .returning(ChargerLease.slot)
+        )
+        owned = sorted(renewed.scalars().all())
+        if len(owned) > fair_share:
+            released = owned[fair_share:]
+            owned = owned[:fair_share]
+            await self.db.execute(
+                sa.update(ChargerLease)
+                .values(owner=None, expires_at=None)
+                .where(ChargerLease.slot.in_(released))
+            )
+        elif len(owned) < fair_share:
+            free = (
+                sa.select(ChargerLease.slot)
+                .where(
+                    ChargerLease.slot < total,
+                    sa.or_(ChargerLease.owner.is_(None), ChargerLease.expires_at < now),
+                )
+                .order_by(ChargerLease.slot)
+                .limit(fair_share - len(owned))
+            )
+            acquired = await self.db.execute(
+                sa.update(ChargerLease)
+                .values(owner=member_id, expires_at=expires_at)
+                .where(ChargerLease.slot.in_(free))
+                .returning(ChargerLease.slot)
+            )
+            owned = sorted([*owned, *acquired.scalars().all()])
+        return owned
+
+    async def release(self, member_id: str) -> None:
+        """Release the membership and the leases, so that other members can acquire them."""
+        await self.db.execute(sa.delete(ChargerMember).where(ChargerMember.id == member_id))
+        await self.db.execute(
+            sa.update(ChargerLease)
+            .values(owner=None, expires_at=None)
+            .where(ChargerLease.owner == member_id)
+        )
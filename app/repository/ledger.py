@@ -1,16 +1,229 @@
 """Ledger repository module."""
 
+import itertools
+from collections import defaultdict
+from collections.abc import Sequence
 from datetime import datetime
 from decimal import Decimal
+from functools import cache
 from uuid import UUID
 
 import sqlalchemy as sa
 from sqlalchemy import func, true
+from sqlalchemy.dialects import postgresql as pg
+from sqlalchemy.exc import NoResultFound
 
+from app.config import settings
 from app.constants import D0, AccountType, TransactionType
-from app.db.model import Account, Journal, Ledger
+from app.db.model import Account, Job, JobCostSummary, Journal, Ledger, SystemBalanceDelta
 from app.logger import L
 from app.repository.base import BaseRepository
+from app.schema.domain import Transaction
+
+# columns of job_cost_summary incremented by the amount of the given transaction types
+COST_SUMMARY_TYPES = {
+    "charged": (
+        TransactionType.CHARGE_ONESHOT,
+        TransactionType.CHARGE_LONGRUN,
+        TransactionType.CHARGE_STORAGE,
+    ),
+    "reserved": (TransactionType.RESERVE,),
+    "released": (TransactionType.RELEASE,),
+    "refunded": (TransactionType.REFUND,),
+}
+COST_SUMMARY_AMOUNTS = ("amount", *COST_SUMMARY_TYPES)
+# attributes of the transactions passed as arrays to the single-statement posting, and their types
+POSTING_COLUMNS = {
+    "transaction_datetime": Journal.transaction_datetime.type,
+    "transaction_type": Journal.transaction_type.type,
+    "job_id": Journal.job_id.type,
+    "price_id": Journal.price_id.type,
+    "discount_id": Journal.discount_id.type,
+    "properties": Journal.properties.type,
+    "debited_from": Ledger.account_id.type,
+    "credited_to": Ledger.account_id.type,
+    "amount": Ledger.amount.type,
+}
+
+
+def _upsert_cost_summary(insert: pg.Insert) -> pg.Insert:
+    """Return the insert statement adding the amounts to the existing cost summaries."""
+    return insert.on_conflict_do_update(
+        index_elements=[JobCostSummary.job_id],
+        set_={
+            **{
+                name: getattr(JobCostSummary, name) + getattr(insert.excluded, name)
+                for name in COST_SUMMARY_AMOUNTS
+            },
+            "last_posting_at": func.greatest(
+                JobCostSummary.last_posting_at, insert.excluded.last_posting_at
+            ),
+        },
+    )
+
+
+def _get_transactions_cte() -> sa.CTE:
+    """Return the CTE selecting the transactions from arrays of bound parameters.
+
+    The transactions are numbered by position, starting from 1.
+    """
+    unnest = (
+        func.unnest(
+            *(sa.bindparam(name, type_=pg.ARRAY(type_)) for name, type_ in POSTING_COLUMNS.items())
+        )
+        .table_valued(
+            *itertools.starmap(sa.column, POSTING_COLUMNS.items()),
+            with_ordinality="position",
+        )
+        .render_derived()
+    )
+    return sa.select(unnest).cte("tx")
+
+
+def _get_reservation_cte(tx: sa.CTE, journal_position: sa.CTE, ledger: sa.CTE) -> sa.CTE:
+    """Return the CTE updating the remaining reservation of the jobs with the RSV amounts."""
+    reserved = (
+        sa.select(tx.c.job_id, func.sum(ledger.c.amount).label("amount"))
+        .join(journal_position, journal_position.c.id == ledger.c.journal_id)
+        .join(tx, tx.c.position == journal_position.c.position)
+        .join(Account, Account.id == ledger.c.account_id)
+        .where(tx.c.job_id.is_not(None), Account.account_type == AccountType.RSV)
+        .group_by(tx.c.job_id)
+        .subquery("reserved")
+    )
+    return (
+        sa.update(Job)
+        .values(remaining_reservation=Job.remaining_reservation + reserved.c.amount)
+        .where(Job.id == reserved.c.job_id)
+        .cte("updated_job")
+    )
+
+
+@cache
+def _get_posting_query(*, deferred: bool) -> sa.Select:
+    """Return the statement used to insert the transactions and update the balance.
+
+    The statement is built only once with bound parameters, so it's compiled only once.
+    The transactions are passed as one array for each of POSTING_COLUMNS, and the accounts
+    to be locked as a sorted list of ids.
+
+    The result and the locking order are the same as in the multi-statement version:
+
+    - the accounts are locked in deterministic order, before any other change.
+    - the journal is inserted only after the accounts have been locked.
+    - the journal and ledger rows are inserted in the same order of the transactions,
+      and for each transaction the debit is inserted in the ledger before the credit.
+    - the balance of each account is updated once with the amounts inserted in the ledger,
+      or appended to system_balance_delta for the system account if deferred is True.
+    - the remaining reservation of the jobs is updated with the amounts of the RSV accounts.
+
+    The cost summaries aren't updated, because SQLAlchemy doesn't cache the statements
+    containing INSERT ... ON CONFLICT, and the whole statement would be compiled at each call.
+
+    The statement returns the id and the type of the updated accounts.
+    """
+    locked_query = (
+        sa.select(Account.id)
+        .where(Account.id.in_(sa.bindparam("account_ids", expanding=True)))
+        .order_by(Account.id)
+        .with_for_update()
+    )
+    if deferred:
+        locked_query = locked_query.where(Account.account_type != AccountType.SYS)
+    locked = locked_query.cte("locked")
+    tx = _get_transactions_cte()
+    journal = (
+        sa.insert(Journal)
+        .from_select(
+            [
+                Journal.transaction_datetime,
+                Journal.transaction_type,
+                Journal.job_id,
+                Journal.price_id,
+                Journal.discount_id,
+                Journal.properties,
+            ],
+            sa.select(
+                tx.c.transaction_datetime,
+                tx.c.transaction_type,
+                tx.c.job_id,
+                tx.c.price_id,
+                tx.c.discount_id,
+                tx.c.properties,
+            )
+            .where(
+                # always true, but it ensures that the accounts are locked before the insert
+                sa.select(func.count()).select_from(locked).scalar_subquery().is_not(None)
+            )
+            .order_by(tx.c.position),
+        )
+        .returning(Journal.id)
+        .cte("new_journal")
+    )
+    # the ids are generated in the same order of the inserted rows
+    journal_position = sa.select(
+        journal.c.id, func.row_number().over(order_by=journal.c.id).label("position")
+    ).cte("journal_position")
+    entry = sa.union_all(
+        sa.select(
+            tx.c.position,
+            sa.literal(0).label("leg"),
+            tx.c.debited_from.label("account_id"),
+            (-tx.c.amount).label("amount"),
+        ),
+        sa.select(
+            tx.c.position,
+            sa.literal(1).label("leg"),
+            tx.c.credited_to.label("account_id"),
+            tx.c.amount.label("amount"),
+        ),
+    ).subquery("entry")
+    ledger = (
+        sa.insert(Ledger)
+        .from_select(
+            [Ledger.account_id, Ledger.journal_id, Ledger.amount],
+            sa.select(entry.c.account_id, journal_position.c.id, entry.c.amount)
+            .join(journal_position, journal_position.c.position == entry.c.position)
+            .order_by(entry.c.position, entry.c.leg),
+        )
+        .returning(Ledger.account_id, Ledger.journal_id, Ledger.amount)
+        .cte("new_ledger")
+    )
+    delta = (
+        sa.select(ledger.c.account_id, func.sum(ledger.c.amount).label("amount"))
+        .group_by(ledger.c.account_id)
+        .subquery("delta")
+    )
+    update_query = (
+        sa.update(Account)
+        .values(balance=Account.balance + delta.c.amount)
+        .where(Account.id == delta.c.account_id, Account.enabled == true())
+        .returning(Account.id, Account.account_type)
+    )
+    if deferred:
+        update_query = update_query.where(Account.account_type != AccountType.SYS)
+    updated = update_query.cte("updated_account")
+    result = sa.select(updated.c.id, updated.c.account_type)
+    if deferred:
+        system_delta = (
+            sa.insert(SystemBalanceDelta)
+            .from_select(
+                [SystemBalanceDelta.account_id, SystemBalanceDelta.amount],
+                sa.select(delta.c.account_id, delta.c.amount)
+                .join(Account, Account.id == delta.c.account_id)
+                .where(Account.account_type == AccountType.SYS),
+            )
+            .returning(SystemBalanceDelta.account_id)
+            .cte("new_system_balance_delta")
+        )
+        result = sa.union_all(
+            result,
+            sa.select(
+                system_delta.c.account_id, sa.literal(AccountType.SYS, Account.account_type.type)
+            ),
+        )
+    updated_job = _get_reservation_cte(tx, journal_position, ledger)
+    return sa.select(result.subquery("result")).add_cte(updated_job)
 
 
 class LedgerRepository(BaseRepository):
@@ -28,17 +241,32 @@ class LedgerRepository(BaseRepository):
         discount_id: int | None = None,
         properties: dict | None = None,
     ) -> None:
-        """Insert a transaction into journal and ledger, and update the balance accordingly."""
+        """Insert a transaction into journal and ledger, and update the balance accordingly.
+
+        Raise NoResultFound if any account is disabled.
+        """
+        if settings.LEDGER_DEFERRED_SYSTEM_BALANCE or settings.LEDGER_SINGLE_STATEMENT_POSTING:
+            await self.insert_transactions(
+                [
+                    Transaction(
+                        amount=amount,
+                        debited_from=debited_from,
+                        credited_to=credited_to,
+                        transaction_datetime=transaction_datetime,
+                        transaction_type=transaction_type,
+                        job_id=job_id,
+                        price_id=price_id,
+                        discount_id=discount_id,
+                        properties=properties,
+                    )
+                ]
+            )
+            return
         if amount <= 0:
             L.warning("Negative transaction amount: {}", amount)
         # Lock both accounts in deterministic order to prevent deadlocks
         # and ensure consistent insertion order in journal and ledger
-        await self.db.execute(
-            sa.select(Account.id)
-            .where(Account.id.in_([debited_from, credited_to]))
-            .order_by(Account.id)
-            .with_for_update()
-        )
+        account_types = await self._lock_accounts([debited_from, credited_to])
         query = (
             sa.insert(Journal)
             .values(
@@ -71,7 +299,7 @@ class LedgerRepository(BaseRepository):
             await self.db.execute(
                 sa.update(Account)
                 .values(balance=Account.balance + amount)
-                .where(Account.id == credited_to)
+                .where(Account.id == credited_to, Account.enabled == true())
                 .returning(Account.balance)
             )
         ).one()
@@ -79,30 +307,385 @@ class LedgerRepository(BaseRepository):
             await self.db.execute(
                 sa.update(Account)
                 .values(balance=Account.balance - amount)
-                .where(Account.id == debited_from)
+                .where(Account.id == debited_from, Account.enabled == true())
                 .returning(Account.balance)
             )
         ).one()
+        transactions = [
+            Transaction(
+                amount=amount,
+                debited_from=debited_from,
+                credited_to=credited_to,
+                transaction_datetime=transaction_datetime,
+                transaction_type=transaction_type,
+                job_id=job_id,
+            )
+        ]
+        await self._update_remaining_reservations(account_types, transactions)
+        await self._update_cost_summaries(account_types, transactions)
 
-    async def get_remaining_reservation_for_job(
-        self, *, job_id: UUID, account_id: UUID | None = None, raise_if_negative: bool = True
-    ) -> Decimal:
-        """Return the remaining reservation amount for a specific job."""
+    async def insert_transactions(self, transactions: Sequence[Transaction]) -> None:
+        """Insert multiple transactions into journal and ledger, and update the balance.
+
+        The accounts involved in any transaction are locked only once in deterministic order,
+        the journal and ledger rows are inserted in the same order of the transactions,
+        and the balance of each account is updated only once with the net amount.
+
+        Only the balance of the enabled accounts is updated, and NoResultFound is raised if any
+        account is disabled, also when the ids have been retrieved from the cache before the
+        account was disabled.
+
+        If LEDGER_DEFERRED_SYSTEM_BALANCE is enabled, the system account is neither locked nor
+        updated, and its net amount is appended to system_balance_delta instead, to be folded
+        into the balance later. This way, charges for different projects don't wait for each other.
+
+        If LEDGER_SINGLE_STATEMENT_POSTING is enabled, the same changes are made with a single
+        data-modifying statement, followed by the upsert of the cost summaries of the jobs.
+        """
+        if not transactions:
+            return
+        for transaction in transactions:
+            if transaction.amount <= 0:
+                L.warning("Negative transaction amount: {}", transaction.amount)
+        deltas: dict[UUID, Decimal] = defaultdict(Decimal)
+        for transaction in transactions:
+            deltas[transaction.debited_from] -= transaction.amount
+            deltas[transaction.credited_to] += transaction.amount
+        account_ids = sorted(deltas)
+        deferred = settings.LEDGER_DEFERRED_SYSTEM_BALANCE
+        if settings.LEDGER_SINGLE_STATEMENT_POSTING:
+            params = {
+                "account_ids": account_ids,
+                **{
+                    name: [getattr(transaction, name) for transaction in transactions]
+                    for name in POSTING_COLUMNS
+                },
+            }
+            query = _get_posting_query(deferred=deferred)
+            account_types = dict((await self.db.execute(query, params)).tuples().all())
+            if len(account_types) != len(account_ids):
+                err = f"Updated {len(account_types)} accounts instead of {len(account_ids)}"
+                raise NoResultFound(err)
+            await self._update_cost_summaries(account_types, transactions)
+            return
+        account_types = await self._lock_accounts(account_ids, exclude_system=deferred)
+        query = (
+            sa.insert(Journal)
+            .values(
+                [
+                    {
+                        "transaction_datetime": transaction.transaction_datetime,
+                        "transaction_type": transaction.transaction_type,
+                        "job_id": transaction.job_id,
+                        "price_id": transaction.price_id,
+                        "discount_id": transaction.discount_id,
+                        "properties": transaction.properties,
+                    }
+                    for transaction in transactions
+                ]
+            )
+            .returning(Journal.id)
+        )
+        # the ids are generated in the same order of the inserted rows
+        journal_ids = sorted((await self.db.execute(query)).scalars().all())
+        await self.db.execute(
+            sa.insert(Ledger),
+            [
+                row
+                for journal_id, transaction in zip(journal_ids, transactions, strict=True)
+                for row in (
+                    {
+                        "account_id": transaction.debited_from,
+                        "journal_id": journal_id,
+                        "amount": -1 * transaction.amount,
+                    },
+                    {
+                        "account_id": transaction.credited_to,
+                        "journal_id": journal_id,
+                        "amount": transaction.amount,
+                    },
+                )
+            ],
+        )
+        update_query = (
+            sa.update(Account)
+            .values(balance=Account.balance + sa.case(deltas, value=Account.id))
+            .where(Account.id.in_(account_ids), Account.enabled == true())
+            .returning(Account.id)
+        )
+        if deferred:
+            update_query = update_query.where(Account.account_type != AccountType.SYS)
+        updated = set((await self.db.execute(update_query)).scalars())
+        if deferred and (missing := [i for i in account_ids if i not in updated]):
+            query = (
+                sa.insert(SystemBalanceDelta)
+                .from_select(
+                    [SystemBalanceDelta.account_id, SystemBalanceDelta.amount],
+                    sa.select(Account.id, sa.case(deltas, value=Account.id)).where(
+                        Account.id.in_(missing), Account.account_type == AccountType.SYS
+                    ),
+                )
+                .returning(SystemBalanceDelta.account_id)
+            )
+            updated.update((await self.db.execute(query)).scalars())
+        if len(updated) != len(account_ids):
+            err = f"Updated {len(updated)} accounts instead of {len(account_ids)}"
+            raise NoResultFound(err)
+        await self._update_remaining_reservations(account_types, transactions)
+        await self._update_cost_summaries(account_types, transactions)
+
+    async def _lock_accounts(
+        self, account_ids: list[UUID], *, exclude_system: bool = False
+    ) -> dict[UUID, AccountType]:
+        """Lock the accounts in deterministic order, and return the type of the locked accounts.
+
+        Args:
+            account_ids: list of account ids.
+            exclude_system: if True, the system account isn't locked.
+        """
         query = (
+            sa.select(Account.id, Account.account_type)
+            .where(Account.id.in_(account_ids))
+            .order_by(Account.id)
+            .with_for_update()
+        )
+        if exclude_system:
+            query = query.where(Account.account_type != AccountType.SYS)
+        return dict((await self.db.execute(query)).tuples().all())
+
+    async def _update_remaining_reservations(
+        self, account_types: dict[UUID, AccountType], transactions: Sequence[Transaction]
+    ) -> None:
+        """Update the remaining reservation of the jobs with the amounts of the RSV accounts."""
+        deltas: dict[UUID, Decimal] = defaultdict(Decimal)
+        for transaction in transactions:
+            if transaction.job_id is None:
+                continue
+            if account_types.get(transaction.credited_to) == AccountType.RSV:
+                deltas[transaction.job_id] += transaction.amount
+            if account_types.get(transaction.debited_from) == AccountType.RSV:
+                deltas[transaction.job_id] -= transaction.amount
+        if not deltas:
+            return
+        await self.db.execute(
+            sa.update(Job)
+            .values(remaining_reservation=Job.remaining_reservation + sa.case(deltas, value=Job.id))
+            .where(Job.id.in_(sorted(deltas)))
+        )
+
+    async def _update_cost_summaries(
+        self, account_types: dict[UUID, AccountType], transactions: Sequence[Transaction]
+    ) -> None:
+        """Add the amounts of the transactions to the cost summary of the jobs."""
+        rows: dict[UUID, dict] = {}
+        for transaction in transactions:
+            if transaction.job_id is None:
+                continue
+            row = rows.setdefault(
+                transaction.job_id,
+                {
+                    "job_id": transaction.job_id,
+                    **dict.fromkeys(COST_SUMMARY_AMOUNTS, D0),
+                    "last_posting_at": transaction.transaction_datetime,
+                },
+            )
+            if account_types.get(transaction.debited_from) == AccountType.PROJ:
+                row["amount"] += transaction.amount
+            if account_types.get(transaction.credited_to) == AccountType.PROJ:
+                row["amount"] -= transaction.amount
+            for name, types in COST_SUMMARY_TYPES.items():
+                if transaction.transaction_type in types:
+                    row[name] += transaction.amount
+            row["last_posting_at"] = max(row["last_posting_at"], transaction.transaction_datetime)
+        if not rows:
+            return
+        # sorted to lock the summaries in deterministic order
+        insert = pg.insert(JobCostSummary).values([rows[job_id] for job_id in sorted(rows)])
+        await self.db.execute(_upsert_cost_summary(insert))
+
+    async def backfill_cost_summaries(self, limit: int, after: UUID | None = None) -> list[UUID]:
+        """Recalculate the cost summary of a batch of jobs from the ledger.
+
+        The summaries are locked before being recalculated, so that any concurrent posting is
+        either included in the calculation, or applied after it.
+
+        Args:
+            limit: maximum number of jobs to be recalculated.
+            after: if specified, recalculate only the jobs with greater id.
+
+        Returns:
+            the ids of the recalculated jobs, in ascending order.
+        """
+        query = (
+            sa.select(Job.id)
+            .where((Job.id > after) if after else true())
+            .order_by(Job.id)
+            .limit(limit)
+        )
+        job_ids = list((await self.db.execute(query)).scalars())
+        if not job_ids:
+            return []
+        await self.db.execute(
+            pg.insert(JobCostSummary)
+            .values([{"job_id": job_id} for job_id in job_ids])
+            .on_conflict_do_nothing()
+        )
+        await self.db.execute(
+            sa.select(JobCostSummary.job_id)
+            .where(JobCostSummary.job_id.in_(job_ids))
+            .order_by(JobCostSummary.job_id)
+            .with_for_update()
+        )
+        # the amount of each transaction type is the amount credited to the expected account
+        credited_types = {
+            "charged": AccountType.SYS,
+            "reserved": AccountType.RSV,
+            "released": AccountType.PROJ,
+            "refunded": AccountType.PROJ,
+        }
+        totals = (
             sa.select(
-                func.sum(Ledger.amount).label("total"),
+                Journal.job_id,
+                func.coalesce(
+                    -func.sum(Ledger.amount).filter(Account.account_type == AccountType.PROJ), D0
+                ).label("amount"),
+                *(
+                    func.coalesce(
+                        func.sum(Ledger.amount).filter(
+                            Journal.transaction_type.in_(COST_SUMMARY_TYPES[name]),
+                            Account.account_type == account_type,
+                        ),
+                        D0,
+                    ).label(name)
+                    for name, account_type in credited_types.items()
+                ),
+                func.max(Journal.transaction_datetime).label("last_posting_at"),
             )
-            .select_from(Journal)
-            .join(Ledger)
-            .join(Account)
-            .where(
-                Journal.job_id == job_id,
-                Account.account_type == AccountType.RSV,
-                (Ledger.account_id == account_id) if account_id else true(),
+            .join(Ledger, Ledger.journal_id == Journal.id)
+            .join(Account, Account.id == Ledger.account_id)
+            .where(Journal.job_id.in_(job_ids))
+            .group_by(Journal.job_id)
+            .subquery("totals")
+        )
+        await self.db.execute(
+            sa.update(JobCostSummary)
+            .values(**dict.fromkeys(COST_SUMMARY_AMOUNTS, D0), last_posting_at=None)
+            .where(JobCostSummary.job_id.in_(job_ids))
+        )
+        await self.db.execute(
+            sa.update(JobCostSummary)
+            .values({name: totals.c[name] for name in (*COST_SUMMARY_AMOUNTS, "last_posting_at")})
+            .where(JobCostSummary.job_id == totals.c.job_id)
+        )
+        return job_ids
+
+    async def get_system_balance_delta(self, account_id: UUID) -> Decimal:
+        """Return the sum of the pending changes to the balance of the system account."""
+        query = sa.select(func.sum(SystemBalanceDelta.amount)).where(
+            SystemBalanceDelta.account_id == account_id
+        )
+        return (await self.db.execute(query)).scalar_one() or D0
+
+    async def fold_system_balance_deltas(self) -> int:
+        """Apply the pending changes to the balance of the system account.
+
+        The pending changes are deleted and added to the balance with a single statement,
+        and only the changes already committed are considered.
+
+        Returns:
+            the number of folded changes.
+        """
+        deleted = (
+            sa.delete(SystemBalanceDelta)
+            .returning(SystemBalanceDelta.account_id, SystemBalanceDelta.amount)
+            .cte("deleted")
+        )
+        delta = (
+            sa.select(
+                deleted.c.account_id,
+                func.sum(deleted.c.amount).label("amount"),
+                func.count().label("count"),
             )
+            .group_by(deleted.c.account_id)
+            .subquery("delta")
         )
-        result = (await self.db.execute(query)).scalar_one() or D0
+        updated = (
+            sa.update(Account)
+            .values(balance=Account.balance + delta.c.amount)
+            .where(Account.id == delta.c.account_id)
+            .returning(delta.c.count)
+            .cte("updated_account")
+        )
+        query = sa.select(func.coalesce(func.sum(updated.c.count), 0))
+        return (await self.db.execute(query)).scalar_one()
+
+    async def get_remaining_reservation_for_job(
+        self, *, job_id: UUID, raise_if_negative: bool = True
+    ) -> Decimal:
+        """Return the remaining reservation amount for a specific job.
+
+        The amount is maintained in the job table by the ledger postings, so it's not calculated
+        from the ledger. See check_remaining_reservations to verify the consistency.
+        """
+        query = sa.select(Job.remaining_reservation).where(Job.id == job_id)
+        result = (await self.db.execute(query)).scalar_one_or_none() or D0
         if raise_if_negative and result < 0:
             err = f"Reservation for job {job_id} is negative: {result}"
             raise RuntimeError(err)
         return result
+
+    async def get_remaining_reservations_for_jobs(self, job_ids: list[UUID]) -> dict[UUID, Decimal]:
+        """Return the remaining reservation amount for each of the given jobs.
+
+        The jobs that don't exist are not included in the result.
+        """
+        if not job_ids:
+            return {}
+        query = sa.select(Job.id, Job.remaining_reservation).where(Job.id.in_(job_ids))
+        return dict((await self.db.execute(query)).tuples().all())
+
+    async def check_remaining_reservations(
+        self, *, repair: bool = False
+    ) -> list[tuple[UUID, Decimal, Decimal]]:
+        """Compare the remaining reservation of the jobs with the sum of the RSV ledger rows.
+
+        Args:
+            repair: if True, set the remaining reservation of the inconsistent jobs to the
+                amount calculated from the ledger.
+
+        Returns:
+            a list of (job_id, remaining_reservation, expected) for the inconsistent jobs.
+        """
+        ledger_total = (
+            sa.select(Journal.job_id, func.sum(Ledger.amount).label("total"))
+            .join(Ledger)
+            .join(Account)
+            .where(Journal.job_id.is_not(None), Account.account_type == AccountType.RSV)
+            .group_by(Journal.job_id)
+            .subquery("ledger_total")
+        )
+        expected = func.coalesce(ledger_total.c.total, D0)
+        query = (
+            sa.select(Job.id, Job.remaining_reservation, expected)
+            .outerjoin(ledger_total, ledger_total.c.job_id == Job.id)
+            .where(Job.remaining_reservation != expected)
+            .order_by(Job.id)
+        )
+        if repair:
+            query = query.with_for_update(of=Job)
+        result = [
+            (job_id, remaining_reservation, total)
+            for job_id, remaining_reservation, total in await self.db.execute(query)
+        ]
+        for job_id, remaining_reservation, total in result:
+            L.warning(
+                "Inconsistent remaining reservation for job {}: {} instead of {}",
+                job_id,
+                remaining_reservation,
+                total,
+            )
+            if repair:
+                await self.db.execute(
+                    sa.update(Job).values(remaining_reservation=total).where(Job.id == job_id)
+                )
+        return result
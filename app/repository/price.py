@@ -1,17 +1,33 @@
 """Price repository module."""
 
+from collections.abc import Sequence
 from datetime import datetime
 from http import HTTPStatus
 from typing import Any
 from uuid import UUID
 
 import sqlalchemy as sa
-from sqlalchemy import null, or_
+from sqlalchemy import func, null, or_
+from sqlalchemy.orm import Session
 
+from app.cache import PRICE_CACHE_CHANNEL, PriceHistory, price_cache
+from app.config import settings
 from app.constants import ServiceSubtype, ServiceType
 from app.db.model import Price, PriceTier
 from app.errors import ApiError, ApiErrorCode
 from app.repository.base import BaseRepository
+from app.schema.domain import PriceInfo
+
+# key set in Session.info when the price cache should be cleared at the end of the transaction
+CLEAR_PRICE_CACHE = "clear_price_cache"
+
+
+@sa.event.listens_for(Session, "after_commit")
+@sa.event.listens_for(Session, "after_rollback")
+def _clear_price_cache(session: Session) -> None:
+    """Clear the price cache, when the transaction adding a price ends."""
+    if session.info.pop(CLEAR_PRICE_CACHE, False):
+        price_cache.clear()
 
 
 class PriceRepository(BaseRepository):
@@ -23,8 +39,11 @@ class PriceRepository(BaseRepository):
         service_type: ServiceType,
         service_subtype: ServiceSubtype,
         usage_datetime: datetime,
-    ) -> Price | None:
+    ) -> PriceInfo | None:
         """Return the price for the specified vlab."""
+        if settings.PRICE_CACHE_ENABLED:
+            history = await self._get_vlab_price_history(vlab_id, service_type, service_subtype)
+            return history.find(usage_datetime)
         query = (
             sa.select(Price)
             .where(
@@ -40,7 +59,33 @@ class PriceRepository(BaseRepository):
             .order_by(Price.valid_from.desc(), Price.id.desc())
             .limit(1)
         )
-        return (await self.db.execute(query)).scalar_one_or_none()
+        price = (await self.db.execute(query)).scalar_one_or_none()
+        return PriceInfo.model_validate(price) if price else None
+
+    async def _get_vlab_price_history(
+        self,
+        vlab_id: UUID | None,
+        service_type: ServiceType,
+        service_subtype: ServiceSubtype,
+    ) -> PriceHistory:
+        """Return all the prices for the specified vlab, from the cache if possible."""
+        key = (vlab_id, service_type, service_subtype)
+        if history := price_cache.get(key):
+            return history
+        generation = price_cache.generation
+        query = (
+            sa.select(Price)
+            .where(
+                Price.service_type == service_type,
+                Price.service_subtype == service_subtype,
+                Price.vlab_id == vlab_id,
+            )
+            .order_by(Price.valid_from, Price.id)
+        )
+        rows = (await self.db.execute(query)).scalars()
+        return price_cache.set(
+            key, [PriceInfo.model_validate(row) for row in rows], generation=generation
+        )
 
     async def get_price(
         self,
@@ -48,7 +93,7 @@ class PriceRepository(BaseRepository):
         service_type: ServiceType,
         service_subtype: ServiceSubtype,
         usage_datetime: datetime,
-    ) -> Price:
+    ) -> PriceInfo:
         """Return the price for the specified vlab, or fallback to the default price."""
         price = await self._get_vlab_price(
             vlab_id=vlab_id,
@@ -72,13 +117,56 @@ class PriceRepository(BaseRepository):
             )
         return price
 
+    async def get_prices(
+        self,
+        vlab_ids: list[UUID],
+        service_types: list[ServiceType],
+        service_subtypes: list[ServiceSubtype],
+        usage_from: datetime,
+        usage_to: datetime,
+    ) -> Sequence[Price]:
+        """Return the prices that may be used for the given vlabs, services and usage interval.
+
+        The result includes the default prices, and it's sorted in the same order used to
+        select a single price, so that it can be used to resolve many prices in memory.
+
+        Args:
+            vlab_ids: list of virtual lab UUIDs.
+            service_types: list of service types.
+            service_subtypes: list of service subtypes.
+            usage_from: minimum usage datetime.
+            usage_to: maximum usage datetime.
+        """
+        query = (
+            sa.select(Price)
+            .where(
+                Price.service_type.in_(service_types),
+                Price.service_subtype.in_(service_subtypes),
+                or_(
+                    Price.vlab_id.in_(vlab_ids),
+                    Price.vlab_id == null(),
+                ),
+                Price.valid_from <= usage_to,
+                or_(
+                    Price.valid_to == null(),
+                    Price.valid_to > usage_from,
+                ),
+            )
+            .order_by(Price.valid_from.desc(), Price.id.desc())
+        )
+        return (await self.db.execute(query)).scalars().all()
+
     async def add_price(self, data: dict[str, Any]) -> Price:
         """Add a price for the specified vlab, or as the default price if vlab is None.
 
         Any other pre-existing price for the same service and vlab isn't invalidated.
+        The price cache of the current process is cleared when the transaction ends, while the
+        other processes are notified only when the transaction is committed.
 
         Note: data is modified in-place.
         """
+        self.db.info[CLEAR_PRICE_CACHE] = True
+        await self.db.execute(sa.select(func.pg_notify(PRICE_CACHE_CHANNEL, "")))
         tiers_data = data.pop("tiers")
         price = (await self.db.execute(sa.insert(Price).values(data).returning(Price))).scalar_one()
         for tier in tiers_data:
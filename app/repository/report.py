@@ -1,16 +1,143 @@
 """Job report repository module."""
 
-from collections.abc import Sequence
+from collections.abc import AsyncIterator, Sequence
 from datetime import datetime
 from uuid import UUID
 
 import sqlalchemy as sa
-from sqlalchemy import Integer, Row, and_, case, func, true
+from sqlalchemy import ColumnElement, Integer, Row, and_, case, func, or_, true, tuple_
+from sqlalchemy.dialects import postgresql as pg
 
-from app.constants import D0, TransactionType
-from app.db.model import Job, Journal, Ledger
+from app.config import settings
+from app.constants import D0, RollupGranularity, TransactionType
+from app.db.model import Job, JobCostSummary, Journal, Ledger, RollupWatermark, UsageRollup
+from app.errors import ApiError, ApiErrorCode
 from app.repository.base import BaseRepository
 from app.schema.api import PaginatedParams
+from app.utils import decode_cursor, encode_cursor
+
+# order of the jobs in the reports, used also to build the cursors
+ORDER_BY_COLUMNS = (Job.started_at.desc(), Job.id)
+# name of the watermark of the usage rollups
+USAGE_ROLLUP_WATERMARK = "usage"
+
+
+def encode_job_cursor(started_at: datetime | None, job_id: UUID) -> str:
+    """Return the cursor of the page of job reports following the given job."""
+    return encode_cursor([started_at.isoformat() if started_at else None, str(job_id)])
+
+
+def _after_cursor(cursor: str) -> ColumnElement[bool]:
+    """Return the condition selecting the jobs after the position encoded in the cursor.
+
+    The jobs not started are sorted first, as the NULLs in descending order.
+    """
+    try:
+        started_at_str, job_id_str = decode_cursor(cursor, size=2)
+        started_at = datetime.fromisoformat(started_at_str) if started_at_str else None
+        job_id = UUID(job_id_str)
+    except (TypeError, ValueError) as err:
+        raise ApiError(
+            message="Invalid cursor",
+            error_code=ApiErrorCode.INVALID_REQUEST,
+        ) from err
+    if started_at is None:
+        return or_(Job.started_at.is_not(None), and_(Job.started_at.is_(None), Job.id > job_id))
+    return or_(Job.started_at < started_at, and_(Job.started_at == started_at, Job.id > job_id))
+
+
+def _get_filtered_jobs_query(
+    vlab_id: UUID | None,
+    proj_id: UUID | None,
+    started_after: datetime | None,
+    started_before: datetime | None,
+) -> sa.Select:
+    """Return the query selecting the id of the jobs to be included in the report."""
+    return (
+        sa.select(Job.id)
+        .select_from(Job)
+        .where(
+            Job.finished_at == Job.last_charged_at,
+            (Job.vlab_id == vlab_id) if vlab_id else true(),
+            (Job.proj_id == proj_id) if proj_id else true(),
+            (Job.started_at >= started_after) if started_after else true(),
+            (Job.started_at < started_before) if started_before else true(),
+        )
+    )
+
+
+def _get_report_query(
+    selected_job_query: sa.Subquery, vlab_id: UUID | None, proj_id: UUID | None
+) -> sa.Select:
+    """Return the query selecting the report of the selected jobs, in the order of the report."""
+    amount_columns: tuple[ColumnElement, ...]
+    if settings.REPORT_FROM_COST_SUMMARY:
+        amount_columns = (
+            func.coalesce(JobCostSummary.amount, D0).label("amount"),
+            func.coalesce(JobCostSummary.reserved, D0).label("reserved_amount"),
+        )
+    else:
+        amount_columns = (
+            (func.coalesce(-func.sum(Ledger.amount), D0)).label("amount"),
+            (
+                -func.sum(
+                    case(
+                        (
+                            Journal.transaction_type == TransactionType.RESERVE,
+                            Ledger.amount,
+                        ),
+                        else_=D0,
+                    )
+                )
+            ).label("reserved_amount"),
+        )
+    query = (
+        sa.select(
+            *([Job.vlab_id] if vlab_id is None and proj_id is None else []),
+            *([Job.proj_id] if proj_id is None else []),
+            Job.id.label("job_id"),
+            Job.service_type.label("type"),
+            Job.service_subtype.label("subtype"),
+            Job.user_id,
+            Job.group_id,
+            Job.name,
+            Job.reserved_at,
+            Job.started_at,
+            Job.finished_at,
+            Job.cancelled_at,
+            *amount_columns,
+            Job.usage_params["count"].label("count"),
+            Job.reservation_params["count"].label("reserved_count"),
+            case(
+                (Job.finished_at == Job.started_at, 0),
+                else_=func.extract("epoch", (Job.finished_at - Job.started_at)).cast(Integer),
+            ).label("duration"),
+            Job.reservation_params["duration"].label("reserved_duration"),
+            Job.usage_params["size"].label("size"),
+        )
+        .select_from(selected_job_query)
+        .join(Job, Job.id == selected_job_query.c.id)
+        .order_by(*ORDER_BY_COLUMNS)
+    )
+    if settings.REPORT_FROM_COST_SUMMARY:
+        return query.outerjoin(JobCostSummary, JobCostSummary.job_id == Job.id)
+    return (
+        query.outerjoin(Journal, Journal.job_id == Job.id)
+        .outerjoin(
+            Ledger,
+            and_(Ledger.journal_id == Journal.id, Ledger.account_id == Job.proj_id),
+        )
+        .group_by(Job.id)
+    )
+
+
+def get_job_report_columns(vlab_id: UUID | None = None, proj_id: UUID | None = None) -> list[str]:
+    """Return the names of the columns of the job reports, in the order they are selected."""
+    selected_job_query = _get_filtered_jobs_query(
+        vlab_id=vlab_id, proj_id=proj_id, started_after=None, started_before=None
+    ).subquery("selected_job")
+    query = _get_report_query(selected_job_query, vlab_id=vlab_id, proj_id=proj_id)
+    return [column.name for column in query.selected_columns]
 
 
 class ReportRepository(BaseRepository):
@@ -23,70 +150,221 @@ class ReportRepository(BaseRepository):
         proj_id: UUID | None = None,
         started_after: datetime | None = None,
         started_before: datetime | None = None,
-    ) -> tuple[Sequence[Row], int]:
-        """Return a page of job reports for a given project, and the total number of jobs."""
-        order_by_columns = (Job.started_at.desc(), Job.id)
-        base_query = (
-            sa.select(Job.id)
-            .select_from(Job)
-            .where(
-                Job.finished_at == Job.last_charged_at,
-                (Job.vlab_id == vlab_id) if vlab_id else true(),
-                (Job.proj_id == proj_id) if proj_id else true(),
-                (Job.started_at >= started_after) if started_after else true(),
-                (Job.started_at < started_before) if started_before else true(),
-            )
+    ) -> tuple[Sequence[Row], int | None]:
+        """Return a page of job reports for a given project, and the total number of jobs.
+
+        The jobs are ordered by (started_at DESC, id), so that the cursor of the next page can
+        be built from the last job of the page. The total is None if not requested.
+        """
+        base_query = _get_filtered_jobs_query(
+            vlab_id=vlab_id,
+            proj_id=proj_id,
+            started_after=started_after,
+            started_before=started_before,
         )
-        count_query = base_query.with_only_columns(func.count())
-        count = (await self.db.execute(count_query)).scalar_one()
+        count = None
+        if pagination.include_total:
+            count_query = base_query.with_only_columns(func.count())
+            count = (await self.db.execute(count_query)).scalar_one()
+        if pagination.cursor is None:
+            page_query = base_query.offset(pagination.page_size * (pagination.page - 1))
+        elif pagination.cursor:
+            page_query = base_query.where(_after_cursor(pagination.cursor))
+        else:
+            page_query = base_query
         selected_job_query = (
-            base_query.order_by(*order_by_columns)
+            page_query.order_by(*ORDER_BY_COLUMNS)
             .limit(pagination.page_size)
-            .offset(pagination.page_size * (pagination.page - 1))
             .subquery("selected_job")
         )
+        query = _get_report_query(selected_job_query, vlab_id=vlab_id, proj_id=proj_id)
+        return (await self.db.execute(query)).all(), count
+
+    async def stream_job_reports(
+        self,
+        batch_size: int,
+        vlab_id: UUID | None = None,
+        proj_id: UUID | None = None,
+        started_after: datetime | None = None,
+        started_before: datetime | None = None,
+    ) -> AsyncIterator[Sequence[Row]]:
+        """Yield all the job reports in batches, fetched from a server-side cursor.
+
+        The jobs are ordered as in get_job_reports, and only one batch is kept in memory.
+        """
+        selected_job_query = _get_filtered_jobs_query(
+            vlab_id=vlab_id,
+            proj_id=proj_id,
+            started_after=started_after,
+            started_before=started_before,
+        ).subquery("selected_job")
+        query = _get_report_query(selected_job_query, vlab_id=vlab_id, proj_id=proj_id)
+        result = await self.db.stream(query.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            yield rows
+
+    async def refresh_usage_rollups(self, batch_size: int) -> int:
+        """Aggregate the next batch of journal entries into the hourly and daily usage rollups.
+
+        The watermark is locked, so that concurrent refreshes are serialized. The entries are
+        aggregated in order of transaction id and id, and only if inserted by a transaction older
+        than any transaction still in progress: the following entries can only be inserted by
+        newer transactions, so that the entries committed out of order aren't skipped.
+        The amount of each transaction is the amount credited by the transaction.
+
+        Args:
+            batch_size: maximum number of journal entries to be aggregated.
+
+        Returns:
+            the number of aggregated journal entries.
+        """
+        await self.db.execute(
+            pg.insert(RollupWatermark).values(name=USAGE_ROLLUP_WATERMARK).on_conflict_do_nothing()
+        )
+        last_xid, last_journal_id = (
+            await self.db.execute(
+                sa.select(RollupWatermark.last_xid, RollupWatermark.last_journal_id)
+                .where(RollupWatermark.name == USAGE_ROLLUP_WATERMARK)
+                .with_for_update()
+            )
+        ).one()
+        # all the transactions with lower ids have been committed or rolled back
+        xmin = sa.cast(
+            sa.cast(func.pg_snapshot_xmin(func.pg_current_snapshot()), sa.Text), sa.BigInteger
+        )
+        next_journal = (
+            sa.select(Journal.xid, Journal.id)
+            .where(
+                tuple_(Journal.xid, Journal.id) > tuple_(last_xid, last_journal_id),
+                Journal.xid < xmin,
+            )
+            .order_by(Journal.xid, Journal.id)
+            .limit(batch_size)
+            .subquery("next_journal")
+        )
+        query = (
+            sa.select(next_journal.c.xid, next_journal.c.id, func.count().over())
+            .order_by(next_journal.c.xid.desc(), next_journal.c.id.desc())
+            .limit(1)
+        )
+        if not (row := (await self.db.execute(query)).one_or_none()):
+            return 0
+        max_xid, max_journal_id, count = row
+        journal_amount = (
+            sa.select(Ledger.journal_id, func.max(Ledger.amount).label("amount"))
+            .join(Journal, Journal.id == Ledger.journal_id)
+            .where(
+                tuple_(Journal.xid, Journal.id) > tuple_(last_xid, last_journal_id),
+                tuple_(Journal.xid, Journal.id) <= tuple_(max_xid, max_journal_id),
+            )
+            .group_by(Ledger.journal_id)
+            .subquery("journal_amount")
+        )
+        for granularity in RollupGranularity:
+            bucket_start = func.date_trunc(
+                str(granularity), Journal.transaction_datetime, "UTC"
+            ).label("bucket_start")
+            select_query = (
+                sa.select(
+                    Job.vlab_id,
+                    sa.literal(granularity, UsageRollup.granularity.type).label("granularity"),
+                    bucket_start,
+                    Job.proj_id,
+                    Job.service_type,
+                    Job.service_subtype,
+                    Journal.transaction_type,
+                    func.sum(journal_amount.c.amount).label("amount"),
+                    func.count().label("transactions"),
+                )
+                .select_from(journal_amount)
+                .join(Journal, Journal.id == journal_amount.c.journal_id)
+                .join(Job, Job.id == Journal.job_id)
+                .group_by(
+                    Job.vlab_id,
+                    bucket_start,
+                    Job.proj_id,
+                    Job.service_type,
+                    Job.service_subtype,
+                    Journal.transaction_type,
+                )
+            )
+            insert_query = pg.insert(UsageRollup).from_select(
+                [column.name for column in select_query.selected_columns], select_query
+            )
+            await self.db.execute(
+                insert_query.on_conflict_do_update(
+                    index_elements=[
+                        UsageRollup.vlab_id,
+                        UsageRollup.granularity,
+                        UsageRollup.bucket_start,
+                        UsageRollup.proj_id,
+                        UsageRollup.service_type,
+                        UsageRollup.service_subtype,
+                        UsageRollup.transaction_type,
+                    ],
+                    set_={
+                        "amount": UsageRollup.amount + insert_query.excluded.amount,
+                        "transactions": UsageRollup.transactions
+                        + insert_query.excluded.transactions,
+                    },
+                )
+            )
+        await self.db.execute(
+            sa.update(RollupWatermark)
+            .values(last_xid=max_xid, last_journal_id=max_journal_id)
+            .where(RollupWatermark.name == USAGE_ROLLUP_WATERMARK)
+        )
+        return count
+
+    async def get_usage_rollups_refreshed_at(self) -> datetime | None:
+        """Return when the usage rollups have been refreshed the last time, if ever."""
+        query = sa.select(RollupWatermark.updated_at).where(
+            RollupWatermark.name == USAGE_ROLLUP_WATERMARK
+        )
+        return (await self.db.execute(query)).scalar_one_or_none()
+
+    async def get_usage_timeseries(
+        self,
+        granularity: RollupGranularity,
+        vlab_id: UUID | None = None,
+        proj_id: UUID | None = None,
+        after: datetime | None = None,
+        before: datetime | None = None,
+    ) -> Sequence[Row]:
+        """Return the usage rollups in the given time range, ordered by bucket.
+
+        Args:
+            granularity: size of the time buckets.
+            vlab_id: if specified, return only the rollups of the virtual-lab.
+            proj_id: if specified, return only the rollups of the project.
+            after: if specified, return only the buckets starting at or after this datetime.
+            before: if specified, return only the buckets starting before this datetime.
+        """
         query = (
             sa.select(
-                *([Job.vlab_id] if vlab_id is None and proj_id is None else []),
-                *([Job.proj_id] if proj_id is None else []),
-                Job.id.label("job_id"),
-                Job.service_type.label("type"),
-                Job.service_subtype.label("subtype"),
-                Job.user_id,
-                Job.group_id,
-                Job.name,
-                Job.reserved_at,
-                Job.started_at,
-                Job.finished_at,
-                Job.cancelled_at,
-                (func.coalesce(-func.sum(Ledger.amount), D0)).label("amount"),
-                (
-                    -func.sum(
-                        case(
-                            (
-                                Journal.transaction_type == TransactionType.RESERVE,
-                                Ledger.amount,
-                            ),
-                            else_=D0,
-                        )
-                    )
-                ).label("reserved_amount"),
-                Job.usage_params["count"].label("count"),
-                Job.reservation_params["count"].label("reserved_count"),
-                case(
-                    (Job.finished_at == Job.started_at, 0),
-                    else_=func.extract("epoch", (Job.finished_at - Job.started_at)).cast(Integer),
-                ).label("duration"),
-                Job.reservation_params["duration"].label("reserved_duration"),
-                Job.usage_params["size"].label("size"),
+                UsageRollup.bucket_start,
+                UsageRollup.vlab_id,
+                UsageRollup.proj_id,
+                UsageRollup.service_type.label("type"),
+                UsageRollup.service_subtype.label("subtype"),
+                UsageRollup.transaction_type,
+                UsageRollup.amount,
+                UsageRollup.transactions,
             )
-            .select_from(selected_job_query)
-            .join(Job, Job.id == selected_job_query.c.id)
-            .outerjoin(Journal, Journal.job_id == Job.id)
-            .outerjoin(
-                Ledger, and_(Ledger.journal_id == Journal.id, Ledger.account_id == Job.proj_id)
+            .where(
+                UsageRollup.granularity == granularity,
+                (UsageRollup.vlab_id == vlab_id) if vlab_id else true(),
+                (UsageRollup.proj_id == proj_id) if proj_id else true(),
+                (UsageRollup.bucket_start >= after) if after else true(),
+                (UsageRollup.bucket_start < before) if before else true(),
+            )
+            .order_by(
+                UsageRollup.bucket_start,
+                UsageRollup.vlab_id,
+                UsageRollup.proj_id,
+                UsageRollup.service_type,
+                UsageRollup.service_subtype,
+                UsageRollup.transaction_type,
             )
-            .group_by(Job.id)
-            .order_by(*order_by_columns)
         )
-        return (await self.db.execute(query)).all(), count
+        return (await self.db.execute(query)).all()
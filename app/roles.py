@@ -0,0 +1,227 @@
+"""Roles of the processes, to run and scale each workload separately."""
+
+import asyncio
+from collections.abc import AsyncIterator, Callable, Iterable
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any
+
+from app.config import settings
+from app.constants import DatabasePool
+from app.db.session import database_session_manager
+from app.task.job_charger.base import BaseTask
+from app.task.job_charger.finished import FinishedJobCharger
+from app.task.job_charger.longrun import PeriodicLongrunCharger
+from app.task.job_charger.oneshot import PeriodicOneshotCharger
+from app.task.job_charger.shard import ShardCoordinator
+from app.task.job_charger.storage import PeriodicStorageCharger
+from app.task.job_charger.system_balance import PeriodicSystemBalanceFolder
+from app.task.job_charger.usage_rollup import PeriodicUsageRollupRefresher
+from app.task.metrics import MetricsWriter
+from app.task.price_cache import PriceCacheListener
+from app.task.queue_consumer.base import QueueConsumer
+from app.task.queue_consumer.longrun import LongrunQueueConsumer
+from app.task.queue_consumer.oneshot import OneshotQueueConsumer
+from app.task.queue_consumer.storage import StorageQueueConsumer
+
+if TYPE_CHECKING:
+    from app.schema.domain import Shard
+
+API_ROLE = "api"
+CONSUMER_ROLES = ("consumer:longrun", "consumer:oneshot", "consumer:storage")
+CHARGER_ROLES = (
+    "charger:longrun",
+    "charger:oneshot",
+    "charger:storage",
+    "charger:finished",
+    "charger:system-balance",
+    "charger:usage-rollup",
+)
+ALL_ROLES = frozenset({API_ROLE, *CONSUMER_ROLES, *CHARGER_ROLES})
+ROLE_ALIASES = {
+    "all": ALL_ROLES,
+    "consumer": frozenset(CONSUMER_ROLES),
+    "charger": frozenset(CHARGER_ROLES),
+}
+
+type Task = BaseTask | QueueConsumer
+
+
+def parse_roles(values: Iterable[str]) -> frozenset[str]:
+    """Return the roles from a list of comma-separated roles or aliases.
+
+    Raise ValueError if any role is unknown.
+    """
+    result: set[str] = set()
+    for value in values:
+        for role in filter(None, (item.strip() for item in value.split(","))):
+            if role in ROLE_ALIASES:
+                result.update(ROLE_ALIASES[role])
+            elif role in ALL_ROLES:
+                result.add(role)
+            else:
+                err = (
+                    f"Invalid role: {role!r}, expected one of {sorted([*ROLE_ALIASES, *ALL_ROLES])}"
+                )
+                raise ValueError(err)
+    if not result:
+        err = "At least one role must be specified"
+        raise ValueError(err)
+    return frozenset(result)
+
+
+def get_pool_size(roles: frozenset[str]) -> int:
+    """Return the size of the default database pool needed by the roles."""
+    # connection used by the listener of the price cache
+    listener_size = 1 if settings.PRICE_CACHE_ENABLED else 0
+    if settings.DB_POOLS_ENABLED:
+        return settings.DB_POOL_SIZE_DEFAULT + listener_size
+    if roles == ALL_ROLES:
+        return settings.DB_POOL_SIZE
+    size = settings.DB_POOL_SIZE_API if API_ROLE in roles else 0
+    size += settings.DB_POOL_SIZE_CONSUMER * len(roles.intersection(CONSUMER_ROLES))
+    size += settings.DB_POOL_SIZE_CHARGER * len(roles.intersection(CHARGER_ROLES))
+    return size + listener_size
+
+
+def get_pools(roles: frozenset[str]) -> dict[str, dict[str, Any]]:
+    """Return the parameters of the separate database pools needed by the roles, if enabled."""
+    if not settings.DB_POOLS_ENABLED:
+        return {}
+    pools = {
+        DatabasePool.API: (
+            settings.DB_POOL_SIZE_API if API_ROLE in roles else 0,
+            settings.DB_POOL_TIMEOUT_API,
+        ),
+        DatabasePool.CONSUMER: (
+            settings.DB_POOL_SIZE_CONSUMER * len(roles.intersection(CONSUMER_ROLES)),
+            settings.DB_POOL_TIMEOUT_CONSUMER,
+        ),
+        DatabasePool.CHARGER: (
+            settings.DB_POOL_SIZE_CHARGER * len(roles.intersection(CHARGER_ROLES)),
+            settings.DB_POOL_TIMEOUT_CHARGER,
+        ),
+    }
+    return {
+        pool: {"pool_size": size, "pool_timeout": timeout}
+        for pool, (size, timeout) in pools.items()
+        if size > 0
+    }
+
+
+def initialize_database(roles: frozenset[str]) -> None:
+    """Initialize the database pools needed by the roles."""
+    pools = get_pools(roles)
+    if settings.DB_REPLICA_URI and API_ROLE in roles:
+        pools[DatabasePool.REPLICA] = {
+            "url": settings.DB_REPLICA_URI,
+            "pool_size": settings.DB_POOL_SIZE_REPLICA,
+            "pool_timeout": settings.DB_POOL_TIMEOUT_API,
+        }
+    database_session_manager.initialize(
+        url=settings.DB_URI,
+        pools=pools,
+        replica_max_lag=settings.DB_REPLICA_MAX_LAG,
+        replica_check_interval=settings.DB_REPLICA_LAG_CHECK_INTERVAL,
+        replica_check_timeout=settings.DB_REPLICA_LAG_CHECK_TIMEOUT,
+        instrument_queries=(
+            settings.DB_QUERY_STATS_ENABLED
+            or settings.SERVER_TIMING_ENABLED
+            or settings.DB_SLOW_QUERY_THRESHOLD is not None
+        ),
+        slow_query_threshold=settings.DB_SLOW_QUERY_THRESHOLD,
+        pool_size=get_pool_size(roles),
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+    )
+
+
+def _create_consumer(cls: type[QueueConsumer], name: str, queue_name: str, delay: int) -> Task:
+    return cls(
+        name=name,
+        queue_name=queue_name,
+        initial_delay=delay,
+        max_number_of_messages=settings.SQS_MAX_NUMBER_OF_MESSAGES,
+        max_concurrency=settings.SQS_MAX_CONCURRENCY,
+        delete_batch_size=settings.SQS_DELETE_BATCH_SIZE,
+        delete_flush_interval=settings.SQS_DELETE_FLUSH_INTERVAL,
+        delete_max_retries=settings.SQS_DELETE_MAX_RETRIES,
+        event_body_storage=settings.EVENT_BODY_STORAGE,
+        event_body_max_length=settings.EVENT_BODY_MAX_LENGTH,
+    )
+
+
+def create_tasks(roles: frozenset[str]) -> list[Task]:
+    """Return the background tasks to be executed for the given roles, excluding the api."""
+    tasks: list[Task] = []
+    if settings.PRICE_CACHE_ENABLED:
+        tasks.append(PriceCacheListener(name="price-cache-listener"))
+    get_shard: Callable[[], Shard] | None = None
+    if settings.CHARGER_SHARDING_ENABLED and roles.intersection(CHARGER_ROLES):
+        shard_coordinator = ShardCoordinator(name="shard-coordinator")
+        get_shard = shard_coordinator.get_shard
+        tasks.append(shard_coordinator)
+    factories: dict[str, Callable[[], Task]] = {
+        "consumer:longrun": lambda: _create_consumer(
+            LongrunQueueConsumer, "longrun-consumer", settings.SQS_LONGRUN_QUEUE_NAME, delay=1
+        ),
+        "consumer:oneshot": lambda: _create_consumer(
+            OneshotQueueConsumer, "oneshot-consumer", settings.SQS_ONESHOT_QUEUE_NAME, delay=2
+        ),
+        "consumer:storage": lambda: _create_consumer(
+            StorageQueueConsumer, "storage-consumer", settings.SQS_STORAGE_QUEUE_NAME, delay=3
+        ),
+        "charger:longrun": lambda: PeriodicLongrunCharger(
+            name="longrun-charger", initial_delay=4, get_shard=get_shard
+        ),
+        "charger:oneshot": lambda: PeriodicOneshotCharger(
+            name="oneshot-charger", initial_delay=5, get_shard=get_shard
+        ),
+        "charger:storage": lambda: PeriodicStorageCharger(
+            name="storage-charger", initial_delay=6, get_shard=get_shard
+        ),
+        "charger:system-balance": lambda: PeriodicSystemBalanceFolder(
+            name="system-balance-folder", initial_delay=7
+        ),
+        "charger:finished": lambda: FinishedJobCharger(
+            name="finished-job-charger", initial_delay=8, get_shard=get_shard
+        ),
+        "charger:usage-rollup": lambda: PeriodicUsageRollupRefresher(
+            name="usage-rollup-refresher", initial_delay=9
+        ),
+    }
+    for role, factory in factories.items():
+        if role not in roles:
+            continue
+        if role == "charger:finished" and not settings.CHARGE_FINISHED_ON_EVENT:
+            continue
+        if role == "charger:usage-rollup" and not settings.USAGE_ROLLUP_ENABLED:
+            continue
+        tasks.append(factory())
+    return tasks
+
+
+def create_worker_tasks() -> list[Task]:
+    """Return the background tasks to be executed by each uvicorn worker of the api.
+
+    Each worker has its own price cache, so it needs its own listener of the invalidations,
+    and it writes its metrics to the shared directory, if configured.
+    """
+    tasks: list[Task] = []
+    if settings.PRICE_CACHE_ENABLED:
+        tasks.append(PriceCacheListener(name="price-cache-listener"))
+    if settings.METRICS_MULTIPROCESS_DIR:
+        tasks.append(MetricsWriter(name="metrics-writer"))
+    return tasks
+
+
+@asynccontextmanager
+async def run_tasks(tasks: Iterable[Task]) -> AsyncIterator[None]:
+    """Run the tasks in background while in the context, and cancel them on exit."""
+    running = [asyncio.create_task(task.run_forever(), name=task.name) for task in tasks]
+    try:
+        yield
+    finally:
+        for running_task in running:
+            running_task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
@@ -9,7 +9,15 @@ from uuid import UUID
 from pydantic import AwareDatetime, Field, model_validator
 from starlette.datastructures import URL
 
-from app.constants import D0, D1, LEGACY_SERVICE_SUBTYPE, ServiceSubtype, ServiceType
+from app.constants import (
+    D0,
+    D1,
+    LEGACY_SERVICE_SUBTYPE,
+    RollupGranularity,
+    ServiceSubtype,
+    ServiceType,
+    TransactionType,
+)
 from app.errors import ApiErrorCode
 from app.schema.common import BaseModel, FormattedDecimal
 
@@ -30,10 +38,16 @@ class ErrorResponse(BaseModel, use_enum_values=True):
 
 
 class PaginatedParams(BaseModel):
-    """PaginatedParams."""
+    """PaginatedParams.
+
+    If cursor is not None, the items are selected after the position encoded in the cursor,
+    instead of skipping the items in the previous pages. An empty cursor selects the first page.
+    """
 
     page: Annotated[int, Field(strict=True, ge=1)]
     page_size: Annotated[int, Field(strict=True, ge=1)]
+    cursor: str | None = None
+    include_total: bool = True
 
 
 class PaginatedMeta(BaseModel):
@@ -41,8 +55,8 @@ class PaginatedMeta(BaseModel):
 
     page: Annotated[int, Field(ge=1)]
     page_size: Annotated[int, Field(ge=1)]
-    total_pages: Annotated[int, Field(ge=0)]
-    total_items: Annotated[int, Field(ge=0)]
+    total_pages: Annotated[int, Field(ge=0)] | None = None
+    total_items: Annotated[int, Field(ge=0)] | None = None
 
 
 class PaginatedLinks(BaseModel):
@@ -52,7 +66,8 @@ class PaginatedLinks(BaseModel):
     prev: str | None
     next: str | None
     first: str
-    last: str
+    last: str | None
+    next_cursor: str | None = None
 
 
 class PaginatedOut[T](BaseModel):
@@ -63,16 +78,36 @@ class PaginatedOut[T](BaseModel):
     links: PaginatedLinks
 
     @classmethod
-    def new(cls, items: Sequence, total_items: int, pagination: PaginatedParams, url: URL) -> Self:
+    def new(
+        cls,
+        items: Sequence,
+        total_items: int | None,
+        pagination: PaginatedParams,
+        url: URL,
+        next_cursor: str | None = None,
+    ) -> Self:
         """Create a new instance with the given parameters.
 
         Args:
             items: sequence of items in the current page.
-            total_items: total number of items available on the server.
+            total_items: total number of items available on the server, or None if not counted.
             pagination: pagination instance containing page and page_size.
             url: current url, used to generate the links to the related pages.
+            next_cursor: cursor of the next page, when using the cursor pagination.
         """
-        total_pages = math.ceil(total_items / pagination.page_size)
+        total_pages = (
+            math.ceil(total_items / pagination.page_size) if total_items is not None else None
+        )
+        # the previous and last pages can be reached only by page number
+        page_url = url.remove_query_params("cursor")
+        if pagination.cursor is None:
+            has_next = total_pages is not None and pagination.page < total_pages
+            next_url = url.include_query_params(page=pagination.page + 1) if has_next else None
+            first_url = url.include_query_params(page=1)
+        else:
+            has_next = next_cursor is not None
+            next_url = url.include_query_params(page=pagination.page + 1, cursor=next_cursor)
+            first_url = url.include_query_params(page=1, cursor="")
         return cls.model_validate(
             {
                 "items": items,
@@ -85,17 +120,18 @@ class PaginatedOut[T](BaseModel):
                 "links": {
                     "self": str(url),
                     "prev": (
-                        str(url.include_query_params(page=pagination.page - 1))
+                        str(page_url.include_query_params(page=pagination.page - 1))
                         if pagination.page > 1
                         else None
                     ),
-                    "next": (
-                        str(url.include_query_params(page=pagination.page + 1))
-                        if pagination.page < total_pages
+                    "next": str(next_url) if has_next else None,
+                    "first": str(first_url),
+                    "last": (
+                        str(page_url.include_query_params(page=total_pages or 1))
+                        if total_pages is not None
                         else None
                     ),
-                    "first": str(url.include_query_params(page=1)),
-                    "last": str(url.include_query_params(page=total_pages or 1)),
+                    "next_cursor": next_cursor,
                 },
             }
         )
@@ -351,6 +387,16 @@ class AddPriceOut(AddPriceBase):
     tiers: list[PriceTierOut]
 
 
+class PriceCacheStatsOut(BaseModel):
+    """PriceCacheStatsOut."""
+
+    enabled: bool
+    hits: int
+    misses: int
+    invalidations: int
+    size: int
+
+
 class BaseEstimateCostIn(BaseModel):
     """BaseEstimateCostIn."""
 
@@ -486,6 +532,27 @@ JobReportUnionOut = Annotated[
 ]
 
 
+class UsagePointOut(BaseModel, from_attributes=True):
+    """UsagePointOut."""
+
+    bucket_start: AwareDatetime
+    vlab_id: UUID
+    proj_id: UUID
+    type: ServiceType
+    subtype: ServiceSubtype
+    transaction_type: TransactionType
+    amount: FormattedDecimal
+    transactions: int
+
+
+class UsageTimeseriesOut(BaseModel):
+    """UsageTimeseriesOut."""
+
+    granularity: RollupGranularity
+    refreshed_at: AwareDatetime | None
+    items: list[UsagePointOut]
+
+
 class LongrunOpenJobOut(BaseModel, from_attributes=True):
     """LongrunOpenJobOut."""
 
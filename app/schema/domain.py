@@ -1,16 +1,23 @@
 """Domain entities."""
 
+import bisect
+from collections import defaultdict
+from collections.abc import Iterable
 from dataclasses import dataclass
 from datetime import datetime
-from decimal import Decimal
-from typing import Annotated, Any
+from decimal import MAX_EMAX, MAX_PREC, MIN_EMIN, Context, Decimal, localcontext
+from functools import cached_property
+from typing import Annotated, Any, Self
 from uuid import UUID
 
 from pydantic import ConfigDict, Field
 
-from app.constants import D0, ServiceSubtype, ServiceType
+from app.constants import D0, ServiceSubtype, ServiceType, TransactionType
 from app.schema.common import BaseModel
 
+# context without rounding: the sums and the products of finite decimals are always exact
+EXACT_CONTEXT = Context(prec=MAX_PREC, Emax=MAX_EMAX, Emin=MIN_EMIN)
+
 
 class BaseAccount(BaseModel):
     """BaseAccount."""
@@ -51,6 +58,141 @@ class Accounts(BaseModel):
     rsv: RsvAccount
 
 
+@dataclass(frozen=True, kw_only=True, slots=True)
+class AccountIds:
+    """Ids of the accounts related to a project."""
+
+    sys_id: UUID
+    vlab_id: UUID
+    proj_id: UUID
+    rsv_id: UUID
+
+
+@dataclass(frozen=True)
+class Shard:
+    """Hash slots of the projects to be charged, out of the total number of slots."""
+
+    slots: frozenset[int]
+    total: int
+
+
+class PriceTierInfo(BaseModel):
+    """PriceTierInfo."""
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+    min_quantity: int
+    max_quantity: int | None
+    fixed_cost: Decimal
+    multiplier: Decimal
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledTiers:
+    """Price tiers compiled to prefix sums, to calculate the cost of any usage range.
+
+    The boundaries are the sorted and distinct min_quantity and max_quantity of the tiers.
+    For each boundary:
+
+    - fixed_before: sum of the fixed costs of the tiers starting before the boundary.
+    - fixed_at: sum of the fixed costs of the tiers starting at the boundary.
+    - variable_before: sum of the variable costs of the usage before the boundary.
+    - multipliers: sum of the multipliers of the tiers covering the boundary and the usage
+      until the next boundary.
+
+    The result of cost(start, end) is the same as iterating over the tiers, where:
+
+    - each tier covers the range [min_quantity, max_quantity).
+    - each tier's fixed_cost is added once when the usage enters that tier.
+    - each tier's multiplier applies to the portion of usage within that tier's range.
+
+    The prefix sums and the costs are calculated without rounding, because the difference
+    of two rounded prefix sums would lose the precision of the usage range, and only the
+    result of cost(start, end) is rounded to the current context.
+    """
+
+    boundaries: tuple[int, ...]
+    fixed_before: tuple[Decimal, ...]
+    fixed_at: tuple[Decimal, ...]
+    variable_before: tuple[Decimal, ...]
+    multipliers: tuple[Decimal, ...]
+
+    @classmethod
+    def from_tiers(cls, tiers: Iterable[PriceTierInfo]) -> Self:
+        """Return a new instance built from the given tiers, in any order."""
+        fixed_costs: defaultdict[int, Decimal] = defaultdict(Decimal)
+        multiplier_changes: defaultdict[int, Decimal] = defaultdict(Decimal)
+        with localcontext(EXACT_CONTEXT):
+            for tier in tiers:
+                if tier.max_quantity is not None and tier.max_quantity <= tier.min_quantity:
+                    # empty tiers never contribute to the cost
+                    continue
+                fixed_costs[tier.min_quantity] += tier.fixed_cost
+                multiplier_changes[tier.min_quantity] += tier.multiplier
+                if tier.max_quantity is not None:
+                    multiplier_changes[tier.max_quantity] -= tier.multiplier
+            boundaries = sorted(multiplier_changes)
+            fixed_before, fixed_at, variable_before, multipliers = [], [], [], []
+            fixed = variable = multiplier = D0
+            previous = boundaries[0] if boundaries else 0
+            for boundary in boundaries:
+                variable += multiplier * (boundary - previous)
+                multiplier += multiplier_changes[boundary]
+                fixed_before.append(fixed)
+                fixed_at.append(fixed_costs[boundary])
+                variable_before.append(variable)
+                multipliers.append(multiplier)
+                fixed += fixed_costs[boundary]
+                previous = boundary
+        return cls(
+            boundaries=tuple(boundaries),
+            fixed_before=tuple(fixed_before),
+            fixed_at=tuple(fixed_at),
+            variable_before=tuple(variable_before),
+            multipliers=tuple(multipliers),
+        )
+
+    def _cumulative_cost(self, usage: int) -> Decimal:
+        """Return the exact cost of the usage from 0 to usage, excluding any tier starting there.
+
+        It must be called in the exact context.
+        """
+        index = bisect.bisect_right(self.boundaries, usage) - 1
+        if index < 0:
+            return D0
+        boundary = self.boundaries[index]
+        cost = self.fixed_before[index] + self.variable_before[index]
+        if usage > boundary:
+            cost += self.fixed_at[index] + self.multipliers[index] * (usage - boundary)
+        return cost
+
+    def cost(self, start: int, end: int) -> Decimal:
+        """Return the usage cost from start to end, or 0 if end <= start."""
+        if end <= start:
+            return D0
+        with localcontext(EXACT_CONTEXT):
+            cost = self._cumulative_cost(end) - self._cumulative_cost(start)
+        # round to the precision of the current context
+        return +cost
+
+
+class PriceInfo(BaseModel):
+    """Immutable price with tiers, not bound to any database session."""
+
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+    id: int
+    vlab_id: UUID | None
+    service_type: ServiceType
+    service_subtype: ServiceSubtype
+    valid_from: datetime
+    valid_to: datetime | None
+    tiers: tuple[PriceTierInfo, ...]
+
+    @cached_property
+    def compiled_tiers(self) -> CompiledTiers:
+        """Tiers compiled once and reused by any calculation of the cost."""
+        return CompiledTiers.from_tiers(self.tiers)
+
+
 class BaseJob(BaseModel):
     """BaseJob."""
 
@@ -74,6 +216,22 @@ class StartedJob(BaseJob):
 
     started_at: datetime
     last_alive_at: datetime
+    next_charge_due_at: datetime | None = None
+
+
+@dataclass(frozen=True, kw_only=True)
+class Transaction:
+    """Transaction to be inserted into journal and ledger."""
+
+    amount: Decimal
+    debited_from: UUID
+    credited_to: UUID
+    transaction_datetime: datetime
+    transaction_type: TransactionType
+    job_id: UUID | None = None
+    price_id: int | None = None
+    discount_id: int | None = None
+    properties: dict | None = None
 
 
 @dataclass(kw_only=True)
@@ -58,6 +58,13 @@ async def get_balance_for_system(repos: RepositoryGroup) -> SysBalanceOut:
     """Return the balance for the system account."""
     with ensure_result(error_message="System account not found"):
         sys = await repos.account.get_system_account()
+    # include the changes not folded yet, when the system balance is updated in deferred mode
+    pending = await repos.ledger.get_system_balance_delta(account_id=sys.id)
     return SysBalanceOut(
-        balance=sys.balance,
+        balance=sys.balance + pending,
     )
+
+
+async def fold_system_balance(repos: RepositoryGroup) -> int:
+    """Apply the pending changes to the balance of the system account, and return their number."""
+    return await repos.ledger.fold_system_balance_deltas()
@@ -6,6 +6,7 @@ from uuid import UUID
 from app.constants import D0, AccountType, TransactionType
 from app.errors import ApiError, ApiErrorCode, ensure_result
 from app.repository.group import RepositoryGroup
+from app.schema.domain import Transaction
 from app.utils import utcnow
 
 
@@ -120,20 +121,24 @@ async def grant(repos: RepositoryGroup, proj_id: UUID, amount: Decimal) -> None:
     """Top-up a vlab and assign the budget to a project in one atomic transaction."""
     now = utcnow()
     with ensure_result(error_message="Account not found"):
-        accounts = await repos.account.get_accounts_by_proj_id(proj_id=proj_id)
-    await repos.ledger.insert_transaction(
-        amount=amount,
-        debited_from=accounts.sys.id,
-        credited_to=accounts.vlab.id,
-        transaction_datetime=now,
-        transaction_type=TransactionType.TOP_UP,
-    )
-    await repos.ledger.insert_transaction(
-        amount=amount,
-        debited_from=accounts.vlab.id,
-        credited_to=accounts.proj.id,
-        transaction_datetime=now,
-        transaction_type=TransactionType.ASSIGN_BUDGET,
+        account_ids = await repos.account.get_account_ids_by_proj_id(proj_id=proj_id)
+    await repos.ledger.insert_transactions(
+        [
+            Transaction(
+                amount=amount,
+                debited_from=account_ids.sys_id,
+                credited_to=account_ids.vlab_id,
+                transaction_datetime=now,
+                transaction_type=TransactionType.TOP_UP,
+            ),
+            Transaction(
+                amount=amount,
+                debited_from=account_ids.vlab_id,
+                credited_to=account_ids.proj_id,
+                transaction_datetime=now,
+                transaction_type=TransactionType.ASSIGN_BUDGET,
+            ),
+        ]
     )
 
 
@@ -169,26 +174,28 @@ async def deplete_virtual_lab(repos: RepositoryGroup, vlab_id: UUID) -> Decimal:
     # Lock all involved accounts up front in deterministic order to avoid deadlocks
     all_ids = sorted([system_account.id, vlab.id, *(p.id for p in projects)])
     await repos.account.lock_accounts(all_ids)
-    total_amount = D0
-    for proj in projects:
-        if proj.balance > D0:
-            await repos.ledger.insert_transaction(
-                amount=proj.balance,
-                debited_from=proj.id,
+    transactions = [
+        Transaction(
+            amount=proj.balance,
+            debited_from=proj.id,
+            credited_to=system_account.id,
+            transaction_datetime=now,
+            transaction_type=TransactionType.DEPLETE,
+            properties={"reason": "deplete_project"},
+        )
+        for proj in projects
+        if proj.balance > D0
+    ]
+    if vlab.balance > D0:
+        transactions.append(
+            Transaction(
+                amount=vlab.balance,
+                debited_from=vlab.id,
                 credited_to=system_account.id,
                 transaction_datetime=now,
                 transaction_type=TransactionType.DEPLETE,
-                properties={"reason": "deplete_project"},
+                properties={"reason": "deplete_vlab"},
             )
-            total_amount += proj.balance
-    if vlab.balance > D0:
-        await repos.ledger.insert_transaction(
-            amount=vlab.balance,
-            debited_from=vlab.id,
-            credited_to=system_account.id,
-            transaction_datetime=now,
-            transaction_type=TransactionType.DEPLETE,
-            properties={"reason": "deplete_vlab"},
         )
-        total_amount += vlab.balance
-    return total_amount
+    await repos.ledger.insert_transactions(transactions)
+    return sum((transaction.amount for transaction in transactions), start=D0)
@@ -1,18 +1,33 @@
 """Charge for longrun jobs."""
 
-from collections import Counter
-from dataclasses import dataclass
-from datetime import datetime
+from collections import Counter, defaultdict
+from collections.abc import AsyncIterator, Sequence
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 from decimal import Decimal
+from functools import partial
+from http import HTTPStatus
+from itertools import batched
+from uuid import UUID
 
-from app.constants import D0, TransactionType
+from app.constants import D0, ServiceSubtype, ServiceType, TransactionType
+from app.db.instrumentation import track_queries
+from app.db.model import Discount
 from app.db.session import SessionFactory
+from app.errors import ApiError, ApiErrorCode
 from app.logger import L
 from app.repository.group import RepositoryGroup
-from app.schema.domain import ChargeLongrunResult, StartedJob
+from app.schema.domain import (
+    AccountIds,
+    ChargeLongrunResult,
+    PriceInfo,
+    Shard,
+    StartedJob,
+    Transaction,
+)
 from app.service.price import calculate_cost
 from app.service.usage import calculate_longrun_cumulative_usage
-from app.utils import utcnow
+from app.utils import run_partitioned, utcnow
 
 
 @dataclass(frozen=True, slots=True)
@@ -27,12 +42,155 @@ class ChargeParams:
     min_charging_interval: float = 0.0
     min_charging_amount: Decimal = D0
     expired: bool = False
+    # if the charge is skipped, the job isn't selected again before this datetime
+    postpone_until: datetime | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class ChargeContext:
+    """Account ids, price, discount, and remaining reservation used by _charge_generic.
+
+    If remaining_reservation is None, it's loaded only when needed.
+    """
+
+    account_ids: AccountIds
+    price: PriceInfo
+    discount: Discount | None
+    remaining_reservation: Decimal | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class PrefetchedData:
+    """Data prefetched in bulk for a chunk of longrun jobs."""
+
+    account_ids: dict[UUID, AccountIds]
+    discounts: dict[UUID, Discount]
+    remaining_reservations: dict[UUID, Decimal]
+    prices: dict[tuple[UUID | None, ServiceType, ServiceSubtype], list[PriceInfo]] = field(
+        default_factory=lambda: defaultdict(list)
+    )
+
+    def _find_price(
+        self,
+        vlab_id: UUID | None,
+        service_type: ServiceType,
+        service_subtype: ServiceSubtype,
+        usage_datetime: datetime,
+    ) -> PriceInfo | None:
+        """Return the price for the specified vlab, as in PriceRepository._get_vlab_price."""
+        for price in self.prices.get((vlab_id, service_type, service_subtype), []):
+            if price.valid_from <= usage_datetime and (
+                price.valid_to is None or price.valid_to > usage_datetime
+            ):
+                return price
+        return None
+
+    def get_price(
+        self,
+        vlab_id: UUID,
+        service_type: ServiceType,
+        service_subtype: ServiceSubtype,
+        usage_datetime: datetime,
+    ) -> PriceInfo:
+        """Return the price for the specified vlab, or fallback to the default price."""
+        price = self._find_price(
+            vlab_id, service_type, service_subtype, usage_datetime
+        ) or self._find_price(None, service_type, service_subtype, usage_datetime)
+        if not price:
+            err = f"Missing price for: {vlab_id} {service_type} {service_subtype} {usage_datetime}"
+            raise ApiError(
+                message=err,
+                error_code=ApiErrorCode.ENTITY_NOT_FOUND,
+                http_status_code=HTTPStatus.NOT_FOUND,
+            )
+        return price
+
+    def get_charge_context(self, job: StartedJob) -> ChargeContext:
+        """Return the ChargeContext for the given job."""
+        account_ids = self.account_ids.get(job.proj_id)
+        if not account_ids:
+            err = f"Accounts not found for project {job.proj_id}"
+            raise ValueError(err)
+        return ChargeContext(
+            account_ids=account_ids,
+            price=self.get_price(
+                vlab_id=account_ids.vlab_id,
+                service_type=job.service_type,
+                service_subtype=job.service_subtype,
+                usage_datetime=job.reserved_at or job.started_at,
+            ),
+            discount=self.discounts.get(account_ids.vlab_id),
+            remaining_reservation=self.remaining_reservations.get(job.id, D0),
+        )
+
+
+async def prefetch_data(repos: RepositoryGroup, jobs: Sequence[StartedJob]) -> PrefetchedData:
+    """Load the data needed to charge the given jobs with a few set-based queries."""
+    account_ids = await repos.account.get_account_ids_by_proj_ids(
+        proj_ids=list({job.proj_id for job in jobs})
+    )
+    vlab_ids = list({item.vlab_id for item in account_ids.values()})
+    usage_datetimes = [job.reserved_at or job.started_at for job in jobs]
+    result = PrefetchedData(
+        account_ids=account_ids,
+        discounts=await repos.discount.get_current_vlab_discounts(vlab_ids),
+        remaining_reservations=await repos.ledger.get_remaining_reservations_for_jobs(
+            job_ids=[job.id for job in jobs]
+        ),
+    )
+    prices = await repos.price.get_prices(
+        vlab_ids=vlab_ids,
+        service_types=list({job.service_type for job in jobs}),
+        service_subtypes=list({job.service_subtype for job in jobs}),
+        usage_from=min(usage_datetimes),
+        usage_to=max(usage_datetimes),
+    )
+    for price in prices:
+        result.prices[price.vlab_id, price.service_type, price.service_subtype].append(
+            PriceInfo.model_validate(price)
+        )
+    return result
+
+
+async def _load_charge_context(repos: RepositoryGroup, job: StartedJob) -> ChargeContext:
+    """Load the ChargeContext for the given job."""
+    account_ids = await repos.account.get_account_ids_by_proj_id(proj_id=job.proj_id)
+    price = await repos.price.get_price(
+        vlab_id=account_ids.vlab_id,
+        service_type=job.service_type,
+        service_subtype=job.service_subtype,
+        usage_datetime=job.reserved_at or job.started_at,
+    )
+    discount = await repos.discount.get_current_vlab_discount(account_ids.vlab_id)
+    return ChargeContext(account_ids=account_ids, price=price, discount=discount)
+
+
+async def _postpone(repos: RepositoryGroup, job: StartedJob, params: ChargeParams) -> None:
+    """Postpone the next charge of a skipped job, if requested."""
+    if params.postpone_until:
+        await repos.job.postpone_longrun_charge(job_id=job.id, due_at=params.postpone_until)
+
+
+async def _get_remaining_reservation(
+    repos: RepositoryGroup, job: StartedJob, context: ChargeContext
+) -> Decimal:
+    """Return the prefetched remaining reservation, or load it if not prefetched."""
+    remaining_reservation = context.remaining_reservation
+    if remaining_reservation is None:
+        return await repos.ledger.get_remaining_reservation_for_job(
+            job_id=job.id, raise_if_negative=True
+        )
+    if remaining_reservation < 0:
+        err = f"Reservation for job {job.id} is negative: {remaining_reservation}"
+        raise RuntimeError(err)
+    return remaining_reservation
 
 
 async def _charge_generic(
     repos: RepositoryGroup,
     job: StartedJob,
     params: ChargeParams,
+    context: ChargeContext | None = None,
 ) -> None:
     total_seconds = int((params.charge_end - params.charge_start).total_seconds())
     if total_seconds < params.min_charging_interval:
@@ -41,15 +199,13 @@ async def _charge_generic(
             job.id,
             total_seconds,
         )
+        await _postpone(repos, job, params)
         return
-    accounts = await repos.account.get_accounts_by_proj_id(proj_id=job.proj_id)
-    price = await repos.price.get_price(
-        vlab_id=accounts.vlab.id,
-        service_type=job.service_type,
-        service_subtype=job.service_subtype,
-        usage_datetime=job.reserved_at or job.started_at,
-    )
-    discount = await repos.discount.get_current_vlab_discount(accounts.vlab.id)
+    if not await repos.job.lock_unchanged_job(job):
+        L.info("Not charging job {}: modified since it was selected", job.id)
+        return
+    context = context or await _load_charge_context(repos, job)
+    account_ids, price, discount = context.account_ids, context.price, context.discount
     discount_id = None if not discount else discount.id
     previous_usage = calculate_longrun_cumulative_usage(
         instances=job.usage_params["instances"],
@@ -75,10 +231,9 @@ async def _charge_generic(
             job.id,
             total_amount,
         )
+        await _postpone(repos, job, params)
         return
-    remaining_reservation = await repos.ledger.get_remaining_reservation_for_job(
-        job_id=job.id, account_id=accounts.rsv.id, raise_if_negative=True
-    )
+    remaining_reservation = await _get_remaining_reservation(repos, job, context)
     if total_amount > 0:
         reservation_amount_to_be_charged = min(total_amount, remaining_reservation)
         project_amount_to_be_charged = max(total_amount - reservation_amount_to_be_charged, D0)
@@ -88,58 +243,68 @@ async def _charge_generic(
         reservation_amount_to_be_charged = D0
         project_amount_to_be_charged = total_amount
 
+    transactions: list[Transaction] = []
     if reservation_amount_to_be_charged > 0:
-        await repos.ledger.insert_transaction(
-            amount=reservation_amount_to_be_charged,
-            debited_from=accounts.rsv.id,
-            credited_to=accounts.sys.id,
-            transaction_datetime=params.transaction_datetime,
-            transaction_type=TransactionType.CHARGE_LONGRUN,
-            job_id=job.id,
-            price_id=price.id,
-            discount_id=discount_id,
-            properties={"reason": f"{params.reason}:charge_reservation"},
+        transactions.append(
+            Transaction(
+                amount=reservation_amount_to_be_charged,
+                debited_from=account_ids.rsv_id,
+                credited_to=account_ids.sys_id,
+                transaction_datetime=params.transaction_datetime,
+                transaction_type=TransactionType.CHARGE_LONGRUN,
+                job_id=job.id,
+                price_id=price.id,
+                discount_id=discount_id,
+                properties={"reason": f"{params.reason}:charge_reservation"},
+            )
         )
     if project_amount_to_be_charged > 0:
-        await repos.ledger.insert_transaction(
-            amount=project_amount_to_be_charged,
-            debited_from=accounts.proj.id,
-            credited_to=accounts.sys.id,
-            transaction_datetime=params.transaction_datetime,
-            transaction_type=TransactionType.CHARGE_LONGRUN,
-            job_id=job.id,
-            price_id=price.id,
-            discount_id=discount_id,
-            properties={"reason": f"{params.reason}:charge_project"},
+        transactions.append(
+            Transaction(
+                amount=project_amount_to_be_charged,
+                debited_from=account_ids.proj_id,
+                credited_to=account_ids.sys_id,
+                transaction_datetime=params.transaction_datetime,
+                transaction_type=TransactionType.CHARGE_LONGRUN,
+                job_id=job.id,
+                price_id=price.id,
+                discount_id=discount_id,
+                properties={"reason": f"{params.reason}:charge_project"},
+            )
         )
     elif project_amount_to_be_charged < 0:
-        await repos.ledger.insert_transaction(
-            amount=project_amount_to_be_charged * -1,
-            debited_from=accounts.sys.id,
-            credited_to=accounts.proj.id,
-            transaction_datetime=params.transaction_datetime,
-            transaction_type=TransactionType.REFUND,
-            job_id=job.id,
-            price_id=price.id,
-            discount_id=discount_id,
-            properties={"reason": f"{params.reason}:refund_project"},
+        transactions.append(
+            Transaction(
+                amount=project_amount_to_be_charged * -1,
+                debited_from=account_ids.sys_id,
+                credited_to=account_ids.proj_id,
+                transaction_datetime=params.transaction_datetime,
+                transaction_type=TransactionType.REFUND,
+                job_id=job.id,
+                price_id=price.id,
+                discount_id=discount_id,
+                properties={"reason": f"{params.reason}:refund_project"},
+            )
         )
     if params.release_reservation and remaining_reservation > 0:
-        await repos.ledger.insert_transaction(
-            amount=remaining_reservation,
-            debited_from=accounts.rsv.id,
-            credited_to=accounts.proj.id,
-            transaction_datetime=params.transaction_datetime,
-            transaction_type=TransactionType.RELEASE,
-            job_id=job.id,
-            price_id=price.id,
-            discount_id=discount_id,
-            properties={"reason": f"{params.reason}:release_reservation"},
+        transactions.append(
+            Transaction(
+                amount=remaining_reservation,
+                debited_from=account_ids.rsv_id,
+                credited_to=account_ids.proj_id,
+                transaction_datetime=params.transaction_datetime,
+                transaction_type=TransactionType.RELEASE,
+                job_id=job.id,
+                price_id=price.id,
+                discount_id=discount_id,
+                properties={"reason": f"{params.reason}:release_reservation"},
+            )
         )
+    await repos.ledger.insert_transactions(transactions)
     await repos.job.update_job(
         job_id=job.id,
-        vlab_id=accounts.vlab.id,
-        proj_id=accounts.proj.id,
+        vlab_id=account_ids.vlab_id,
+        proj_id=account_ids.proj_id,
         last_charged_at=params.charge_end,
         **(
             {
@@ -159,8 +324,13 @@ def _resolve_charge_params(  # noqa: PLR0911
     expiration_interval: float,
     min_charging_interval: float,
     min_charging_amount: Decimal,
+    postpone: bool = False,
 ) -> ChargeParams:
-    """Return ChargeParams for _charge_generic."""
+    """Return ChargeParams for _charge_generic.
+
+    If postpone is True, the running jobs not charged are postponed by min_charging_interval.
+    """
+    postpone_until = now + timedelta(seconds=min_charging_interval) if postpone else None
     match job:
         case StartedJob(
             last_alive_at=datetime() as last_alive_at,
@@ -200,6 +370,7 @@ def _resolve_charge_params(  # noqa: PLR0911
                 reason="unfinished_uncharged",
                 min_charging_interval=min_charging_interval,
                 min_charging_amount=min_charging_amount,
+                postpone_until=postpone_until,
             )
         case StartedJob(last_charged_at=datetime() as last_charged_at, finished_at=None):
             # Charge running time since the last charge, set charge_end=now
@@ -211,6 +382,7 @@ def _resolve_charge_params(  # noqa: PLR0911
                 reason="unfinished_charged",
                 min_charging_interval=min_charging_interval,
                 min_charging_amount=min_charging_amount,
+                postpone_until=postpone_until,
             )
         case StartedJob(last_charged_at=None, finished_at=datetime() as finished_at):
             # Charge full running time, set charge_end=finished_at, and release reservation
@@ -253,12 +425,79 @@ def _resolve_charge_params(  # noqa: PLR0911
             raise ValueError(err)
 
 
+async def _charge_job(
+    session_factory: SessionFactory,
+    item: tuple[StartedJob, ChargeParams],
+    *,
+    counts: Counter[str],
+    prefetched: PrefetchedData | None = None,
+) -> None:
+    """Charge a single job in a separate transaction, and update the counts."""
+    job, params = item
+    try:
+        context = prefetched.get_charge_context(job) if prefetched else None
+        with track_queries("longrun job", job_id=str(job.id)):
+            async with session_factory() as db:
+                await _charge_generic(RepositoryGroup(db=db), job, params, context)
+    except Exception:  # noqa: BLE001
+        L.exception("Error processing longrun job {}", job.id)
+        counts["failure"] += 1
+    else:
+        counts[params.reason] += 1
+
+
+async def _iter_all_chunks(
+    session_factory: SessionFactory,
+    *,
+    chunk_size: int | None,
+    job_ids: list[UUID] | None,
+    shard: Shard | None,
+) -> AsyncIterator[Sequence[StartedJob]]:
+    """Yield all the jobs to be charged, in chunks of chunk_size jobs or in a single chunk."""
+    async with session_factory() as db:
+        jobs = await RepositoryGroup(db=db).job.get_longrun_to_be_charged(
+            job_ids=job_ids, shard=shard
+        )
+    for chunk in batched(jobs, chunk_size) if chunk_size else [jobs]:
+        yield chunk
+
+
+async def _iter_due_chunks(
+    session_factory: SessionFactory, *, now: datetime, chunk_size: int, shard: Shard | None
+) -> AsyncIterator[Sequence[StartedJob]]:
+    """Yield the jobs due to be charged, in chunks selected after the last charged chunk.
+
+    The keyset of the last job of each chunk ensures that the loop ends, even if the jobs
+    charged in the previous chunks are due again.
+    """
+    after = None
+    while True:
+        async with session_factory() as db:
+            chunk = await RepositoryGroup(db=db).job.get_longrun_due(
+                due_at=now, limit=chunk_size, after=after, shard=shard
+            )
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]
+        after = (last.next_charge_due_at or now, last.id)
+        if len(chunk) < chunk_size:
+            return
+
+
 async def charge_longrun(
     session_factory: SessionFactory,
     min_charging_interval: float = 0.0,
     min_charging_amount: Decimal = D0,
     expiration_interval: float = 3600,
     transaction_datetime: datetime | None = None,
+    *,
+    bulk: bool = False,
+    chunk_size: int = 1000,
+    concurrency: int = 1,
+    due_only: bool = False,
+    job_ids: list[UUID] | None = None,
+    shard: Shard | None = None,
 ) -> ChargeLongrunResult:
     """Charge for longrun jobs.
 
@@ -271,25 +510,53 @@ async def charge_longrun(
         expiration_interval: time since last_alive_at, after which the job is considered expired.
         transaction_datetime: datetime of the transaction, or None to use the current timestamp.
             If the job is still running, it's used also to calculate the duration to be charged.
+        bulk: if True, the accounts, prices, discounts, and remaining reservations are prefetched
+            for each chunk of jobs, and the costs are calculated in memory, so that only the
+            postings are executed for each job. The remaining reservation of a started job is
+            modified only by this function, so it can be prefetched safely.
+        chunk_size: number of jobs prefetched at once in bulk mode.
+        concurrency: maximum number of jobs charged concurrently. The jobs of the same project
+            are always charged sequentially, to avoid contention on the same accounts.
+        due_only: if True, only the jobs with next_charge_due_at <= transaction_datetime are
+            selected, in chunks of chunk_size jobs, and the running jobs not charged because
+            of min_charging_interval or min_charging_amount are postponed. The due datetime
+            is calculated with the intervals in the settings, so the same intervals should be
+            passed to this function.
+        job_ids: if specified, only the given jobs are charged, if needed.
+        shard: if specified, only the jobs of the projects in the shard are charged.
     """
     now = transaction_datetime or utcnow()
     counts: Counter[str] = Counter()
-    async with session_factory() as db:
-        jobs = await RepositoryGroup(db=db).job.get_longrun_to_be_charged()
-    for job in jobs:
-        params = _resolve_charge_params(
-            job,
-            now=now,
-            expiration_interval=expiration_interval,
-            min_charging_interval=min_charging_interval,
-            min_charging_amount=min_charging_amount,
+    chunks = (
+        _iter_due_chunks(session_factory, now=now, chunk_size=chunk_size, shard=shard)
+        if due_only and job_ids is None
+        else _iter_all_chunks(
+            session_factory, chunk_size=chunk_size if bulk else None, job_ids=job_ids, shard=shard
         )
-        try:
+    )
+    async for chunk in chunks:
+        prefetched = None
+        if bulk:
             async with session_factory() as db:
-                await _charge_generic(RepositoryGroup(db=db), job, params)
-        except Exception:  # noqa: BLE001
-            L.exception("Error processing longrun job {}", job.id)
-            counts["failure"] += 1
-        else:
-            counts[params.reason] += 1
+                prefetched = await prefetch_data(RepositoryGroup(db=db), chunk)
+        jobs_with_params = [
+            (
+                job,
+                _resolve_charge_params(
+                    job,
+                    now=now,
+                    expiration_interval=expiration_interval,
+                    min_charging_interval=min_charging_interval,
+                    min_charging_amount=min_charging_amount,
+                    postpone=due_only,
+                ),
+            )
+            for job in chunk
+        ]
+        await run_partitioned(
+            jobs_with_params,
+            partial(_charge_job, session_factory, counts=counts, prefetched=prefetched),
+            key=lambda item: item[0].proj_id,
+            concurrency=concurrency,
+        )
     return ChargeLongrunResult(**counts)
@@ -1,14 +1,17 @@
 """Charge for oneshot jobs."""
 
 from datetime import datetime
+from uuid import UUID
 
 from app.constants import D0, TransactionType
+from app.db.instrumentation import track_queries
 from app.db.session import SessionFactory
 from app.logger import L
 from app.repository.group import RepositoryGroup
-from app.schema.domain import ChargeOneshotResult, StartedJob
+from app.schema.domain import ChargeOneshotResult, Shard, StartedJob, Transaction
 from app.service.price import calculate_cost
 from app.service.usage import calculate_oneshot_usage_value
+from app.utils import run_partitioned
 
 
 async def _charge_generic(
@@ -18,14 +21,17 @@ async def _charge_generic(
     charging_at: datetime,
     reason: str,
 ) -> None:
-    accounts = await repos.account.get_accounts_by_proj_id(proj_id=job.proj_id)
+    if not await repos.job.lock_unchanged_job(job):
+        L.info("Not charging job {}: modified since it was selected", job.id)
+        return
+    account_ids = await repos.account.get_account_ids_by_proj_id(proj_id=job.proj_id)
     price = await repos.price.get_price(
-        vlab_id=accounts.vlab.id,
+        vlab_id=account_ids.vlab_id,
         service_type=job.service_type,
         service_subtype=job.service_subtype,
         usage_datetime=job.reserved_at or job.started_at,
     )
-    discount = await repos.discount.get_current_vlab_discount(accounts.vlab.id)
+    discount = await repos.discount.get_current_vlab_discount(account_ids.vlab_id)
     discount_id = None if not discount else discount.id
     usage_value = calculate_oneshot_usage_value(
         count=job.usage_params["count"],
@@ -40,74 +46,98 @@ async def _charge_generic(
         err = f"Total amount for job {job.id} is negative: {total_amount}"
         raise RuntimeError(err)
     remaining_reservation = await repos.ledger.get_remaining_reservation_for_job(
-        job_id=job.id, account_id=accounts.rsv.id, raise_if_negative=True
+        job_id=job.id, raise_if_negative=True
     )
     reservation_amount_to_be_charged = min(total_amount, remaining_reservation)
     project_amount_to_be_charged = max(total_amount - reservation_amount_to_be_charged, D0)
     remaining_reservation -= reservation_amount_to_be_charged
+    transactions: list[Transaction] = []
     if reservation_amount_to_be_charged > 0:
-        await repos.ledger.insert_transaction(
-            amount=reservation_amount_to_be_charged,
-            debited_from=accounts.rsv.id,
-            credited_to=accounts.sys.id,
-            transaction_datetime=charging_at,
-            transaction_type=TransactionType.CHARGE_ONESHOT,
-            job_id=job.id,
-            price_id=price.id,
-            discount_id=discount_id,
-            properties={"reason": f"{reason}:charge_reservation"},
+        transactions.append(
+            Transaction(
+                amount=reservation_amount_to_be_charged,
+                debited_from=account_ids.rsv_id,
+                credited_to=account_ids.sys_id,
+                transaction_datetime=charging_at,
+                transaction_type=TransactionType.CHARGE_ONESHOT,
+                job_id=job.id,
+                price_id=price.id,
+                discount_id=discount_id,
+                properties={"reason": f"{reason}:charge_reservation"},
+            )
         )
     if project_amount_to_be_charged > 0:
-        await repos.ledger.insert_transaction(
-            amount=project_amount_to_be_charged,
-            debited_from=accounts.proj.id,
-            credited_to=accounts.sys.id,
-            transaction_datetime=charging_at,
-            transaction_type=TransactionType.CHARGE_ONESHOT,
-            job_id=job.id,
-            price_id=price.id,
-            discount_id=discount_id,
-            properties={"reason": f"{reason}:charge_project"},
+        transactions.append(
+            Transaction(
+                amount=project_amount_to_be_charged,
+                debited_from=account_ids.proj_id,
+                credited_to=account_ids.sys_id,
+                transaction_datetime=charging_at,
+                transaction_type=TransactionType.CHARGE_ONESHOT,
+                job_id=job.id,
+                price_id=price.id,
+                discount_id=discount_id,
+                properties={"reason": f"{reason}:charge_project"},
+            )
         )
     if remaining_reservation > 0:
-        await repos.ledger.insert_transaction(
-            amount=remaining_reservation,
-            debited_from=accounts.rsv.id,
-            credited_to=accounts.proj.id,
-            transaction_datetime=charging_at,
-            transaction_type=TransactionType.RELEASE,
-            job_id=job.id,
-            price_id=price.id,
-            discount_id=discount_id,
-            properties={"reason": f"{reason}:release_reservation"},
+        transactions.append(
+            Transaction(
+                amount=remaining_reservation,
+                debited_from=account_ids.rsv_id,
+                credited_to=account_ids.proj_id,
+                transaction_datetime=charging_at,
+                transaction_type=TransactionType.RELEASE,
+                job_id=job.id,
+                price_id=price.id,
+                discount_id=discount_id,
+                properties={"reason": f"{reason}:release_reservation"},
+            )
         )
+    await repos.ledger.insert_transactions(transactions)
     await repos.job.update_job(
         job_id=job.id,
-        vlab_id=accounts.vlab.id,
-        proj_id=accounts.proj.id,
+        vlab_id=account_ids.vlab_id,
+        proj_id=account_ids.proj_id,
         last_charged_at=charging_at,
     )
 
 
-async def charge_oneshot(session_factory: SessionFactory) -> ChargeOneshotResult:
+async def charge_oneshot(
+    session_factory: SessionFactory,
+    *,
+    concurrency: int = 1,
+    job_ids: list[UUID] | None = None,
+    shard: Shard | None = None,
+) -> ChargeOneshotResult:
     """Charge for oneshot jobs.
 
     Args:
         session_factory: async context manager that yields an AsyncSession.
+        concurrency: maximum number of jobs charged concurrently. The jobs of the same project
+            are always charged sequentially, to avoid contention on the same accounts.
+        job_ids: if specified, only the given jobs are charged, if needed.
+        shard: if specified, only the jobs of the projects in the shard are charged.
     """
     result = ChargeOneshotResult()
-    async with session_factory() as db:
-        jobs = await RepositoryGroup(db=db).job.get_oneshot_to_be_charged()
-    for job in jobs:
+
+    async def _charge_job(job: StartedJob) -> None:
         try:
-            async with session_factory() as db:
-                repos = RepositoryGroup(db=db)
-                await _charge_generic(
-                    repos, job, charging_at=job.started_at, reason="finished_uncharged"
-                )
+            with track_queries("oneshot job", job_id=str(job.id)):
+                async with session_factory() as db:
+                    repos = RepositoryGroup(db=db)
+                    await _charge_generic(
+                        repos, job, charging_at=job.started_at, reason="finished_uncharged"
+                    )
         except Exception:  # noqa: BLE001
             L.exception("Error processing oneshot job {}", job.id)
             result.failure += 1
         else:
             result.success += 1
+
+    async with session_factory() as db:
+        jobs = await RepositoryGroup(db=db).job.get_oneshot_to_be_charged(
+            job_ids=job_ids, shard=shard
+        )
+    await run_partitioned(jobs, _charge_job, key=lambda job: job.proj_id, concurrency=concurrency)
     return result
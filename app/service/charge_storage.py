@@ -6,11 +6,12 @@ from decimal import Decimal
 from typing import Any
 
 from app.constants import D0, TransactionType
+from app.db.instrumentation import track_queries
 from app.db.session import SessionFactory
 from app.logger import L
 from app.repository.group import RepositoryGroup
 from app.schema.domain import ChargeStorageResult, StartedJob
-from app.utils import utcnow
+from app.utils import run_partitioned, utcnow
 
 
 async def _charge_one(
@@ -31,14 +32,17 @@ async def _charge_one(
             total_seconds,
         )
         return
-    accounts = await repos.account.get_accounts_by_proj_id(proj_id=job.proj_id)
+    if not await repos.job.lock_unchanged_job(job):
+        L.info("Not charging job {}: modified since it was selected", job.id)
+        return
+    account_ids = await repos.account.get_account_ids_by_proj_id(proj_id=job.proj_id)
     price = await repos.price.get_price(
-        vlab_id=accounts.vlab.id,
+        vlab_id=account_ids.vlab_id,
         service_type=job.service_type,
         service_subtype=job.service_subtype,
         usage_datetime=charging_at,
     )
-    discount = await repos.discount.get_current_vlab_discount(accounts.vlab.id)
+    discount = await repos.discount.get_current_vlab_discount(account_ids.vlab_id)
     discount_id = None if not discount else discount.id
     # Storage uses a single tier with fixed_cost=0 (see tiered-pricing.md)
     multiplier = price.tiers[0].multiplier
@@ -55,8 +59,8 @@ async def _charge_one(
         return
     await repos.ledger.insert_transaction(
         amount=total_amount,
-        debited_from=accounts.proj.id,
-        credited_to=accounts.sys.id,
+        debited_from=account_ids.proj_id,
+        credited_to=account_ids.sys_id,
         transaction_datetime=transaction_datetime,
         transaction_type=TransactionType.CHARGE_STORAGE,
         job_id=job.id,
@@ -66,8 +70,8 @@ async def _charge_one(
     )
     await repos.job.update_job(
         job_id=job.id,
-        vlab_id=accounts.vlab.id,
-        proj_id=accounts.proj.id,
+        vlab_id=account_ids.vlab_id,
+        proj_id=account_ids.proj_id,
         last_charged_at=charging_at,
     )
 
@@ -78,6 +82,8 @@ async def charge_storage(
     min_charging_interval: float = 0.0,
     min_charging_amount: Decimal = D0,
     transaction_datetime: datetime | None = None,
+    *,
+    concurrency: int = 1,
 ) -> ChargeStorageResult:
     """Charge for the storage and update the corresponding job.
 
@@ -88,23 +94,29 @@ async def charge_storage(
         min_charging_amount: minimum amount of money to be charged for running jobs.
         transaction_datetime: datetime of the transaction, or None to use the current timestamp.
             If the job is still running, it's used also to calculate the duration to be charged.
+        concurrency: maximum number of jobs charged concurrently. The jobs of the same project
+            are always charged sequentially, to avoid contention on the same accounts.
     """
     now = transaction_datetime or utcnow()
     result = ChargeStorageResult()
-    for job in jobs:
+
+    async def _charge_job(job: StartedJob) -> None:
         try:
-            async with session_factory() as db:
-                repos = RepositoryGroup(db=db)
-                await _charge_one(
-                    repos=repos,
-                    job=job,
-                    transaction_datetime=now,
-                    min_charging_interval=min_charging_interval,
-                    min_charging_amount=min_charging_amount,
-                )
+            with track_queries("storage job", job_id=str(job.id)):
+                async with session_factory() as db:
+                    repos = RepositoryGroup(db=db)
+                    await _charge_one(
+                        repos=repos,
+                        job=job,
+                        transaction_datetime=now,
+                        min_charging_interval=min_charging_interval,
+                        min_charging_amount=min_charging_amount,
+                    )
         except Exception:  # noqa: BLE001
             L.exception("Error processing storage job {}", job.id)
             result.failure += 1
         else:
             result.success += 1
+
+    await run_partitioned(jobs, _charge_job, key=lambda job: job.proj_id, concurrency=concurrency)
     return result
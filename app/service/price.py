@@ -1,38 +1,49 @@
 """Price service."""
 
-from decimal import Decimal
+from collections.abc import Sequence
+from decimal import Decimal, localcontext
 
-from app.db.model import Discount, Price, PriceTier
+from app.db.model import Discount, Price
 from app.errors import ensure_result
 from app.repository.group import RepositoryGroup
 from app.schema.api import AddPriceIn, EstimateCostOut, EstimateOneshotCostIn
+from app.schema.domain import EXACT_CONTEXT, PriceInfo, PriceTierInfo
 from app.service.usage import calculate_oneshot_usage_value
 from app.utils import utcnow
 
 
-def _iter_cost(tiers: list[PriceTier], start: int, end: int) -> Decimal:
+def _iter_cost(tiers: Sequence[PriceTierInfo], start: int, end: int) -> Decimal:
     """Return the usage cost from start to end by iterating over tiers.
 
+    It's the reference implementation of PriceInfo.compiled_tiers.cost, expecting the tiers
+    ordered by min_quantity.
+
     Each tier covers the range [min_quantity, max_quantity).
     Each tier's fixed_cost is added once when the usage enters that tier.
     Each tier's multiplier applies to the portion of usage within that tier's range.
+
+    As in compiled_tiers.cost, the cost is calculated without rounding, and only the result is
+    rounded to the current context, so that the two results are identical. Rounding each step
+    to the default precision would differ by up to 2 units in the last place.
     """
     cost = Decimal(0)
-    for tier in tiers:
-        if end <= tier.min_quantity:
-            break
-        tier_start = max(start, tier.min_quantity)
-        tier_end = end if tier.max_quantity is None else min(end, tier.max_quantity)
-        if tier_start >= tier_end:
-            continue
-        if start <= tier.min_quantity:
-            cost += tier.fixed_cost
-        cost += tier.multiplier * (tier_end - tier_start)
-    return cost
+    with localcontext(EXACT_CONTEXT):
+        for tier in tiers:
+            if end <= tier.min_quantity:
+                break
+            tier_start = max(start, tier.min_quantity)
+            tier_end = end if tier.max_quantity is None else min(end, tier.max_quantity)
+            if tier_start >= tier_end:
+                continue
+            if start <= tier.min_quantity:
+                cost += tier.fixed_cost
+            cost += tier.multiplier * (tier_end - tier_start)
+    # round to the precision of the current context
+    return +cost
 
 
 def calculate_cost(
-    price: Price,
+    price: PriceInfo,
     *,
     previous_usage: int,
     current_usage: int,
@@ -46,7 +57,7 @@ def calculate_cost(
         current_usage: cumulative usage including the new increment.
         discount: optional discount to apply to the final cost, not to the separate cost components.
     """
-    cost = _iter_cost(price.tiers, start=previous_usage, end=current_usage)
+    cost = price.compiled_tiers.cost(start=previous_usage, end=current_usage)
     if discount:
         cost *= Decimal(1) - discount.discount
     return cost
@@ -66,8 +77,10 @@ async def estimate_oneshot_cost(
     """Estimate the cost for a oneshot job."""
     # Get vlab_id from proj_id
     with ensure_result(error_message="Project not found"):
-        accounts = await repos.account.get_accounts_by_proj_id(proj_id=estimate_request.proj_id)
-    vlab_id = accounts.vlab.id
+        account_ids = await repos.account.get_account_ids_by_proj_id(
+            proj_id=estimate_request.proj_id
+        )
+    vlab_id = account_ids.vlab_id
 
     # Get price
     usage_datetime = utcnow()
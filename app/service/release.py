@@ -34,15 +34,15 @@ async def _release_reservation(
             error_code=ApiErrorCode.JOB_ALREADY_CANCELLED,
         )
     with ensure_result(error_message="Account not found"):
-        accounts = await repos.account.get_accounts_by_proj_id(proj_id=job.proj_id)
+        account_ids = await repos.account.get_account_ids_by_proj_id(proj_id=job.proj_id)
     remaining_reservation = await repos.ledger.get_remaining_reservation_for_job(
-        job_id=job.id, account_id=accounts.rsv.id, raise_if_negative=True
+        job_id=job.id, raise_if_negative=True
     )
     if remaining_reservation > 0:
         await repos.ledger.insert_transaction(
             amount=remaining_reservation,
-            debited_from=accounts.rsv.id,
-            credited_to=accounts.proj.id,
+            debited_from=account_ids.rsv_id,
+            credited_to=account_ids.proj_id,
             transaction_datetime=now,
             transaction_type=TransactionType.RELEASE,
             job_id=job.id,
@@ -50,8 +50,8 @@ async def _release_reservation(
         )
     await repos.job.update_job(
         job_id=job_id,
-        vlab_id=accounts.vlab.id,
-        proj_id=accounts.proj.id,
+        vlab_id=account_ids.vlab_id,
+        proj_id=account_ids.proj_id,
         cancelled_at=now,
     )
     return remaining_reservation
@@ -1,25 +1,35 @@
 """Report service."""
 
-from collections.abc import Sequence
+import csv
+import io
+import json
+from collections.abc import AsyncIterator, Sequence
+from datetime import datetime
+from decimal import Decimal
+from typing import Any
 from uuid import UUID
 
 from sqlalchemy import Row
 
+from app.config import settings
+from app.constants import ExportFormat, RollupGranularity
+from app.db.session import SessionFactory
 from app.errors import ensure_result
 from app.repository.group import RepositoryGroup
+from app.repository.report import encode_job_cursor, get_job_report_columns
 from app.schema.api import PaginatedParams
 
 
 async def get_report_for_system(
     repos: RepositoryGroup, pagination: PaginatedParams
-) -> tuple[Sequence[Row], int]:
+) -> tuple[Sequence[Row], int | None]:
     """Return the job report for the full system."""
     return await repos.report.get_job_reports(pagination=pagination)
 
 
 async def get_report_for_vlab(
     repos: RepositoryGroup, vlab_id: UUID, pagination: PaginatedParams
-) -> tuple[Sequence[Row], int]:
+) -> tuple[Sequence[Row], int | None]:
     """Return the job report for a given virtual-lab."""
     with ensure_result(error_message="Virtual lab not found"):
         vlab_account = await repos.account.get_vlab_account(vlab_id=vlab_id)
@@ -28,8 +38,121 @@ async def get_report_for_vlab(
 
 async def get_report_for_project(
     repos: RepositoryGroup, proj_id: UUID, pagination: PaginatedParams
-) -> tuple[Sequence[Row], int]:
+) -> tuple[Sequence[Row], int | None]:
     """Return the job report for a given project, including the reserved amount."""
     with ensure_result(error_message="Project not found"):
         proj_account = await repos.account.get_proj_account(proj_id=proj_id)
     return await repos.report.get_job_reports(pagination=pagination, proj_id=proj_account.id)
+
+
+def get_next_cursor(jobs: Sequence[Row], pagination: PaginatedParams) -> str | None:
+    """Return the cursor of the next page when using the cursor pagination.
+
+    Return None if not using the cursor pagination, or if the page is the last one.
+    """
+    if pagination.cursor is None or len(jobs) < pagination.page_size:
+        return None
+    return encode_job_cursor(started_at=jobs[-1].started_at, job_id=jobs[-1].job_id)
+
+
+async def refresh_usage_rollups(repos: RepositoryGroup) -> int:
+    """Aggregate the next batch of journal entries into the usage rollups.
+
+    Returns:
+        the number of aggregated journal entries.
+    """
+    return await repos.report.refresh_usage_rollups(batch_size=settings.USAGE_ROLLUP_BATCH_SIZE)
+
+
+async def get_usage_timeseries(
+    repos: RepositoryGroup,
+    granularity: RollupGranularity,
+    vlab_id: UUID | None = None,
+    proj_id: UUID | None = None,
+    after: datetime | None = None,
+    before: datetime | None = None,
+) -> tuple[Sequence[Row], datetime | None]:
+    """Return the usage rollups of the system, virtual-lab, or project, and when last refreshed."""
+    if vlab_id:
+        with ensure_result(error_message="Virtual lab not found"):
+            await repos.account.get_vlab_account(vlab_id=vlab_id)
+    if proj_id:
+        with ensure_result(error_message="Project not found"):
+            await repos.account.get_proj_account(proj_id=proj_id)
+    items = await repos.report.get_usage_timeseries(
+        granularity=granularity, vlab_id=vlab_id, proj_id=proj_id, after=after, before=before
+    )
+    return items, await repos.report.get_usage_rollups_refreshed_at()
+
+
+def _serialize_value(value: Any) -> Any:
+    """Return the value converted to a type that can be serialized as in the api responses."""
+    if isinstance(value, UUID | Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _serialize_ndjson(rows: Sequence[Row]) -> str:
+    """Return the rows serialized as newline-delimited json."""
+    return "".join(
+        json.dumps(
+            {key: _serialize_value(value) for key, value in row._asdict().items()},
+            separators=(",", ":"),
+        )
+        + "\n"
+        for row in rows
+    )
+
+
+def _serialize_csv(rows: Sequence[Sequence[Any]]) -> str:
+    """Return the rows serialized as csv."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([_serialize_value(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+async def _iter_report(
+    session_factory: SessionFactory,
+    export_format: ExportFormat,
+    vlab_id: UUID | None,
+    proj_id: UUID | None,
+) -> AsyncIterator[str]:
+    """Yield the job report serialized in chunks, one for each batch of rows.
+
+    The csv header is built from the columns of the report, so it's included even without rows.
+    """
+    serialize = _serialize_csv if export_format == ExportFormat.CSV else _serialize_ndjson
+    if export_format == ExportFormat.CSV:
+        yield _serialize_csv([get_job_report_columns(vlab_id=vlab_id, proj_id=proj_id)])
+    async with session_factory() as db:
+        async for rows in RepositoryGroup(db=db).report.stream_job_reports(
+            batch_size=settings.REPORT_EXPORT_BATCH_SIZE, vlab_id=vlab_id, proj_id=proj_id
+        ):
+            yield serialize(rows)
+
+
+async def export_report(
+    session_factory: SessionFactory,
+    export_format: ExportFormat,
+    vlab_id: UUID | None = None,
+    proj_id: UUID | None = None,
+) -> AsyncIterator[str]:
+    """Return an iterator over the job report, for the full system or the given account.
+
+    The account is checked immediately, so that any error is raised before streaming the report.
+    The report is streamed using a new session, that is closed when the iteration is completed.
+    """
+    async with session_factory() as db:
+        repos = RepositoryGroup(db=db)
+        if vlab_id:
+            with ensure_result(error_message="Virtual lab not found"):
+                await repos.account.get_vlab_account(vlab_id=vlab_id)
+        if proj_id:
+            with ensure_result(error_message="Project not found"):
+                await repos.account.get_proj_account(proj_id=proj_id)
+    return _iter_report(
+        session_factory, export_format=export_format, vlab_id=vlab_id, proj_id=proj_id
+    )
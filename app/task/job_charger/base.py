@@ -1,9 +1,19 @@
 """Abstract task."""
 
 import asyncio
+import time
 from abc import ABC, abstractmethod
 
+from app.db.instrumentation import track_queries
 from app.logger import L
+from app.metrics import metrics
+
+TASK_RUNS = metrics.counter(
+    "task_runs_total", "Number of loops executed by the periodic tasks.", ("task", "status")
+)
+TASK_RUN_DURATION = metrics.histogram(
+    "task_run_duration_seconds", "Duration of the loops executed by the periodic tasks.", ("task",)
+)
 
 
 class BaseTask(ABC):
@@ -27,6 +37,7 @@ class BaseTask(ABC):
         self._success = 0
         self._failure = 0
         self.logger = L.bind(name=name)
+        self._metric_labels = (name,)
 
     @property
     def name(self) -> str:
@@ -64,15 +75,21 @@ class BaseTask(ABC):
         self.logger.info("Starting {}", self.name)
         await asyncio.sleep(self._initial_delay)
         while True:
+            start = time.perf_counter()
             try:
-                await self._run_once()
+                with track_queries(f"loop of {self.name}", task=self.name):
+                    await self._run_once()
             except Exception:
                 self._failure += 1
                 sleep = self._error_sleep
+                status = "failure"
                 self.logger.exception("Error in run_once {}", self._failure)
             else:
                 self._success += 1
                 sleep = self._loop_sleep
+                status = "success"
+            TASK_RUN_DURATION.observe(time.perf_counter() - start, self._metric_labels)
+            TASK_RUNS.inc((self.name, status))
             if 0 < limit <= self._counter:
                 break
             await asyncio.sleep(sleep)
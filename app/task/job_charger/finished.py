@@ -0,0 +1,112 @@
+"""Charger of the finished jobs notified by the consumers."""
+
+import asyncio
+from collections.abc import Callable
+from typing import Any
+from uuid import UUID
+
+from app.config import settings
+from app.constants import DatabasePool, ServiceType
+from app.db.session import database_session_manager
+from app.repository.job import JOB_FINISHED_CHANNEL
+from app.schema.domain import Shard
+from app.service.charge_longrun import charge_longrun
+from app.service.charge_oneshot import charge_oneshot
+from app.task.job_charger.base import BaseTask
+
+
+class FinishedJobCharger(BaseTask):
+    """Charge the finished oneshot and longrun jobs as soon as the consumers notify them.
+
+    The task keeps a dedicated database connection, listens for the notifications, and charges
+    the notified jobs together after a short delay. Any notification sent while disconnected is
+    lost, but the jobs are still charged by the periodic chargers.
+    """
+
+    def __init__(
+        self, name: str, initial_delay: int = 0, get_shard: Callable[[], Shard] | None = None
+    ) -> None:
+        """Init the task.
+
+        Args:
+            name: name of the task.
+            initial_delay: initial delay in seconds, before starting the task.
+            get_shard: function returning the shard to be charged, or None to charge all the jobs.
+        """
+        super().__init__(
+            name=name,
+            initial_delay=initial_delay,
+            loop_sleep=settings.CHARGE_FINISHED_LOOP_SLEEP,
+            error_sleep=settings.CHARGE_FINISHED_ERROR_SLEEP,
+        )
+        self._get_shard = get_shard
+        self._pending: dict[ServiceType, set[UUID]] = {
+            ServiceType.ONESHOT: set(),
+            ServiceType.LONGRUN: set(),
+        }
+        self._wakeup = asyncio.Event()
+        self._notifications = 0
+
+    def _on_notification(self, _conn: Any, _pid: int, _channel: str, payload: str) -> None:
+        """Add the notified job to the pending jobs."""
+        self._notifications += 1
+        service_type, _, job_id = payload.partition(":")
+        try:
+            self._pending[ServiceType(service_type)].add(UUID(job_id))
+        except (KeyError, ValueError):
+            self.logger.warning("Invalid notification: {}", payload)
+            return
+        self._wakeup.set()
+
+    async def _charge_pending(self) -> None:
+        """Charge the pending jobs."""
+        oneshot_ids = list(self._pending[ServiceType.ONESHOT])
+        longrun_ids = list(self._pending[ServiceType.LONGRUN])
+        for pending in self._pending.values():
+            pending.clear()
+        shard = self._get_shard() if self._get_shard else None
+        if oneshot_ids:
+            result = await charge_oneshot(
+                session_factory=database_session_manager.session_factory(DatabasePool.CHARGER),
+                concurrency=settings.CHARGE_ONESHOT_CONCURRENCY,
+                job_ids=oneshot_ids,
+                shard=shard,
+            )
+            self.logger.info("Charged finished oneshot jobs: {}", result)
+        if longrun_ids:
+            result = await charge_longrun(
+                session_factory=database_session_manager.session_factory(DatabasePool.CHARGER),
+                min_charging_interval=settings.CHARGE_LONGRUN_MIN_CHARGING_INTERVAL,
+                min_charging_amount=settings.CHARGE_LONGRUN_MIN_CHARGING_AMOUNT,
+                expiration_interval=settings.CHARGE_LONGRUN_EXPIRATION_INTERVAL,
+                concurrency=settings.CHARGE_LONGRUN_CONCURRENCY,
+                job_ids=longrun_ids,
+                shard=shard,
+            )
+            self.logger.info("Charged finished longrun jobs: {}", result)
+
+    async def _run_once(self) -> None:
+        closed = asyncio.Event()
+
+        def _on_termination(_conn: Any) -> None:
+            closed.set()
+            self._wakeup.set()
+
+        async with database_session_manager.connection(DatabasePool.CHARGER) as conn:
+            driver_conn = (await conn.get_raw_connection()).driver_connection
+            if driver_conn is None:
+                err = "Driver connection not available"
+                raise RuntimeError(err)
+            driver_conn.add_termination_listener(_on_termination)
+            await driver_conn.add_listener(JOB_FINISHED_CHANNEL, self._on_notification)
+            self.logger.info("Listening for finished jobs")
+            try:
+                while not closed.is_set():
+                    await self._wakeup.wait()
+                    await asyncio.sleep(settings.CHARGE_FINISHED_DELAY)
+                    self._wakeup.clear()
+                    await self._charge_pending()
+            finally:
+                if not driver_conn.is_closed():
+                    await driver_conn.remove_listener(JOB_FINISHED_CHANNEL, self._on_notification)
+        self.logger.warning("Connection closed, stopped listening for finished jobs")
@@ -1,7 +1,11 @@
 """Longrun job charger."""
 
+from collections.abc import Callable
+
 from app.config import settings
+from app.constants import DatabasePool
 from app.db.session import database_session_manager
+from app.schema.domain import Shard
 from app.service.charge_longrun import charge_longrun
 from app.task.job_charger.base import BaseTask
 
@@ -9,19 +13,33 @@ from app.task.job_charger.base import BaseTask
 class PeriodicLongrunCharger(BaseTask):
     """PeriodicLongrunCharger."""
 
-    def __init__(self, name: str, initial_delay: int = 0) -> None:
-        """Init the task."""
+    def __init__(
+        self, name: str, initial_delay: int = 0, get_shard: Callable[[], Shard] | None = None
+    ) -> None:
+        """Init the task.
+
+        Args:
+            name: name of the task.
+            initial_delay: initial delay in seconds, before starting the task.
+            get_shard: function returning the shard to be charged, or None to charge all the jobs.
+        """
         super().__init__(
             name=name,
             initial_delay=initial_delay,
             loop_sleep=settings.CHARGE_LONGRUN_LOOP_SLEEP,
             error_sleep=settings.CHARGE_LONGRUN_ERROR_SLEEP,
         )
+        self._get_shard = get_shard
 
-    async def _run_once(self) -> None:  # noqa: PLR6301
+    async def _run_once(self) -> None:
         await charge_longrun(
-            session_factory=database_session_manager.session,
+            session_factory=database_session_manager.session_factory(DatabasePool.CHARGER),
             min_charging_interval=settings.CHARGE_LONGRUN_MIN_CHARGING_INTERVAL,
             min_charging_amount=settings.CHARGE_LONGRUN_MIN_CHARGING_AMOUNT,
             expiration_interval=settings.CHARGE_LONGRUN_EXPIRATION_INTERVAL,
+            bulk=settings.CHARGE_LONGRUN_BULK_MODE,
+            chunk_size=settings.CHARGE_LONGRUN_BULK_CHUNK_SIZE,
+            concurrency=settings.CHARGE_LONGRUN_CONCURRENCY,
+            due_only=settings.CHARGE_LONGRUN_DUE_ONLY,
+            shard=self._get_shard() if self._get_shard else None,
         )
@@ -1,7 +1,11 @@
 """Oneshot job charger."""
 
+from collections.abc import Callable
+
 from app.config import settings
+from app.constants import DatabasePool
 from app.db.session import database_session_manager
+from app.schema.domain import Shard
 from app.service.charge_oneshot import charge_oneshot
 from app.task.job_charger.base import BaseTask
 
@@ -9,14 +13,27 @@ from app.task.job_charger.base import BaseTask
 class PeriodicOneshotCharger(BaseTask):
     """PeriodicOneshotCharger."""
 
-    def __init__(self, name: str, initial_delay: int = 0) -> None:
-        """Init the task."""
+    def __init__(
+        self, name: str, initial_delay: int = 0, get_shard: Callable[[], Shard] | None = None
+    ) -> None:
+        """Init the task.
+
+        Args:
+            name: name of the task.
+            initial_delay: initial delay in seconds, before starting the task.
+            get_shard: function returning the shard to be charged, or None to charge all the jobs.
+        """
         super().__init__(
             name=name,
             initial_delay=initial_delay,
             loop_sleep=settings.CHARGE_ONESHOT_LOOP_SLEEP,
             error_sleep=settings.CHARGE_ONESHOT_ERROR_SLEEP,
         )
+        self._get_shard = get_shard
 
-    async def _run_once(self) -> None:  # noqa: PLR6301
-        await charge_oneshot(session_factory=database_session_manager.session)
+    async def _run_once(self) -> None:
+        await charge_oneshot(
+            session_factory=database_session_manager.session_factory(DatabasePool.CHARGER),
+            concurrency=settings.CHARGE_ONESHOT_CONCURRENCY,
+            shard=self._get_shard() if self._get_shard else None,
+        )
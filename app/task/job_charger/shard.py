@@ -0,0 +1,62 @@
+"""Coordinator of the charger shards."""
+
+import os
+import socket
+import time
+
+from app.config import settings
+from app.constants import DatabasePool
+from app.db.session import database_session_manager
+from app.repository.group import RepositoryGroup
+from app.schema.domain import Shard
+from app.task.job_charger.base import BaseTask
+from app.utils import create_uuid
+
+
+class ShardCoordinator(BaseTask):
+    """Lease a fair share of the project hash slots, so that each replica charges different jobs.
+
+    The leases are renewed and rebalanced at each loop, and they expire when the replica stops
+    renewing them, so that the other replicas can acquire them. If the leases cannot be renewed
+    in time, the replica stops charging until they are renewed.
+
+    While the leases are moved from one replica to another, the same job may be selected by both
+    replicas, but it's charged only once because the job is locked and checked before charging.
+    """
+
+    def __init__(self, name: str, initial_delay: int = 0) -> None:
+        """Init the task."""
+        super().__init__(
+            name=name,
+            initial_delay=initial_delay,
+            loop_sleep=settings.CHARGER_SHARDING_RENEW_INTERVAL,
+            error_sleep=settings.CHARGER_SHARDING_ERROR_SLEEP,
+        )
+        self.member_id = f"{socket.gethostname()}:{os.getpid()}:{create_uuid()}"
+        self._slots: frozenset[int] = frozenset()
+        self._valid_until = 0.0
+
+    def get_shard(self) -> Shard:
+        """Return the slots currently leased, or an empty shard if the leases may be expired."""
+        slots = self._slots if time.monotonic() < self._valid_until else frozenset()
+        return Shard(slots=slots, total=settings.CHARGER_SHARDING_SLOTS)
+
+    async def _run_once(self) -> None:
+        # the leases are considered expired locally before they actually expire in the database
+        valid_until = time.monotonic() + settings.CHARGER_SHARDING_LEASE_TTL / 2
+        async with database_session_manager.session(DatabasePool.CHARGER) as db:
+            slots = await RepositoryGroup(db=db).lease.rebalance(
+                member_id=self.member_id,
+                total=settings.CHARGER_SHARDING_SLOTS,
+                ttl=settings.CHARGER_SHARDING_LEASE_TTL,
+            )
+        if frozenset(slots) != self._slots:
+            self.logger.info("Leased slots: {}", slots)
+        self._slots = frozenset(slots)
+        self._valid_until = valid_until
+
+    async def release(self) -> None:
+        """Release the leases, so that the other replicas can acquire them immediately."""
+        self._slots = frozenset()
+        async with database_session_manager.session(DatabasePool.CHARGER) as db:
+            await RepositoryGroup(db=db).lease.release(member_id=self.member_id)
@@ -1,8 +1,12 @@
 """Storage charger."""
 
+from collections.abc import Callable
+
 from app.config import settings
+from app.constants import DatabasePool
 from app.db.session import database_session_manager
 from app.repository.group import RepositoryGroup
+from app.schema.domain import Shard
 from app.service.charge_storage import charge_storage
 from app.task.job_charger.base import BaseTask
 
@@ -10,31 +14,46 @@ from app.task.job_charger.base import BaseTask
 class PeriodicStorageCharger(BaseTask):
     """PeriodicStorageCharger."""
 
-    def __init__(self, name: str, initial_delay: int = 0) -> None:
-        """Init the task."""
+    def __init__(
+        self, name: str, initial_delay: int = 0, get_shard: Callable[[], Shard] | None = None
+    ) -> None:
+        """Init the task.
+
+        Args:
+            name: name of the task.
+            initial_delay: initial delay in seconds, before starting the task.
+            get_shard: function returning the shard to be charged, or None to charge all the jobs.
+        """
         super().__init__(
             name=name,
             initial_delay=initial_delay,
             loop_sleep=settings.CHARGE_STORAGE_LOOP_SLEEP,
             error_sleep=settings.CHARGE_STORAGE_ERROR_SLEEP,
         )
+        self._get_shard = get_shard
 
-    async def _run_once(self) -> None:  # noqa: PLR6301
-        session_factory = database_session_manager.session
+    async def _run_once(self) -> None:
+        session_factory = database_session_manager.session_factory(DatabasePool.CHARGER)
+        shard = self._get_shard() if self._get_shard else None
 
         # get and charge finished jobs not charged or partially charged
         async with session_factory() as db:
             repos = RepositoryGroup(db=db)
-            jobs = await repos.job.get_storage_finished_to_be_charged()
-        await charge_storage(session_factory=session_factory, jobs=jobs)
+            jobs = await repos.job.get_storage_finished_to_be_charged(shard=shard)
+        await charge_storage(
+            session_factory=session_factory,
+            jobs=jobs,
+            concurrency=settings.CHARGE_STORAGE_CONCURRENCY,
+        )
 
         # get and charge running jobs
         async with session_factory() as db:
             repos = RepositoryGroup(db=db)
-            jobs = await repos.job.get_storage_running()
+            jobs = await repos.job.get_storage_running(shard=shard)
         await charge_storage(
             session_factory=session_factory,
             jobs=jobs,
             min_charging_interval=settings.CHARGE_STORAGE_MIN_CHARGING_INTERVAL,
             min_charging_amount=settings.CHARGE_STORAGE_MIN_CHARGING_AMOUNT,
+            concurrency=settings.CHARGE_STORAGE_CONCURRENCY,
         )
@@ -0,0 +1,27 @@
+"""System balance folder."""
+
+from app.config import settings
+from app.constants import DatabasePool
+from app.db.session import database_session_manager
+from app.repository.group import RepositoryGroup
+from app.service.balance import fold_system_balance
+from app.task.job_charger.base import BaseTask
+
+
+class PeriodicSystemBalanceFolder(BaseTask):
+    """Apply the pending changes to the system balance, when it's updated in deferred mode."""
+
+    def __init__(self, name: str, initial_delay: int = 0) -> None:
+        """Init the task."""
+        super().__init__(
+            name=name,
+            initial_delay=initial_delay,
+            loop_sleep=settings.SYSTEM_BALANCE_FOLD_LOOP_SLEEP,
+            error_sleep=settings.SYSTEM_BALANCE_FOLD_ERROR_SLEEP,
+        )
+
+    async def _run_once(self) -> None:
+        async with database_session_manager.session(DatabasePool.CHARGER) as db:
+            count = await fold_system_balance(RepositoryGroup(db=db))
+        if count:
+            self.logger.info("Folded {} changes into the system balance", count)
@@ -0,0 +1,36 @@
+"""Refresher of the usage rollups."""
+
+from app.config import settings
+from app.constants import DatabasePool
+from app.db.session import database_session_manager
+from app.repository.group import RepositoryGroup
+from app.service.report import refresh_usage_rollups
+from app.task.job_charger.base import BaseTask
+
+
+class PeriodicUsageRollupRefresher(BaseTask):
+    """Aggregate the new journal entries into the usage rollups.
+
+    Each batch is aggregated in a separate transaction, and the batches are repeated until all
+    the journal entries older than the safety lag have been aggregated.
+    """
+
+    def __init__(self, name: str, initial_delay: int = 0) -> None:
+        """Init the task."""
+        super().__init__(
+            name=name,
+            initial_delay=initial_delay,
+            loop_sleep=settings.USAGE_ROLLUP_LOOP_SLEEP,
+            error_sleep=settings.USAGE_ROLLUP_ERROR_SLEEP,
+        )
+
+    async def _run_once(self) -> None:
+        total = 0
+        while True:
+            async with database_session_manager.session(DatabasePool.CHARGER) as db:
+                count = await refresh_usage_rollups(RepositoryGroup(db=db))
+            total += count
+            if count < settings.USAGE_ROLLUP_BATCH_SIZE:
+                break
+        if total:
+            self.logger.info("Aggregated {} journal entries into the usage rollups", total)
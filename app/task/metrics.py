@@ -0,0 +1,21 @@
+"""Sharing of the metrics with the other processes."""
+
+from app.config import settings
+from app.metrics import metrics
+from app.task.job_charger.base import BaseTask
+
+
+class MetricsWriter(BaseTask):
+    """Write periodically the metrics of the process to the shared directory."""
+
+    def __init__(self, name: str, initial_delay: int = 0) -> None:
+        """Init the task."""
+        super().__init__(
+            name=name,
+            initial_delay=initial_delay,
+            loop_sleep=settings.METRICS_WRITE_INTERVAL,
+            error_sleep=settings.METRICS_WRITE_INTERVAL,
+        )
+
+    async def _run_once(self) -> None:  # noqa: PLR6301
+        metrics.write()
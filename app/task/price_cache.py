@@ -0,0 +1,51 @@
+"""Invalidation of the price cache."""
+
+import asyncio
+from typing import Any
+
+from app.cache import PRICE_CACHE_CHANNEL, price_cache
+from app.config import settings
+from app.db.session import database_session_manager
+from app.task.job_charger.base import BaseTask
+
+
+class PriceCacheListener(BaseTask):
+    """Clear the price cache when any process notifies that the prices have been modified.
+
+    The task keeps a dedicated database connection, and listens for the notifications until the
+    connection is closed. The cache is cleared also when listening starts, because any
+    notification sent while disconnected is lost.
+    """
+
+    def __init__(self, name: str, initial_delay: int = 0) -> None:
+        """Init the task."""
+        super().__init__(
+            name=name,
+            initial_delay=initial_delay,
+            loop_sleep=settings.PRICE_CACHE_LISTENER_LOOP_SLEEP,
+            error_sleep=settings.PRICE_CACHE_LISTENER_ERROR_SLEEP,
+        )
+        self._notifications = 0
+
+    def _on_notification(self, *args: Any) -> None:  # noqa: ARG002
+        """Clear the cache."""
+        self._notifications += 1
+        price_cache.clear()
+
+    async def _run_once(self) -> None:
+        closed = asyncio.Event()
+        async with database_session_manager.connection() as conn:
+            driver_conn = (await conn.get_raw_connection()).driver_connection
+            if driver_conn is None:
+                err = "Driver connection not available"
+                raise RuntimeError(err)
+            driver_conn.add_termination_listener(lambda _: closed.set())
+            await driver_conn.add_listener(PRICE_CACHE_CHANNEL, self._on_notification)
+            self.logger.info("Listening for price cache invalidations")
+            price_cache.clear()
+            try:
+                await closed.wait()
+            finally:
+                if not driver_conn.is_closed():
+                    await driver_conn.remove_listener(PRICE_CACHE_CHANNEL, self._on_notification)
+        self.logger.warning("Connection closed, stopped listening for price cache invalidations")
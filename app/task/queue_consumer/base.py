@@ -1,6 +1,7 @@
 """Base consumer module."""
 
 import asyncio
+import time
 import traceback
 from abc import ABC, abstractmethod
 from typing import Any
@@ -11,12 +12,50 @@ from aiobotocore.client import AioBaseClient
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
-from app.constants import EventStatus
+from app.constants import DatabasePool, EventBodyStorage, EventStatus
+from app.db.instrumentation import track_queries
 from app.db.session import database_session_manager
 from app.logger import L
+from app.metrics import AGE_BUCKETS, metrics
+from app.queue.ack import MessageAcknowledger
+from app.queue.recorder import EventRecorder
 from app.queue.utils import CreateSQSClientProtocol, create_default_sqs_client, get_queue_url
 from app.repository.event import EventRepository
 
+# maximum number of messages that can be returned by a single call to receive_message
+MAX_NUMBER_OF_MESSAGES = 10
+
+SQS_RECEIVE_DURATION = metrics.histogram(
+    "sqs_receive_duration_seconds",
+    "Duration of the calls receiving the messages, including the long polling.",
+    ("queue",),
+)
+SQS_MESSAGES_RECEIVED = metrics.counter(
+    "sqs_messages_received_total", "Number of messages received from the queue.", ("queue",)
+)
+SQS_MESSAGE_AGE = metrics.histogram(
+    "sqs_message_age_seconds",
+    "Time elapsed between sending and receiving the messages, from SentTimestamp.",
+    ("queue",),
+    buckets=AGE_BUCKETS,
+)
+SQS_MESSAGES_CONSUMED = metrics.counter(
+    "sqs_messages_consumed_total", "Number of messages consumed.", ("queue", "status")
+)
+SQS_CONSUME_DURATION = metrics.histogram(
+    "sqs_consume_duration_seconds",
+    "Duration of the transactions consuming one or more messages together.",
+    ("queue",),
+)
+
+
+def _is_redelivered(msg: dict[str, Any]) -> bool:
+    """Return True if the message may have been received before.
+
+    The messages without ApproximateReceiveCount are considered redelivered.
+    """
+    return int(msg.get("Attributes", {}).get("ApproximateReceiveCount", 2)) > 1
+
 
 class QueueConsumer(ABC):
     """Generic queue consumer."""
@@ -27,6 +66,13 @@ class QueueConsumer(ABC):
         queue_name: str,
         initial_delay: int = 0,
         create_sqs_client: CreateSQSClientProtocol | None = None,
+        max_number_of_messages: int = 1,
+        max_concurrency: int = 1,
+        delete_batch_size: int = 10,
+        delete_flush_interval: float = 1,
+        delete_max_retries: int = 3,
+        event_body_storage: EventBodyStorage = EventBodyStorage.FULL,
+        event_body_max_length: int = 1000,
     ) -> None:
         """Init the QueueConsumer.
 
@@ -35,12 +81,37 @@ class QueueConsumer(ABC):
             queue_name: name of the queue.
             initial_delay: initial delay in seconds, before starting to consume the queue.
             create_sqs_client: optional async context manager used to create a sqs client.
+            max_number_of_messages: maximum number of messages to receive at once (1 to 10).
+            max_concurrency: maximum number of message groups processed concurrently.
+            delete_batch_size: number of processed messages triggering a batch deletion (1 to 10).
+            delete_flush_interval: maximum number of seconds before deleting processed messages.
+            delete_max_retries: maximum number of retries for messages that failed to be deleted.
+            event_body_storage: how the body of the completed events is stored.
+            event_body_max_length: maximum number of characters stored when truncating the body.
         """
+        if not 1 <= max_number_of_messages <= MAX_NUMBER_OF_MESSAGES:
+            err = f"max_number_of_messages must be between 1 and {MAX_NUMBER_OF_MESSAGES}"
+            raise ValueError(err)
+        if max_concurrency < 1:
+            err = "max_concurrency must be greater than 0"
+            raise ValueError(err)
         self._name = name
         self._queue_name = queue_name
         self._initial_delay = initial_delay
+        self._max_number_of_messages = max_number_of_messages
+        self._max_concurrency = max_concurrency
+        self._delete_batch_size = delete_batch_size
+        self._delete_flush_interval = delete_flush_interval
+        self._delete_max_retries = delete_max_retries
+        self._recorder = EventRecorder(
+            queue_name=queue_name,
+            body_storage=event_body_storage,
+            body_max_length=event_body_max_length,
+        )
+        self._acknowledger: MessageAcknowledger | None = None
         self._create_sqs_client = create_sqs_client or create_default_sqs_client
         self.logger = L.bind(name=name, queue=queue_name)
+        self._metric_labels = (queue_name,)
 
     @property
     def name(self) -> str:
@@ -52,40 +123,167 @@ class QueueConsumer(ABC):
         """Return the queue name."""
         return self._queue_name
 
+    def get_stats(self) -> dict[str, int]:
+        """Return the statistics about the acknowledged messages."""
+        if not self._acknowledger:
+            return {"acked": 0, "failed": 0, "retried": 0, "pending": 0}
+        return self._acknowledger.get_stats()
+
     @abstractmethod
     async def _consume(self, msg: dict[str, Any], db: AsyncSession) -> UUID:
         """Consume the message."""
 
+    async def _consume_many(self, msgs: list[dict[str, Any]], db: AsyncSession) -> list[UUID]:
+        """Consume the messages together, and return the job ids in the same order.
+
+        It's called only for the messages grouped together by _split_group, and by default
+        the messages are consumed one by one in the same transaction.
+        """
+        return [await self._consume(msg=msg, db=db) for msg in msgs]
+
+    def _split_group(self, messages: list[dict[str, Any]]) -> list[list[dict[str, Any]]]:  # noqa: PLR6301
+        """Split the messages of a group into lists of messages to be consumed together.
+
+        By default, each message is consumed separately.
+        """
+        return [[msg] for msg in messages]
+
+    async def _consume_once(
+        self, msgs: list[dict[str, Any]], db: AsyncSession
+    ) -> list[UUID | None]:
+        """Consume the messages not consumed yet, and return the job ids in the same order.
+
+        The completed events are stored in the same transaction with a single statement, so the
+        messages redelivered after being committed are skipped, returning the job ids of the
+        stored events. The stored events are looked up only for the redelivered messages.
+        """
+        redelivered = [UUID(msg["MessageId"]) for msg in msgs if _is_redelivered(msg)]
+        completed = (
+            await EventRepository(db=db).get_completed_job_ids(message_ids=redelivered)
+            if redelivered
+            else {}
+        )
+        pending = [msg for msg in msgs if UUID(msg["MessageId"]) not in completed]
+        if skipped := len(msgs) - len(pending):
+            self.logger.warning("Skipped {} messages already consumed", skipped)
+        consumed: list[UUID] = []
+        if len(pending) == 1:
+            consumed = [await self._consume(msg=pending[0], db=db)]
+        elif pending:
+            consumed = await self._consume_many(msgs=pending, db=db)
+        consumed_iter = iter(consumed)
+        job_ids = [
+            completed[message_id] if message_id in completed else next(consumed_iter)
+            for message_id in (UUID(msg["MessageId"]) for msg in msgs)
+        ]
+        await self._recorder.record(db=db, msgs=msgs, job_ids=job_ids)
+        return job_ids
+
     async def _wrap(self, msg: dict[str, Any]) -> bool:
         """Wrap the message handler and return True if successful, False otherwise.
 
-        The message is stored for future inspection.
+        The message is stored for future inspection: the completed messages are stored in the
+        same transaction, while the failed messages are stored after rolling back.
         """
-        async with database_session_manager.session() as db:
-            event_repo = EventRepository(db=db)
-            try:
-                job_id = await self._consume(msg=msg, db=db)
-            except Exception:
-                self.logger.exception("Error processing message")
-                # ensure that any pending change is rolled back
-                await db.rollback()
-                await event_repo.upsert(
-                    msg=msg,
-                    queue_name=self._queue_name,
-                    status=EventStatus.FAILED,
-                    error=traceback.format_exc(),
-                )
-                return False
-            else:
-                await event_repo.upsert(
-                    msg=msg,
-                    queue_name=self._queue_name,
-                    status=EventStatus.COMPLETED,
-                    job_id=job_id,
-                )
-                return True
-
-    async def _run_once(self, sqs_client: AioBaseClient, queue_url: str) -> None:
+        start = time.perf_counter()
+        with track_queries("message", queue=self._queue_name, message_id=msg.get("MessageId")):
+            async with database_session_manager.session(DatabasePool.CONSUMER) as db:
+                event_repo = EventRepository(db=db)
+                try:
+                    await self._consume_once(msgs=[msg], db=db)
+                except Exception:
+                    SQS_MESSAGES_CONSUMED.inc((self._queue_name, "failure"))
+                    self.logger.exception("Error processing message")
+                    # ensure that any pending change is rolled back
+                    await db.rollback()
+                    await event_repo.upsert(
+                        msg=msg,
+                        queue_name=self._queue_name,
+                        status=EventStatus.FAILED,
+                        error=traceback.format_exc(),
+                    )
+                    return False
+        SQS_CONSUME_DURATION.observe(time.perf_counter() - start, self._metric_labels)
+        SQS_MESSAGES_CONSUMED.inc((self._queue_name, "success"))
+        return True
+
+    def _record_received(self, messages: list[dict[str, Any]]) -> None:
+        """Record the number of received messages, and their age."""
+        if not messages:
+            return
+        SQS_MESSAGES_RECEIVED.inc(self._metric_labels, len(messages))
+        now_ms = time.time() * 1000
+        for msg in messages:
+            if sent_timestamp := msg.get("Attributes", {}).get("SentTimestamp"):
+                age = (now_ms - int(sent_timestamp)) / 1000
+                SQS_MESSAGE_AGE.observe(max(age, 0), self._metric_labels)
+
+    @staticmethod
+    def _group_messages(messages: list[dict[str, Any]]) -> list[list[dict[str, Any]]]:
+        """Split the messages by MessageGroupId, preserving the order within each group."""
+        groups: dict[str, list[dict[str, Any]]] = {}
+        for msg in messages:
+            group_id = msg.get("Attributes", {}).get("MessageGroupId", "")
+            groups.setdefault(group_id, []).append(msg)
+        return list(groups.values())
+
+    async def _process_group(
+        self, messages: list[dict[str, Any]], processed: list[dict[str, Any]]
+    ) -> None:
+        """Process sequentially the messages belonging to the same group.
+
+        The processing stops at the first failure: the failed message and the following ones
+        aren't deleted, so they will be received again in the same order when they become visible.
+
+        The messages that can be consumed together are processed in a single transaction,
+        falling back to processing them one by one if the transaction fails.
+
+        Unexpected errors, for example when committing a transaction, are handled as failures,
+        so they don't affect the messages already committed, or the other groups.
+
+        Args:
+            messages: messages of the group, in the order they have been received.
+            processed: list where the messages processed successfully are appended.
+        """
+        done: list[dict[str, Any]] = []
+        try:
+            for msgs in self._split_group(messages):
+                if len(msgs) > 1 and await self._wrap_many(msgs=msgs):
+                    done.extend(msgs)
+                    continue
+                for msg in msgs:
+                    if not await self._wrap(msg=msg):
+                        return
+                    done.append(msg)
+        except Exception:
+            self.logger.exception("Unexpected error processing the messages of the group")
+        finally:
+            processed.extend(done)
+            if (skipped := len(messages) - len(done) - 1) > 0:
+                self.logger.warning("Skipped {} messages in the same group", skipped)
+
+    async def _wrap_many(self, msgs: list[dict[str, Any]]) -> bool:
+        """Wrap the handler of multiple messages and return True if successful, False otherwise.
+
+        The messages are consumed and stored in the same transaction, only if successful.
+        """
+        start = time.perf_counter()
+        with track_queries(f"{len(msgs)} messages", queue=self._queue_name):
+            async with database_session_manager.session(DatabasePool.CONSUMER) as db:
+                try:
+                    await self._consume_once(msgs=msgs, db=db)
+                except Exception:
+                    self.logger.exception("Error processing {} messages together", len(msgs))
+                    # ensure that any pending change is rolled back
+                    await db.rollback()
+                    return False
+        SQS_CONSUME_DURATION.observe(time.perf_counter() - start, self._metric_labels)
+        SQS_MESSAGES_CONSUMED.inc((self._queue_name, "success"), len(msgs))
+        return True
+
+    async def _run_once(
+        self, sqs_client: AioBaseClient, queue_url: str, acknowledger: MessageAcknowledger
+    ) -> None:
         """Receive and process a single batch of messages.
 
         FIFO queue logic applies only per message group ID.
@@ -93,30 +291,52 @@ class QueueConsumer(ABC):
         When you receive a message with a message group ID, no more messages for the same message
         group ID are returned unless you delete the message, or it becomes visible.
 
+        Messages belonging to different groups are processed concurrently, up to the configured
+        maximum concurrency, while messages in the same group are processed in order.
+        The processed messages are deleted in batches by the acknowledger, and the messages
+        redelivered because the deletion failed are detected as duplicates and skipped.
+
         See Also:
             https://docs.aws.amazon.com/AWSSimpleQueueService/latest/SQSDeveloperGuide/FIFO-queues-understanding-logic.html
         """
+        start = time.perf_counter()
         response = await sqs_client.receive_message(
             QueueUrl=queue_url,
             MessageSystemAttributeNames=[
+                "ApproximateReceiveCount",
                 "MessageGroupId",
                 "SenderId",
                 "SentTimestamp",
                 "SequenceNumber",
             ],
-            MaxNumberOfMessages=1,
+            MaxNumberOfMessages=self._max_number_of_messages,
             VisibilityTimeout=30,
             WaitTimeSeconds=20,  # enable long polling
         )
+        SQS_RECEIVE_DURATION.observe(time.perf_counter() - start, self._metric_labels)
         messages = response.get("Messages", [])
-        self.logger.info("Received {} messages", len(messages))
-        for msg in messages:
-            receipt_handle = msg["ReceiptHandle"]
-            if await self._wrap(msg=msg):
-                await sqs_client.delete_message(
-                    QueueUrl=queue_url,
-                    ReceiptHandle=receipt_handle,
-                )
+        self._record_received(messages)
+        groups = self._group_messages(messages)
+        self.logger.info("Received {} messages in {} groups", len(messages), len(groups))
+        processed: list[dict[str, Any]] = []
+        try:
+            if len(groups) <= 1 or self._max_concurrency == 1:
+                for group in groups:
+                    await self._process_group(group, processed)
+            else:
+                semaphore = asyncio.Semaphore(self._max_concurrency)
+
+                async def _process_bounded(group: list[dict[str, Any]]) -> None:
+                    async with semaphore:
+                        await self._process_group(group, processed)
+
+                async with asyncio.TaskGroup() as tg:
+                    for group in groups:
+                        tg.create_task(_process_bounded(group))
+        finally:
+            # the messages already committed are deleted even if cancelled
+            for msg in processed:
+                acknowledger.ack(msg["ReceiptHandle"])
 
     async def run_forever(self, limit: int = 0) -> None:
         """Retrieve and dispatch messages from the queue until the task is cancelled.
@@ -129,10 +349,18 @@ class QueueConsumer(ABC):
             self.logger.info("Starting {}", self._name)
             await asyncio.sleep(self._initial_delay)
             queue_url = await get_queue_url(sqs_client, queue_name=self._queue_name)
-            while limit == 0 or counter < limit:
-                try:
-                    await self._run_once(sqs_client, queue_url)
-                except botocore.exceptions.ClientError:
-                    self.logger.exception("Client error")
-                    await asyncio.sleep(settings.SQS_CLIENT_ERROR_SLEEP)
-                counter += 1
+            self._acknowledger = MessageAcknowledger(
+                sqs_client,
+                queue_url,
+                batch_size=self._delete_batch_size,
+                flush_interval=self._delete_flush_interval,
+                max_retries=self._delete_max_retries,
+            )
+            async with self._acknowledger as acknowledger:
+                while limit == 0 or counter < limit:
+                    try:
+                        await self._run_once(sqs_client, queue_url, acknowledger)
+                    except* botocore.exceptions.ClientError:
+                        self.logger.exception("Client error")
+                        await asyncio.sleep(settings.SQS_CLIENT_ERROR_SLEEP)
+                    counter += 1
@@ -1,23 +1,41 @@
 """Longrun job consumer module."""
 
-from typing import Any
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any
 from uuid import UUID
 
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import settings
 from app.constants import LongrunStatus
 from app.db.model import Job
 from app.repository.group import RepositoryGroup
-from app.schema.domain import Accounts
+from app.schema.domain import AccountIds
 from app.schema.queue import LongrunEvent
-from app.task.queue_consumer.base import QueueConsumer
+from app.task.queue_consumer.base import MAX_NUMBER_OF_MESSAGES, QueueConsumer
 
+if TYPE_CHECKING:
+    from datetime import datetime
 
-async def _handle_started(repos: RepositoryGroup, event: LongrunEvent, accounts: Accounts) -> Job:
+
+@lru_cache(maxsize=MAX_NUMBER_OF_MESSAGES)
+def _parse_event(body: str) -> LongrunEvent:
+    """Return the event parsed from the body of the message.
+
+    The events of the last received batch are cached, so each message is parsed only once
+    when split by status and then consumed. The returned events must not be modified.
+    """
+    return LongrunEvent.model_validate_json(body)
+
+
+async def _handle_started(
+    repos: RepositoryGroup, event: LongrunEvent, account_ids: AccountIds
+) -> Job:
     return await repos.job.update_job(
         job_id=event.job_id,
-        vlab_id=accounts.vlab.id,
-        proj_id=accounts.proj.id,
+        vlab_id=account_ids.vlab_id,
+        proj_id=account_ids.proj_id,
         started_at=event.timestamp,
         last_alive_at=event.timestamp,
         usage_params={
@@ -27,28 +45,35 @@ async def _handle_started(repos: RepositoryGroup, event: LongrunEvent, accounts:
     )
 
 
-async def _handle_running(repos: RepositoryGroup, event: LongrunEvent, accounts: Accounts) -> Job:
+async def _handle_running(
+    repos: RepositoryGroup, event: LongrunEvent, account_ids: AccountIds
+) -> Job:
     return await repos.job.update_job(
         job_id=event.job_id,
-        vlab_id=accounts.vlab.id,
-        proj_id=accounts.proj.id,
+        vlab_id=account_ids.vlab_id,
+        proj_id=account_ids.proj_id,
         last_alive_at=event.timestamp,
     )
 
 
-async def _handle_finished(repos: RepositoryGroup, event: LongrunEvent, accounts: Accounts) -> Job:
+async def _handle_finished(
+    repos: RepositoryGroup, event: LongrunEvent, account_ids: AccountIds
+) -> Job:
     optional_kwargs = {}
     if event.name is not None:
         optional_kwargs["name"] = event.name
 
-    return await repos.job.update_job(
+    job = await repos.job.update_job(
         job_id=event.job_id,
-        vlab_id=accounts.vlab.id,
-        proj_id=accounts.proj.id,
+        vlab_id=account_ids.vlab_id,
+        proj_id=account_ids.proj_id,
         last_alive_at=event.timestamp,
         finished_at=event.timestamp,
         **optional_kwargs,
     )
+    if settings.CHARGE_FINISHED_ON_EVENT:
+        await repos.job.notify_finished(job_id=job.id, service_type=job.service_type)
+    return job
 
 
 class LongrunQueueConsumer(QueueConsumer):
@@ -57,10 +82,10 @@ class LongrunQueueConsumer(QueueConsumer):
     async def _consume(self, msg: dict[str, Any], db: AsyncSession) -> UUID:
         """Consume the message."""
         self.logger.info("Message received: {}", msg)
-        event = LongrunEvent.model_validate_json(msg["Body"])
+        event = _parse_event(msg["Body"])
 
         repos = RepositoryGroup(db=db)
-        accounts = await repos.account.get_accounts_by_proj_id(proj_id=event.proj_id)
+        account_ids = await repos.account.get_account_ids_by_proj_id(proj_id=event.proj_id)
 
         try:
             handler = {
@@ -72,5 +97,62 @@ class LongrunQueueConsumer(QueueConsumer):
             err = f"Status not handled: {event.status}"
             raise ValueError(err) from None
 
-        result = await handler(repos, event=event, accounts=accounts)
+        result = await handler(repos, event=event, account_ids=account_ids)
         return result.id
+
+    async def _consume_many(self, msgs: list[dict[str, Any]], db: AsyncSession) -> list[UUID]:
+        """Consume multiple RUNNING messages, updating all the jobs with a single statement.
+
+        The last_alive_at of each job is set to the most recent timestamp of its messages.
+        """
+        events = [_parse_event(msg["Body"]) for msg in msgs]
+        if any(event.status != LongrunStatus.RUNNING for event in events):
+            err = "Only RUNNING events can be consumed together"
+            raise ValueError(err)
+
+        repos = RepositoryGroup(db=db)
+        account_ids_by_proj_id: dict[UUID, AccountIds] = {}
+        last_alive_by_job: dict[tuple[UUID, UUID], datetime] = {}
+        for event in events:
+            key = (event.proj_id, event.job_id)
+            last_alive_by_job[key] = max(
+                event.timestamp, last_alive_by_job.get(key, event.timestamp)
+            )
+        values = []
+        for (proj_id, job_id), last_alive_at in last_alive_by_job.items():
+            if proj_id not in account_ids_by_proj_id:
+                account_ids_by_proj_id[proj_id] = await repos.account.get_account_ids_by_proj_id(
+                    proj_id=proj_id
+                )
+            account_ids = account_ids_by_proj_id[proj_id]
+            values.append((job_id, account_ids.vlab_id, account_ids.proj_id, last_alive_at))
+        await repos.job.update_last_alive_at(values)
+        self.logger.info(
+            "Coalesced {} running messages into {} job updates", len(msgs), len(last_alive_by_job)
+        )
+        return [event.job_id for event in events]
+
+    def _split_group(self, messages: list[dict[str, Any]]) -> list[list[dict[str, Any]]]:  # noqa: PLR6301
+        """Split the messages, grouping together the consecutive RUNNING messages.
+
+        The order of the messages in the group is preserved, so the RUNNING messages are never
+        moved before or after any STARTED or FINISHED message of the same group.
+        """
+        result: list[list[dict[str, Any]]] = []
+        running: list[dict[str, Any]] = []
+        for msg in messages:
+            try:
+                status = _parse_event(msg["Body"]).status
+            except ValidationError:
+                # invalid messages are consumed separately to record the error
+                status = None
+            if status == LongrunStatus.RUNNING:
+                running.append(msg)
+                continue
+            if running:
+                result.append(running)
+                running = []
+            result.append([msg])
+        if running:
+            result.append(running)
+        return result
@@ -5,6 +5,7 @@ from uuid import UUID
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import settings
 from app.errors import EventError
 from app.repository.group import RepositoryGroup
 from app.schema.queue import OneshotEvent
@@ -20,7 +21,7 @@ class OneshotQueueConsumer(QueueConsumer):
         event = OneshotEvent.model_validate_json(msg["Body"])
         repos = RepositoryGroup(db=db)
 
-        accounts = await repos.account.get_accounts_by_proj_id(proj_id=event.proj_id)
+        account_ids = await repos.account.get_account_ids_by_proj_id(proj_id=event.proj_id)
 
         job = await repos.job.get_job(job_id=event.job_id)
         if job is None:
@@ -32,8 +33,8 @@ class OneshotQueueConsumer(QueueConsumer):
         if unmatched_attributes := {
             key: value
             for key, value in [
-                ("vlab_id", job.vlab_id == accounts.vlab.id),
-                ("proj_id", job.proj_id == accounts.proj.id),
+                ("vlab_id", job.vlab_id == account_ids.vlab_id),
+                ("proj_id", job.proj_id == account_ids.proj_id),
                 ("service_type", job.service_type == event.type),
                 ("service_subtype", job.service_subtype == event.subtype),
             ]
@@ -44,8 +45,8 @@ class OneshotQueueConsumer(QueueConsumer):
 
         result = await repos.job.update_job(
             job_id=event.job_id,
-            vlab_id=accounts.vlab.id,
-            proj_id=accounts.proj.id,
+            vlab_id=account_ids.vlab_id,
+            proj_id=account_ids.proj_id,
             started_at=event.timestamp,
             last_alive_at=event.timestamp,
             finished_at=event.timestamp,
@@ -54,4 +55,6 @@ class OneshotQueueConsumer(QueueConsumer):
                 "count": event.count,
             },
         )
+        if settings.CHARGE_FINISHED_ON_EVENT:
+            await repos.job.notify_finished(job_id=result.id, service_type=result.service_type)
         return result.id
@@ -20,20 +20,20 @@ class StorageQueueConsumer(QueueConsumer):
         event = StorageEvent.model_validate_json(msg["Body"])
 
         repos = RepositoryGroup(db=db)
-        accounts = await repos.account.get_accounts_by_proj_id(proj_id=event.proj_id)
+        account_ids = await repos.account.get_account_ids_by_proj_id(proj_id=event.proj_id)
 
         # close the old running job(s)
         await repos.job.update_finished_at(
-            vlab_id=accounts.vlab.id,
-            proj_id=accounts.proj.id,
+            vlab_id=account_ids.vlab_id,
+            proj_id=account_ids.proj_id,
             service_type=event.type,
             finished_at=event.timestamp,
         )
         # insert a new job
         result = await repos.job.insert_job(
             job_id=create_uuid(),
-            vlab_id=accounts.vlab.id,
-            proj_id=accounts.proj.id,
+            vlab_id=account_ids.vlab_id,
+            proj_id=account_ids.proj_id,
             service_type=event.type,
             service_subtype=event.subtype,
             started_at=event.timestamp,
@@ -1,7 +1,13 @@
 """Generic utilities."""
 
+import asyncio
+import base64
+import binascii
+import json
 import time
 import uuid
+from collections import defaultdict
+from collections.abc import Awaitable, Callable, Hashable, Iterable, Sequence
 from datetime import UTC, datetime
 
 
@@ -18,3 +24,64 @@ def utcnow() -> datetime:
 def create_uuid() -> uuid.UUID:
     """Return a new random UUID."""
     return uuid.uuid4()
+
+
+async def run_partitioned[T](
+    items: Iterable[T],
+    func: Callable[[T], Awaitable[None]],
+    *,
+    key: Callable[[T], Hashable],
+    concurrency: int = 1,
+) -> None:
+    """Call func for each item, running the partitions of items concurrently.
+
+    The items with the same key are processed sequentially and in order by the same worker,
+    while at most `concurrency` partitions are processed at the same time.
+    If concurrency is 1, all the items are processed sequentially in the original order.
+
+    The function func is expected to handle its own errors, because any exception
+    cancels the processing of all the partitions.
+    """
+    if concurrency <= 1:
+        for item in items:
+            await func(item)
+        return
+    partitions: dict[Hashable, list[T]] = defaultdict(list)
+    for item in items:
+        partitions[key(item)].append(item)
+    pending = iter(partitions.values())
+
+    async def worker() -> None:
+        # the iterator is shared, so each partition is consumed by only one worker
+        for partition in pending:
+            for item in partition:
+                await func(item)
+
+    async with asyncio.TaskGroup() as tg:
+        for _ in range(min(concurrency, len(partitions))):
+            tg.create_task(worker())
+
+
+def encode_cursor(values: Sequence[str | None]) -> str:
+    """Return an opaque cursor encoding the given values."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list[str | None]:
+    """Return the values encoded in the given cursor.
+
+    Raise ValueError if the cursor is invalid, or if the number of values is not the expected one.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as err:
+        msg = "Invalid cursor"
+        raise ValueError(msg) from err
+    if (
+        not isinstance(values, list)
+        or len(values) != size
+        or not all(value is None or isinstance(value, str) for value in values)
+    ):
+        msg = "Invalid cursor"
+        raise ValueError(msg)
+    return values
@@ -5,4 +5,4 @@ set -ex -o pipefail
 alembic upgrade head
 
 # use exec to replace the shell and ensure that SIGINT is sent to the app
-exec python -m app
+exec python -m app "$@"
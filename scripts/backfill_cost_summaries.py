@@ -0,0 +1,44 @@
+"""Populate the cost summary of the existing jobs from the ledger.
+
+The cost summaries are maintained by the ledger postings, but the jobs charged before the
+summaries were introduced need to be populated once, before enabling REPORT_FROM_COST_SUMMARY.
+The script can be executed while the service is running, and executed again to repair any
+inconsistent summary. Example:
+
+    DB_HOST=127.0.0.1 PYTHONPATH=. uv run scripts/backfill_cost_summaries.py --batch-size 1000
+"""
+
+# ruff: noqa: INP001, T201
+
+import argparse
+import asyncio
+
+from app.config import settings
+from app.db.session import database_session_manager
+from app.repository.group import RepositoryGroup
+
+
+async def main(batch_size: int) -> int:
+    """Recalculate the summaries in batches, and return the number of jobs."""
+    database_session_manager.initialize(url=settings.DB_URI, pool_size=1)
+    count = 0
+    try:
+        job_ids = None
+        while job_ids is None or len(job_ids) == batch_size:
+            # each batch is committed separately, to keep the summaries locked for a short time
+            async with database_session_manager.session() as db:
+                job_ids = await RepositoryGroup(db=db).ledger.backfill_cost_summaries(
+                    limit=batch_size, after=job_ids[-1] if job_ids else None
+                )
+            count += len(job_ids)
+            print(f"Recalculated jobs: {count}")
+    finally:
+        await database_session_manager.close()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1000, help="jobs in each transaction")
+    args = parser.parse_args()
+    asyncio.run(main(batch_size=args.batch_size))
@@ -0,0 +1,140 @@
+"""Compare the latency of the ledger posting modes.
+
+The benchmark makes longrun reservations and charges the reserved jobs, first with the
+multi-statement posting and then with the single-statement posting.
+
+All the changes are made in a single transaction that is rolled back at the end, but the
+benchmark should be run only against a local or test database, because the accounts are locked
+for the whole duration. Example:
+
+    DB_HOST=127.0.0.1 PYTHONPATH=. uv run scripts/benchmark_ledger.py --iterations 200
+"""
+
+# ruff: noqa: INP001, T201
+
+import argparse
+import asyncio
+import statistics
+import time
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from decimal import Decimal
+from uuid import UUID
+
+from sqlalchemy.exc import NoResultFound
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.constants import ServiceSubtype, ServiceType, TransactionType
+from app.db.session import database_session_manager
+from app.repository.group import RepositoryGroup
+from app.schema.api import MakeLongrunReservationIn
+from app.service.charge_longrun import charge_longrun
+from app.service.reservation import make_longrun_reservation
+from app.utils import create_uuid, utcnow
+
+
+async def _setup(repos: RepositoryGroup) -> tuple[UUID, MakeLongrunReservationIn]:
+    """Create the accounts and the price, and return the vlab id and the reservation request."""
+    try:
+        sys_account = await repos.account.get_system_account()
+    except NoResultFound:
+        sys_account = await repos.account.add_sys_account(account_id=create_uuid(), name="SYS")
+    vlab = await repos.account.add_vlab_account(account_id=create_uuid(), name="benchmark")
+    proj = await repos.account.add_proj_account(
+        account_id=create_uuid(), name="benchmark", vlab_id=vlab.id
+    )
+    await repos.ledger.insert_transaction(
+        amount=Decimal(10**9),
+        debited_from=sys_account.id,
+        credited_to=proj.id,
+        transaction_datetime=utcnow(),
+        transaction_type=TransactionType.TOP_UP,
+    )
+    await repos.price.add_price(
+        {
+            "service_type": ServiceType.LONGRUN,
+            "service_subtype": ServiceSubtype.SINGLE_CELL_SIM,
+            "valid_from": utcnow() - timedelta(days=1),
+            "valid_to": None,
+            "vlab_id": vlab.id,
+            "tiers": [
+                {
+                    "min_quantity": 0,
+                    "max_quantity": None,
+                    "fixed_cost": Decimal("0.5"),
+                    "multiplier": Decimal("0.001"),
+                }
+            ],
+        }
+    )
+    return vlab.id, MakeLongrunReservationIn(
+        proj_id=proj.id,
+        user_id=create_uuid(),
+        type=ServiceType.LONGRUN,
+        subtype=ServiceSubtype.SINGLE_CELL_SIM,
+        duration=3600,
+        instances=1,
+    )
+
+
+async def _run(db: AsyncSession, iterations: int) -> dict[str, list[float]]:
+    """Run the benchmark and return the elapsed times in seconds, grouped by operation."""
+    repos = RepositoryGroup(db=db)
+
+    @asynccontextmanager
+    async def session_factory() -> AsyncIterator[AsyncSession]:
+        yield db
+
+    vlab_id, reservation_request = await _setup(repos)
+    timings: dict[str, list[float]] = defaultdict(list)
+    for _ in range(iterations):
+        start = time.perf_counter()
+        reservation = await make_longrun_reservation(repos, reservation_request)
+        timings["make_longrun_reservation"].append(time.perf_counter() - start)
+
+        now = utcnow()
+        await repos.job.update_job(
+            job_id=reservation.job_id,
+            vlab_id=vlab_id,
+            proj_id=reservation_request.proj_id,
+            started_at=now - timedelta(minutes=10),
+            last_alive_at=now,
+            finished_at=now,
+            usage_params={"instances": 1},
+        )
+        start = time.perf_counter()
+        await charge_longrun(session_factory, transaction_datetime=now)
+        timings["charge_longrun"].append(time.perf_counter() - start)
+    return timings
+
+
+async def main(iterations: int) -> None:
+    """Run the benchmark for each posting mode."""
+    database_session_manager.initialize(url=settings.DB_URI, pool_size=1)
+    try:
+        for single_statement in [False, True]:
+            settings.LEDGER_SINGLE_STATEMENT_POSTING = single_statement
+            async with database_session_manager.session() as db:
+                try:
+                    timings = await _run(db, iterations=iterations)
+                finally:
+                    await db.rollback()
+            mode = "single-statement" if single_statement else "multi-statement"
+            for name, values in timings.items():
+                print(
+                    f"{mode:<17} {name:<25} "
+                    f"mean={statistics.mean(values) * 1000:.2f}ms "
+                    f"median={statistics.median(values) * 1000:.2f}ms"
+                )
+    finally:
+        await database_session_manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(iterations=args.iterations))
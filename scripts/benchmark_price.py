@@ -0,0 +1,70 @@
+"""Compare the latency of the cost calculation with iterated and compiled tiers.
+
+The benchmark calculates the cost of random usage ranges with a price having the given number
+of consecutive tiers, first iterating over the tiers and then using the compiled tiers.
+It doesn't need any database. Example:
+
+    PYTHONPATH=. uv run scripts/benchmark_price.py --tiers 20 --iterations 100000
+"""
+
+# ruff: noqa: INP001, T201, S311
+
+import argparse
+import itertools
+import random
+import time
+from decimal import Decimal
+
+from app.schema.domain import CompiledTiers, PriceTierInfo
+from app.service.price import _iter_cost  # noqa: PLC2701
+
+
+def _make_tiers(count: int, width: int) -> list[PriceTierInfo]:
+    """Return consecutive tiers, where the last one is unbounded."""
+    return [
+        PriceTierInfo(
+            min_quantity=n * width,
+            max_quantity=None if n == count - 1 else (n + 1) * width,
+            fixed_cost=Decimal(n) / 10,
+            multiplier=Decimal(count - n) / 1000,
+        )
+        for n in range(count)
+    ]
+
+
+def main(tiers_count: int, iterations: int, width: int) -> None:
+    """Run the benchmark and print the mean time per calculation."""
+    rng = random.Random(0)
+    tiers = _make_tiers(tiers_count, width=width)
+    max_usage = tiers_count * width * 2
+    ranges = [
+        tuple(sorted((rng.randint(0, max_usage), rng.randint(0, max_usage))))
+        for _ in range(iterations)
+    ]
+
+    start = time.perf_counter()
+    compiled = CompiledTiers.from_tiers(tiers)
+    compile_time = time.perf_counter() - start
+    print(f"{'compile':<10} total={compile_time * 1e6:.2f}us")
+
+    results = {}
+    for name, func in [
+        ("iterated", lambda s, e: _iter_cost(tiers, start=s, end=e)),
+        ("compiled", lambda s, e: compiled.cost(start=s, end=e)),
+    ]:
+        start = time.perf_counter()
+        results[name] = list(itertools.starmap(func, ranges))
+        elapsed = time.perf_counter() - start
+        print(f"{name:<10} mean={elapsed / iterations * 1e6:.3f}us")
+    if results["iterated"] != results["compiled"]:
+        err = "The calculated costs are different"
+        raise SystemExit(err)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tiers", type=int, default=10)
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--width", type=int, default=1000, help="usage covered by each tier")
+    args = parser.parse_args()
+    main(tiers_count=args.tiers, iterations=args.iterations, width=args.width)
@@ -0,0 +1,37 @@
+"""Check the remaining reservation of the jobs against the ledger.
+
+The remaining reservation is maintained in the job table by the ledger postings, and it should
+always be equal to the sum of the ledger rows of the RSV accounts. Example:
+
+    DB_HOST=127.0.0.1 PYTHONPATH=. uv run scripts/check_reservations.py [--repair]
+"""
+
+# ruff: noqa: INP001, T201
+
+import argparse
+import asyncio
+
+from app.config import settings
+from app.db.session import database_session_manager
+from app.repository.group import RepositoryGroup
+
+
+async def main(*, repair: bool) -> int:
+    """Check the jobs and return the number of inconsistencies found."""
+    database_session_manager.initialize(url=settings.DB_URI, pool_size=1)
+    try:
+        async with database_session_manager.session() as db:
+            result = await RepositoryGroup(db=db).ledger.check_remaining_reservations(repair=repair)
+    finally:
+        await database_session_manager.close()
+    for job_id, remaining_reservation, expected in result:
+        print(f"{job_id}: {remaining_reservation} instead of {expected}")
+    print(f"Inconsistent jobs: {len(result)}{' (repaired)' if repair and result else ''}")
+    return len(result)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repair", action="store_true", help="fix the inconsistent jobs")
+    args = parser.parse_args()
+    raise SystemExit(1 if asyncio.run(main(repair=args.repair)) and not args.repair else 0)
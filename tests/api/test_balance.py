@@ -1,6 +1,9 @@
 import pytest
+import sqlalchemy as sa
 
-from tests.constants import PROJ_ID, PROJ_ID_2, VLAB_ID
+from app.db.model import SystemBalanceDelta
+
+from tests.constants import PROJ_ID, PROJ_ID_2, SYS_ID, VLAB_ID
 
 
 @pytest.mark.usefixtures("_db_account")
@@ -11,6 +14,20 @@ async def test_get_balance_for_system(api_client):
     assert response.status_code == 200
 
 
+@pytest.mark.usefixtures("_db_account")
+async def test_get_balance_for_system_with_pending_changes(api_client, db):
+    await db.execute(
+        sa.insert(SystemBalanceDelta),
+        [{"account_id": SYS_ID, "amount": 10}, {"account_id": SYS_ID, "amount": 5}],
+    )
+    await db.commit()
+
+    response = await api_client.get("/balance/system")
+
+    assert response.json()["data"] == {"balance": "-2985.00"}
+    assert response.status_code == 200
+
+
 @pytest.mark.usefixtures("_db_account")
 async def test_get_balance_for_virtual_lab(api_client):
     response = await api_client.get(f"/balance/virtual-lab/{VLAB_ID}")
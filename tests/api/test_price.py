@@ -1,5 +1,6 @@
 import pytest
 
+from app.config import settings
 from app.constants import ServiceSubtype
 
 from tests.constants import PROJ_ID, VLAB_ID
@@ -107,3 +108,16 @@ async def test_post_price_with_legacy_subtype(api_client):
         error_type="value_error",
         msg="subtype `ml-retrieval` is legacy",
     )
+
+
+async def test_get_price_cache_stats(api_client):
+    response = await api_client.get("/price/cache")
+
+    assert response.status_code == 200
+    assert response.json()["data"] == {
+        "enabled": settings.PRICE_CACHE_ENABLED,
+        "hits": 0,
+        "misses": 0,
+        "invalidations": 0,
+        "size": 0,
+    }
@@ -1,9 +1,35 @@
+import csv
+import io
+import json
 from unittest.mock import ANY
 
 import pytest
 
+from app.config import settings
+from app.repository.report import ReportRepository
+
 from tests.constants import UUIDS
 
+REPORT_COLUMNS = [
+    "job_id",
+    "type",
+    "subtype",
+    "user_id",
+    "group_id",
+    "name",
+    "reserved_at",
+    "started_at",
+    "finished_at",
+    "cancelled_at",
+    "amount",
+    "reserved_amount",
+    "count",
+    "reserved_count",
+    "duration",
+    "reserved_duration",
+    "size",
+]
+
 
 @pytest.mark.usefixtures("_db_ledger")
 @pytest.mark.parametrize(
@@ -150,3 +176,187 @@ async def test_get_report_not_found(api_client, url, expected_message):
         "error_code": "ENTITY_NOT_FOUND",
         "message": expected_message,
     }
+
+
+@pytest.mark.usefixtures("_db_ledger")
+async def test_get_report_with_cursor(api_client):
+    url = f"/report/project/{UUIDS.PROJ[0]}"
+    response = await api_client.get(
+        url, params={"page_size": 2, "cursor": "", "include_total": False}
+    )
+
+    assert response.status_code == 200, f"unexpected response {response.text!r}"
+    data = response.json()["data"]
+    assert [item["job_id"] for item in data["items"]] == [str(UUIDS.JOB[2]), str(UUIDS.JOB[1])]
+    assert data["meta"] == {"page": 1, "page_size": 2}
+    next_cursor = data["links"]["next_cursor"]
+    assert data["links"] == {
+        "self": f"{api_client.base_url}{url}?page_size=2&cursor=&include_total=false",
+        "first": f"{api_client.base_url}{url}?page_size=2&include_total=false&page=1&cursor=",
+        "last": None,
+        "prev": None,
+        "next": (
+            f"{api_client.base_url}{url}?page_size=2&include_total=false"
+            f"&page=2&cursor={next_cursor}"
+        ),
+        "next_cursor": next_cursor,
+    }
+
+    response = await api_client.get(data["links"]["next"])
+
+    assert response.status_code == 200, f"unexpected response {response.text!r}"
+    data = response.json()["data"]
+    assert [item["job_id"] for item in data["items"]] == [str(UUIDS.JOB[0])]
+    assert data["meta"] == {"page": 2, "page_size": 2}
+    assert data["links"]["next"] is None
+    assert data["links"]["prev"] == (
+        f"{api_client.base_url}{url}?page_size=2&include_total=false&page=1"
+    )
+
+
+async def test_get_report_with_invalid_cursor(api_client):
+    response = await api_client.get("/report/system", params={"cursor": "invalid"})
+
+    assert response.status_code == 400, f"unexpected response {response.text!r}"
+    assert response.json() == {
+        "details": None,
+        "error_code": "INVALID_REQUEST",
+        "message": "Invalid cursor",
+    }
+
+
+@pytest.mark.usefixtures("_db_ledger")
+@pytest.mark.parametrize(
+    ("url", "extra_columns"),
+    [
+        ("/report/system/export", ["vlab_id", "proj_id"]),
+        (f"/report/virtual-lab/{UUIDS.VLAB[0]}/export", ["proj_id"]),
+        (f"/report/project/{UUIDS.PROJ[0]}/export", []),
+    ],
+)
+async def test_export_report(api_client, monkeypatch, url, extra_columns):
+    monkeypatch.setattr(settings, "REPORT_EXPORT_BATCH_SIZE", 2)
+    response = await api_client.get(url)
+
+    assert response.status_code == 200, f"unexpected response {response.text!r}"
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.headers["content-disposition"].endswith('.ndjson"')
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["job_id"] for row in rows] == [str(job_id) for job_id in UUIDS.JOB[2::-1]]
+    assert list(rows[0]) == [*extra_columns, *REPORT_COLUMNS]
+    assert rows[2]["amount"] == "0.01500"
+    assert rows[2]["reserved_amount"] == "0.01000"
+    assert rows[2]["count"] == 1500
+
+    response = await api_client.get(url, params={"format": "csv"})
+
+    assert response.status_code == 200, f"unexpected response {response.text!r}"
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"].endswith('.csv"')
+    csv_rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["job_id"] for row in csv_rows] == [row["job_id"] for row in rows]
+    assert list(csv_rows[0]) == [*extra_columns, *REPORT_COLUMNS]
+    assert csv_rows[2]["amount"] == "0.01500"
+    assert csv_rows[2]["started_at"] == rows[2]["started_at"]
+    assert not csv_rows[0]["name"]
+
+
+@pytest.mark.parametrize(
+    ("url", "expected_message"),
+    [
+        (f"/report/virtual-lab/{UUIDS.SYS}/export", "Virtual lab not found"),
+        (f"/report/project/{UUIDS.SYS}/export", "Project not found"),
+    ],
+)
+async def test_export_report_not_found(api_client, url, expected_message):
+    response = await api_client.get(url, params={"format": "csv"})
+
+    assert response.status_code == 404, f"unexpected response {response.text!r}"
+    assert response.json()["message"] == expected_message
+
+
+@pytest.mark.usefixtures("_db_account")
+@pytest.mark.parametrize(
+    ("url", "extra_columns"),
+    [
+        ("/report/system/export", ["vlab_id", "proj_id"]),
+        (f"/report/virtual-lab/{UUIDS.VLAB[0]}/export", ["proj_id"]),
+        (f"/report/project/{UUIDS.PROJ[0]}/export", []),
+    ],
+)
+async def test_export_report_empty(api_client, url, extra_columns):
+    response = await api_client.get(url, params={"format": "csv"})
+
+    assert response.status_code == 200, f"unexpected response {response.text!r}"
+    # only the header
+    assert list(csv.reader(io.StringIO(response.text))) == [[*extra_columns, *REPORT_COLUMNS]]
+
+    response = await api_client.get(url)
+
+    assert response.status_code == 200, f"unexpected response {response.text!r}"
+    assert not response.text
+
+
+@pytest.mark.usefixtures("_db_ledger")
+async def test_get_usage_timeseries(api_client, db):
+    await ReportRepository(db).refresh_usage_rollups(batch_size=10)
+    await db.commit()
+
+    response = await api_client.get(
+        "/report/usage-timeseries", params={"vlab_id": str(UUIDS.VLAB[0]), "granularity": "hour"}
+    )
+
+    assert response.status_code == 200, f"unexpected response {response.text!r}"
+    data = response.json()["data"]
+    assert data == {
+        "granularity": "hour",
+        "refreshed_at": ANY,
+        "items": [
+            {
+                "bucket_start": ANY,
+                "vlab_id": str(UUIDS.VLAB[0]),
+                "proj_id": str(UUIDS.PROJ[0]),
+                "type": "oneshot",
+                "subtype": "ml-llm",
+                "transaction_type": "reserve",
+                "amount": "0.01",
+                "transactions": 1,
+            },
+            {
+                "bucket_start": ANY,
+                "vlab_id": str(UUIDS.VLAB[0]),
+                "proj_id": str(UUIDS.PROJ[0]),
+                "type": "oneshot",
+                "subtype": "ml-llm",
+                "transaction_type": "charge-oneshot",
+                "amount": "0.02",
+                "transactions": 2,
+            },
+        ],
+    }
+
+    response = await api_client.get(
+        "/report/usage-timeseries",
+        params={
+            "proj_id": str(UUIDS.PROJ[0]),
+            "granularity": "hour",
+            "after": data["items"][0]["bucket_start"],
+        },
+    )
+
+    assert response.status_code == 200, f"unexpected response {response.text!r}"
+    assert len(response.json()["data"]["items"]) == 2
+
+
+@pytest.mark.parametrize(
+    ("params", "expected_message"),
+    [
+        ({"vlab_id": str(UUIDS.SYS)}, "Virtual lab not found"),
+        ({"proj_id": str(UUIDS.SYS)}, "Project not found"),
+    ],
+)
+async def test_get_usage_timeseries_not_found(api_client, params, expected_message):
+    response = await api_client.get("/report/usage-timeseries", params=params)
+
+    assert response.status_code == 404, f"unexpected response {response.text!r}"
+    assert response.json()["message"] == expected_message
@@ -1,3 +1,7 @@
+from httpx import ASGITransport, AsyncClient
+
+from app import metrics
+from app.application import metrics_app
 from app.config import settings
 
 
@@ -35,3 +39,25 @@ async def test_error(api_client):
         "message": "Generic error returned for testing purposes",
         "details": None,
     }
+
+
+async def test_metrics(api_client):
+    await api_client.get("/health")
+
+    response = await api_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE
+    assert 'http_requests_total{method="GET",route="/health",status="200"}' in response.text
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+    assert "# TYPE db_pool_checkout_duration_seconds histogram" in response.text
+    assert 'cache_entries{cache="price"}' in response.text
+
+
+async def test_metrics_app():
+    transport = ASGITransport(app=metrics_app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert "# TYPE task_runs_total counter" in response.text
@@ -15,6 +15,7 @@ from httpx import ASGITransport, AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import application
+from app.cache import account_ids_cache, price_cache
 from app.config import settings
 from app.constants import D0, ServiceSubtype, ServiceType, TransactionType
 from app.db.model import Account, Job, Journal, Ledger, Price, PriceTier
@@ -65,6 +66,10 @@ async def _db_cleanup(db):
     yield
     await db.rollback()
     await truncate_tables(db)
+    price_cache.clear()
+    price_cache.reset_stats()
+    account_ids_cache.clear()
+    account_ids_cache.reset_stats()
 
 
 @pytest.fixture
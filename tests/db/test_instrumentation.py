@@ -0,0 +1,59 @@
+from unittest.mock import ANY, MagicMock
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.exc import DBAPIError
+
+from app.config import settings
+from app.db import instrumentation as test_module
+from app.db.session import DatabaseSessionManager
+
+
+@pytest.fixture
+async def instrumented_manager():
+    database_session_manager = DatabaseSessionManager()
+    database_session_manager.initialize(
+        url=settings.DB_URI, instrument_queries=True, slow_query_threshold=0
+    )
+    yield database_session_manager
+    await database_session_manager.close()
+
+
+async def test_track_queries(instrumented_manager, monkeypatch):
+    monkeypatch.setattr(settings, "DB_QUERY_STATS_ENABLED", True)
+    mock_logger = MagicMock()
+    monkeypatch.setattr(test_module, "L", mock_logger)
+    assert test_module.get_query_stats() is None
+
+    with test_module.track_queries("outer", key="value") as outer_stats:
+        async with instrumented_manager.session() as db:
+            await db.execute(sa.text("SELECT 'secret'"))
+            with test_module.track_queries("inner") as inner_stats:
+                assert test_module.get_query_stats() is inner_stats
+                await db.execute(sa.select(sa.literal(1)))
+                with pytest.raises(DBAPIError):
+                    await db.execute(sa.text("SELECT 1/0"))
+
+    assert test_module.get_query_stats() is None
+    assert inner_stats.statements == 1
+    assert outer_stats.statements == 2
+    assert outer_stats.duration >= inner_stats.duration > 0
+    assert outer_stats.as_extra() == {
+        "db_statements": 2,
+        "db_time_ms": round(outer_stats.duration * 1000, 3),
+    }
+    mock_logger.bind.assert_any_call(db_statements=1, db_time_ms=ANY)
+    mock_logger.bind.assert_any_call(key="value", db_statements=2, db_time_ms=ANY)
+    info_calls = mock_logger.bind.return_value.info.call_args_list
+    assert [call.args[-1] for call in info_calls] == ["inner", "outer"]
+    slow_calls = mock_logger.warning.call_args_list
+    assert [call.args[1:] for call in slow_calls] == [
+        (ANY, 0, "", "SELECT '?'"),
+        (ANY, 1, "", "SELECT $1::INTEGER AS anon_1"),
+    ]
+
+
+def test_redact_statement(monkeypatch):
+    monkeypatch.setattr(test_module, "SLOW_STATEMENT_MAX_LENGTH", 20)
+    assert test_module.redact_statement("SELECT 'it''s', $1") == "SELECT '?', $1"
+    assert test_module.redact_statement("SELECT 1, 2, 3, 4, 5, 6, 7") == "SELECT 1, 2, 3, 4, 5..."
@@ -1,7 +1,11 @@
+import asyncio
+
 import pytest
+import sqlalchemy as sa
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 
 from app.config import settings
+from app.constants import DatabasePool
 from app.db import session as test_module
 
 
@@ -32,3 +36,140 @@ async def test_database_session_manager_lifecycle():
 
     with pytest.raises(RuntimeError, match="DB engine not initialized"):
         await database_session_manager.close()
+
+
+async def test_database_session_manager_pools():
+    database_session_manager = test_module.DatabaseSessionManager()
+    database_session_manager.initialize(
+        url=settings.DB_URI,
+        pools={DatabasePool.CHARGER: {"pool_size": 1, "pool_timeout": 0.1}},
+        pool_size=2,
+        max_overflow=0,
+    )
+    try:
+        charger_engine = database_session_manager._get_engine(DatabasePool.CHARGER)
+        assert charger_engine is not database_session_manager._engine
+        # the pools not configured use the default engine
+        assert database_session_manager._get_engine(DatabasePool.API) is (
+            database_session_manager._engine
+        )
+
+        session_factory = database_session_manager.session_factory(DatabasePool.CHARGER)
+        async with session_factory() as session:
+            await session.execute(sa.text("SELECT 1"))
+            # the charger pool is exhausted, while the default pool is still available
+            with pytest.raises(sa.exc.TimeoutError):
+                async with database_session_manager.connection(DatabasePool.CHARGER) as conn:
+                    await conn.execute(sa.text("SELECT 1"))
+            async with database_session_manager.connection() as conn:
+                await conn.execute(sa.text("SELECT 1"))
+
+        stats = database_session_manager.get_pool_stats()
+        assert stats.keys() == {DatabasePool.DEFAULT, DatabasePool.CHARGER}
+        assert stats[DatabasePool.CHARGER]["size"] == 1
+        assert stats[DatabasePool.CHARGER]["checkouts"] == 2
+        assert stats[DatabasePool.CHARGER]["timeouts"] == 1
+        assert stats[DatabasePool.CHARGER]["wait_max"] >= 0.1
+        assert stats[DatabasePool.DEFAULT]["checkouts"] == 1
+        assert stats[DatabasePool.DEFAULT]["timeouts"] == 0
+
+        database_session_manager.reset_pool_stats()
+        stats = database_session_manager.get_pool_stats()
+        assert stats[DatabasePool.CHARGER]["checkouts"] == 0
+    finally:
+        await database_session_manager.close()
+    assert database_session_manager.get_pool_stats() == {}
+
+
+async def test_database_session_manager_read_session():
+    database_session_manager = test_module.DatabaseSessionManager()
+    database_session_manager.initialize(
+        url=settings.DB_URI,
+        pools={DatabasePool.REPLICA: {"url": settings.DB_URI, "pool_size": 1}},
+        replica_max_lag=5,
+        replica_check_interval=0,
+        pool_size=2,
+    )
+    try:
+        replica_engine = database_session_manager._get_engine(DatabasePool.REPLICA)
+        async with database_session_manager.read_session() as session:
+            assert session.bind is replica_engine
+            assert (await session.execute(sa.text("SELECT 1"))).scalar_one() == 1
+        assert database_session_manager.get_replica_stats() == {
+            "lag": 0,
+            "replica": 1,
+            "fallback": 0,
+        }
+
+        # fall back to the primary when the lag exceeds the threshold
+        database_session_manager._replica_max_lag = -1
+        async with database_session_manager.read_session() as session:
+            assert session.bind is database_session_manager._engine
+        assert database_session_manager.get_replica_stats()["fallback"] == 1
+
+        # the lag isn't checked again before the interval
+        database_session_manager._replica_max_lag = 5
+        database_session_manager._replica_check_interval = 3600
+        async with database_session_manager.read_session() as session:
+            assert session.bind is replica_engine
+    finally:
+        await database_session_manager.close()
+
+
+async def test_database_session_manager_read_session_with_unavailable_replica():
+    database_session_manager = test_module.DatabaseSessionManager()
+    database_session_manager.initialize(
+        url=settings.DB_URI,
+        pools={
+            DatabasePool.REPLICA: {"url": sa.make_url(settings.DB_URI).set(port=1), "pool_size": 1}
+        },
+        replica_check_interval=0,
+        pool_size=2,
+    )
+    try:
+        async with database_session_manager.read_session() as session:
+            assert session.bind is database_session_manager._engine
+        assert database_session_manager.get_replica_stats() == {
+            "lag": None,
+            "replica": 0,
+            "fallback": 1,
+        }
+    finally:
+        await database_session_manager.close()
+
+
+async def test_database_session_manager_read_session_with_replica_check_timeout():
+    database_session_manager = test_module.DatabaseSessionManager()
+    database_session_manager.initialize(
+        url=settings.DB_URI,
+        pools={DatabasePool.REPLICA: {"url": settings.DB_URI, "pool_size": 1}},
+        replica_check_interval=0,
+        replica_check_timeout=0.1,
+        pool_size=2,
+        max_overflow=0,
+    )
+    try:
+        # the only connection of the replica is checked out, so the check waits for the pool
+        async with (
+            database_session_manager.connection(DatabasePool.REPLICA),
+            asyncio.timeout(5),
+            database_session_manager.read_session() as session,
+        ):
+            assert session.bind is database_session_manager._engine
+        assert database_session_manager.get_replica_stats() == {
+            "lag": None,
+            "replica": 0,
+            "fallback": 1,
+        }
+    finally:
+        await database_session_manager.close()
+
+
+async def test_database_session_manager_read_session_without_replica():
+    database_session_manager = test_module.DatabaseSessionManager()
+    database_session_manager.initialize(url=settings.DB_URI, pool_size=1)
+    try:
+        async with database_session_manager.read_session() as session:
+            assert session.bind is database_session_manager._engine
+    finally:
+        await database_session_manager.close()
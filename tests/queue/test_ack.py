@@ -0,0 +1,116 @@
+import asyncio
+
+import botocore.exceptions
+import pytest
+
+from app.queue import ack as test_module
+
+QUEUE_URL = "http://queue:9324/000000000000/test.fifo"
+
+
+class FakeSQSClient:
+    def __init__(self, failures=()):
+        # list of {receipt_handle: sender_fault} or exceptions, consumed at each call
+        self.failures = list(failures)
+        self.calls = []
+
+    async def delete_message_batch(self, QueueUrl, Entries):  # noqa: N803
+        assert QueueUrl == QUEUE_URL
+        self.calls.append([entry["ReceiptHandle"] for entry in Entries])
+        failures = self.failures.pop(0) if self.failures else {}
+        if isinstance(failures, Exception):
+            raise failures
+        return {
+            "Successful": [
+                {"Id": entry["Id"]} for entry in Entries if entry["ReceiptHandle"] not in failures
+            ],
+            "Failed": [
+                {
+                    "Id": entry["Id"],
+                    "SenderFault": failures[entry["ReceiptHandle"]],
+                    "Code": "Error",
+                }
+                for entry in Entries
+                if entry["ReceiptHandle"] in failures
+            ],
+        }
+
+
+def test_init_with_invalid_params():
+    with pytest.raises(ValueError, match="batch_size must be between 1 and 10"):
+        test_module.MessageAcknowledger(FakeSQSClient(), QUEUE_URL, batch_size=11)
+
+
+async def test_flush_when_batch_is_full():
+    sqs_client = FakeSQSClient()
+    async with test_module.MessageAcknowledger(
+        sqs_client, QUEUE_URL, batch_size=3, flush_interval=60
+    ) as acknowledger:
+        for n in range(4):
+            acknowledger.ack(f"receipt-{n}")
+        await asyncio.sleep(0.01)
+        assert sqs_client.calls == [["receipt-0", "receipt-1", "receipt-2", "receipt-3"]]
+        acknowledger.ack("receipt-4")
+        await asyncio.sleep(0.01)
+        assert acknowledger.get_stats()["pending"] == 1
+
+    # the pending messages are deleted when exiting the context manager
+    assert sqs_client.calls[-1] == ["receipt-4"]
+    assert acknowledger.get_stats() == {"acked": 5, "failed": 0, "retried": 0, "pending": 0}
+
+
+async def test_flush_after_interval():
+    sqs_client = FakeSQSClient()
+    async with test_module.MessageAcknowledger(
+        sqs_client, QUEUE_URL, batch_size=10, flush_interval=0.01
+    ) as acknowledger:
+        acknowledger.ack("receipt-0")
+        await asyncio.sleep(0.05)
+        assert sqs_client.calls == [["receipt-0"]]
+
+
+async def test_flush_more_than_max_batch_size():
+    sqs_client = FakeSQSClient()
+    acknowledger = test_module.MessageAcknowledger(sqs_client, QUEUE_URL)
+    for n in range(25):
+        acknowledger.ack(f"receipt-{n}")
+    await acknowledger.flush()
+    assert [len(call) for call in sqs_client.calls] == [10, 10, 5]
+    assert acknowledger.get_stats()["acked"] == 25
+
+
+async def test_retry_partial_failures():
+    sqs_client = FakeSQSClient(
+        failures=[
+            {"receipt-1": False, "receipt-2": True},
+            {"receipt-1": False},
+        ]
+    )
+    acknowledger = test_module.MessageAcknowledger(sqs_client, QUEUE_URL, max_retries=3)
+    for n in range(3):
+        acknowledger.ack(f"receipt-{n}")
+
+    await acknowledger.flush()
+    # receipt-2 is not retried because of the sender fault
+    assert acknowledger.get_stats() == {"acked": 1, "failed": 1, "retried": 1, "pending": 1}
+
+    await acknowledger.flush()
+    await acknowledger.flush()
+    assert sqs_client.calls == [
+        ["receipt-0", "receipt-1", "receipt-2"],
+        ["receipt-1"],
+        ["receipt-1"],
+    ]
+    assert acknowledger.get_stats() == {"acked": 2, "failed": 1, "retried": 2, "pending": 0}
+
+
+async def test_retry_until_max_retries():
+    error = botocore.exceptions.EndpointConnectionError(endpoint_url=QUEUE_URL)
+    sqs_client = FakeSQSClient(failures=[error, error, error])
+    acknowledger = test_module.MessageAcknowledger(sqs_client, QUEUE_URL, max_retries=2)
+    acknowledger.ack("receipt-0")
+    async with acknowledger:
+        pass
+
+    assert len(sqs_client.calls) == 3
+    assert acknowledger.get_stats() == {"acked": 0, "failed": 1, "retried": 2, "pending": 0}
@@ -0,0 +1,51 @@
+import json
+from uuid import UUID
+
+import pytest
+import sqlalchemy as sa
+
+from app.constants import EventBodyStorage, EventStatus
+from app.db.model import Event
+from app.queue import recorder as test_module
+
+BODY = json.dumps({"type": "storage", "size": "1073741824", "padding": "x" * 100})
+
+
+@pytest.mark.parametrize(
+    ("storage", "max_length", "expected"),
+    [
+        (EventBodyStorage.FULL, 10, BODY),
+        (EventBodyStorage.TRUNCATED, 10, BODY[:10] + test_module.TRUNCATED_BODY_SUFFIX),
+        (EventBodyStorage.TRUNCATED, 1000, BODY),
+    ],
+)
+def test_encode_event_body(storage, max_length, expected):
+    result = test_module.encode_event_body(BODY, storage=storage, max_length=max_length)
+    assert result == expected
+    assert test_module.decode_event_body(result) == result
+
+
+def test_encode_event_body_compressed():
+    result = test_module.encode_event_body(BODY, storage=EventBodyStorage.COMPRESSED, max_length=0)
+    assert result.startswith(test_module.COMPRESSED_BODY_PREFIX)
+    assert len(result) < len(BODY)
+    assert test_module.decode_event_body(result) == BODY
+
+
+def test_decode_event_body_none():
+    assert test_module.decode_event_body(None) is None
+
+
+async def test_record(db):
+    recorder = test_module.EventRecorder(
+        queue_name="test.fifo", body_storage=EventBodyStorage.COMPRESSED
+    )
+    msgs = [{"Attributes": {}, "Body": BODY, "MessageId": str(UUID(int=n))} for n in range(3)]
+
+    await recorder.record(db, msgs=msgs, job_ids=[None, None, None])
+
+    records = (await db.scalars(sa.select(Event).order_by(Event.message_id))).all()
+    assert [r.message_id for r in records] == [UUID(int=n) for n in range(3)]
+    assert all(r.status == EventStatus.COMPLETED for r in records)
+    assert all(r.counter == 1 for r in records)
+    assert all(test_module.decode_event_body(r.body) == BODY for r in records)
@@ -0,0 +1,98 @@
+from decimal import Decimal
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.exc import DBAPIError, NoResultFound
+
+from app.cache import account_ids_cache
+from app.constants import AccountType
+from app.db.model import Account
+from app.db.session import database_session_manager
+from app.repository import account as test_module
+from app.schema.domain import AccountIds
+from app.utils import create_uuid
+
+from tests.constants import UUIDS
+
+EXPECTED_IDS = [
+    AccountIds(
+        sys_id=UUIDS.SYS,
+        vlab_id=UUIDS.VLAB[0],
+        proj_id=UUIDS.PROJ[n],
+        rsv_id=UUIDS.RSV[n],
+    )
+    for n in range(2)
+]
+
+
+@pytest.mark.usefixtures("_db_account")
+async def test_get_accounts_by_proj_id(db):
+    repo = test_module.AccountRepository(db)
+
+    accounts = await repo.get_accounts_by_proj_id(UUIDS.PROJ[0])
+
+    assert accounts.sys.id == UUIDS.SYS
+    assert accounts.vlab.id == UUIDS.VLAB[0]
+    assert accounts.vlab.balance == Decimal(2000)
+    assert accounts.proj.id == UUIDS.PROJ[0]
+    assert accounts.proj.vlab_id == UUIDS.VLAB[0]
+    assert accounts.proj.balance == Decimal(400)
+    assert accounts.rsv.id == UUIDS.RSV[0]
+    assert accounts.rsv.proj_id == UUIDS.PROJ[0]
+
+    with pytest.raises(NoResultFound):
+        await repo.get_accounts_by_proj_id(UUIDS.VLAB[0])
+    with pytest.raises(NoResultFound):
+        await repo.get_accounts_by_proj_id(create_uuid())
+
+
+@pytest.mark.parametrize(
+    ("for_update", "locked"),
+    [
+        (set(), []),
+        ({AccountType.PROJ}, [UUIDS.PROJ[0]]),
+        ({AccountType.VLAB, AccountType.RSV}, [UUIDS.VLAB[0], UUIDS.RSV[0]]),
+        (set(AccountType), [UUIDS.SYS, UUIDS.VLAB[0], UUIDS.PROJ[0], UUIDS.RSV[0]]),
+    ],
+)
+@pytest.mark.usefixtures("_db_account")
+async def test_get_accounts_by_proj_id_for_update(for_update, locked):
+    account_ids = [UUIDS.SYS, UUIDS.VLAB[0], UUIDS.PROJ[0], UUIDS.RSV[0]]
+    async with database_session_manager.session() as db1:
+        await test_module.AccountRepository(db1).get_accounts_by_proj_id(
+            UUIDS.PROJ[0], for_update=for_update
+        )
+        for account_id in account_ids:
+            async with database_session_manager.session() as db2:
+                await db2.execute(sa.text("SET LOCAL lock_timeout = '50ms'"))
+                query = sa.select(Account.id).where(Account.id == account_id).with_for_update()
+                if account_id in locked:
+                    with pytest.raises(DBAPIError, match="lock timeout"):
+                        await db2.execute(query)
+                else:
+                    await db2.execute(query)
+
+
+@pytest.mark.usefixtures("_db_account")
+async def test_get_account_ids_by_proj_id(db):
+    repo = test_module.AccountRepository(db)
+
+    for _ in range(2):
+        assert await repo.get_account_ids_by_proj_id(UUIDS.PROJ[0]) == EXPECTED_IDS[0]
+    assert account_ids_cache.get_stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    with pytest.raises(NoResultFound):
+        await repo.get_account_ids_by_proj_id(create_uuid())
+    assert account_ids_cache.get_stats() == {"hits": 1, "misses": 2, "size": 1}
+
+
+@pytest.mark.usefixtures("_db_account")
+async def test_get_account_ids_by_proj_ids(db):
+    repo = test_module.AccountRepository(db)
+    await repo.get_account_ids_by_proj_id(UUIDS.PROJ[0])
+
+    result = await repo.get_account_ids_by_proj_ids([UUIDS.PROJ[0], UUIDS.PROJ[1], create_uuid()])
+
+    assert result == {UUIDS.PROJ[n]: EXPECTED_IDS[n] for n in range(2)}
+    assert account_ids_cache.get_stats() == {"hits": 1, "misses": 3, "size": 2}
+    assert await repo.get_account_ids_by_proj_ids([]) == {}
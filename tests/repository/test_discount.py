@@ -0,0 +1,37 @@
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+
+from app.repository import discount as test_module
+
+from tests.constants import VLAB_ID, VLAB_ID_2
+
+
+@pytest.mark.usefixtures("_db_account")
+async def test_get_current_vlab_discounts(db):
+    repo = test_module.DiscountRepository(db)
+    now = datetime.now(tz=UTC)
+    discounts = [
+        # expired
+        {"valid_from": now - timedelta(days=10), "valid_to": now - timedelta(days=5)},
+        # active, superseded by the next one
+        {"valid_from": now - timedelta(days=4), "valid_to": None},
+        # active
+        {"valid_from": now - timedelta(days=3), "valid_to": now + timedelta(days=5)},
+        # not yet valid
+        {"valid_from": now + timedelta(days=1), "valid_to": None},
+    ]
+    ids = [
+        (await repo.create_discount({**d, "vlab_id": VLAB_ID, "discount": Decimal("0.1")})).id
+        for d in discounts
+    ]
+    await db.commit()
+
+    result = await repo.get_current_vlab_discounts([UUID(VLAB_ID), UUID(VLAB_ID_2)])
+
+    assert list(result) == [UUID(VLAB_ID)]
+    assert result[UUID(VLAB_ID)].id == ids[2]
+    assert (await repo.get_current_vlab_discount(UUID(VLAB_ID))).id == ids[2]
+    assert await repo.get_current_vlab_discounts([]) == {}
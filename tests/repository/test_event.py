@@ -0,0 +1,61 @@
+from uuid import UUID
+
+import sqlalchemy as sa
+
+from app.constants import EventStatus
+from app.db.model import Event
+from app.repository import event as test_module
+
+
+def _make_message(n):
+    return {
+        "Attributes": {"MessageGroupId": "group"},
+        "Body": f'{{"n": {n}}}',
+        "MessageId": str(UUID(int=n)),
+    }
+
+
+async def test_upsert_many(db):
+    repo = test_module.EventRepository(db)
+    await repo.upsert(msg=_make_message(0), queue_name="test.fifo", status=EventStatus.FAILED)
+
+    msgs = [_make_message(0), _make_message(1), _make_message(1), _make_message(2)]
+    await repo.upsert_many(
+        msgs=msgs,
+        queue_name="test.fifo",
+        status=EventStatus.COMPLETED,
+        job_ids=[None, None, None, None],
+        bodies=["body-0", "body-1", "body-1", None],
+    )
+
+    records = (await db.scalars(sa.select(Event).order_by(Event.message_id))).all()
+    assert [(r.message_id, r.status, r.body, r.counter) for r in records] == [
+        (UUID(int=0), EventStatus.COMPLETED, "body-0", 2),
+        (UUID(int=1), EventStatus.COMPLETED, "body-1", 2),
+        (UUID(int=2), EventStatus.COMPLETED, None, 1),
+    ]
+    assert all(r.error is None for r in records)
+
+
+async def test_upsert_many_empty(db):
+    repo = test_module.EventRepository(db)
+    await repo.upsert_many(
+        msgs=[], queue_name="test.fifo", status=EventStatus.COMPLETED, job_ids=[]
+    )
+
+    assert (await db.scalar(sa.select(sa.func.count()).select_from(Event))) == 0
+
+
+async def test_get_completed_job_ids(db):
+    repo = test_module.EventRepository(db)
+    await repo.upsert(msg=_make_message(0), queue_name="test.fifo", status=EventStatus.FAILED)
+    await repo.upsert_many(
+        msgs=[_make_message(1), _make_message(2)],
+        queue_name="test.fifo",
+        status=EventStatus.COMPLETED,
+        job_ids=[None, None],
+    )
+
+    result = await repo.get_completed_job_ids([UUID(int=n) for n in range(4)])
+
+    assert result == {UUID(int=1): None, UUID(int=2): None}
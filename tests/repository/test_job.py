@@ -1,13 +1,17 @@
-from datetime import UTC, datetime
+from datetime import UTC, datetime, timedelta
 from uuid import UUID
 
 import pytest
+from sqlalchemy.exc import NoResultFound
 
+from app.config import settings
 from app.constants import ServiceSubtype, ServiceType
 from app.db.model import Job
 from app.repository import job as test_module
+from app.schema.domain import Shard, StartedJob
 
-from tests.constants import PROJ_ID, USER_ID, VLAB_ID
+from tests.constants import PROJ_ID, USER_ID, UUIDS, VLAB_ID
+from tests.utils import _insert_longrun_job, _update_job
 
 
 @pytest.mark.usefixtures("_db_account")
@@ -28,3 +32,202 @@ async def test_insert_job(db):
 
     assert isinstance(result, Job)
     assert result.id is not None
+    assert result.next_charge_due_at is None
+
+
+@pytest.mark.usefixtures("_db_account")
+async def test_next_charge_due_at(db, monkeypatch):
+    monkeypatch.setattr(settings, "CHARGE_LONGRUN_MIN_CHARGING_INTERVAL", 60)
+    monkeypatch.setattr(settings, "CHARGE_LONGRUN_EXPIRATION_INTERVAL", 3600)
+    repo = test_module.JobRepository(db)
+    job_id = UUID("e0f0cd3c-595a-47a7-b292-267124f5a8df")
+    vlab_id, proj_id = UUID(VLAB_ID), UUID(PROJ_ID)
+    started_at = datetime(2025, 1, 1, 12, tzinfo=UTC)
+
+    job = await repo.insert_job(
+        job_id=job_id,
+        vlab_id=vlab_id,
+        proj_id=proj_id,
+        service_type=ServiceType.LONGRUN,
+        service_subtype=ServiceSubtype.SINGLE_CELL_SIM,
+        reserved_at=started_at,
+    )
+    assert job.next_charge_due_at is None
+
+    # started: due after the minimum charging interval
+    job = await repo.update_job(
+        job_id, vlab_id, proj_id, started_at=started_at, last_alive_at=started_at
+    )
+    assert job.next_charge_due_at == started_at + timedelta(seconds=60)
+
+    # charged: due after the minimum charging interval since the last charge
+    charged_at = started_at + timedelta(hours=2)
+    job = await repo.update_job(job_id, vlab_id, proj_id, last_charged_at=charged_at)
+    # but the job expires earlier, because it isn't alive since the start
+    assert job.next_charge_due_at == started_at + timedelta(seconds=3600)
+    job = await repo.update_job(job_id, vlab_id, proj_id, last_alive_at=charged_at)
+    assert job.next_charge_due_at == charged_at + timedelta(seconds=60)
+
+    # finished: due immediately
+    finished_at = charged_at + timedelta(seconds=10)
+    job = await repo.update_job(
+        job_id, vlab_id, proj_id, last_alive_at=finished_at, finished_at=finished_at
+    )
+    assert job.next_charge_due_at == finished_at
+
+    # postponed
+    await repo.postpone_longrun_charge(job_id, due_at=finished_at + timedelta(seconds=30))
+    job = await repo.get_job(job_id)
+    assert job.next_charge_due_at == finished_at + timedelta(seconds=30)
+
+    # fully charged: never due
+    job = await repo.update_job(job_id, vlab_id, proj_id, last_charged_at=finished_at)
+    assert job.next_charge_due_at is None
+
+    # postponing a job not due has no effect
+    await repo.postpone_longrun_charge(job_id, due_at=finished_at)
+    job = await repo.get_job(job_id)
+    assert job.next_charge_due_at is None
+
+
+@pytest.mark.usefixtures("_db_account")
+async def test_next_charge_due_at_postponed(db, monkeypatch):
+    monkeypatch.setattr(settings, "CHARGE_LONGRUN_MIN_CHARGING_INTERVAL", 60)
+    monkeypatch.setattr(settings, "CHARGE_LONGRUN_EXPIRATION_INTERVAL", 3600)
+    repo = test_module.JobRepository(db)
+    job_id = UUID(int=1)
+    vlab_id, proj_id = UUID(VLAB_ID), UUID(PROJ_ID)
+    started_at = datetime(2025, 1, 1, 12, tzinfo=UTC)
+    postponed = started_at + timedelta(seconds=1800)
+    await _insert_longrun_job(db, job_id, instances=1, started_at=started_at)
+    await repo.refresh_next_charge_due_at()
+    await repo.postpone_longrun_charge(job_id, due_at=postponed)
+
+    # the heartbeats don't override the postponed charge
+    alive_at = started_at + timedelta(seconds=10)
+    job = await repo.update_job(job_id, vlab_id, proj_id, last_alive_at=alive_at)
+    assert job.next_charge_due_at == postponed
+    await repo.update_last_alive_at([(job_id, vlab_id, proj_id, alive_at)])
+    await db.refresh(job)
+    assert job.next_charge_due_at == postponed
+
+    # but a heartbeat can delay the charge further
+    await _update_job(db, job_id, last_charged_at=started_at + timedelta(seconds=1790))
+    job = await repo.update_job(job_id, vlab_id, proj_id, last_alive_at=alive_at)
+    assert job.next_charge_due_at == started_at + timedelta(seconds=1850)
+
+    # the charge is recalculated when charged or finished
+    charged_at = started_at + timedelta(seconds=1800)
+    job = await repo.update_job(job_id, vlab_id, proj_id, last_charged_at=charged_at)
+    assert job.next_charge_due_at == started_at + timedelta(seconds=1860)
+    await repo.postpone_longrun_charge(job_id, due_at=started_at + timedelta(seconds=3000))
+    finished_at = charged_at + timedelta(seconds=10)
+    job = await repo.update_job(job_id, vlab_id, proj_id, finished_at=finished_at)
+    assert job.next_charge_due_at == finished_at
+
+    # the heartbeats don't postpone the fully charged jobs
+    job = await repo.update_job(job_id, vlab_id, proj_id, last_charged_at=finished_at)
+    assert job.next_charge_due_at is None
+    job = await repo.update_job(job_id, vlab_id, proj_id, last_alive_at=finished_at)
+    assert job.next_charge_due_at is None
+
+
+@pytest.mark.usefixtures("_db_account")
+async def test_update_last_alive_at(db, monkeypatch):
+    monkeypatch.setattr(settings, "CHARGE_LONGRUN_MIN_CHARGING_INTERVAL", 3600)
+    monkeypatch.setattr(settings, "CHARGE_LONGRUN_EXPIRATION_INTERVAL", 60)
+    repo = test_module.JobRepository(db)
+    vlab_id, proj_id = UUID(VLAB_ID), UUID(PROJ_ID)
+    started_at = datetime(2025, 1, 1, 12, tzinfo=UTC)
+    job_ids = [UUID(int=n) for n in range(3)]
+    for job_id in job_ids:
+        await _insert_longrun_job(db, job_id, instances=1, started_at=started_at)
+
+    await repo.update_last_alive_at(
+        [
+            (job_ids[0], vlab_id, proj_id, started_at + timedelta(seconds=10)),
+            (job_ids[1], vlab_id, proj_id, started_at + timedelta(seconds=20)),
+        ]
+    )
+
+    # due when the jobs expire, before the charging interval elapses
+    for job_id, last_alive_at, next_charge_due_at in [
+        (job_ids[0], started_at + timedelta(seconds=10), started_at + timedelta(seconds=70)),
+        (job_ids[1], started_at + timedelta(seconds=20), started_at + timedelta(seconds=80)),
+        (job_ids[2], started_at, None),
+    ]:
+        job = await repo.get_job(job_id)
+        await db.refresh(job)
+        assert job.last_alive_at == last_alive_at
+        assert job.next_charge_due_at == next_charge_due_at
+
+    # the jobs of other projects aren't updated
+    with pytest.raises(NoResultFound, match="Updated 1 jobs instead of 2"):
+        await repo.update_last_alive_at(
+            [
+                (job_ids[0], vlab_id, proj_id, started_at),
+                (job_ids[1], vlab_id, UUID(int=999), started_at),
+            ]
+        )
+
+
+@pytest.mark.usefixtures("_db_account")
+async def test_get_longrun_due(db, monkeypatch):
+    monkeypatch.setattr(settings, "CHARGE_LONGRUN_MIN_CHARGING_INTERVAL", 60)
+    repo = test_module.JobRepository(db)
+    now = datetime(2025, 1, 1, 12, tzinfo=UTC)
+    job_ids = [UUID(int=n) for n in range(5)]
+    for n, job_id in enumerate(job_ids):
+        await _insert_longrun_job(
+            db, job_id, instances=1, started_at=now - timedelta(seconds=100 - 10 * n)
+        )
+    # not started
+    await _update_job(db, job_ids[4], started_at=None)
+    await repo.refresh_next_charge_due_at()
+
+    # due times: now - 40s, now - 30s, now - 20s, now - 10s
+    result = await repo.get_longrun_due(due_at=now - timedelta(seconds=15), limit=2)
+    assert [job.id for job in result] == job_ids[:2]
+    after = (result[-1].next_charge_due_at, result[-1].id)
+    result = await repo.get_longrun_due(due_at=now - timedelta(seconds=15), limit=2, after=after)
+    assert [job.id for job in result] == job_ids[2:3]
+    result = await repo.get_longrun_due(due_at=now, limit=10)
+    assert [job.id for job in result] == job_ids[:4]
+
+
+@pytest.mark.usefixtures("_db_account")
+async def test_lock_unchanged_job(db):
+    repo = test_module.JobRepository(db)
+    now = datetime(2025, 1, 1, 12, tzinfo=UTC)
+    job_id = UUID(int=1)
+    await _insert_longrun_job(db, job_id, instances=1, started_at=now)
+    job = StartedJob.model_validate(await repo.get_job(job_id))
+
+    assert await repo.lock_unchanged_job(job) is True
+
+    await _update_job(db, job_id, last_charged_at=now + timedelta(minutes=1))
+    assert await repo.lock_unchanged_job(job) is False
+    job = job.model_copy(update={"id": UUID(int=2)})
+    assert await repo.lock_unchanged_job(job) is False
+
+
+@pytest.mark.usefixtures("_db_account")
+async def test_get_longrun_to_be_charged_with_shard(db):
+    repo = test_module.JobRepository(db)
+    now = datetime(2025, 1, 1, 12, tzinfo=UTC)
+    job_ids = {UUID(int=n) for n in range(2)}
+    for n, job_id in enumerate(job_ids):
+        await _insert_longrun_job(db, job_id, instances=1, started_at=now)
+        await _update_job(db, job_id, proj_id=UUIDS.PROJ[n])
+
+    selected = [
+        {job.id for job in await repo.get_longrun_to_be_charged(shard=shard)}
+        for shard in [
+            Shard(slots=frozenset({0, 1}), total=4),
+            Shard(slots=frozenset({2, 3}), total=4),
+        ]
+    ]
+    # each job is selected by only one shard
+    assert selected[0] | selected[1] == job_ids
+    assert selected[0] & selected[1] == set()
+    assert await repo.get_longrun_to_be_charged(shard=Shard(slots=frozenset(), total=4)) == []
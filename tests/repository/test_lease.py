@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+import sqlalchemy as sa
+
+from app.db.model import ChargerLease, ChargerMember
+from app.repository import lease as test_module
+
+
+async def test_rebalance(db):
+    repo = test_module.LeaseRepository(db)
+
+    # the first member acquires all the slots
+    assert await repo.rebalance(member_id="a", total=5, ttl=60) == [0, 1, 2, 3, 4]
+
+    # the second member doesn't find any free slot
+    assert await repo.rebalance(member_id="b", total=5, ttl=60) == []
+    # the first member releases the slots exceeding its fair share
+    assert await repo.rebalance(member_id="a", total=5, ttl=60) == [0, 1, 2]
+    # the second member acquires the released slots
+    assert await repo.rebalance(member_id="b", total=5, ttl=60) == [3, 4]
+
+    # the leases of the expired members can be acquired by the other members
+    await db.execute(
+        sa.update(ChargerMember).values(expires_at=sa.func.now() - timedelta(seconds=1))
+    )
+    await db.execute(
+        sa.update(ChargerLease)
+        .values(expires_at=sa.func.now() - timedelta(seconds=1))
+        .where(ChargerLease.owner == "b")
+    )
+    assert await repo.rebalance(member_id="a", total=5, ttl=60) == [0, 1, 2, 3, 4]
+    members = (await db.execute(sa.select(ChargerMember.id))).scalars().all()
+    assert members == ["a"]
+
+
+async def test_release(db):
+    repo = test_module.LeaseRepository(db)
+    assert await repo.rebalance(member_id="a", total=2, ttl=60) == [0, 1]
+    assert await repo.rebalance(member_id="b", total=2, ttl=60) == []
+
+    await repo.release(member_id="a")
+
+    assert await repo.rebalance(member_id="b", total=2, ttl=60) == [0, 1]
+    members = (await db.execute(sa.select(ChargerMember.id))).scalars().all()
+    assert members == ["b"]
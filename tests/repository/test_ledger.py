@@ -0,0 +1,390 @@
+import operator
+from datetime import UTC, datetime
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.exc import IntegrityError, NoResultFound
+
+from app.config import settings
+from app.constants import TransactionType
+from app.db.model import Account, Job, JobCostSummary, Journal, Ledger
+from app.db.session import database_session_manager
+from app.repository import ledger as test_module
+from app.repository.account import AccountRepository
+from app.schema.domain import Transaction
+
+from tests.constants import PROJ_ID, PROJ_ID_2, RSV_ID, SYS_ID, UUIDS
+
+TRANSACTION_DATETIME = datetime(2024, 1, 1, tzinfo=UTC)
+
+
+@pytest.fixture(params=[False, True], ids=["multi-statement", "single-statement"])
+def single_statement_posting(request, monkeypatch):
+    monkeypatch.setattr(settings, "LEDGER_SINGLE_STATEMENT_POSTING", request.param)
+    return request.param
+
+
+async def _get_rows(db):
+    journal = (await db.execute(sa.select(Journal).order_by(Journal.id))).scalars().all()
+    ledger = (await db.execute(sa.select(Ledger).order_by(Ledger.id))).scalars().all()
+    balances = dict((await db.execute(sa.select(Account.id, Account.balance))).all())
+    return journal, ledger, balances
+
+
+@pytest.mark.usefixtures("_db_job", "single_statement_posting")
+async def test_insert_transaction(db):
+    repo = test_module.LedgerRepository(db)
+    for amount in [Decimal("10.5"), Decimal(20)]:
+        await repo.insert_transaction(
+            amount=amount,
+            debited_from=UUID(PROJ_ID),
+            credited_to=UUID(RSV_ID),
+            transaction_datetime=TRANSACTION_DATETIME,
+            transaction_type=TransactionType.RESERVE,
+            job_id=UUIDS.JOB[0],
+            properties={"reason": "test"},
+        )
+
+    journal, ledger, balances = await _get_rows(db)
+    # the sequences may not start from 1 if other transactions have been rolled back
+    j0, l0 = journal[0].id - 1, ledger[0].id - 1
+    assert [
+        (j.id - j0, j.transaction_datetime, j.transaction_type, j.job_id, j.properties)
+        for j in journal
+    ] == [
+        (1, TRANSACTION_DATETIME, TransactionType.RESERVE, UUIDS.JOB[0], {"reason": "test"}),
+        (2, TRANSACTION_DATETIME, TransactionType.RESERVE, UUIDS.JOB[0], {"reason": "test"}),
+    ]
+    assert [(row.id - l0, row.journal_id - j0, row.account_id, row.amount) for row in ledger] == [
+        (1, 1, UUID(PROJ_ID), Decimal("-10.5")),
+        (2, 1, UUID(RSV_ID), Decimal("10.5")),
+        (3, 2, UUID(PROJ_ID), Decimal(-20)),
+        (4, 2, UUID(RSV_ID), Decimal(20)),
+    ]
+    assert balances[UUID(PROJ_ID)] == Decimal("369.5")
+    assert balances[UUID(RSV_ID)] == Decimal("130.5")
+
+
+@pytest.mark.usefixtures("_db_account", "single_statement_posting")
+async def test_insert_transaction_same_account(db):
+    repo = test_module.LedgerRepository(db)
+    await repo.insert_transaction(
+        amount=Decimal(10),
+        debited_from=UUID(PROJ_ID),
+        credited_to=UUID(PROJ_ID),
+        transaction_datetime=TRANSACTION_DATETIME,
+        transaction_type=TransactionType.RESERVE,
+    )
+
+    _, ledger, balances = await _get_rows(db)
+    assert [row.amount for row in ledger] == [Decimal(-10), Decimal(10)]
+    assert balances[UUID(PROJ_ID)] == Decimal(400)
+
+
+@pytest.mark.usefixtures("_db_account", "single_statement_posting")
+async def test_insert_transaction_with_missing_account(db):
+    repo = test_module.LedgerRepository(db)
+    with pytest.raises(IntegrityError):
+        await repo.insert_transaction(
+            amount=Decimal(10),
+            debited_from=UUID(PROJ_ID),
+            credited_to=UUID(int=0),
+            transaction_datetime=TRANSACTION_DATETIME,
+            transaction_type=TransactionType.RESERVE,
+        )
+
+
+@pytest.mark.parametrize("deferred", [False, True], ids=["immediate", "deferred"])
+@pytest.mark.usefixtures("_db_account", "single_statement_posting")
+async def test_insert_transactions_with_disabled_account(db, monkeypatch, deferred):
+    monkeypatch.setattr(settings, "LEDGER_DEFERRED_SYSTEM_BALANCE", deferred)
+    # the ids are cached before the project is disabled
+    account_ids = await AccountRepository(db).get_account_ids_by_proj_id(UUID(PROJ_ID))
+    await db.execute(sa.update(Account).values(enabled=False).where(Account.id == PROJ_ID))
+    await db.commit()
+    repo = test_module.LedgerRepository(db)
+    with pytest.raises(NoResultFound):
+        await repo.insert_transactions(
+            [
+                Transaction(
+                    amount=Decimal(10),
+                    debited_from=account_ids.proj_id,
+                    credited_to=account_ids.sys_id,
+                    transaction_datetime=TRANSACTION_DATETIME,
+                    transaction_type=TransactionType.CHARGE_ONESHOT,
+                )
+            ]
+        )
+    await db.rollback()
+
+    journal, ledger, balances = await _get_rows(db)
+    assert journal == []
+    assert ledger == []
+    assert balances[UUID(PROJ_ID)] == Decimal(400)
+
+
+@pytest.mark.usefixtures("_db_job", "single_statement_posting")
+async def test_insert_transactions(db):
+    repo = test_module.LedgerRepository(db)
+    transactions = [
+        Transaction(
+            amount=Decimal(30),
+            debited_from=UUID(RSV_ID),
+            credited_to=UUID(SYS_ID),
+            transaction_datetime=TRANSACTION_DATETIME,
+            transaction_type=TransactionType.CHARGE_LONGRUN,
+            job_id=UUIDS.JOB[1],
+            properties={"reason": "charge_reservation"},
+        ),
+        Transaction(
+            amount=Decimal("12.5"),
+            debited_from=UUID(PROJ_ID),
+            credited_to=UUID(SYS_ID),
+            transaction_datetime=TRANSACTION_DATETIME,
+            transaction_type=TransactionType.CHARGE_LONGRUN,
+            job_id=UUIDS.JOB[1],
+            properties={"reason": "charge_project"},
+        ),
+        Transaction(
+            amount=Decimal(70),
+            debited_from=UUID(RSV_ID),
+            credited_to=UUID(PROJ_ID),
+            transaction_datetime=TRANSACTION_DATETIME,
+            transaction_type=TransactionType.RELEASE,
+            job_id=UUIDS.JOB[1],
+            properties={"reason": "release_reservation"},
+        ),
+    ]
+    await repo.insert_transactions(transactions)
+
+    journal, ledger, balances = await _get_rows(db)
+    assert [(j.transaction_type, j.properties) for j in journal] == [
+        (TransactionType.CHARGE_LONGRUN, {"reason": "charge_reservation"}),
+        (TransactionType.CHARGE_LONGRUN, {"reason": "charge_project"}),
+        (TransactionType.RELEASE, {"reason": "release_reservation"}),
+    ]
+    assert [(row.journal_id, row.account_id, row.amount) for row in ledger] == [
+        (journal[0].id, UUID(RSV_ID), Decimal(-30)),
+        (journal[0].id, UUID(SYS_ID), Decimal(30)),
+        (journal[1].id, UUID(PROJ_ID), Decimal("-12.5")),
+        (journal[1].id, UUID(SYS_ID), Decimal("12.5")),
+        (journal[2].id, UUID(RSV_ID), Decimal(-70)),
+        (journal[2].id, UUID(PROJ_ID), Decimal(70)),
+    ]
+    assert balances[UUID(SYS_ID)] == Decimal("-2957.5")
+    assert balances[UUID(PROJ_ID)] == Decimal("457.5")
+    assert balances[UUID(RSV_ID)] == Decimal(0)
+
+
+@pytest.mark.usefixtures("_db_account", "single_statement_posting")
+async def test_insert_transactions_empty(db):
+    repo = test_module.LedgerRepository(db)
+    await repo.insert_transactions([])
+
+    journal, ledger, _ = await _get_rows(db)
+    assert journal == []
+    assert ledger == []
+
+
+@pytest.mark.usefixtures("_db_account", "single_statement_posting")
+async def test_deferred_system_balance(db, monkeypatch):
+    monkeypatch.setattr(settings, "LEDGER_DEFERRED_SYSTEM_BALANCE", True)
+    repo = test_module.LedgerRepository(db)
+    for amount in [Decimal(10), Decimal(5)]:
+        await repo.insert_transaction(
+            amount=amount,
+            debited_from=UUID(PROJ_ID),
+            credited_to=UUID(SYS_ID),
+            transaction_datetime=TRANSACTION_DATETIME,
+            transaction_type=TransactionType.CHARGE_STORAGE,
+        )
+
+    _, ledger, balances = await _get_rows(db)
+    assert [(row.account_id, row.amount) for row in ledger] == [
+        (UUID(PROJ_ID), Decimal(-10)),
+        (UUID(SYS_ID), Decimal(10)),
+        (UUID(PROJ_ID), Decimal(-5)),
+        (UUID(SYS_ID), Decimal(5)),
+    ]
+    assert balances[UUID(PROJ_ID)] == Decimal(385)
+    assert balances[UUID(SYS_ID)] == Decimal(-3000)
+    assert await repo.get_system_balance_delta(account_id=UUID(SYS_ID)) == Decimal(15)
+
+    assert await repo.fold_system_balance_deltas() == 2
+    assert await repo.fold_system_balance_deltas() == 0
+
+    _, _, balances = await _get_rows(db)
+    assert balances[UUID(SYS_ID)] == Decimal(-2985)
+    assert await repo.get_system_balance_delta(account_id=UUID(SYS_ID)) == 0
+
+
+@pytest.mark.usefixtures("_db_account", "single_statement_posting")
+async def test_deferred_system_balance_concurrent_charges(monkeypatch):
+    monkeypatch.setattr(settings, "LEDGER_DEFERRED_SYSTEM_BALANCE", True)
+    async with (
+        database_session_manager.session() as db1,
+        database_session_manager.session() as db2,
+    ):
+        # the second transaction would fail if it had to wait for the lock on the system account
+        await db2.execute(sa.text("SET LOCAL lock_timeout = '100ms'"))
+        for db, proj_id in [(db1, PROJ_ID), (db2, PROJ_ID_2)]:
+            await test_module.LedgerRepository(db).insert_transaction(
+                amount=Decimal(10),
+                debited_from=UUID(proj_id),
+                credited_to=UUID(SYS_ID),
+                transaction_datetime=TRANSACTION_DATETIME,
+                transaction_type=TransactionType.CHARGE_STORAGE,
+            )
+
+
+@pytest.mark.usefixtures("_db_job", "single_statement_posting")
+async def test_remaining_reservation(db):
+    repo = test_module.LedgerRepository(db)
+    job_id = UUIDS.JOB[1]
+    for amount, debited_from, credited_to in [
+        (Decimal(100), PROJ_ID, RSV_ID),
+        (Decimal(30), RSV_ID, SYS_ID),
+        (Decimal(5), PROJ_ID, SYS_ID),
+    ]:
+        await repo.insert_transaction(
+            amount=amount,
+            debited_from=UUID(debited_from),
+            credited_to=UUID(credited_to),
+            transaction_datetime=TRANSACTION_DATETIME,
+            transaction_type=TransactionType.CHARGE_LONGRUN,
+            job_id=job_id,
+        )
+    assert await repo.get_remaining_reservation_for_job(job_id=job_id) == Decimal(70)
+
+    await repo.insert_transactions(
+        [
+            Transaction(
+                amount=Decimal(70),
+                debited_from=UUID(RSV_ID),
+                credited_to=UUID(PROJ_ID),
+                transaction_datetime=TRANSACTION_DATETIME,
+                transaction_type=TransactionType.RELEASE,
+                job_id=job_id,
+            )
+        ]
+    )
+    assert await repo.get_remaining_reservation_for_job(job_id=job_id) == 0
+    assert await repo.check_remaining_reservations() == []
+
+
+@pytest.mark.usefixtures("_db_job")
+async def test_remaining_reservation_negative(db):
+    repo = test_module.LedgerRepository(db)
+    await db.execute(sa.update(Job).values(remaining_reservation=-1).where(Job.id == UUIDS.JOB[0]))
+    with pytest.raises(RuntimeError, match="is negative"):
+        await repo.get_remaining_reservation_for_job(job_id=UUIDS.JOB[0])
+    assert await repo.get_remaining_reservation_for_job(job_id=UUID(int=0)) == 0
+
+
+@pytest.mark.usefixtures("_db_ledger")
+async def test_check_remaining_reservations(db):
+    repo = test_module.LedgerRepository(db)
+    assert await repo.check_remaining_reservations() == []
+
+    await db.execute(sa.update(Job).values(remaining_reservation=10).where(Job.id == UUIDS.JOB[0]))
+    expected = [(UUIDS.JOB[0], Decimal(10), Decimal(0))]
+    assert await repo.check_remaining_reservations() == expected
+    assert await repo.check_remaining_reservations(repair=True) == expected
+    assert await repo.check_remaining_reservations() == []
+    assert await repo.get_remaining_reservation_for_job(job_id=UUIDS.JOB[0]) == 0
+
+
+async def _get_cost_summaries(db):
+    query = sa.select(JobCostSummary).order_by(JobCostSummary.job_id)
+    return [
+        {
+            "job_id": summary.job_id,
+            "amount": summary.amount,
+            "charged": summary.charged,
+            "reserved": summary.reserved,
+            "released": summary.released,
+            "refunded": summary.refunded,
+            "last_posting_at": summary.last_posting_at,
+        }
+        for summary in (await db.execute(query)).scalars()
+    ]
+
+
+@pytest.mark.parametrize("deferred", [False, True], ids=["immediate", "deferred"])
+@pytest.mark.usefixtures("_db_job", "single_statement_posting")
+async def test_cost_summary(db, monkeypatch, deferred):
+    monkeypatch.setattr(settings, "LEDGER_DEFERRED_SYSTEM_BALANCE", deferred)
+    repo = test_module.LedgerRepository(db)
+    job_id = UUIDS.JOB[1]
+    later = datetime(2024, 1, 2, tzinfo=UTC)
+    for amount, debited_from, credited_to, transaction_type, transaction_datetime in [
+        (Decimal(100), PROJ_ID, RSV_ID, TransactionType.RESERVE, TRANSACTION_DATETIME),
+        (Decimal(30), RSV_ID, SYS_ID, TransactionType.CHARGE_LONGRUN, later),
+        (Decimal(5), PROJ_ID, SYS_ID, TransactionType.CHARGE_LONGRUN, TRANSACTION_DATETIME),
+        (Decimal(2), SYS_ID, PROJ_ID, TransactionType.REFUND, TRANSACTION_DATETIME),
+    ]:
+        await repo.insert_transaction(
+            amount=amount,
+            debited_from=UUID(debited_from),
+            credited_to=UUID(credited_to),
+            transaction_datetime=transaction_datetime,
+            transaction_type=transaction_type,
+            job_id=job_id,
+        )
+    await repo.insert_transactions(
+        [
+            Transaction(
+                amount=Decimal(70),
+                debited_from=UUID(RSV_ID),
+                credited_to=UUID(PROJ_ID),
+                transaction_datetime=TRANSACTION_DATETIME,
+                transaction_type=TransactionType.RELEASE,
+                job_id=job_id,
+            ),
+            Transaction(
+                amount=Decimal(1),
+                debited_from=UUID(PROJ_ID),
+                credited_to=UUID(SYS_ID),
+                transaction_datetime=TRANSACTION_DATETIME,
+                transaction_type=TransactionType.CHARGE_ONESHOT,
+                job_id=UUIDS.JOB[0],
+            ),
+        ]
+    )
+    expected = [
+        {
+            "job_id": UUIDS.JOB[0],
+            "amount": Decimal(1),
+            "charged": Decimal(1),
+            "reserved": Decimal(0),
+            "released": Decimal(0),
+            "refunded": Decimal(0),
+            "last_posting_at": TRANSACTION_DATETIME,
+        },
+        {
+            "job_id": job_id,
+            "amount": Decimal(33),  # 100 + 5 - 2 - 70
+            "charged": Decimal(35),
+            "reserved": Decimal(100),
+            "released": Decimal(70),
+            "refunded": Decimal(2),
+            "last_posting_at": later,
+        },
+    ]
+    assert await _get_cost_summaries(db) == sorted(expected, key=operator.itemgetter("job_id"))
+
+    # the summaries recalculated from the ledger are the same
+    await db.execute(sa.delete(JobCostSummary))
+    job_ids = []
+    while batch := await repo.backfill_cost_summaries(
+        limit=2, after=job_ids[-1] if job_ids else None
+    ):
+        job_ids += batch
+    assert job_ids == sorted(job_ids)
+    assert len(job_ids) == len(UUIDS.JOB)
+    summaries = [
+        row for row in await _get_cost_summaries(db) if row["job_id"] in {UUIDS.JOB[0], job_id}
+    ]
+    assert summaries == sorted(expected, key=operator.itemgetter("job_id"))
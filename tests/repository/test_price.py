@@ -0,0 +1,118 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+import sqlalchemy as sa
+
+from app.cache import price_cache
+from app.config import settings
+from app.constants import ServiceSubtype, ServiceType
+from app.db.model import Price
+from app.errors import ApiError
+from app.repository import price as test_module
+from app.utils import create_uuid
+
+from tests.constants import VLAB_ID
+
+
+@pytest.fixture(params=[False, True], ids=["no-cache", "cache"])
+def price_cache_enabled(request, monkeypatch):
+    monkeypatch.setattr(settings, "PRICE_CACHE_ENABLED", request.param)
+    return request.param
+
+
+async def _add_price(repo, valid_from, valid_to=None, vlab_id=VLAB_ID, multiplier="0.02"):
+    price = await repo.add_price(
+        {
+            "service_type": ServiceType.LONGRUN,
+            "service_subtype": ServiceSubtype.SINGLE_CELL_SIM,
+            "valid_from": datetime.fromisoformat(valid_from),
+            "valid_to": datetime.fromisoformat(valid_to) if valid_to else None,
+            "vlab_id": vlab_id,
+            "tiers": [
+                {
+                    "min_quantity": 0,
+                    "max_quantity": None,
+                    "fixed_cost": Decimal(1),
+                    "multiplier": Decimal(multiplier),
+                }
+            ],
+        }
+    )
+    return price.id
+
+
+async def _get_price_id(repo, usage_datetime, vlab_id=VLAB_ID):
+    price = await repo.get_price(
+        vlab_id=vlab_id,
+        service_type=ServiceType.LONGRUN,
+        service_subtype=ServiceSubtype.SINGLE_CELL_SIM,
+        usage_datetime=datetime.fromisoformat(usage_datetime),
+    )
+    return price.id
+
+
+@pytest.mark.usefixtures("_db_account", "_db_price", "price_cache_enabled")
+async def test_get_price(db):
+    repo = test_module.PriceRepository(db)
+    default_id = (
+        await db.execute(
+            sa.select(Price.id).where(
+                Price.vlab_id.is_(None), Price.service_subtype == ServiceSubtype.SINGLE_CELL_SIM
+            )
+        )
+    ).scalar_one()
+    price_id_1 = await _add_price(repo, "2025-01-01T00:00:00Z", "2025-06-01T00:00:00Z")
+    price_id_2 = await _add_price(repo, "2025-03-01T00:00:00Z")
+    price_id_3 = await _add_price(repo, "2025-03-01T00:00:00Z", "2025-04-01T00:00:00Z")
+    await db.commit()
+
+    assert await _get_price_id(repo, "2024-06-01T00:00:00Z") == default_id
+    assert await _get_price_id(repo, "2025-01-01T00:00:00Z") == price_id_1
+    assert await _get_price_id(repo, "2025-02-28T23:59:59Z") == price_id_1
+    # the latest valid_from and id are selected when multiple prices are valid
+    assert await _get_price_id(repo, "2025-03-01T00:00:00Z") == price_id_3
+    assert await _get_price_id(repo, "2025-04-01T00:00:00Z") == price_id_2
+    assert await _get_price_id(repo, "2030-01-01T00:00:00Z") == price_id_2
+    # fallback to the default price for other vlabs
+    assert await _get_price_id(repo, "2030-01-01T00:00:00Z", vlab_id=create_uuid()) == default_id
+    with pytest.raises(ApiError, match="Missing price"):
+        await _get_price_id(repo, "2023-01-01T00:00:00Z")
+
+    price = await repo.get_price(
+        vlab_id=VLAB_ID,
+        service_type=ServiceType.LONGRUN,
+        service_subtype=ServiceSubtype.SINGLE_CELL_SIM,
+        usage_datetime=datetime.fromisoformat("2030-01-01T00:00:00Z"),
+    )
+    assert [tier.multiplier for tier in price.tiers] == [Decimal("0.02")]
+
+
+@pytest.mark.usefixtures("_db_account", "_db_price")
+async def test_get_price_with_cache(db, monkeypatch):
+    monkeypatch.setattr(settings, "PRICE_CACHE_ENABLED", True)
+    repo = test_module.PriceRepository(db)
+    price_id_1 = await _add_price(repo, "2025-01-01T00:00:00Z")
+    await db.commit()
+    assert price_cache.get_stats() == {"hits": 0, "misses": 0, "invalidations": 1, "size": 0}
+
+    for _ in range(3):
+        assert await _get_price_id(repo, "2025-02-01T00:00:00Z") == price_id_1
+    assert price_cache.get_stats() == {"hits": 2, "misses": 1, "invalidations": 1, "size": 1}
+
+    # the cache is cleared when the transaction adding a price is rolled back
+    await _add_price(repo, "2025-01-15T00:00:00Z")
+    await db.rollback()
+    assert price_cache.get_stats()["invalidations"] == 2
+    assert await _get_price_id(repo, "2025-02-01T00:00:00Z") == price_id_1
+
+    # the cache is cleared when the transaction adding a price is committed
+    price_id_2 = await _add_price(repo, "2025-01-15T00:00:00Z")
+    await db.commit()
+    assert price_cache.get_stats() == {"hits": 2, "misses": 2, "invalidations": 3, "size": 0}
+    assert await _get_price_id(repo, "2025-02-01T00:00:00Z") == price_id_2
+
+    # the expired entries are reloaded
+    monkeypatch.setattr(settings, "PRICE_CACHE_TTL", 0)
+    assert await _get_price_id(repo, "2025-02-01T00:00:00Z") == price_id_2
+    assert price_cache.get_stats() == {"hits": 2, "misses": 4, "invalidations": 3, "size": 1}
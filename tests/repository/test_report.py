@@ -1,12 +1,20 @@
+from datetime import timedelta
 from decimal import Decimal
 from unittest.mock import ANY
 from uuid import UUID
 
 import pytest
+import sqlalchemy as sa
 
-from app.constants import D0, ServiceSubtype, ServiceType
+from app.config import settings
+from app.constants import D0, RollupGranularity, ServiceSubtype, ServiceType, TransactionType
+from app.db.model import Journal, Ledger
+from app.db.session import database_session_manager
+from app.errors import ApiError
 from app.repository import report as test_module
+from app.repository.ledger import LedgerRepository
 from app.schema.api import PaginatedParams
+from app.utils import utcnow
 
 from tests.constants import GROUP_ID, GROUP_ID_2, PROJ_ID, USER_ID, UUIDS, VLAB_ID
 
@@ -71,8 +79,13 @@ EXPECTED = [
 ]
 
 
+@pytest.mark.parametrize("from_cost_summary", [False, True], ids=["ledger", "cost-summary"])
 @pytest.mark.usefixtures("_db_ledger")
-async def test_get_job_reports(db):
+async def test_get_job_reports(db, monkeypatch, from_cost_summary):
+    if from_cost_summary:
+        # the ledger rows are inserted directly, so the summaries must be populated
+        await LedgerRepository(db).backfill_cost_summaries(limit=100)
+        monkeypatch.setattr(settings, "REPORT_FROM_COST_SUMMARY", True)
     repo = test_module.ReportRepository(db)
 
     started_after = None
@@ -110,3 +123,135 @@ async def test_get_job_reports(db):
             assert [dict(row._mapping) for row in result] == EXPECTED[
                 page_size * (page - 1) : page_size * page
             ]
+
+
+@pytest.mark.usefixtures("_db_ledger")
+async def test_get_job_reports_with_cursor(db):
+    repo = test_module.ReportRepository(db)
+
+    for page_size in 1, 2, 3:
+        cursor = ""
+        results = []
+        for page in 1, 2, 3:
+            pagination = PaginatedParams(
+                page=page, page_size=page_size, cursor=cursor, include_total=False
+            )
+            result, count = await repo.get_job_reports(
+                pagination=pagination, vlab_id=VLAB_ID, proj_id=PROJ_ID
+            )
+            assert count is None
+            results += [dict(row._mapping) for row in result]
+            if len(result) < page_size:
+                break
+            cursor = test_module.encode_job_cursor(result[-1].started_at, result[-1].job_id)
+        assert results == EXPECTED
+
+
+async def test_get_job_reports_with_invalid_cursor(db):
+    repo = test_module.ReportRepository(db)
+    for cursor in ["invalid", test_module.encode_cursor(["invalid", "invalid"])]:
+        pagination = PaginatedParams(page=1, page_size=10, cursor=cursor)
+        with pytest.raises(ApiError, match="Invalid cursor"):
+            await repo.get_job_reports(pagination=pagination)
+
+
+@pytest.mark.usefixtures("_db_ledger")
+async def test_refresh_usage_rollups(db):
+    repo = test_module.ReportRepository(db)
+
+    assert await repo.get_usage_rollups_refreshed_at() is None
+    assert await repo.refresh_usage_rollups(batch_size=2) == 2
+    assert await repo.get_usage_rollups_refreshed_at() is not None
+    assert await repo.refresh_usage_rollups(batch_size=2) == 1
+    assert await repo.refresh_usage_rollups(batch_size=2) == 0
+    await db.commit()
+
+    now = utcnow()
+    for granularity, bucket_start in [
+        (RollupGranularity.HOUR, now.replace(minute=0, second=0, microsecond=0)),
+        (RollupGranularity.DAY, now.replace(hour=0, minute=0, second=0, microsecond=0)),
+    ]:
+        result = await repo.get_usage_timeseries(
+            granularity=granularity, vlab_id=VLAB_ID, after=bucket_start - timedelta(days=1)
+        )
+        # the transactions may be in the previous bucket if executed at the end of the bucket
+        assert [row._asdict() | {"bucket_start": ANY} for row in result] == [
+            {
+                "bucket_start": ANY,
+                "vlab_id": UUID(VLAB_ID),
+                "proj_id": UUID(PROJ_ID),
+                "type": ServiceType.ONESHOT,
+                "subtype": ServiceSubtype.ML_LLM,
+                "transaction_type": TransactionType.RESERVE,
+                "amount": Decimal("0.01"),
+                "transactions": 1,
+            },
+            {
+                "bucket_start": ANY,
+                "vlab_id": UUID(VLAB_ID),
+                "proj_id": UUID(PROJ_ID),
+                "type": ServiceType.ONESHOT,
+                "subtype": ServiceSubtype.ML_LLM,
+                "transaction_type": TransactionType.CHARGE_ONESHOT,
+                "amount": Decimal("0.015"),
+                "transactions": 2,
+            },
+        ]
+        assert result[0].bucket_start <= now
+
+    result = await repo.get_usage_timeseries(
+        granularity=RollupGranularity.DAY, proj_id=PROJ_ID, before=now - timedelta(days=1)
+    )
+    assert result == []
+
+
+async def _insert_charge(db, amount):
+    journal_id = (
+        await db.execute(
+            sa.insert(Journal)
+            .values(
+                transaction_datetime=utcnow(),
+                transaction_type=TransactionType.CHARGE_ONESHOT,
+                job_id=UUIDS.JOB[0],
+            )
+            .returning(Journal.id)
+        )
+    ).scalar_one()
+    await db.execute(
+        sa.insert(Ledger),
+        [
+            {"account_id": UUIDS.PROJ[0], "journal_id": journal_id, "amount": -amount},
+            {"account_id": UUIDS.SYS, "journal_id": journal_id, "amount": amount},
+        ],
+    )
+    return journal_id
+
+
+@pytest.mark.usefixtures("_db_ledger")
+async def test_refresh_usage_rollups_with_entries_committed_out_of_order(db):
+    repo = test_module.ReportRepository(db)
+
+    async with database_session_manager.session() as db1:
+        # the first entry is committed after the second entry and after the refresh
+        journal_id_1 = await _insert_charge(db1, Decimal("0.1"))
+        journal_id_2 = await _insert_charge(db, Decimal("0.2"))
+        await db.commit()
+        assert journal_id_1 < journal_id_2
+
+        # the second entry is held back, until the transaction of the first one is completed
+        assert await repo.refresh_usage_rollups(batch_size=10) == 3
+        await db.commit()
+        await db1.commit()
+
+    assert await repo.refresh_usage_rollups(batch_size=10) == 2
+    assert await repo.refresh_usage_rollups(batch_size=10) == 0
+    await db.commit()
+
+    result = await repo.get_usage_timeseries(
+        granularity=RollupGranularity.DAY,
+        proj_id=PROJ_ID,
+        after=utcnow() - timedelta(days=2),
+    )
+    charges = [row for row in result if row.transaction_type == TransactionType.CHARGE_ONESHOT]
+    assert sum(row.amount for row in charges) == Decimal("0.315")
+    assert sum(row.transactions for row in charges) == 4
@@ -2,8 +2,13 @@ from datetime import timedelta
 from decimal import Decimal
 
 import pytest
+import sqlalchemy as sa
 
-from app.constants import TransactionType
+from app.config import settings
+from app.constants import ServiceSubtype, ServiceType, TransactionType
+from app.db.model import Account, Discount, Price, PriceTier
+from app.db.session import database_session_manager
+from app.repository.group import RepositoryGroup
 from app.schema.domain import ChargeLongrunResult
 from app.service import charge_longrun as test_module
 from app.utils import create_uuid, utcnow
@@ -12,12 +17,17 @@ from tests.constants import UUIDS
 from tests.utils import _insert_longrun_job, _select_job, _select_ledger_rows, _update_job
 
 
+@pytest.fixture(params=[False, True], ids=["per-job", "bulk"])
+def bulk(request):
+    return request.param
+
+
 @pytest.mark.usefixtures("_db_account", "_db_price")
-async def test_charge_longrun(db, session_factory):
+async def test_charge_longrun(db, session_factory, bulk):
     now = utcnow()
 
     # no jobs
-    result = await test_module.charge_longrun(session_factory, transaction_datetime=now)
+    result = await test_module.charge_longrun(session_factory, transaction_datetime=now, bulk=bulk)
     assert result == ChargeLongrunResult()
 
     # new job
@@ -30,7 +40,7 @@ async def test_charge_longrun(db, session_factory):
     # unfinished_uncharged job
     transaction_datetime = now - timedelta(minutes=5)
     result = await test_module.charge_longrun(
-        session_factory, transaction_datetime=transaction_datetime
+        session_factory, transaction_datetime=transaction_datetime, bulk=bulk
     )
     assert result == ChargeLongrunResult(
         unfinished_uncharged=1,
@@ -64,7 +74,7 @@ async def test_charge_longrun(db, session_factory):
     # unfinished_charged job
     transaction_datetime = now - timedelta(minutes=4)
     result = await test_module.charge_longrun(
-        session_factory, transaction_datetime=transaction_datetime
+        session_factory, transaction_datetime=transaction_datetime, bulk=bulk
     )
     assert result == ChargeLongrunResult(
         unfinished_charged=1,
@@ -102,7 +112,7 @@ async def test_charge_longrun(db, session_factory):
 
     transaction_datetime = now
     result = await test_module.charge_longrun(
-        session_factory, transaction_datetime=transaction_datetime
+        session_factory, transaction_datetime=transaction_datetime, bulk=bulk
     )
     assert result == ChargeLongrunResult(
         finished_charged=1,
@@ -135,7 +145,7 @@ async def test_charge_longrun(db, session_factory):
 
 
 @pytest.mark.usefixtures("_db_account", "_db_price")
-async def test_charge_longrun_expired_uncharged(db, session_factory):
+async def test_charge_longrun_expired_uncharged(db, session_factory, bulk):
     job_id = create_uuid()
     now = utcnow()
     await _insert_longrun_job(db, job_id, instances=1, started_at=now - timedelta(hours=1))
@@ -144,7 +154,7 @@ async def test_charge_longrun_expired_uncharged(db, session_factory):
     assert job.last_charged_at is None
 
     result = await test_module.charge_longrun(
-        session_factory, expiration_interval=1800, transaction_datetime=now
+        session_factory, expiration_interval=1800, transaction_datetime=now, bulk=bulk
     )
     assert result == ChargeLongrunResult(
         expired_uncharged=1,
@@ -179,7 +189,7 @@ async def test_charge_longrun_expired_uncharged(db, session_factory):
 
 
 @pytest.mark.usefixtures("_db_account", "_db_price")
-async def test_charge_longrun_expired_charged(db, session_factory):
+async def test_charge_longrun_expired_charged(db, session_factory, bulk):
     job_id = create_uuid()
     now = utcnow()
     await _insert_longrun_job(
@@ -194,7 +204,7 @@ async def test_charge_longrun_expired_charged(db, session_factory):
     assert job.last_charged_at is not None
 
     result = await test_module.charge_longrun(
-        session_factory, expiration_interval=1800, transaction_datetime=now
+        session_factory, expiration_interval=1800, transaction_datetime=now, bulk=bulk
     )
     assert result == ChargeLongrunResult(
         expired_charged=1,
@@ -227,3 +237,135 @@ async def test_charge_longrun_expired_charged(db, session_factory):
             "transaction_type": TransactionType.CHARGE_LONGRUN,
         },
     ]
+
+
+@pytest.mark.parametrize("single_statement", [False, True], ids=["multi", "single"])
+@pytest.mark.usefixtures("_db_account", "_db_price")
+async def test_charge_longrun_with_vlab_price_discount_and_reservation(
+    db, session_factory, bulk, single_statement, monkeypatch
+):
+    monkeypatch.setattr(settings, "LEDGER_SINGLE_STATEMENT_POSTING", single_statement)
+    now = utcnow()
+    await db.execute(
+        sa.insert(Discount).values(
+            vlab_id=UUIDS.VLAB[0], valid_from=now - timedelta(days=1), discount=Decimal("0.5")
+        )
+    )
+    vlab_price_id = (
+        await db.execute(
+            sa.insert(Price)
+            .values(
+                service_type=ServiceType.LONGRUN,
+                service_subtype=ServiceSubtype.SINGLE_CELL_SIM,
+                valid_from=now - timedelta(days=1),
+                vlab_id=UUIDS.VLAB[0],
+            )
+            .returning(Price.id)
+        )
+    ).scalar_one()
+    await db.execute(
+        sa.insert(PriceTier).values(
+            price_id=vlab_price_id,
+            min_quantity=0,
+            fixed_cost=Decimal(1),
+            multiplier=Decimal("0.02"),
+        )
+    )
+    job_ids = [create_uuid() for _ in range(3)]
+    for n, job_id in enumerate(job_ids):
+        await _insert_longrun_job(db, job_id, instances=1, started_at=now - timedelta(minutes=10))
+        await _update_job(db, job_id, proj_id=UUIDS.PROJ[n % 2], remaining_reservation=Decimal(2))
+    # the price of the last job is missing, but the other jobs are charged
+    await _update_job(db, job_ids[2], service_subtype=ServiceSubtype.ML_LLM)
+
+    result = await test_module.charge_longrun(
+        session_factory, transaction_datetime=now, chunk_size=2, bulk=bulk
+    )
+
+    assert result == ChargeLongrunResult(unfinished_uncharged=2, failure=1)
+    # (600 * 0.02 + 1) * (1 - 0.5) = 6.5, of which 2 charged to the reservation
+    for job_id, proj_id, rsv_id in zip(job_ids, UUIDS.PROJ, UUIDS.RSV, strict=False):
+        rows = await _select_ledger_rows(db, job_id)
+        assert [(row.account_id, row.amount, row.price_id) for row in rows] == [
+            (rsv_id, Decimal(-2), vlab_price_id),
+            (UUIDS.SYS, Decimal(2), vlab_price_id),
+            (proj_id, Decimal("-4.5"), vlab_price_id),
+            (UUIDS.SYS, Decimal("4.5"), vlab_price_id),
+        ]
+        assert (await _select_job(db, job_id)).remaining_reservation == 0
+    assert await _select_ledger_rows(db, job_ids[2]) == []
+
+
+@pytest.mark.usefixtures("_db_account", "_db_price")
+async def test_charge_longrun_concurrently(db, bulk):
+    now = utcnow()
+    job_ids = [create_uuid() for _ in range(6)]
+    for n, job_id in enumerate(job_ids):
+        await _insert_longrun_job(db, job_id, instances=1, started_at=now - timedelta(minutes=10))
+        await _update_job(db, job_id, proj_id=UUIDS.PROJ[n % 2])
+    # the price of the last job is missing, but the other jobs are charged
+    await _update_job(db, job_ids[-1], service_subtype=ServiceSubtype.ML_LLM)
+    await db.commit()
+
+    result = await test_module.charge_longrun(
+        database_session_manager.session, transaction_datetime=now, concurrency=4, bulk=bulk
+    )
+
+    assert result == ChargeLongrunResult(unfinished_uncharged=5, failure=1)
+    expected_amount = 600 * Decimal("0.01") + Decimal("1.5")
+    balances = dict((await db.execute(sa.select(Account.id, Account.balance))).all())
+    assert balances[UUIDS.SYS] == -3000 + 5 * expected_amount
+    assert balances[UUIDS.PROJ[0]] == 400 - 3 * expected_amount
+    assert balances[UUIDS.PROJ[1]] == 500 - 2 * expected_amount
+
+
+@pytest.mark.usefixtures("_db_account", "_db_price")
+async def test_charge_longrun_due_only(db, session_factory, bulk, monkeypatch):
+    monkeypatch.setattr(settings, "CHARGE_LONGRUN_MIN_CHARGING_INTERVAL", 60)
+    monkeypatch.setattr(settings, "CHARGE_LONGRUN_EXPIRATION_INTERVAL", 3600)
+    now = utcnow()
+    job_ids = [create_uuid() for _ in range(5)]
+    # due, never charged
+    await _insert_longrun_job(db, job_ids[0], instances=1, started_at=now - timedelta(minutes=10))
+    # due, finished
+    await _insert_longrun_job(db, job_ids[1], instances=1, started_at=now - timedelta(minutes=10))
+    await _update_job(db, job_ids[1], finished_at=now - timedelta(minutes=1))
+    # not due, charged recently
+    await _insert_longrun_job(
+        db,
+        job_ids[2],
+        instances=1,
+        started_at=now - timedelta(minutes=10),
+        last_charged_at=now - timedelta(seconds=30),
+    )
+    # not due, started recently
+    await _insert_longrun_job(db, job_ids[3], instances=1, started_at=now - timedelta(seconds=30))
+    # due, but skipped because of the longer min_charging_interval of the charger
+    await _insert_longrun_job(db, job_ids[4], instances=1, started_at=now - timedelta(seconds=90))
+    await RepositoryGroup(db=db).job.refresh_next_charge_due_at()
+
+    result = await test_module.charge_longrun(
+        session_factory,
+        min_charging_interval=120,
+        transaction_datetime=now,
+        chunk_size=1,
+        bulk=bulk,
+        due_only=True,
+    )
+
+    # the skipped jobs are counted as processed
+    assert result == ChargeLongrunResult(unfinished_uncharged=2, finished_uncharged=1)
+    jobs = [await _select_job(db, job_id) for job_id in job_ids]
+    assert jobs[0].last_charged_at == now
+    assert jobs[0].next_charge_due_at == now + timedelta(seconds=60)
+    assert jobs[1].last_charged_at == jobs[1].finished_at
+    assert jobs[1].next_charge_due_at is None
+    assert jobs[4].last_charged_at is None
+    assert jobs[4].next_charge_due_at == now + timedelta(seconds=120)
+    assert len(await _select_ledger_rows(db, job_ids[2])) == 0
+
+    # nothing is due at the same time
+    result = await test_module.charge_longrun(
+        session_factory, transaction_datetime=now, bulk=bulk, due_only=True
+    )
+    assert result == ChargeLongrunResult()
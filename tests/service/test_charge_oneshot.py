@@ -3,7 +3,8 @@ from decimal import Decimal
 import pytest
 
 from app.constants import TransactionType
-from app.schema.domain import ChargeOneshotResult
+from app.repository.group import RepositoryGroup
+from app.schema.domain import ChargeOneshotResult, StartedJob
 from app.service import charge_oneshot as test_module
 from app.utils import create_uuid, utcnow
 
@@ -68,3 +69,44 @@ async def test_charge_oneshot(db, session_factory):
             "transaction_type": TransactionType.CHARGE_ONESHOT,
         },
     ]
+
+
+@pytest.mark.usefixtures("_db_account", "_db_price")
+async def test_charge_oneshot_job_ids(db, session_factory):
+    now = utcnow()
+    job_ids = [create_uuid() for _ in range(2)]
+    for job_id in job_ids:
+        await _insert_oneshot_job(db, job_id, reserved_count=100, reserved_at=now)
+        await _update_job(
+            db,
+            job_id,
+            started_at=now,
+            last_alive_at=now,
+            finished_at=now,
+            usage_params={"count": 1},
+        )
+
+    result = await test_module.charge_oneshot(session_factory, job_ids=job_ids[1:])
+
+    assert result == ChargeOneshotResult(success=1)
+    assert (await _select_job(db, job_ids[0])).last_charged_at is None
+    assert (await _select_job(db, job_ids[1])).last_charged_at == now
+
+
+@pytest.mark.usefixtures("_db_account", "_db_price")
+async def test_charge_oneshot_not_charged_twice(db):
+    now = utcnow()
+    job_id = create_uuid()
+    await _insert_oneshot_job(db, job_id, reserved_count=100, reserved_at=now)
+    job = await _update_job(
+        db, job_id, started_at=now, last_alive_at=now, finished_at=now, usage_params={"count": 1}
+    )
+    # the same job selected by two chargers
+    selected = StartedJob.model_validate(job)
+    repos = RepositoryGroup(db=db)
+
+    for _ in range(2):
+        await test_module._charge_generic(repos, selected, charging_at=now, reason="test")
+
+    # charged only once
+    assert len(await _select_ledger_rows(db, job_id)) == 2
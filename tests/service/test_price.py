@@ -1,3 +1,4 @@
+import random
 from datetime import datetime
 from decimal import Decimal
 
@@ -8,6 +9,7 @@ from app.db.model import Discount, Price, PriceTier
 from app.errors import ApiError
 from app.repository.group import RepositoryGroup
 from app.schema.api import AddPriceIn
+from app.schema.domain import CompiledTiers, PriceInfo, PriceTierInfo
 from app.service import price as test_module
 
 from tests.constants import UUIDS
@@ -22,7 +24,7 @@ _DISCOUNT_20 = Discount(
 
 
 def _make_price(tiers):
-    """Helper to create a Price with tiers for unit tests."""
+    """Helper to create a PriceInfo with tiers for unit tests."""
     price = Price(
         id=1,
         service_type=ServiceType.ONESHOT,
@@ -35,7 +37,7 @@ def _make_price(tiers):
         [PriceTier(price_id=1, **t) for t in tiers],
         key=lambda t: t.min_quantity,
     )
-    return price
+    return PriceInfo.model_validate(price)
 
 
 def _tier(min_q, max_q, fixed, mult):
@@ -167,6 +169,55 @@ def test_calculate_cost(tiers, previous_usage, current_usage, discount, expected
     assert result == Decimal(expected)
 
 
+def _random_tiers(rng, scale):
+    """Return random tiers ordered by min_quantity, with gaps, overlaps and empty tiers."""
+    tiers = []
+    for _ in range(rng.randint(0, 6)):
+        min_q = rng.randint(0, 100) * scale
+        max_q = rng.choice([None, min_q + rng.randint(-5, 50) * scale])
+        fixed = Decimal(rng.randint(0, 1000)) / 100
+        mult = rng.choice(
+            [Decimal(rng.randint(0, 10000)) / 10000, Decimal(1) / rng.choice([3, 7, 3600])]
+        )
+        tiers.append(
+            PriceTierInfo(min_quantity=min_q, max_quantity=max_q, fixed_cost=fixed, multiplier=mult)
+        )
+    return sorted(tiers, key=lambda t: t.min_quantity)
+
+
+@pytest.mark.parametrize("scale", [1, 3600, 100_000])
+def test_compiled_tiers_equivalent_to_iteration(scale):
+    rng = random.Random(42)  # noqa: S311
+    for _ in range(500):
+        tiers = _random_tiers(rng, scale)
+        compiled = CompiledTiers.from_tiers(tiers)
+        for _ in range(20):
+            start = rng.randint(-5, 160) * scale + rng.randint(0, scale - 1)
+            end = rng.choice([start, start + rng.randint(0, 10), rng.randint(-5, 160) * scale])
+            expected = test_module._iter_cost(tiers, start=start, end=end)
+            assert compiled.cost(start=start, end=end) == expected, (tiers, start, end)
+
+
+@pytest.mark.parametrize(
+    ("start", "end", "expected"),
+    [
+        (0, 600, "0.1666666666666666666666666667"),
+        (345_600, 346_200, "0.1666666666666666666666666667"),
+        (10_000_000, 10_000_001, "0.0002777777777777777777777777778"),
+    ],
+)
+def test_compiled_tiers_large_usage(start, end, expected):
+    tiers = [PriceTierInfo(**_tier(0, None, 0, Decimal(1) / 3600))]
+    assert CompiledTiers.from_tiers(tiers).cost(start=start, end=end) == Decimal(expected)
+
+
+def test_compiled_tiers_cached_by_price():
+    price = _make_price([_tier(0, 100, 1, "0.5"), _tier(100, None, 2, "0.1")])
+    assert price.compiled_tiers is price.compiled_tiers
+    assert price.compiled_tiers.boundaries == (0, 100)
+    assert price.compiled_tiers.cost(start=50, end=150) == Decimal(32)
+
+
 @pytest.mark.usefixtures("_db_account")
 async def test_add_price(db):
     repos = RepositoryGroup(db)
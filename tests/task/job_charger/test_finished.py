@@ -0,0 +1,53 @@
+import asyncio
+import contextlib
+
+import pytest
+import sqlalchemy as sa
+
+from app.constants import ServiceType
+from app.db.session import database_session_manager
+from app.repository.group import RepositoryGroup
+from app.task.job_charger import finished as test_module
+from app.utils import create_uuid, utcnow
+
+from tests.task.test_price_cache import _wait_for
+from tests.utils import _insert_oneshot_job, _select_job, _update_job
+
+
+@pytest.mark.usefixtures("_db_account", "_db_price")
+async def test_finished_job_charger(db):
+    now = utcnow()
+    job_id = create_uuid()
+    await _insert_oneshot_job(db, job_id, reserved_count=100, reserved_at=now)
+    await _update_job(
+        db, job_id, started_at=now, last_alive_at=now, finished_at=now, usage_params={"count": 10}
+    )
+    await db.commit()
+
+    task = test_module.FinishedJobCharger(name="test-finished-job-charger")
+    runner = asyncio.create_task(task.run_forever())
+    try:
+        # wait for the listener to be ready
+        await asyncio.sleep(0.2)
+        async with database_session_manager.session() as session:
+            repos = RepositoryGroup(db=session)
+            await repos.job.notify_finished(job_id=job_id, service_type=ServiceType.ONESHOT)
+            await repos.job.notify_finished(job_id=create_uuid(), service_type=ServiceType.LONGRUN)
+            await session.execute(
+                sa.select(sa.func.pg_notify(test_module.JOB_FINISHED_CHANNEL, "invalid"))
+            )
+
+        async def _is_charged():
+            await db.rollback()
+            return (await _select_job(db, job_id)).last_charged_at is not None
+
+        for _ in range(200):
+            if await _is_charged():
+                break
+            await asyncio.sleep(0.01)
+        assert await _is_charged()
+        await _wait_for(lambda: task._notifications == 3)
+    finally:
+        runner.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await runner
@@ -0,0 +1,22 @@
+from app.config import settings
+from app.schema.domain import Shard
+from app.task.job_charger import shard as test_module
+
+
+async def test_shard_coordinator(monkeypatch):
+    monkeypatch.setattr(settings, "CHARGER_SHARDING_SLOTS", 4)
+    task = test_module.ShardCoordinator(name="test-shard-coordinator")
+    # nothing is charged before leasing the slots
+    assert task.get_shard() == Shard(slots=frozenset(), total=4)
+
+    await task.run_forever(limit=1)
+    assert task.get_stats()["success"] == 1
+    assert task.get_shard() == Shard(slots=frozenset(range(4)), total=4)
+
+    # nothing is charged if the leases may be expired
+    task._valid_until = 0
+    assert task.get_shard() == Shard(slots=frozenset(), total=4)
+
+    await task.run_forever(limit=1)
+    await task.release()
+    assert task.get_shard() == Shard(slots=frozenset(), total=4)
@@ -0,0 +1,18 @@
+from unittest.mock import patch
+
+from app.task.job_charger import base, system_balance as test_module
+
+
+@patch(f"{test_module.__name__}.fold_system_balance")
+async def test_periodic_system_balance_folder_run_forever(mock_fold_system_balance):
+    mock_fold_system_balance.return_value = 2
+    task = test_module.PeriodicSystemBalanceFolder(name="test-system-balance-folder")
+    await task.run_forever(limit=1)
+    assert mock_fold_system_balance.call_count == 1
+    assert task.get_stats() == {
+        "counter": 1,
+        "success": 1,
+        "failure": 0,
+    }
+    assert base.TASK_RUNS.get(("test-system-balance-folder", "success")) == 1
+    assert base.TASK_RUN_DURATION.get_count(("test-system-balance-folder",)) == 1
@@ -0,0 +1,17 @@
+from unittest.mock import patch
+
+from app.task.job_charger import usage_rollup as test_module
+
+
+@patch(f"{test_module.__name__}.refresh_usage_rollups")
+async def test_periodic_usage_rollup_refresher_run_forever(mock_refresh_usage_rollups, monkeypatch):
+    monkeypatch.setattr(test_module.settings, "USAGE_ROLLUP_BATCH_SIZE", 10)
+    mock_refresh_usage_rollups.side_effect = [10, 3]
+    task = test_module.PeriodicUsageRollupRefresher(name="test-usage-rollup-refresher")
+    await task.run_forever(limit=1)
+    assert mock_refresh_usage_rollups.call_count == 2
+    assert task.get_stats() == {
+        "counter": 1,
+        "success": 1,
+        "failure": 0,
+    }
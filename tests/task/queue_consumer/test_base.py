@@ -0,0 +1,247 @@
+import asyncio
+import itertools
+import time
+from uuid import UUID
+
+import pytest
+import sqlalchemy as sa
+
+from app.config import settings
+from app.constants import EventStatus
+from app.db.instrumentation import track_queries
+from app.db.model import Event
+from app.db.session import DatabaseSessionManager
+from app.task.queue_consumer import base as test_module
+
+from tests.constants import UUIDS
+
+QUEUE_URL = "http://queue:9324/000000000000/test.fifo"
+
+
+def _make_message(n, group_id):
+    return {
+        "Attributes": {"MessageGroupId": group_id},
+        "Body": "{}",
+        "MessageId": f"message-{n}",
+        "ReceiptHandle": f"receipt-{n}",
+    }
+
+
+class FakeSQSClient:
+    def __init__(self, messages):
+        self.messages = messages
+        self.received = []
+
+    async def receive_message(self, **kwargs):
+        self.received.append(kwargs)
+        return {"Messages": self.messages}
+
+
+class FakeAcknowledger:
+    def __init__(self):
+        self.deleted = []
+
+    def ack(self, receipt_handle):
+        self.deleted.append(receipt_handle)
+
+
+class RecordingConsumer(test_module.QueueConsumer):
+    def __init__(self, *args, failing=(), raising=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failing = set(failing)
+        self.raising = set(raising)
+        self.processed = []
+        self.running = 0
+        self.max_running = 0
+
+    async def _consume(self, msg, db):
+        raise NotImplementedError
+
+    async def _wrap(self, msg):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        self.processed.append(msg["MessageId"])
+        if msg["MessageId"] in self.raising:
+            # simulate an error outside the handler, for example when committing
+            raise RuntimeError(msg["MessageId"])
+        return msg["MessageId"] not in self.failing
+
+
+async def test_consume_many_default():
+    class Consumer(test_module.QueueConsumer):
+        async def _consume(self, msg, db):  # noqa: ARG002, PLR6301
+            return UUID(int=int(msg["MessageId"].removeprefix("message-")))
+
+    consumer = Consumer(name="test", queue_name="test.fifo")
+    messages = list(itertools.starmap(_make_message, enumerate("AAA")))
+
+    result = await consumer._consume_many(messages, db=None)
+
+    assert result == [UUID(int=n) for n in range(3)]
+
+
+def test_init_with_invalid_params():
+    with pytest.raises(ValueError, match="max_number_of_messages must be between 1 and 10"):
+        RecordingConsumer(name="test", queue_name="test.fifo", max_number_of_messages=11)
+    with pytest.raises(ValueError, match="max_concurrency must be greater than 0"):
+        RecordingConsumer(name="test", queue_name="test.fifo", max_concurrency=0)
+
+
+def test_group_messages():
+    messages = [
+        _make_message(0, "A"),
+        _make_message(1, "B"),
+        _make_message(2, "A"),
+        _make_message(3, "C"),
+        _make_message(4, "B"),
+    ]
+    groups = test_module.QueueConsumer._group_messages(messages)
+    assert [[msg["MessageId"] for msg in group] for group in groups] == [
+        ["message-0", "message-2"],
+        ["message-1", "message-4"],
+        ["message-3"],
+    ]
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 2, 4])
+async def test_run_once_batched(max_concurrency):
+    messages = list(itertools.starmap(_make_message, enumerate("ABCDABCDAB")))
+    sqs_client = FakeSQSClient(messages)
+    acknowledger = FakeAcknowledger()
+    consumer = RecordingConsumer(
+        name="test",
+        queue_name="test.fifo",
+        max_number_of_messages=10,
+        max_concurrency=max_concurrency,
+    )
+
+    await consumer._run_once(sqs_client, QUEUE_URL, acknowledger)
+
+    assert sqs_client.received[0]["MaxNumberOfMessages"] == 10
+    assert sorted(consumer.processed) == sorted(msg["MessageId"] for msg in messages)
+    assert sorted(acknowledger.deleted) == sorted(msg["ReceiptHandle"] for msg in messages)
+    assert consumer.max_running == max_concurrency
+    # the order is preserved within each group
+    for group_id in "ABCD":
+        expected = [
+            msg["MessageId"] for msg in messages if msg["Attributes"]["MessageGroupId"] == group_id
+        ]
+        assert [m for m in consumer.processed if m in expected] == expected
+
+
+async def test_run_once_stops_group_at_first_failure():
+    messages = list(itertools.starmap(_make_message, enumerate("ABABAB")))
+    sqs_client = FakeSQSClient(messages)
+    acknowledger = FakeAcknowledger()
+    consumer = RecordingConsumer(
+        name="test",
+        queue_name="test.fifo",
+        max_number_of_messages=10,
+        max_concurrency=2,
+        failing={"message-2"},
+    )
+
+    await consumer._run_once(sqs_client, QUEUE_URL, acknowledger)
+
+    # message-4 is not processed because message-2 in the same group failed
+    assert sorted(consumer.processed) == [
+        "message-0",
+        "message-1",
+        "message-2",
+        "message-3",
+        "message-5",
+    ]
+    assert sorted(acknowledger.deleted) == ["receipt-0", "receipt-1", "receipt-3", "receipt-5"]
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 2])
+async def test_run_once_acks_other_groups_on_unexpected_error(max_concurrency):
+    messages = list(itertools.starmap(_make_message, enumerate("ABABAB")))
+    acknowledger = FakeAcknowledger()
+    consumer = RecordingConsumer(
+        name="test",
+        queue_name="test.fifo",
+        max_number_of_messages=10,
+        max_concurrency=max_concurrency,
+        raising={"message-2"},
+    )
+
+    await consumer._run_once(FakeSQSClient(messages), QUEUE_URL, acknowledger)
+
+    # the group B and the messages of the group A committed before the error are deleted
+    assert sorted(consumer.processed) == [
+        "message-0",
+        "message-1",
+        "message-2",
+        "message-3",
+        "message-5",
+    ]
+    assert sorted(acknowledger.deleted) == ["receipt-0", "receipt-1", "receipt-3", "receipt-5"]
+
+
+async def test_run_once_records_metrics():
+    messages = list(itertools.starmap(_make_message, enumerate("AB")))
+    messages[0]["Attributes"]["SentTimestamp"] = str(int(time.time() * 1000) - 2000)
+    consumer = RecordingConsumer(name="test", queue_name="test-metrics.fifo")
+    labels = ("test-metrics.fifo",)
+
+    await consumer._run_once(FakeSQSClient(messages), QUEUE_URL, FakeAcknowledger())
+
+    assert test_module.SQS_RECEIVE_DURATION.get_count(labels) == 1
+    assert test_module.SQS_MESSAGES_RECEIVED.get(labels) == 2
+    # only the messages with SentTimestamp are recorded
+    assert test_module.SQS_MESSAGE_AGE.get_count(labels) == 1
+
+
+@pytest.fixture
+async def instrumented_manager():
+    database_session_manager = DatabaseSessionManager()
+    database_session_manager.initialize(url=settings.DB_URI, instrument_queries=True)
+    yield database_session_manager
+    await database_session_manager.close()
+
+
+@pytest.mark.usefixtures("_db_job")
+async def test_consume_once_statements(db, instrumented_manager):
+    class Consumer(test_module.QueueConsumer):
+        async def _consume(self, msg, db):
+            raise NotImplementedError
+
+        async def _consume_many(self, msgs, db):  # noqa: ARG002, PLR6301
+            consumed.extend(msg["MessageId"] for msg in msgs)
+            return [UUIDS.JOB[0]] * len(msgs)
+
+    consumer = Consumer(name="test", queue_name="test.fifo")
+    consumed = []
+
+    async def _consume_batch(receive_count, count):
+        messages = [
+            {
+                "Attributes": {"MessageGroupId": "A", "ApproximateReceiveCount": receive_count},
+                "Body": "{}",
+                "MessageId": str(UUID(int=n)),
+                "ReceiptHandle": f"receipt-{n}",
+            }
+            for n in range(count)
+        ]
+        async with instrumented_manager.session() as session:
+            with track_queries("batch") as stats:
+                job_ids = await consumer._consume_once(messages, db=session)
+            await session.commit()
+        assert job_ids == [UUIDS.JOB[0]] * count
+        return stats.statements
+
+    # the events of the first deliveries are stored without looking up the completed events
+    assert await _consume_batch("1", 3) == 1
+    assert consumed == [str(UUID(int=n)) for n in range(3)]
+
+    # the completed events are looked up once for all the redelivered messages
+    assert await _consume_batch("2", 5) == 2
+    # the messages already consumed are skipped
+    assert consumed == [str(UUID(int=n)) for n in range(5)]
+
+    events = (await db.scalars(sa.select(Event).order_by(Event.message_id))).all()
+    assert [event.counter for event in events] == [2, 2, 2, 1, 1]
+    assert all(event.status == EventStatus.COMPLETED for event in events)
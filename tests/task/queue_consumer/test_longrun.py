@@ -1,5 +1,19 @@
+import json
+from datetime import UTC, datetime
+from uuid import UUID
+
+import pytest
+import sqlalchemy as sa
+
 from app.config import settings
+from app.constants import EventStatus, LongrunStatus, ServiceSubtype, ServiceType
+from app.db.model import Event, Job
 from app.task.queue_consumer import longrun as test_module
+from app.utils import since_unix_epoch
+
+from tests.constants import PROJ_ID, UUIDS
+
+QUEUE_URL = "http://queue:9324/000000000000/test.fifo"
 
 
 async def test_consume(sqs_client_factory):
@@ -12,3 +26,105 @@ async def test_consume(sqs_client_factory):
     assert consumer.queue_name == queue_name
 
     # await consumer.run_forever(limit=1)
+
+
+class FakeSQSClient:
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def receive_message(self, **kwargs):  # noqa: ARG002
+        return {"Messages": self.messages}
+
+
+class FakeAcknowledger:
+    def __init__(self):
+        self.deleted = []
+
+    def ack(self, receipt_handle):
+        self.deleted.append(receipt_handle)
+
+
+def _make_message(n, job_id, status, timestamp):
+    body = {
+        "type": ServiceType.LONGRUN,
+        "subtype": ServiceSubtype.SINGLE_CELL_SIM,
+        "proj_id": PROJ_ID,
+        "job_id": str(job_id),
+        "status": status,
+        "timestamp": timestamp,
+    }
+    return {
+        "Attributes": {"MessageGroupId": PROJ_ID},
+        "Body": json.dumps(body),
+        "MessageId": str(UUID(int=n)),
+        "ReceiptHandle": f"receipt-{n}",
+    }
+
+
+def test_split_group():
+    consumer = test_module.LongrunQueueConsumer(name="test", queue_name="test.fifo")
+    timestamp = since_unix_epoch()
+    statuses = ["running", "running", "finished", "running", "started", "running", "running"]
+    messages = [
+        _make_message(n, UUIDS.JOB[1], status, timestamp) for n, status in enumerate(statuses)
+    ]
+    result = consumer._split_group(messages)
+    assert [[int(UUID(msg["MessageId"])) for msg in msgs] for msgs in result] == [
+        [0, 1],
+        [2],
+        [3],
+        [4],
+        [5, 6],
+    ]
+
+
+@pytest.mark.usefixtures("_db_job")
+async def test_run_once_coalesces_running_messages(db):
+    timestamp = since_unix_epoch()
+    messages = [
+        _make_message(n, UUIDS.JOB[1], LongrunStatus.RUNNING, timestamp + n) for n in range(5)
+    ]
+    acknowledger = FakeAcknowledger()
+    consumer = test_module.LongrunQueueConsumer(
+        name="test", queue_name="test.fifo", max_number_of_messages=10
+    )
+    test_module._parse_event.cache_clear()
+
+    await consumer._run_once(FakeSQSClient(messages), QUEUE_URL, acknowledger)
+
+    # each message is parsed only once, when split and when consumed
+    assert test_module._parse_event.cache_info().misses == len(messages)
+    assert acknowledger.deleted == [msg["ReceiptHandle"] for msg in messages]
+    job = await db.get(Job, UUIDS.JOB[1])
+    assert job.last_alive_at == datetime.fromtimestamp(timestamp + 4, tz=UTC)
+    events = (await db.scalars(sa.select(Event).order_by(Event.id))).all()
+    assert [event.message_id for event in events] == [UUID(msg["MessageId"]) for msg in messages]
+    assert all(event.status == EventStatus.COMPLETED for event in events)
+    assert all(event.job_id == UUIDS.JOB[1] for event in events)
+
+
+@pytest.mark.usefixtures("_db_job")
+async def test_run_once_falls_back_to_single_messages(db):
+    timestamp = since_unix_epoch()
+    unknown_job_id = UUID(int=999)
+    messages = [
+        _make_message(0, UUIDS.JOB[1], LongrunStatus.RUNNING, timestamp),
+        _make_message(1, unknown_job_id, LongrunStatus.RUNNING, timestamp + 1),
+        _make_message(2, UUIDS.JOB[1], LongrunStatus.RUNNING, timestamp + 2),
+    ]
+    acknowledger = FakeAcknowledger()
+    consumer = test_module.LongrunQueueConsumer(
+        name="test", queue_name="test.fifo", max_number_of_messages=10
+    )
+
+    await consumer._run_once(FakeSQSClient(messages), QUEUE_URL, acknowledger)
+
+    # the messages following the failed one in the same group are not processed
+    assert acknowledger.deleted == ["receipt-0"]
+    job = await db.get(Job, UUIDS.JOB[1])
+    assert job.last_alive_at == datetime.fromtimestamp(timestamp, tz=UTC)
+    events = (await db.scalars(sa.select(Event).order_by(Event.message_id))).all()
+    assert [(event.message_id, event.status) for event in events] == [
+        (UUID(int=0), EventStatus.COMPLETED),
+        (UUID(int=1), EventStatus.FAILED),
+    ]
@@ -6,6 +6,7 @@ import pytest
 import sqlalchemy as sa
 
 from app.config import settings
+from app.constants import EventStatus
 from app.db.model import Event, Job
 from app.task.queue_consumer import storage as test_module
 from app.utils import since_unix_epoch
@@ -47,6 +48,7 @@ def _prepare_stub(stub, queue_url, queue_name, message_id, receipt_handle, messa
         expected_params={
             "QueueUrl": queue_url,
             "MessageSystemAttributeNames": [
+                "ApproximateReceiveCount",
                 "MessageGroupId",
                 "SenderId",
                 "SentTimestamp",
@@ -58,11 +60,11 @@ def _prepare_stub(stub, queue_url, queue_name, message_id, receipt_handle, messa
         },
     )
     stub.add_response(
-        "delete_message",
-        service_response={},
+        "delete_message_batch",
+        service_response={"Successful": [{"Id": "0"}], "Failed": []},
         expected_params={
             "QueueUrl": queue_url,
-            "ReceiptHandle": receipt_handle,
+            "Entries": [{"Id": "0", "ReceiptHandle": receipt_handle}],
         },
     )
 
@@ -92,6 +94,7 @@ async def test_consume(sqs_stubber, sqs_client_factory, db):
     await consumer.run_forever(limit=1)
 
     sqs_stubber.assert_no_pending_responses()
+    assert consumer.get_stats() == {"acked": 1, "failed": 0, "retried": 0, "pending": 0}
 
     # verify the content of the db
     query = sa.select(Event)
@@ -108,3 +111,47 @@ async def test_consume(sqs_stubber, sqs_client_factory, db):
     assert records[0].proj_id == UUID(PROJ_ID)
     assert records[0].started_at == datetime.fromtimestamp(timestamp, tz=UTC)
     assert records[0].usage_params == {"size": 1073741824}
+
+
+class FakeSQSClient:
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def receive_message(self, **kwargs):  # noqa: ARG002
+        return {"Messages": self.messages}
+
+
+class FakeAcknowledger:
+    def __init__(self):
+        self.deleted = []
+
+    def ack(self, receipt_handle):
+        self.deleted.append(receipt_handle)
+
+
+@pytest.mark.usefixtures("_db_account")
+async def test_run_once_skips_redelivered_message(db):
+    message_id = "3e7a742a-3450-4ca2-a2ee-b044a525d16f"
+    message_body = {
+        "type": "storage",
+        "proj_id": PROJ_ID,
+        "size": "1073741824",
+        "timestamp": since_unix_epoch(),
+    }
+    response = _get_receive_message_response(message_id, "receipt", message_body)
+    consumer = test_module.StorageQueueConsumer(name="test", queue_name="test.fifo")
+
+    # the message is received again after being committed, because it couldn't be deleted
+    for receive_count in "1", "2":
+        response["Messages"][0]["Attributes"]["ApproximateReceiveCount"] = receive_count
+        acknowledger = FakeAcknowledger()
+        await consumer._run_once(FakeSQSClient(response["Messages"]), "queue-url", acknowledger)
+        assert acknowledger.deleted == ["receipt"]
+
+    event = (await db.scalars(sa.select(Event))).one()
+    assert event.message_id == UUID(message_id)
+    assert event.status == EventStatus.COMPLETED
+    assert event.counter == 2
+    # the redelivered message didn't create another job to be charged
+    job = (await db.scalars(sa.select(Job))).one()
+    assert event.job_id == job.id
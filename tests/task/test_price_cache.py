@@ -0,0 +1,55 @@
+import asyncio
+import contextlib
+from datetime import datetime
+
+import pytest
+
+from app.cache import price_cache
+from app.constants import ServiceSubtype, ServiceType
+from app.db.session import database_session_manager
+from app.repository.group import RepositoryGroup
+from app.repository.price import CLEAR_PRICE_CACHE
+from app.task import price_cache as test_module
+
+from tests.test_cache import KEY, _make_price
+
+
+async def _wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    msg = "Condition not satisfied"
+    raise AssertionError(msg)
+
+
+@pytest.mark.usefixtures("_db_account")
+async def test_price_cache_listener():
+    listener = test_module.PriceCacheListener(name="test-listener")
+    task = asyncio.create_task(listener.run_forever())
+    try:
+        # the cache is cleared when the listener starts
+        await _wait_for(lambda: price_cache.get_stats()["invalidations"] == 1)
+        price_cache.set(KEY, [_make_price(1, "2024-01-01T00:00:00Z")], price_cache.generation)
+
+        # simulate another process, notifying the invalidation without clearing the local cache
+        async with database_session_manager.session() as db:
+            await RepositoryGroup(db=db).price.add_price(
+                {
+                    "service_type": ServiceType.LONGRUN,
+                    "service_subtype": ServiceSubtype.SINGLE_CELL_SIM,
+                    "valid_from": datetime.fromisoformat("2024-01-01T00:00:00Z"),
+                    "valid_to": None,
+                    "vlab_id": None,
+                    "tiers": [],
+                }
+            )
+            db.info.pop(CLEAR_PRICE_CACHE)
+            assert price_cache.get_stats()["size"] == 1
+
+        await _wait_for(lambda: price_cache.get_stats()["size"] == 0)
+        assert listener._notifications == 1
+    finally:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from app import cache as test_module
+from app.constants import ServiceSubtype, ServiceType
+from app.schema.domain import PriceInfo
+
+KEY = (None, ServiceType.LONGRUN, ServiceSubtype.SINGLE_CELL_SIM)
+
+
+def _make_price(price_id, valid_from, valid_to=None):
+    return PriceInfo(
+        id=price_id,
+        vlab_id=None,
+        service_type=ServiceType.LONGRUN,
+        service_subtype=ServiceSubtype.SINGLE_CELL_SIM,
+        valid_from=datetime.fromisoformat(valid_from),
+        valid_to=datetime.fromisoformat(valid_to) if valid_to else None,
+        tiers=(),
+    )
+
+
+def test_price_history_find():
+    cache = test_module.PriceCache()
+    history = cache.set(
+        KEY,
+        [
+            _make_price(1, "2024-01-01T00:00:00Z"),
+            _make_price(2, "2025-01-01T00:00:00Z", "2025-02-01T00:00:00Z"),
+            _make_price(3, "2025-01-01T00:00:00Z", "2025-01-15T00:00:00Z"),
+        ],
+        generation=cache.generation,
+    )
+
+    def _find(usage_datetime):
+        price = history.find(datetime.fromisoformat(usage_datetime))
+        return price.id if price else None
+
+    assert _find("2023-12-31T23:59:59Z") is None
+    assert _find("2024-01-01T00:00:00Z") == 1
+    assert _find("2025-01-01T00:00:00Z") == 3
+    assert _find("2025-01-15T00:00:00Z") == 2
+    assert _find("2025-02-01T00:00:00Z") == 1
+
+
+def test_price_cache_discards_entries_loaded_before_invalidation():
+    cache = test_module.PriceCache()
+    generation = cache.generation
+    cache.clear()
+
+    history = cache.set(KEY, [_make_price(1, "2024-01-01T00:00:00Z")], generation=generation)
+
+    assert len(history.prices) == 1
+    assert cache.get(KEY) is None
+    assert cache.get_stats() == {"hits": 0, "misses": 1, "invalidations": 1, "size": 0}
@@ -0,0 +1,114 @@
+import math
+
+import pytest
+
+from app import metrics as test_module
+
+
+def test_counter():
+    registry = test_module.MetricsRegistry()
+    counter = registry.counter("test_total", "Test counter.", ("method", "status"))
+    counter.inc(("GET", "200"))
+    counter.inc(("GET", "200"), 2)
+    counter.inc(("POST", 'a"b\\c\nd'))
+
+    assert counter.get(("GET", "200")) == 3
+    assert counter.get(("GET", "404")) == 0
+    assert registry.render() == (
+        "# HELP test_total Test counter.\n"
+        "# TYPE test_total counter\n"
+        'test_total{method="GET",status="200"} 3\n'
+        'test_total{method="POST",status="a\\"b\\\\c\\nd"} 1\n'
+    )
+
+    registry.reset()
+    assert counter.get(("GET", "200")) == 0
+
+
+def test_histogram():
+    registry = test_module.MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "Test histogram.", buckets=(0.1, 1))
+    for value in 0.05, 0.1, 0.5, 2:
+        histogram.observe(value)
+
+    assert histogram.get_count() == 4
+    assert registry.render() == (
+        "# HELP test_seconds Test histogram.\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{le="0.1"} 2\n'
+        'test_seconds_bucket{le="1"} 3\n'
+        'test_seconds_bucket{le="+Inf"} 4\n'
+        "test_seconds_sum 2.65\n"
+        "test_seconds_count 4\n"
+    )
+
+
+def test_callback():
+    registry = test_module.MetricsRegistry()
+    registry.callback(
+        "test_gauge",
+        "Test gauge.",
+        ("pool",),
+        lambda: [(("api",), 1.5), (("replica",), None), (("default",), math.inf)],
+    )
+
+    assert registry.render() == (
+        "# HELP test_gauge Test gauge.\n"
+        "# TYPE test_gauge gauge\n"
+        'test_gauge{pool="api"} 1.5\n'
+        'test_gauge{pool="default"} +Inf\n'
+    )
+
+
+def test_register_duplicate():
+    registry = test_module.MetricsRegistry()
+    registry.counter("test_total", "Test counter.")
+
+    with pytest.raises(ValueError, match="Metric already registered"):
+        registry.histogram("test_total", "Test histogram.")
+
+
+def _make_registry(directory, gauge_value):
+    registry = test_module.MetricsRegistry()
+    registry.configure_directory(str(directory))
+    counter = registry.counter("test_total", "Test counter.", ("status",))
+    histogram = registry.histogram("test_seconds", "Test histogram.", buckets=(1,))
+    registry.callback("test_gauge", "Test gauge.", (), lambda: [((), gauge_value)])
+    return registry, counter, histogram
+
+
+def test_shared_directory(tmp_path):
+    registry_1, counter_1, histogram_1 = _make_registry(tmp_path, 1)
+    registry_2, counter_2, histogram_2 = _make_registry(tmp_path, 2)
+    counter_1.inc(("200",), 2)
+    counter_2.inc(("200",))
+    counter_2.inc(("500",))
+    histogram_1.observe(0.5)
+    histogram_2.observe(3)
+    registry_2.write()
+
+    expected = (
+        "# HELP test_total Test counter.\n"
+        "# TYPE test_total counter\n"
+        'test_total{status="200"} 3\n'
+        'test_total{status="500"} 1\n'
+        "# HELP test_seconds Test histogram.\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{le="1"} 1\n'
+        'test_seconds_bucket{le="+Inf"} 2\n'
+        "test_seconds_sum 3.5\n"
+        "test_seconds_count 2\n"
+        "# HELP test_gauge Test gauge.\n"
+        "# TYPE test_gauge gauge\n"
+        "test_gauge 3\n"
+    )
+    assert registry_1.render() == expected
+    assert registry_2.render() == expected
+
+    # the counters of an exiting process are kept, while its gauges are removed
+    registry_2.write(final=True)
+    assert registry_1.render() == expected.replace("test_gauge 3", "test_gauge 1")
+    assert sorted(path.suffix for path in tmp_path.iterdir()) == [".json", ".json"]
+
+    registry_1.configure_directory(None)
+    assert 'test_total{status="200"} 2\n' in registry_1.render()
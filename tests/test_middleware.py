@@ -0,0 +1,99 @@
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route
+
+from app import middleware as test_module
+from app.db.instrumentation import get_query_stats
+
+
+async def _endpoint(_request: Request) -> PlainTextResponse:
+    stats = get_query_stats()
+    stats.statements += 2
+    stats.duration += 0.0125
+    return PlainTextResponse("OK")
+
+
+async def _request(app, path="/items/1"):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get(path)
+
+
+async def test_metrics_middleware():
+    app = FastAPI()
+    app.add_api_route("/items/{item_id}", _endpoint)
+    app.add_middleware(test_module.QueryStatsMiddleware)
+    app.add_middleware(test_module.MetricsMiddleware)
+    labels = ("GET", "/items/{item_id}")
+
+    count = test_module.HTTP_REQUEST_DURATION.get_count(labels)
+    response = await _request(app)
+
+    assert response.status_code == 200
+    assert test_module.HTTP_REQUESTS.get((*labels, "200")) >= 1
+    assert test_module.HTTP_REQUEST_DURATION.get_count(labels) == count + 1
+
+    response = await _request(app, "/unknown")
+
+    assert response.status_code == 404
+    assert test_module.HTTP_REQUESTS.get(("GET", test_module.UNMATCHED_ROUTE, "404")) >= 1
+
+
+async def test_query_stats_middleware():
+    app = Starlette(routes=[Route("/items/{item_id}", _endpoint)])
+    app.add_middleware(test_module.QueryStatsMiddleware, server_timing=True)
+
+    response = await _request(app)
+
+    assert response.status_code == 200
+    assert response.headers["Server-Timing"] == 'db;dur=12.5;desc="2 statements"'
+
+    app = Starlette(routes=[Route("/items/{item_id}", _endpoint)])
+    app.add_middleware(test_module.QueryStatsMiddleware)
+
+    response = await _request(app)
+
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+
+
+async def test_metrics_middleware_with_starlette_routes():
+    sub_app = Starlette(routes=[Route("/items/{item_id}", _endpoint, methods=["GET"])])
+    app = Starlette(
+        routes=[Route("/items/{item_id}", _endpoint), Mount("/sub", app=sub_app)],
+        middleware=[
+            Middleware(test_module.MetricsMiddleware),
+            Middleware(test_module.QueryStatsMiddleware),
+        ],
+    )
+
+    for path, label, status in [
+        ("/items/1", "/items/{item_id}", "200"),
+        ("/sub/items/1", "/sub/items/{item_id}", "200"),
+        ("/sub/unknown", test_module.UNMATCHED_ROUTE, "404"),
+    ]:
+        count = test_module.HTTP_REQUESTS.get(("GET", label, status))
+        response = await _request(app, path)
+
+        assert response.status_code == int(status)
+        assert test_module.HTTP_REQUESTS.get(("GET", label, status)) == count + 1
+
+    count = test_module.HTTP_REQUESTS.get(("POST", "/sub/items/{item_id}", "405"))
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/sub/items/1")
+
+    assert response.status_code == 405
+    assert test_module.HTTP_REQUESTS.get(("POST", "/sub/items/{item_id}", "405")) == count + 1
+
+
+async def test_metrics_middleware_with_application(api_client):
+    for path, label in [("/version", "/version"), ("/docs", "/docs")]:
+        count = test_module.HTTP_REQUESTS.get(("GET", label, "200"))
+        response = await api_client.get(path)
+
+        assert response.status_code == 200
+        assert test_module.HTTP_REQUESTS.get(("GET", label, "200")) == count + 1
@@ -0,0 +1,153 @@
+import asyncio
+
+import pytest
+
+from app import roles as test_module
+from app.config import settings
+from app.constants import DatabasePool
+
+
+@pytest.mark.parametrize(
+    ("values", "expected"),
+    [
+        (["api"], {"api"}),
+        (
+            ["api, consumer:longrun", "charger:oneshot"],
+            {"api", "consumer:longrun", "charger:oneshot"},
+        ),
+        (["consumer"], set(test_module.CONSUMER_ROLES)),
+        (["charger,api"], {"api", *test_module.CHARGER_ROLES}),
+        (["all"], test_module.ALL_ROLES),
+    ],
+)
+def test_parse_roles(values, expected):
+    assert test_module.parse_roles(values) == expected
+
+
+@pytest.mark.parametrize("values", [["invalid"], ["api,consumer:invalid"], [], [" , "]])
+def test_parse_roles_invalid(values):
+    with pytest.raises(ValueError, match=r"Invalid role|At least one role"):
+        test_module.parse_roles(values)
+
+
+def test_get_pool_size(monkeypatch):
+    monkeypatch.setattr(settings, "PRICE_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "DB_POOL_SIZE", 30)
+    monkeypatch.setattr(settings, "DB_POOL_SIZE_API", 20)
+    monkeypatch.setattr(settings, "DB_POOL_SIZE_CONSUMER", 5)
+    monkeypatch.setattr(settings, "DB_POOL_SIZE_CHARGER", 3)
+
+    assert test_module.get_pool_size(test_module.ALL_ROLES) == 30
+    assert test_module.get_pool_size(frozenset({"api"})) == 20
+    assert test_module.get_pool_size(frozenset(test_module.CONSUMER_ROLES)) == 15
+    assert test_module.get_pool_size(frozenset({"api", "charger:longrun"})) == 23
+
+    monkeypatch.setattr(settings, "PRICE_CACHE_ENABLED", True)
+    assert test_module.get_pool_size(frozenset({"api"})) == 21
+
+
+def test_get_pools(monkeypatch):
+    monkeypatch.setattr(settings, "PRICE_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "DB_POOLS_ENABLED", False)
+    assert test_module.get_pools(test_module.ALL_ROLES) == {}
+
+    monkeypatch.setattr(settings, "DB_POOLS_ENABLED", True)
+    monkeypatch.setattr(settings, "DB_POOL_SIZE_DEFAULT", 2)
+    monkeypatch.setattr(settings, "DB_POOL_SIZE_API", 20)
+    monkeypatch.setattr(settings, "DB_POOL_SIZE_CONSUMER", 5)
+    monkeypatch.setattr(settings, "DB_POOL_SIZE_CHARGER", 3)
+    monkeypatch.setattr(settings, "DB_POOL_TIMEOUT_API", 10)
+    monkeypatch.setattr(settings, "DB_POOL_TIMEOUT_CONSUMER", 20)
+    monkeypatch.setattr(settings, "DB_POOL_TIMEOUT_CHARGER", 30)
+    assert test_module.get_pool_size(test_module.ALL_ROLES) == 2
+    assert test_module.get_pools(test_module.ALL_ROLES) == {
+        DatabasePool.API: {"pool_size": 20, "pool_timeout": 10},
+        DatabasePool.CONSUMER: {"pool_size": 15, "pool_timeout": 20},
+        DatabasePool.CHARGER: {"pool_size": 18, "pool_timeout": 30},
+    }
+    assert test_module.get_pools(frozenset({"api", "charger:longrun"})) == {
+        DatabasePool.API: {"pool_size": 20, "pool_timeout": 10},
+        DatabasePool.CHARGER: {"pool_size": 3, "pool_timeout": 30},
+    }
+
+
+def test_create_tasks(monkeypatch):
+    monkeypatch.setattr(settings, "PRICE_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "CHARGER_SHARDING_ENABLED", False)
+    monkeypatch.setattr(settings, "CHARGE_FINISHED_ON_EVENT", False)
+    monkeypatch.setattr(settings, "USAGE_ROLLUP_ENABLED", False)
+
+    assert test_module.create_tasks(frozenset({"api"})) == []
+
+    tasks = test_module.create_tasks(test_module.ALL_ROLES)
+    assert [task.name for task in tasks] == [
+        "longrun-consumer",
+        "oneshot-consumer",
+        "storage-consumer",
+        "longrun-charger",
+        "oneshot-charger",
+        "storage-charger",
+        "system-balance-folder",
+    ]
+
+    tasks = test_module.create_tasks(frozenset({"consumer:oneshot"}))
+    assert [task.name for task in tasks] == ["oneshot-consumer"]
+
+
+def test_create_tasks_with_optional_tasks(monkeypatch):
+    monkeypatch.setattr(settings, "PRICE_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "CHARGER_SHARDING_ENABLED", True)
+    monkeypatch.setattr(settings, "CHARGE_FINISHED_ON_EVENT", True)
+    monkeypatch.setattr(settings, "USAGE_ROLLUP_ENABLED", True)
+
+    tasks = test_module.create_tasks(frozenset({"consumer:longrun"}))
+    assert [task.name for task in tasks] == ["price-cache-listener", "longrun-consumer"]
+
+    tasks = test_module.create_tasks(
+        frozenset({"charger:longrun", "charger:finished", "charger:usage-rollup"})
+    )
+    assert [task.name for task in tasks] == [
+        "price-cache-listener",
+        "shard-coordinator",
+        "longrun-charger",
+        "finished-job-charger",
+        "usage-rollup-refresher",
+    ]
+    shard_coordinator = tasks[1]
+    assert tasks[2]._get_shard == shard_coordinator.get_shard
+    assert tasks[3]._get_shard == shard_coordinator.get_shard
+
+
+def test_create_worker_tasks(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "PRICE_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "METRICS_MULTIPROCESS_DIR", "")
+    assert test_module.create_worker_tasks() == []
+
+    monkeypatch.setattr(settings, "PRICE_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "METRICS_MULTIPROCESS_DIR", str(tmp_path))
+    tasks = test_module.create_worker_tasks()
+    assert [type(task) for task in tasks] == [
+        test_module.PriceCacheListener,
+        test_module.MetricsWriter,
+    ]
+
+
+async def test_run_tasks():
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    class FakeTask:
+        name = "fake"
+
+        async def run_forever(self):  # noqa: PLR6301
+            started.set()
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+    async with test_module.run_tasks([FakeTask()]):
+        await asyncio.wait_for(started.wait(), timeout=1)
+        assert not cancelled.is_set()
+    assert cancelled.is_set()
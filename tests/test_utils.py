@@ -0,0 +1,59 @@
+import asyncio
+import operator
+
+import pytest
+
+from app import utils as test_module
+
+
+@pytest.mark.parametrize("concurrency", [1, 2, 3, 10])
+async def test_run_partitioned(concurrency):
+    items = [(key, n) for n, key in enumerate("ABCABCAAD")]
+    processed = []
+    running = 0
+    max_running = 0
+
+    async def func(item):
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        processed.append(item)
+
+    await test_module.run_partitioned(
+        items, func, key=operator.itemgetter(0), concurrency=concurrency
+    )
+
+    assert max_running == min(concurrency, 4)
+    if concurrency == 1:
+        assert processed == items
+    else:
+        assert sorted(processed) == sorted(items)
+        # the order is preserved within each partition
+        for key in "ABCD":
+            assert [item for item in processed if item[0] == key] == [
+                item for item in items if item[0] == key
+            ]
+
+
+async def test_run_partitioned_with_error():
+    async def func(item):
+        await asyncio.sleep(0.01)
+        if item == 3:
+            raise ValueError(item)
+
+    with pytest.raises(ExceptionGroup) as exc_info:
+        await test_module.run_partitioned(range(6), func, key=lambda item: item, concurrency=2)
+    assert exc_info.group_contains(ValueError)
+
+
+def test_encode_and_decode_cursor():
+    values = ["2024-01-01T00:00:00+00:00", None]
+    cursor = test_module.encode_cursor(values)
+    assert "=" not in cursor
+    assert test_module.decode_cursor(cursor, size=2) == values
+
+    for invalid in ["!", "invalid", test_module.encode_cursor(["a"]), "e30"]:
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            test_module.decode_cursor(invalid, size=2)